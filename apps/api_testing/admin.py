@@ -40,8 +40,8 @@ class RequestHistoryAdmin(admin.ModelAdmin):
 
 @admin.register(TestSuite)
 class TestSuiteAdmin(admin.ModelAdmin):
-    list_display = ['name', 'project', 'environment', 'created_by', 'created_at']
-    list_filter = ['project', 'created_at']
+    list_display = ['name', 'project', 'environment', 'execution_mode', 'max_concurrency', 'created_by', 'created_at']
+    list_filter = ['project', 'execution_mode', 'created_at']
     search_fields = ['name', 'description']
 
 
@@ -0,0 +1,116 @@
+"""
+API请求执行使用的HTTP连接池
+
+每个执行环境共享一个连接池（HTTPAdapter），同一主机的请求复用 keep-alive 连接，
+避免每次请求都重新进行 DNS 解析、TCP 握手和 TLS 握手。
+新建连接的耗时会被记录下来，用于统计连接复用率。
+
+会话（requests.Session）按线程创建，同一执行环境的会话挂载同一个连接池。
+Cookie 只在一次请求（包括重定向链）内有效：发送前清空当前线程会话的 Cookie，
+上一次执行的响应 Cookie 不会带到后续请求，并行执行的其他线程也互不影响。
+"""
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+_local = threading.local()
+_adapters = {}
+_adapters_lock = threading.Lock()
+
+
+class _TimedConnectionMixin:
+    """记录新建连接（含TLS握手）耗时的连接类"""
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        elapsed = (time.perf_counter() - start) * 1000
+        _local.new_connections = getattr(_local, 'new_connections', 0) + 1
+        _local.connect_time = getattr(_local, 'connect_time', 0.0) + elapsed
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """使用计时连接池的适配器"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+def _get_adapter(key):
+    """获取执行环境共享的连接池"""
+    adapter = _adapters.get(key)
+    if adapter is None:
+        with _adapters_lock:
+            adapter = _adapters.get(key)
+            if adapter is None:
+                adapter = PooledHTTPAdapter(
+                    pool_connections=getattr(settings, 'API_HTTP_POOL_CONNECTIONS', 20),
+                    pool_maxsize=getattr(settings, 'API_HTTP_POOL_MAXSIZE', 20),
+                    pool_block=getattr(settings, 'API_HTTP_POOL_BLOCK', True),
+                )
+                _adapters[key] = adapter
+    return adapter
+
+
+def get_session(environment=None):
+    """获取当前线程中执行环境对应的会话（挂载执行环境共享的连接池）"""
+    key = environment.id if environment is not None else None
+    sessions = getattr(_local, 'sessions', None)
+    if sessions is None:
+        sessions = _local.sessions = {}
+    session = sessions.get(key)
+    if session is None:
+        adapter = _get_adapter(key)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        sessions[key] = session
+    return session
+
+
+def send_request(environment=None, **kwargs):
+    """通过连接池发送请求
+
+    Returns:
+        tuple: (response, connection_info)，connection_info 包含
+        connection_reused（是否复用已有连接）和 connect_time（新建连接耗时，毫秒）
+    """
+    _local.new_connections = 0
+    _local.connect_time = 0.0
+
+    session = get_session(environment)
+    # 不带上一次请求的响应Cookie，重定向链中设置的Cookie仍按默认策略生效
+    session.cookies.clear()
+    response = session.request(**kwargs)
+
+    reused = _local.new_connections == 0
+    connection_info = {
+        'connection_reused': reused,
+        'connect_time': None if reused else round(_local.connect_time, 2),
+    }
+    return response, connection_info
@@ -0,0 +1,16 @@
+"""
+API测试模块的后台作业
+"""
+from apps.core.job_queue import job
+
+
+@job('api.run_scheduled_task', queue='api')
+def run_scheduled_task(task_id, execution_log_id):
+    """执行API定时任务"""
+    from .models import ScheduledTask, TaskExecutionLog
+    from .views import ScheduledTaskViewSet
+
+    task = ScheduledTask.objects.get(id=task_id)
+    execution_log = TaskExecutionLog.objects.get(id=execution_log_id)
+    ScheduledTaskViewSet()._execute_task(task, execution_log)
+    return {'execution_log_id': execution_log_id}
@@ -144,6 +144,8 @@ class RequestHistory(models.Model):
     response_data = models.JSONField(null=True, blank=True, verbose_name='响应数据')
     status_code = models.IntegerField(null=True, blank=True, verbose_name='状态码')
     response_time = models.FloatField(null=True, blank=True, verbose_name='响应时间(ms)')
+    connection_reused = models.BooleanField(null=True, blank=True, verbose_name='是否复用连接')
+    connect_time = models.FloatField(null=True, blank=True, verbose_name='建立连接耗时(ms)')
     error_message = models.TextField(blank=True, verbose_name='错误信息')
     assertions_results = models.JSONField(null=True, blank=True, verbose_name='断言结果')
     executed_by = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='执行者')
@@ -161,6 +163,11 @@ class RequestHistory(models.Model):
 
 class TestSuite(models.Model):
     """测试套件模型（自动化测试）"""
+    EXECUTION_MODE_CHOICES = [
+        ('SEQUENTIAL', '顺序执行'),
+        ('PARALLEL', '并行执行'),
+    ]
+
     project = models.ForeignKey(ApiProject, on_delete=models.CASCADE, related_name='test_suites',
                                 verbose_name='所属项目')
     name = models.CharField(max_length=200, verbose_name='套件名称')
@@ -168,6 +175,10 @@ class TestSuite(models.Model):
     requests = models.ManyToManyField(ApiRequest, through='TestSuiteRequest', verbose_name='包含请求')
     environment = models.ForeignKey(Environment, on_delete=models.SET_NULL, null=True, blank=True,
                                     verbose_name='执行环境')
+    execution_mode = models.CharField(max_length=20, choices=EXECUTION_MODE_CHOICES, default='SEQUENTIAL',
+                                      verbose_name='执行模式')
+    max_concurrency = models.PositiveIntegerField(default=5, verbose_name='最大并发数',
+                                                  help_text='并行执行模式下同时发送的最大请求数')
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_test_suites',
                                    verbose_name='创建者')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
@@ -190,6 +201,8 @@ class TestSuiteRequest(models.Model):
     order = models.IntegerField(default=0, verbose_name='执行顺序')
     assertions = models.JSONField(default=list, verbose_name='断言规则')
     enabled = models.BooleanField(default=True, verbose_name='是否启用')
+    is_barrier = models.BooleanField(default=False, verbose_name='执行屏障',
+                                     help_text='并行执行时，等待前序请求全部完成后再执行，后续请求也等待其完成')
 
     class Meta:
         db_table = 'api_test_suite_requests'
@@ -304,6 +317,10 @@ class ScheduledTask(models.Model):
         verbose_name = '定时任务'
         verbose_name_plural = '定时任务'
         ordering = ['-created_at']
+        indexes = [
+            # 调度器按 status='ACTIVE' AND next_run_time <= now 查询到期任务
+            models.Index(fields=['status', 'next_run_time']),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.get_task_type_display()})"
@@ -159,8 +159,8 @@ class RequestHistorySerializer(serializers.ModelSerializer):
         model = RequestHistory
         fields = [
             'id', 'request', 'environment', 'request_data', 'response_data',
-            'status_code', 'response_time', 'error_message', 'assertions_results',
-            'executed_by', 'executed_at'
+            'status_code', 'response_time', 'connection_reused', 'connect_time',
+            'error_message', 'assertions_results', 'executed_by', 'executed_at'
         ]
 
 
@@ -169,7 +169,7 @@ class TestSuiteRequestSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = TestSuiteRequest
-        fields = ['id', 'request', 'order', 'assertions', 'enabled']
+        fields = ['id', 'request', 'order', 'assertions', 'enabled', 'is_barrier']
 
 
 class TestSuiteSerializer(serializers.ModelSerializer):
@@ -180,6 +180,7 @@ class TestSuiteSerializer(serializers.ModelSerializer):
         model = TestSuite
         fields = [
             'id', 'name', 'description', 'project', 'environment',
+            'execution_mode', 'max_concurrency',
             'suite_requests', 'created_by', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
@@ -0,0 +1,185 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from .models import ApiProject, ApiCollection, ApiRequest, TestSuite, TestSuiteRequest, RequestHistory
+from .utils import execute_suite_requests, _build_execution_stages
+from .http_client import send_request
+from .variable_engine import compile_request, resolve_environment
+
+User = get_user_model()
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, text='ok'):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {'content-type': 'text/plain'}
+
+
+class SuiteExecutionTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        self.project = ApiProject.objects.create(
+            name='API项目', project_type='HTTP', status='IN_PROGRESS', owner=self.user
+        )
+        self.collection = ApiCollection.objects.create(name='集合', project=self.project)
+        self.suite = TestSuite.objects.create(
+            project=self.project, name='套件', created_by=self.user,
+            execution_mode='PARALLEL', max_concurrency=4
+        )
+        for i in range(6):
+            api_request = ApiRequest.objects.create(
+                collection=self.collection, name=f'请求{i}', method='GET',
+                url=f'http://example.com/{i}', created_by=self.user
+            )
+            TestSuiteRequest.objects.create(
+                test_suite=self.suite, request=api_request, order=i, is_barrier=(i == 2)
+            )
+
+    def _suite_requests(self):
+        return self.suite.testsuiterequest_set.select_related('request').order_by('order')
+
+    def test_barrier_splits_stages(self):
+        """测试屏障请求单独成为一个阶段"""
+        stages = _build_execution_stages(list(self._suite_requests()))
+        self.assertEqual([[sr.order for sr in stage] for stage in stages], [[0, 1], [2], [3, 4, 5]])
+
+    def test_parallel_results_keep_order(self):
+        """测试并行执行的结果保持配置的顺序"""
+        def fake_send(environment, method, url, **kwargs):
+            # 越靠前的请求越慢，确保完成顺序与配置顺序不同
+            time.sleep(0.05 * (5 - int(url.rsplit('/', 1)[-1])))
+            return FakeResponse(), {'connection_reused': True, 'connect_time': None}
+
+        with mock.patch('apps.api_testing.utils.send_request', side_effect=fake_send):
+            results, passed, failed = execute_suite_requests(
+                self._suite_requests(), None, self.user,
+                execution_mode='PARALLEL', max_concurrency=4
+            )
+
+        self.assertEqual([r['name'] for r in results], [f'请求{i}' for i in range(6)])
+        self.assertEqual((passed, failed), (6, 0))
+        self.assertEqual(RequestHistory.objects.count(), 6)
+
+    def test_request_error_is_reported(self):
+        """测试请求异常记为失败且不写入请求历史"""
+        with mock.patch('apps.api_testing.utils.send_request', side_effect=ConnectionError('refused')):
+            results, passed, failed = execute_suite_requests(
+                self._suite_requests(), None, self.user, execution_mode='SEQUENTIAL'
+            )
+
+        self.assertEqual((passed, failed), (0, 6))
+        self.assertEqual(results[0]['error'], 'refused')
+        self.assertEqual(RequestHistory.objects.count(), 0)
+
+    def test_cancelled_job_stops_between_requests(self):
+        """测试作业被取消后不再发送剩余的请求，已完成请求的历史已保存"""
+        from apps.core.job_queue import JobCancelled
+
+        checks = [None, None, JobCancelled()]
+        with mock.patch('apps.api_testing.utils.check_cancelled', side_effect=checks), \
+                mock.patch('apps.api_testing.utils.send_request',
+                           return_value=(FakeResponse(), {'connection_reused': True, 'connect_time': None})) as send:
+            with self.assertRaises(JobCancelled):
+                execute_suite_requests(self._suite_requests(), None, self.user, execution_mode='SEQUENTIAL')
+        self.assertEqual(send.call_count, 2)
+        self.assertEqual(RequestHistory.objects.count(), 2)
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/login':
+            # 登录后重定向，Cookie 需要在重定向后的请求中带上
+            self.send_response(302)
+            self.send_header('Location', '/home')
+            self.send_header('Set-Cookie', 'sid=2; Path=/')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = (self.headers.get('Cookie') or 'ok').encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'sid=1')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpClientTestCase(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused_across_requests(self):
+        """测试同一主机的请求复用连接且不保留Cookie"""
+        _, first = send_request(method='GET', url=self.url, timeout=5)
+        response, second = send_request(method='GET', url=self.url, timeout=5)
+
+        self.assertFalse(first['connection_reused'])
+        self.assertIsNotNone(first['connect_time'])
+        self.assertTrue(second['connection_reused'])
+        self.assertIsNone(second['connect_time'])
+        self.assertNotIn('Cookie', response.request.headers)
+
+    def test_cookies_kept_within_redirect_chain(self):
+        """测试重定向链中设置的Cookie在后续跳转中生效，但不带到下一次请求"""
+        response, _ = send_request(method='GET', url=self.url + 'login', timeout=5)
+        self.assertEqual(response.text, 'sid=2')
+
+        response, _ = send_request(method='GET', url=self.url + 'home', timeout=5)
+        self.assertEqual(response.text, 'ok')
+
+
+class VariableEngineTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        project = ApiProject.objects.create(
+            name='API项目', project_type='HTTP', status='IN_PROGRESS', owner=self.user
+        )
+        self.api_request = ApiRequest.objects.create(
+            collection=ApiCollection.objects.create(name='集合', project=project),
+            name='登录', method='POST', url='{{host}}/login',
+            headers=[{'key': 'Authorization', 'value': 'Bearer {{token}}', 'enabled': True}],
+            params={'lang': '{{lang}}'},
+            body={'type': 'json', 'data': {'user': '{{user}}', 'tags': ['{{tag}}', 1]}},
+            created_by=self.user
+        )
+
+    def test_render_and_report_unresolved(self):
+        """测试变量替换并报告未解析的变量"""
+        values = resolve_environment({
+            'host': 'http://api.test',
+            'token': {'initialValue': 'init', 'currentValue': 'abc'},
+            'user': 'alice',
+            'tag': None,
+        })
+        rendered = compile_request(self.api_request).render(values)
+
+        self.assertEqual(rendered['url'], 'http://api.test/login')
+        self.assertEqual(rendered['headers'], {'Authorization': 'Bearer abc'})
+        self.assertEqual(rendered['params'], {'lang': '{{lang}}'})
+        self.assertEqual(rendered['body'], {'user': 'alice', 'tags': ['', 1]})
+        self.assertEqual(rendered['unresolved'], ['lang'])
+
+    def test_compiled_request_cached_until_updated(self):
+        """测试编译结果在请求修改后失效"""
+        compiled = compile_request(self.api_request)
+        self.assertIs(compile_request(ApiRequest.objects.get(pk=self.api_request.pk)), compiled)
+
+        self.api_request.url = '{{host}}/logout'
+        self.api_request.save()
+        self.assertIsNot(compile_request(self.api_request), compiled)
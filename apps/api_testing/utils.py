@@ -1,7 +1,10 @@
 import json
 import time
 from django.utils import timezone
+from apps.core.job_queue import JobCancelled, check_cancelled
 from .models import RequestHistory
+from .http_client import send_request
+from .variable_engine import compile_request, resolve_environment
 
 
 def execute_assertions(response, assertions):
@@ -104,12 +107,183 @@ def execute_assertions(response, assertions):
     return results
 
 
+def _build_execution_stages(suite_requests):
+    """按屏障拆分执行阶段
+
+    屏障请求单独成为一个阶段：它会等待前序请求全部完成后才开始，
+    后续请求也会等待它完成后才开始。相邻的非屏障请求归入同一阶段并发执行。
+    """
+    stages = []
+    current = []
+    for suite_request in suite_requests:
+        if suite_request.is_barrier:
+            if current:
+                stages.append(current)
+                current = []
+            stages.append([suite_request])
+        else:
+            current.append(suite_request)
+    if current:
+        stages.append(current)
+    return stages
+
+
+def _run_suite_request(suite_request, environment, values):
+    """执行套件中的单个请求（不访问数据库，可在工作线程中调用）"""
+    api_request = suite_request.request
+
+    try:
+        # 使用编译后的模板替换变量
+        rendered = compile_request(api_request).render(values)
+        url = rendered['url']
+        headers = rendered['headers']
+        params = rendered['params']
+        body_data = rendered['body']
+
+        # 执行请求
+        start_time = time.time()
+        response, connection_info = send_request(
+            environment,
+            method=api_request.method,
+            url=url,
+            headers=headers,
+            params=params,
+            json=body_data,
+            timeout=30
+        )
+        end_time = time.time()
+        response_time = (end_time - start_time) * 1000
+
+        # 执行断言验证
+        assertions = api_request.assertions or []
+        for assertion in assertions:
+            if assertion.get('type') == 'response_time':
+                assertion['actual_time'] = response_time
+
+        assertions_results = execute_assertions(response, assertions)
+
+        # 检查所有断言是否通过
+        passed = True
+        error_message = ''
+
+        # 检查套件请求的断言
+        for assertion in suite_request.assertions:
+            if assertion.get('type') == 'status_code':
+                expected = assertion.get('value')
+                if response.status_code != expected:
+                    passed = False
+                    error_message = f'状态码断言失败: 期望 {expected}, 实际 {response.status_code}'
+                    break
+
+        # 检查接口自身的断言
+        if passed and assertions_results:
+            for assertion_result in assertions_results:
+                if not assertion_result.get('passed', True):
+                    passed = False
+                    error_message = f"断言失败: {assertion_result.get('name', '未命名断言')} - {assertion_result.get('error', '断言不通过')}"
+                    break
+
+        result = {
+            'name': api_request.name,
+            'method': api_request.method,
+            'url': url,
+            'status_code': response.status_code,
+            'response_time': response_time,
+            'passed': passed,
+            'error': error_message,
+            'assertions_results': assertions_results,
+            'unresolved_variables': rendered['unresolved']
+        }
+        history_data = {
+            'request_data': {
+                'url': url,
+                'method': api_request.method,
+                'headers': headers,
+                'params': params,
+                'body': body_data,
+                'unresolved_variables': rendered['unresolved']
+            },
+            'response_data': {
+                'headers': dict(response.headers),
+                'body': response.text,
+                'json': response.json() if response.headers.get('content-type', '').startswith('application/json') else None
+            },
+            'status_code': response.status_code,
+            'response_time': response_time,
+            'assertions_results': assertions_results,
+            **connection_info,
+        }
+        return result, history_data
+
+    except Exception as e:
+        return {
+            'name': api_request.name,
+            'method': api_request.method,
+            'url': api_request.url,
+            'passed': False,
+            'error': str(e)
+        }, None
+
+
+def execute_suite_requests(suite_requests, environment, executed_by, execution_mode='SEQUENTIAL', max_concurrency=1):
+    """执行套件中的请求
+
+    并行模式下，同一阶段内的请求在线程池中并发发送，并发数不超过
+    max_concurrency 与 API_SUITE_MAX_WORKERS 中的较小值；阶段之间由屏障请求分隔。
+    无论哪种模式，返回结果都保持套件中配置的 order 顺序。
+    请求历史在每个阶段（串行模式下每个请求）完成后立即保存。
+
+    Returns:
+        tuple: (results, passed_count, failed_count)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from django.conf import settings
+
+    suite_requests = list(suite_requests)
+
+    # 解析环境变量（整个套件只解析一次）
+    values = resolve_environment(environment.variables if environment else None)
+
+    max_workers = min(max_concurrency or 1, getattr(settings, 'API_SUITE_MAX_WORKERS', 20))
+    results = []
+
+    def record(batch, outcomes):
+        """汇总一批请求的结果并保存请求历史，作业中途取消或失败时已完成请求的历史不丢失"""
+        histories = []
+        for suite_request, (result, history_data) in zip(batch, outcomes):
+            results.append(result)
+
+            # 保存请求历史
+            if history_data is not None:
+                histories.append(RequestHistory(
+                    request=suite_request.request,
+                    environment=environment,
+                    executed_by=executed_by,
+                    **history_data
+                ))
+        if histories:
+            RequestHistory.objects.bulk_create(histories)
+
+    if execution_mode == 'PARALLEL' and max_workers > 1 and len(suite_requests) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='api-suite') as pool:
+            for stage in _build_execution_stages(suite_requests):
+                # 在作业中执行且作业已被取消时抛出 JobCancelled，不再发送剩余的请求
+                check_cancelled()
+                record(stage, list(pool.map(lambda item: _run_suite_request(item, environment, values), stage)))
+    else:
+        for suite_request in suite_requests:
+            check_cancelled()
+            record([suite_request], [_run_suite_request(suite_request, environment, values)])
+
+    passed_count = sum(1 for result in results if result['passed'])
+    failed_count = len(results) - passed_count
+    return results, passed_count, failed_count
+
+
 def execute_test_suite(test_suite, environment, executed_by):
     """执行测试套件并返回结果"""
-    from .models import TestExecution, RequestHistory
-    import requests
-    import time
-    
+    from .models import TestExecution
+
     try:
         # 创建执行记录
         execution = TestExecution.objects.create(
@@ -118,145 +292,23 @@ def execute_test_suite(test_suite, environment, executed_by):
             start_time=timezone.now(),
             executed_by=executed_by
         )
-        
+
         # 获取套件中的请求
-        suite_requests = test_suite.testsuiterequest_set.filter(enabled=True).order_by('order')
-        
+        suite_requests = test_suite.testsuiterequest_set.filter(
+            enabled=True
+        ).select_related('request').order_by('order')
+
         execution.total_requests = suite_requests.count()
         execution.save()
-        
-        results = []
-        passed_count = 0
-        failed_count = 0
-        
-        # 执行每个请求
-        for suite_request in suite_requests:
-            api_request = suite_request.request
-            
-            try:
-                # 解析环境变量
-                variables = {}
-                if environment:
-                    variables.update(environment.variables)
-                
-                # 替换URL中的变量
-                url = _replace_variables(api_request.url, variables)
-                
-                # 准备请求头
-                headers = {}
-                if isinstance(api_request.headers, list):
-                    for header_item in api_request.headers:
-                        if header_item.get('enabled', True) and header_item.get('key'):
-                            key = header_item['key']
-                            value = _replace_variables(str(header_item.get('value', '')), variables)
-                            headers[key] = value
-                else:
-                    headers = api_request.headers.copy()
-                    for key, value in headers.items():
-                        headers[key] = _replace_variables(str(value), variables)
-                
-                # 准备请求参数
-                params = api_request.params.copy() if api_request.params else {}
-                for key, value in params.items():
-                    params[key] = _replace_variables(str(value), variables)
-                
-                # 准备请求体
-                body_data = None
-                if api_request.body and api_request.method in ['POST', 'PUT', 'PATCH']:
-                    if api_request.body.get('type') == 'json':
-                        body_data = api_request.body.get('data', {})
-                        body_data = _replace_variables_in_dict(body_data, variables)
-                
-                # 执行请求
-                start_time = time.time()
-                response = requests.request(
-                    method=api_request.method,
-                    url=url,
-                    headers=headers,
-                    params=params,
-                    json=body_data,
-                    timeout=30
-                )
-                end_time = time.time()
-                response_time = (end_time - start_time) * 1000
-                
-                # 执行断言验证
-                assertions = api_request.assertions or []
-                for assertion in assertions:
-                    if assertion.get('type') == 'response_time':
-                        assertion['actual_time'] = response_time
-                
-                assertions_results = execute_assertions(response, assertions)
-                
-                # 检查所有断言是否通过
-                passed = True
-                error_message = ''
-                
-                # 检查套件请求的断言
-                for assertion in suite_request.assertions:
-                    if assertion.get('type') == 'status_code':
-                        expected = assertion.get('value')
-                        if response.status_code != expected:
-                            passed = False
-                            error_message = f'状态码断言失败: 期望 {expected}, 实际 {response.status_code}'
-                            break
-                
-                # 检查接口自身的断言
-                if passed and assertions_results:
-                    for assertion_result in assertions_results:
-                        if not assertion_result.get('passed', True):
-                            passed = False
-                            error_message = f"断言失败: {assertion_result.get('name', '未命名断言')} - {assertion_result.get('error', '断言不通过')}"
-                            break
-                
-                if passed:
-                    passed_count += 1
-                else:
-                    failed_count += 1
-                
-                results.append({
-                    'name': api_request.name,
-                    'method': api_request.method,
-                    'url': url,
-                    'status_code': response.status_code,
-                    'response_time': response_time,
-                    'passed': passed,
-                    'error': error_message,
-                    'assertions_results': assertions_results
-                })
-                
-                # 保存请求历史
-                RequestHistory.objects.create(
-                    request=api_request,
-                    environment=environment,
-                    request_data={
-                        'url': url,
-                        'method': api_request.method,
-                        'headers': headers,
-                        '极速版params': params,
-                        'body': body_data
-                    },
-                    response_data={
-                        'headers': dict(response.headers),
-                        'body': response.text,
-                        'json': response.json() if response.headers.get('content-type', '').startswith('application/json') else None
-                    },
-                    status_code=response.status_code,
-                    response_time=response_time,
-                    assertions_results=assertions_results,
-                    executed_by=executed_by
-                )
-                
-            except Exception as e:
-                failed_count += 1
-                results.append({
-                    'name': api_request.name,
-                    'method': api_request.method,
-                    'url': api_request.url,
-                    'passed': False,
-                    'error': str(e)
-                })
-        
+
+        results, passed_count, failed_count = execute_suite_requests(
+            suite_requests,
+            environment,
+            executed_by,
+            execution_mode=test_suite.execution_mode,
+            max_concurrency=test_suite.max_concurrency
+        )
+
         # 更新执行结果
         execution.end_time = timezone.now()
         execution.passed_requests = passed_count
@@ -264,7 +316,7 @@ def execute_test_suite(test_suite, environment, executed_by):
         execution.status = 'COMPLETED' if failed_count == 0 else 'FAILED'
         execution.results = results
         execution.save()
-        
+
         return {
             'success': True,
             'execution_id': execution.id,
@@ -273,7 +325,12 @@ def execute_test_suite(test_suite, environment, executed_by):
             'total_count': execution.total_requests,
             'results': results
         }
-        
+
+    except JobCancelled:
+        execution.status = 'CANCELLED'
+        execution.end_time = timezone.now()
+        execution.save()
+        raise
     except Exception as e:
         return {
             'success': False,
@@ -283,46 +340,19 @@ def execute_test_suite(test_suite, environment, executed_by):
 
 def execute_api_request(api_request, environment, executed_by):
     """执行单个API请求并返回结果"""
-    import requests
-    import time
-    
     try:
-        # 解析环境变量
-        variables = {}
-        if environment:
-            variables.update(environment.variables)
-        
-        # 替换URL中的变量
-        url = _replace_variables(api_request.url, variables)
-        
-        # 准备请求头
-        headers = {}
-        if isinstance(api_request.headers, list):
-            for header_item in api_request.headers:
-                if header_item.get('enabled', True) and header_item.get('key'):
-                    key = header_item['key']
-                    value = _replace_variables(str(header_item.get('value', '')), variables)
-                    headers[key] = value
-        else:
-            headers = api_request.headers.copy()
-            for key, value in headers.items():
-                headers[key] = _replace_variables(str(value), variables)
-        
-        # 准备请求参数
-        params = api_request.params.copy() if api_request.params else {}
-        for key, value in params.items():
-            params[key] = _replace_variables(str(value), variables)
-        
-        # 准备请求体
-        body_data = None
-        if api_request.body and api_request.method in ['POST', 'PUT', 'PATCH']:
-            if api_request.body.get('type') == 'json':
-                body_data = api_request.body.get('data', {})
-                body_data = _replace_variables_in_dict(body_data, variables)
+        # 解析环境变量并替换请求中的变量
+        values = resolve_environment(environment.variables if environment else None)
+        rendered = compile_request(api_request).render(values)
+        url = rendered['url']
+        headers = rendered['headers']
+        params = rendered['params']
+        body_data = rendered['body']
         
         # 执行请求
         start_time = time.time()
-        response = requests.request(
+        response, connection_info = send_request(
+            environment,
             method=api_request.method,
             url=url,
             headers=headers,
@@ -350,7 +380,8 @@ def execute_api_request(api_request, environment, executed_by):
                 'method': api_request.method,
                 'headers': headers,
                 'params': params,
-                'body': body_data
+                'body': body_data,
+                'unresolved_variables': rendered['unresolved']
             },
             response_data={
                 'headers': dict(response.headers),
@@ -360,7 +391,8 @@ def execute_api_request(api_request, environment, executed_by):
             status_code=response.status_code,
             response_time=response_time,
             assertions_results=assertions_results,
-            executed_by=executed_by
+            executed_by=executed_by,
+            **connection_info
         )
         
         return {
@@ -369,6 +401,7 @@ def execute_api_request(api_request, environment, executed_by):
             'status_code': response.status_code,
             'response_time': response_time,
             'assertions_results': assertions_results,
+            'unresolved_variables': rendered['unresolved'],
             'response_data': {
                 'headers': dict(response.headers),
                 'body': response.text,
@@ -381,30 +414,3 @@ def execute_api_request(api_request, environment, executed_by):
             'success': False,
             'error': str(e)
         }
-
-
-def _replace_variables(text, variables):
-    """替换文本中的变量"""
-    if not isinstance(text, str):
-        return text
-    
-    result = text
-    for key, value in (variables or {}).items():
-        if isinstance(value, dict):
-            replacement = str(value.get('currentValue', '') or value.get('initialValue', ''))
-        else:
-            replacement = str(value) if value is not None else ''
-        result = result.replace(f'{{{{{key}}}}}', replacement)
-    return result
-
-
-def _replace_variables_in_dict(data, variables):
-    """递归替换字典中的变量"""
-    if isinstance(data, dict):
-        return {k: _replace_variables_in_dict(v, variables) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [_replace_variables_in_dict(item, variables) for item in data]
-    elif isinstance(data, str):
-        return _replace_variables(data, variables)
-    else:
-        return data
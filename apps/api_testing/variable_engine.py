@@ -0,0 +1,144 @@
+"""
+API请求变量替换引擎
+
+请求中的 {{变量名}} 模板只在请求内容变化时解析一次，编译结果按
+(请求ID, updated_at) 缓存；环境变量在一次执行中也只解析一次。
+替换时一次遍历即可完成，无法解析的变量保持原样并被收集返回。
+"""
+import re
+import threading
+from collections import OrderedDict
+
+VARIABLE_PATTERN = re.compile(r'\{\{([^{}]+)\}\}')
+
+# 编译结果缓存的最大请求数
+COMPILED_CACHE_SIZE = 512
+
+_compiled_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def resolve_environment(variables):
+    """把环境变量配置解析成 变量名 -> 字符串值 的映射"""
+    values = {}
+    for key, value in (variables or {}).items():
+        if isinstance(value, dict):
+            values[key] = str(value.get('currentValue', '') or value.get('initialValue', ''))
+        else:
+            values[key] = str(value) if value is not None else ''
+    return values
+
+
+class Template:
+    """编译后的字符串模板"""
+    __slots__ = ('parts', 'variables')
+
+    def __init__(self, text):
+        # parts 中偶数位置为字面量，奇数位置为变量名
+        self.parts = VARIABLE_PATTERN.split(text)
+        self.variables = self.parts[1::2]
+
+    def render(self, values, unresolved):
+        if not self.variables:
+            return self.parts[0]
+        output = []
+        for index, part in enumerate(self.parts):
+            if index % 2 == 0:
+                output.append(part)
+            elif part in values:
+                output.append(values[part])
+            else:
+                unresolved.add(part)
+                output.append('{{' + part + '}}')
+        return ''.join(output)
+
+
+def compile_value(data):
+    """递归编译字典、列表和字符串中的模板"""
+    if isinstance(data, dict):
+        return {k: compile_value(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [compile_value(item) for item in data]
+    elif isinstance(data, str):
+        return Template(data)
+    else:
+        return data
+
+
+def render_value(compiled, values, unresolved):
+    """使用变量值渲染编译后的数据"""
+    if isinstance(compiled, Template):
+        return compiled.render(values, unresolved)
+    elif isinstance(compiled, dict):
+        return {k: render_value(v, values, unresolved) for k, v in compiled.items()}
+    elif isinstance(compiled, list):
+        return [render_value(item, values, unresolved) for item in compiled]
+    else:
+        return compiled
+
+
+class CompiledRequest:
+    """编译后的API请求"""
+
+    def __init__(self, api_request):
+        self.method = api_request.method
+        self.url = Template(api_request.url or '')
+
+        # 支持新的数组格式和旧的对象格式
+        self.headers = []
+        if isinstance(api_request.headers, list):
+            for header_item in api_request.headers:
+                if header_item.get('enabled', True) and header_item.get('key'):
+                    self.headers.append((header_item['key'], Template(str(header_item.get('value', '')))))
+        else:
+            for key, value in (api_request.headers or {}).items():
+                self.headers.append((key, Template(str(value))))
+
+        self.params = [(key, Template(str(value))) for key, value in (api_request.params or {}).items()]
+
+        body = api_request.body or {}
+        self.has_body = bool(body) and api_request.method in ['POST', 'PUT', 'PATCH']
+        self.body_type = body.get('type')
+        self.body = compile_value(body.get('data', {}) if self.body_type == 'json' else body.get('data'))
+
+    def render(self, values, json_body_only=True):
+        """渲染请求
+
+        Args:
+            values: resolve_environment 返回的变量映射
+            json_body_only: 为True时只发送JSON类型的请求体
+
+        Returns:
+            dict: url、headers、params、body 以及未解析的变量名列表 unresolved
+        """
+        unresolved = set()
+        body = None
+        if self.has_body and (self.body_type == 'json' or not json_body_only):
+            body = render_value(self.body, values, unresolved)
+        return {
+            'url': self.url.render(values, unresolved),
+            'headers': {key: template.render(values, unresolved) for key, template in self.headers},
+            'params': {key: template.render(values, unresolved) for key, template in self.params},
+            'body': body,
+            'unresolved': sorted(unresolved),
+        }
+
+
+def compile_request(api_request):
+    """获取请求的编译结果，请求修改后（updated_at变化）自动重新编译"""
+    if api_request.pk is None:
+        return CompiledRequest(api_request)
+
+    key = (api_request.pk, api_request.updated_at)
+    with _cache_lock:
+        compiled = _compiled_cache.get(key)
+        if compiled is not None:
+            _compiled_cache.move_to_end(key)
+            return compiled
+
+    compiled = CompiledRequest(api_request)
+    with _cache_lock:
+        _compiled_cache[key] = compiled
+        while len(_compiled_cache) > COMPILED_CACHE_SIZE:
+            _compiled_cache.popitem(last=False)
+    return compiled
@@ -40,7 +40,10 @@ from .serializers import (
 
 logger = logging.getLogger(__name__)
 
-from .utils import execute_assertions
+from .utils import execute_assertions, execute_suite_requests
+from apps.core.job_queue import JobCancelled
+from .http_client import send_request
+from .variable_engine import compile_request, resolve_environment
 from .operation_logger import log_operation
 from .serializers import (
     ApiProjectSerializer, ApiCollectionSerializer, ApiRequestSerializer,
@@ -332,44 +335,22 @@ class ApiRequestViewSet(viewsets.ModelViewSet):
         
         try:
             # 解析环境变量
-            variables = {}
+            env = None
             if environment_id:
                 env = Environment.objects.get(id=environment_id)
-                variables.update(env.variables)
+            values = resolve_environment(env.variables if env else None)
             
-            # 替换URL中的变量
-            url = self._replace_variables(api_request.url or '', variables)
-            
-            # 准备请求头
-            headers = {}
-            if isinstance(api_request.headers, list):
-                for header_item in api_request.headers:
-                    if header_item.get('enabled', True) and header_item.get('key'):
-                        key = header_item['key']
-                        value = self._replace_variables(str(header_item.get('value', '')), variables)
-                        headers[key] = value
-            else:
-                headers = api_request.headers.copy()
-                for key, value in headers.items():
-                    headers[key] = self._replace_variables(str(value), variables)
-            
-            # 准备请求参数
-            params = api_request.params.copy() if api_request.params else {}
-            for key, value in params.items():
-                params[key] = self._replace_variables(str(value), variables)
-            
-            # 准备请求体
-            body_data = None
-            if api_request.body and api_request.method in ['POST', 'PUT', 'PATCH']:
-                if api_request.body.get('type') == 'json':
-                    body_data = api_request.body.get('data', {})
-                    body_data = self._replace_variables_in_dict(body_data, variables)
-                else:
-                    body_data = self._replace_variables_in_dict(api_request.body.get('data'), variables)
+            # 使用编译后的模板替换URL、请求头、参数和请求体中的变量
+            rendered = compile_request(api_request).render(values, json_body_only=False)
+            url = rendered['url']
+            headers = rendered['headers']
+            params = rendered['params']
+            body_data = rendered['body']
             
             # 执行请求
             start_time = time.time()
-            response = requests.request(
+            response, connection_info = send_request(
+                env,
                 method=api_request.method,
                 url=url,
                 headers=headers,
@@ -397,7 +378,8 @@ class ApiRequestViewSet(viewsets.ModelViewSet):
                     'method': api_request.method,
                     'headers': headers,
                     'params': params,
-                    'body': body_data
+                    'body': body_data,
+                    'unresolved_variables': rendered['unresolved']
                 },
                 response_data={
                     'headers': dict(response.headers),
@@ -406,7 +388,8 @@ class ApiRequestViewSet(viewsets.ModelViewSet):
                 },
                 status_code=response.status_code,
                 response_time=response_time,
-                executed_by=request.user
+                executed_by=request.user,
+                **connection_info
             )
             
             # 记录执行操作
@@ -421,6 +404,7 @@ class ApiRequestViewSet(viewsets.ModelViewSet):
             # 返回包含断言结果的数据
             history_data = RequestHistorySerializer(history).data
             history_data['assertions_results'] = assertions_results
+            history_data['unresolved_variables'] = rendered['unresolved']
             
             return Response(history_data)
             
@@ -441,31 +425,6 @@ class ApiRequestViewSet(viewsets.ModelViewSet):
             )
             
             return Response(RequestHistorySerializer(history).data, status=status.HTTP_400_BAD_REQUEST)
-    
-    def _replace_variables(self, text, variables):
-        """替换文本中的变量"""
-        if not isinstance(text, str):
-            return text
-        
-        result = text
-        for key, value in (variables or {}).items():
-            if isinstance(value, dict):
-                replacement = str(value.get('currentValue', '') or value.get('initialValue', ''))
-            else:
-                replacement = str(value) if value is not None else ''
-            result = result.replace(f'{{{{{key}}}}}', replacement)
-        return result
-    
-    def _replace_variables_in_dict(self, data, variables):
-        """递归替换字典中的变量"""
-        if isinstance(data, dict):
-            return {k: self._replace_variables_in_dict(v, variables) for k, v in data.items()}
-        elif isinstance(data, list):
-            return [self._replace_variables_in_dict(item, variables) for item in data]
-        elif isinstance(data, str):
-            return self._replace_variables(data, variables)
-        else:
-            return data
 
 
 class EnvironmentViewSet(viewsets.ModelViewSet):
@@ -613,146 +572,19 @@ class TestSuiteViewSet(viewsets.ModelViewSet):
             suite_requests = TestSuiteRequest.objects.filter(
                 test_suite=test_suite,
                 enabled=True
-            ).order_by('order')
+            ).select_related('request').order_by('order')
             
             execution.total_requests = suite_requests.count()
             execution.save()
             
-            results = []
-            passed_count = 0
-            failed_count = 0
-            
-            # 执行每个请求
-            for suite_request in suite_requests:
-                api_request = suite_request.request
-                
-                try:
-                    # 解析环境变量
-                    variables = {}
-                    if test_suite.environment:
-                        variables.update(test_suite.environment.variables)
-                    
-                    # 替换URL中的变量
-                    url = self._replace_variables(api_request.url, variables)
-                    
-                    # 准备请求头
-                    headers = {}
-                    # 支持新的数组格式和旧的对象格式
-                    if isinstance(api_request.headers, list):
-                        # 新的数组格式 [{"key": "Authorization", "value": "Bearer {{token}}", "enabled": true, "description": "..."}]
-                        for header_item in api_request.headers:
-                            if header_item.get('enabled', True) and header_item.get('key'):
-                                key = header_item['key']
-                                value = self._replace_variables(str(header_item.get('value', '')), variables)
-                                headers[key] = value
-                    else:
-                        # 旧的对象格式 {"Authorization": "Bearer {{token}}"}
-                        headers = api_request.headers.copy()
-                        for key, value in headers.items():
-                            headers[key] = self._replace_variables(str(value), variables)
-                    
-                    params = api_request.params.copy()
-                    for key, value in params.items():
-                        params[key] = self._replace_variables(str(value), variables)
-                    
-                    body_data = None
-                    if api_request.body and api_request.method in ['POST', 'PUT', 'PATCH']:
-                        if api_request.body.get('type') == 'json':
-                            body_data = api_request.body.get('data', {})
-                            body_data = self._replace_variables_in_dict(body_data, variables)
-                    
-                    # 执行请求
-                    start_time = time.time()
-                    response = requests.request(
-                        method=api_request.method,
-                        url=url,
-                        headers=headers,
-                        params=params,
-                        json=body_data,
-                        timeout=30
-                    )
-                    end_time = time.time()
-                    response_time = (end_time - start_time) * 1000
-                    
-                    # 执行断言验证
-                    assertions = api_request.assertions or []
-                    # 添加响应时间到断言中
-                    for assertion in assertions:
-                        if assertion.get('type') == 'response_time':
-                            assertion['actual_time'] = response_time
-                    
-                    # 使用共享的断言执行方法
-                    assertions_results = execute_assertions(response, assertions)
-                    
-                    # 检查所有断言是否通过
-                    passed = True
-                    error_message = ''
-                    
-                    # 检查套件请求的断言
-                    for assertion in suite_request.assertions:
-                        # 简单的状态码断言
-                        if assertion.get('type') == 'status_code':
-                            expected = assertion.get('value')
-                            if response.status_code != expected:
-                                passed = False
-                                error_message = f'状态码断言失败: 期望 {expected}, 实际 {response.status_code}'
-                                break
-                    
-                    # 检查接口自身的断言
-                    if passed and assertions_results:
-                        for assertion_result in assertions_results:
-                            if not assertion_result.get('passed', True):
-                                passed = False
-                                error_message = f"断言失败: {assertion_result.get('name', '未命名断言')} - {assertion_result.get('error', '断言不通过')}"
-                                break
-                    
-                    if passed:
-                        passed_count += 1
-                    else:
-                        failed_count += 1
-                    
-                    results.append({
-                        'name': api_request.name,
-                        'method': api_request.method,
-                        'url': url,
-                        'status_code': response.status_code,
-                        'response_time': response_time,
-                        'passed': passed,
-                        'error': error_message,
-                        'assertions_results': assertions_results
-                    })
-                    
-                    # 保存请求历史
-                    RequestHistory.objects.create(
-                        request=api_request,
-                        environment=test_suite.environment,
-                        request_data={
-                            'url': url,
-                            'method': api_request.method,
-                            'headers': headers,
-                            'params': params,
-                            'body': body_data
-                        },
-                        response_data={
-                            'headers': dict(response.headers),
-                            'body': response.text,
-                            'json': response.json() if response.headers.get('content-type', '').startswith('application/json') else None
-                        },
-                        status_code=response.status_code,
-                        response_time=response_time,
-                        assertions_results=assertions_results,
-                        executed_by=request.user
-                    )
-                    
-                except Exception as e:
-                    failed_count += 1
-                    results.append({
-                        'name': api_request.name,
-                        'method': api_request.method,
-                        'url': api_request.url,
-                        'passed': False,
-                        'error': str(e)
-                    })
+            # 按套件配置的执行模式（顺序/并行）执行请求
+            results, passed_count, failed_count = execute_suite_requests(
+                suite_requests,
+                test_suite.environment,
+                request.user,
+                execution_mode=test_suite.execution_mode,
+                max_concurrency=test_suite.max_concurrency
+            )
             
             # 更新执行结果
             execution.end_time = timezone.now()
@@ -835,31 +667,6 @@ class TestSuiteViewSet(viewsets.ModelViewSet):
             
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-    
-    def _replace_variables(self, text, variables):
-        """替换文本中的变量"""
-        if not isinstance(text, str):
-            return text
-        
-        result = text
-        for key, value in (variables or {}).items():
-            if isinstance(value, dict):
-                replacement = str(value.get('currentValue', '') or value.get('initialValue', ''))
-            else:
-                replacement = str(value) if value is not None else ''
-            result = result.replace(f'{{{{{key}}}}}', replacement)
-        return result
-    
-    def _replace_variables_in_dict(self, data, variables):
-        """递归替换字典中的变量"""
-        if isinstance(data, dict):
-            return {k: self._replace_variables_in_dict(v, variables) for k, v in data.items()}
-        elif isinstance(data, list):
-            return [self._replace_variables_in_dict(item, variables) for item in data]
-        elif isinstance(data, str):
-            return self._replace_variables(data, variables)
-        else:
-            return data
 
 
 class TestSuiteRequestViewSet(viewsets.ModelViewSet):
@@ -1415,11 +1222,11 @@ class ScheduledTaskViewSet(viewsets.ModelViewSet):
             
             # 异步执行任务
             logger.info("调用 _execute_task_async 方法")
-            self._execute_task_async(task, execution_log)
+            job = self._execute_task_async(task, execution_log)
             
             logger.info("任务开始执行")
             return Response(
-                {'message': '任务已开始执行', 'execution_id': execution_log.id},
+                {'message': '任务已开始执行', 'execution_id': execution_log.id, 'job_id': job.id},
                 status=status.HTTP_200_OK
             )
             
@@ -1492,118 +1299,120 @@ class ScheduledTaskViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
     
     def _execute_task_async(self, task, execution_log):
-        """异步执行任务"""
-        import threading
-        from datetime import datetime
-        
-        # 添加测试日志
+        """提交到作业队列异步执行任务"""
+        from apps.core.job_queue import enqueue
+
+        return enqueue('api.run_scheduled_task', task.id, execution_log.id, created_by=execution_log.executed_by)
+
+    def _execute_task(self, task, execution_log):
+        """执行任务并记录执行日志（在作业队列的worker中调用）"""
         import logging
         logger = logging.getLogger(__name__)
-        logger.info("=== _execute_task_async 方法被调用 ===")
-        
-        def execute():
-            try:
-                # 更新执行状态
-                execution_log.status = 'RUNNING'
-                execution_log.start_time = timezone.now()
-                execution_log.save()
-                
-                # 执行任务
-                if task.task_type == 'TEST_SUITE':
-                    result = self._execute_test_suite(task)
-                elif task.task_type == 'API_REQUEST':
-                    result = self._execute_api_request(task)
-                else:
-                    raise ValueError(f"未知的任务类型: {task.task_type}")
-                
-                # 更新执行结果
-                execution_log.status = 'COMPLETED'
-                execution_log.end_time = timezone.now()
-                execution_log.result = result
-                execution_log.save()
-                
-                # 更新任务统计
-                task.update_run_stats(success=True)
-                task.last_result = result
-                task.save()
-                
-                logger.info("=== 开始检查发送成功通知 ===")
-                # 发送通知（如果配置了）
-                # 检查任务是否有通知设置
-                notification_setting = None
-                if hasattr(task, 'notification_settings'):
-                    try:
-                        notification_setting = task.notification_settings.first()
-                        logger.info(f"获取到通知设置: {notification_setting}")
-                        if notification_setting:
-                            logger.info(f"通知设置详情 - ID: {notification_setting.id}, 是否启用: {notification_setting.is_enabled}, 成功通知: {notification_setting.notify_on_success}")
-                        else:
-                            logger.info("没有找到通知设置")
-                    except Exception as e:
-                        logger.error(f"获取任务通知设置时出错: {e}")
-                        import traceback
-                        traceback.print_exc()
-                else:
-                    logger.info("任务没有notification_settings属性")
-                
-                if notification_setting and notification_setting.is_enabled:
-                    logger.info("通知设置已启用，准备发送成功通知")
-                    if notification_setting.notify_on_success:
-                        logger.info("调用 _send_notification 方法发送成功通知")
-                        self._send_notification(task, execution_log, success=True)
+        logger.info("=== _execute_task 方法被调用 ===")
+
+        try:
+            # 更新执行状态
+            execution_log.status = 'RUNNING'
+            execution_log.start_time = timezone.now()
+            execution_log.save()
+
+            # 执行任务
+            if task.task_type == 'TEST_SUITE':
+                result = self._execute_test_suite(task)
+            elif task.task_type == 'API_REQUEST':
+                result = self._execute_api_request(task)
+            else:
+                raise ValueError(f"未知的任务类型: {task.task_type}")
+
+            # 更新执行结果
+            execution_log.status = 'COMPLETED'
+            execution_log.end_time = timezone.now()
+            execution_log.result = result
+            execution_log.save()
+
+            # 更新任务统计
+            task.update_run_stats(success=True)
+            task.last_result = result
+            task.save()
+
+            logger.info("=== 开始检查发送成功通知 ===")
+            # 发送通知（如果配置了）
+            # 检查任务是否有通知设置
+            notification_setting = None
+            if hasattr(task, 'notification_settings'):
+                try:
+                    notification_setting = task.notification_settings.first()
+                    logger.info(f"获取到通知设置: {notification_setting}")
+                    if notification_setting:
+                        logger.info(f"通知设置详情 - ID: {notification_setting.id}, 是否启用: {notification_setting.is_enabled}, 成功通知: {notification_setting.notify_on_success}")
                     else:
-                        logger.info("通知设置中未启用成功通知")
-                else:
-                    logger.info("通知设置未启用或不存在，跳过成功通知")
-                logger.info("=== 结束检查发送成功通知 ===")
-                
-            except Exception as e:
-                # 记录执行失败
-                execution_log.status = 'FAILED'
-                execution_log.end_time = timezone.now()
-                execution_log.error_message = str(e)
-                execution_log.save()
-                
-                # 更新任务统计
-                task.update_run_stats(success=False)
-                task.error_message = str(e)
-                task.save()
-                
-                logger.info("=== 开始检查发送失败通知 ===")
-                # 发送失败通知（如果配置了）
-                # 检查任务是否有通知设置
-                notification_setting = None
-                if hasattr(task, 'notification_settings'):
-                    try:
-                        notification_setting = task.notification_settings.first()
-                        logger.info(f"获取到通知设置（失败情况）: {notification_setting}")
-                        if notification_setting:
-                            logger.info(f"通知设置详情（失败情况） - ID: {notification_setting.id}, 是否启用: {notification_setting.is_enabled}, 失败通知: {notification_setting.notify_on_failure}")
-                        else:
-                            logger.info("没有找到通知设置（失败情况）")
-                    except Exception as e:
-                        logger.error(f"获取任务通知设置时出错（失败情况）: {e}")
-                        import traceback
-                        traceback.print_exc()
+                        logger.info("没有找到通知设置")
+                except Exception as e:
+                    logger.error(f"获取任务通知设置时出错: {e}")
+                    import traceback
+                    traceback.print_exc()
+            else:
+                logger.info("任务没有notification_settings属性")
+
+            if notification_setting and notification_setting.is_enabled:
+                logger.info("通知设置已启用，准备发送成功通知")
+                if notification_setting.notify_on_success:
+                    logger.info("调用 _send_notification 方法发送成功通知")
+                    self._send_notification(task, execution_log, success=True)
                 else:
-                    logger.info("任务没有notification_settings属性（失败情况）")
-                
-                if notification_setting and notification_setting.is_enabled:
-                    logger.info("通知设置已启用，准备发送失败通知")
-                    if notification_setting.notify_on_failure:
-                        logger.info("调用 _send_notification 方法发送失败通知")
-                        self._send_notification(task, execution_log, success=False)
+                    logger.info("通知设置中未启用成功通知")
+            else:
+                logger.info("通知设置未启用或不存在，跳过成功通知")
+            logger.info("=== 结束检查发送成功通知 ===")
+
+        except JobCancelled:
+            execution_log.status = 'CANCELLED'
+            execution_log.end_time = timezone.now()
+            execution_log.error_message = '作业已取消'
+            execution_log.save()
+            raise
+        except Exception as e:
+            # 记录执行失败
+            execution_log.status = 'FAILED'
+            execution_log.end_time = timezone.now()
+            execution_log.error_message = str(e)
+            execution_log.save()
+
+            # 更新任务统计
+            task.update_run_stats(success=False)
+            task.error_message = str(e)
+            task.save()
+
+            logger.info("=== 开始检查发送失败通知 ===")
+            # 发送失败通知（如果配置了）
+            # 检查任务是否有通知设置
+            notification_setting = None
+            if hasattr(task, 'notification_settings'):
+                try:
+                    notification_setting = task.notification_settings.first()
+                    logger.info(f"获取到通知设置（失败情况）: {notification_setting}")
+                    if notification_setting:
+                        logger.info(f"通知设置详情（失败情况） - ID: {notification_setting.id}, 是否启用: {notification_setting.is_enabled}, 失败通知: {notification_setting.notify_on_failure}")
                     else:
-                        logger.info("通知设置中未启用失败通知")
+                        logger.info("没有找到通知设置（失败情况）")
+                except Exception as e:
+                    logger.error(f"获取任务通知设置时出错（失败情况）: {e}")
+                    import traceback
+                    traceback.print_exc()
+            else:
+                logger.info("任务没有notification_settings属性（失败情况）")
+
+            if notification_setting and notification_setting.is_enabled:
+                logger.info("通知设置已启用，准备发送失败通知")
+                if notification_setting.notify_on_failure:
+                    logger.info("调用 _send_notification 方法发送失败通知")
+                    self._send_notification(task, execution_log, success=False)
                 else:
-                    logger.info("通知设置未启用或不存在，跳过失败通知")
-                logger.info("=== 结束检查发送失败通知 ===")
-        
-        # 在新线程中执行
-        thread = threading.Thread(target=execute)
-        thread.daemon = True
-        thread.start()
-    
+                    logger.info("通知设置中未启用失败通知")
+            else:
+                logger.info("通知设置未启用或不存在，跳过失败通知")
+            logger.info("=== 结束检查发送失败通知 ===")
+
     def _execute_test_suite(self, task):
         """执行测试套件"""
         from .utils import execute_test_suite
@@ -2185,13 +1994,27 @@ class ApiDashboardViewSet(viewsets.ViewSet):
         ).count()
         
         # 执行记录数量 (仅统计当前用户有权访问的)
-        history_count = RequestHistory.objects.filter(
+        histories = RequestHistory.objects.filter(
             request__collection__project_id__in=project_ids
-        ).count()
+        )
+        history_count = histories.count()
+
+        # 连接池统计 (复用率和新建连接平均耗时)
+        connection_stats = histories.filter(connection_reused__isnull=False).aggregate(
+            total=models.Count('id'),
+            reused=models.Count('id', filter=models.Q(connection_reused=True)),
+            avg_connect_time=models.Avg('connect_time'),
+        )
+        connection_reuse_rate = (
+            round(connection_stats['reused'] / connection_stats['total'] * 100, 2)
+            if connection_stats['total'] else 0
+        )
 
         return Response({
             'project_count': project_count,
             'interface_count': interface_count,
             'suite_count': suite_count,
-            'history_count': history_count
+            'history_count': history_count,
+            'connection_reuse_rate': connection_reuse_rate,
+            'avg_connect_time': round(connection_stats['avg_connect_time'] or 0, 2)
         })
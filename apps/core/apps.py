@@ -5,3 +5,7 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.core'
     verbose_name = '核心功能'
+
+    def ready(self):
+        from .scheduler import connect_signals
+        connect_signals()
@@ -0,0 +1,176 @@
+"""
+进度事件发布/订阅
+
+后台任务按频道发布进度事件，SSE 连接订阅频道并阻塞等待新事件，不再轮询数据库。
+每个事件带有频道内递增的ID，客户端断线重连时通过 Last-Event-ID 从断点继续接收。
+
+后端由 settings.EVENT_BROKER_BACKEND 指定：
+- memory: 进程内（默认），发布者和SSE连接需要在同一个进程中
+- redis:  基于 Redis Stream，支持多进程、多机部署
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _max_events():
+    return getattr(settings, 'EVENT_BROKER_MAX_EVENTS', 20000)
+
+
+def _ttl():
+    return getattr(settings, 'EVENT_BROKER_TTL', 600)
+
+
+class _Channel:
+    def __init__(self, max_events):
+        self.events = deque(maxlen=max_events)
+        self.last_seq = 0
+        self.condition = threading.Condition()
+        self.closed = False
+        self.touched_at = time.monotonic()
+
+
+class MemoryBroker:
+    """进程内事件通道，每个频道保留最近的事件用于断点续传"""
+
+    def __init__(self):
+        self._channels = {}
+        # 未关闭但长时间无活动而被清理的频道的最后事件ID，频道重新创建时继续编号
+        self._last_seqs = {}
+        self._lock = threading.Lock()
+
+    def _get_channel(self, channel):
+        with self._lock:
+            ch = self._channels.get(channel)
+            if ch is None:
+                self._purge()
+                ch = _Channel(_max_events())
+                ch.last_seq = self._last_seqs.pop(channel, 0)
+                self._channels[channel] = ch
+            return ch
+
+    def _purge(self):
+        """清理长时间无活动的频道（调用方持有锁）
+
+        未关闭的频道（任务可能只是暂时没有进度）只释放事件，保留最后事件ID，
+        之后重新发布时事件ID继续递增，持有 Last-Event-ID 的订阅者不会漏掉新事件。
+        """
+        deadline = time.monotonic() - _ttl()
+        for name in [name for name, ch in self._channels.items() if ch.touched_at < deadline]:
+            ch = self._channels.pop(name)
+            if not ch.closed:
+                self._last_seqs[name] = ch.last_seq
+
+    def publish(self, channel, data):
+        ch = self._get_channel(channel)
+        with ch.condition:
+            ch.last_seq += 1
+            ch.events.append((ch.last_seq, data))
+            ch.touched_at = time.monotonic()
+            ch.condition.notify_all()
+            return str(ch.last_seq)
+
+    def read(self, channel, last_id=None, timeout=None):
+        try:
+            after = int(last_id) if last_id else 0
+        except ValueError:
+            after = 0
+        ch = self._get_channel(channel)
+        with ch.condition:
+            if ch.last_seq <= after and not ch.closed:
+                ch.condition.wait(timeout)
+            if not ch.events or ch.last_seq <= after:
+                return []
+            # 事件ID连续，直接定位到 after 之后的位置
+            start = max(0, after - ch.events[0][0] + 1)
+            return [(str(seq), data) for seq, data in islice(ch.events, start, None)]
+
+    def close(self, channel):
+        ch = self._get_channel(channel)
+        with ch.condition:
+            ch.closed = True
+            ch.touched_at = time.monotonic()
+            ch.condition.notify_all()
+
+
+class RedisBroker:
+    """基于 Redis Stream 的事件通道"""
+
+    def __init__(self):
+        import redis
+        self._redis = redis.Redis.from_url(settings.EVENT_BROKER_REDIS_URL)
+
+    def _key(self, channel):
+        return f'events:{channel}'
+
+    def publish(self, channel, data):
+        key = self._key(channel)
+        event_id = self._redis.xadd(
+            key, {'data': json.dumps(data, ensure_ascii=False)}, maxlen=_max_events(), approximate=True
+        )
+        return event_id.decode()
+
+    def read(self, channel, last_id=None, timeout=None):
+        block = int(timeout * 1000) if timeout else None
+        result = self._redis.xread({self._key(channel): last_id or '0'}, block=block)
+        events = []
+        for _, entries in result or []:
+            for event_id, fields in entries:
+                events.append((event_id.decode(), json.loads(fields[b'data'])))
+        return events
+
+    def close(self, channel):
+        self._redis.expire(self._key(channel), _ttl())
+
+
+_backends = {
+    'memory': MemoryBroker,
+    'redis': RedisBroker,
+}
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend_name = getattr(settings, 'EVENT_BROKER_BACKEND', 'memory')
+                if backend_name not in _backends:
+                    raise ValueError(f"不支持的事件通道后端: {backend_name}")
+                _broker = _backends[backend_name]()
+    return _broker
+
+
+def publish(channel, data):
+    """发布事件，返回事件ID；发布失败只记录日志，不影响后台任务"""
+    try:
+        return get_broker().publish(channel, data)
+    except Exception as e:
+        logger.warning(f"发布事件到 {channel} 失败: {e}")
+        return None
+
+
+def read(channel, last_id=None, timeout=None):
+    """读取 last_id 之后的事件，没有新事件时最多阻塞 timeout 秒
+
+    Returns:
+        list: [(event_id, data), ...]
+    """
+    return get_broker().read(channel, last_id, timeout)
+
+
+def close(channel):
+    """标记频道结束，保留的事件在 EVENT_BROKER_TTL 秒后清理"""
+    try:
+        get_broker().close(channel)
+    except Exception as e:
+        logger.warning(f"关闭事件频道 {channel} 失败: {e}")
@@ -0,0 +1,456 @@
+"""
+后台作业队列
+
+各模块在自己的 jobs.py 中用 @job 注册作业函数，视图和调度器通过 enqueue()
+提交作业，而不是直接启动后台线程。作业记录保存在 Job 表中，支持按队列
+限制并发、失败重试和取消。
+
+执行后端由 settings.JOB_BACKEND 指定：
+- thread: 在当前进程内按队列使用线程池执行（默认，无需额外服务）
+- celery: 发送到 Celery，由独立的 worker 进程执行，服务重启不丢失作业
+- eager:  提交时立即同步执行，用于测试
+
+作业被领取时记录执行节点并获得租约（JOB_LEASE_SECONDS），执行期间由心跳线程定期续约。
+节点崩溃后租约过期，作业会被 recover_expired_jobs() 重新提交，由其他节点接管。
+
+thread 后端排队中的作业保存在进程内的线程池队列中，等待重试的作业由进程内的定时器提交，
+进程重启后这些作业不会再被执行。提交时作业记录提交节点并获得租约，心跳线程同样为其续约。
+计划执行时间（scheduled_at）已过去 JOB_RECOVER_GRACE_SECONDS 秒仍未开始、且提交节点的租约已过期
+的作业由 recover_stalled_jobs() 重新提交（调度器启动时和之后定期执行，thread 后端在进程中首次
+使用时执行一次）。作业领取时的条件更新保证重复提交的作业只执行一次。
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_discovered = False
+_current = threading.local()
+
+# 当前执行节点标识
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'
+
+
+class JobCancelled(Exception):
+    """作业在执行过程中被取消"""
+
+
+class JobDefinition:
+    def __init__(self, name, func, queue, max_retries, retry_delay, on_cancel=None):
+        self.name = name
+        self.func = func
+        self.queue = queue
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.on_cancel = on_cancel
+
+
+def job(name, queue='default', max_retries=0, retry_delay=30, on_cancel=None):
+    """注册作业函数
+
+    Args:
+        name: 作业名，提交时使用
+        queue: 所属队列（api / ui / ai），决定并发上限和 Celery 路由
+        max_retries: 执行抛出异常时的最大重试次数
+        retry_delay: 首次重试的延迟秒数，之后按指数退避
+        on_cancel: 作业被取消时调用 on_cancel(job_record, running)，running 表示作业正在执行；
+            用于通知不在检查点调用 check_cancelled() 的作业（如通过执行记录传递停止信号的AI执行）
+    """
+    def decorator(func):
+        _registry[name] = JobDefinition(name, func, queue, max_retries, retry_delay, on_cancel)
+        return func
+    return decorator
+
+
+def get_definition(name):
+    global _discovered
+    if name not in _registry and not _discovered:
+        # 导入所有应用的 jobs 模块以完成注册（worker 进程中首次执行时）
+        autodiscover_modules('jobs')
+        _discovered = True
+    try:
+        return _registry[name]
+    except KeyError:
+        raise ValueError(f"未注册的作业: {name}")
+
+
+class EagerBackend:
+    """提交时立即在当前线程中执行"""
+
+    def submit(self, job_record, countdown=0):
+        execute_job(job_record.id, manage_connections=False)
+
+    def revoke(self, job_record):
+        pass
+
+
+class ThreadBackend:
+    """进程内线程池，每个队列一个线程池"""
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+        # 接管上次进程退出时未执行的作业
+        threading.Thread(target=self._recover, name='job-recover', daemon=True).start()
+
+    def _recover(self):
+        try:
+            close_old_connections()
+            recovered = recover_stalled_jobs()
+            if recovered:
+                logger.warning(f"已重新提交 {recovered} 个未执行的作业")
+        except Exception as e:
+            logger.warning(f"重新提交未执行的作业失败: {e}")
+        finally:
+            close_old_connections()
+
+    def _get_pool(self, queue):
+        with self._lock:
+            pool = self._pools.get(queue)
+            if pool is None:
+                max_workers = settings.JOB_QUEUES.get(queue, 1)
+                pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'job-{queue}')
+                self._pools[queue] = pool
+            return pool
+
+    def submit(self, job_record, countdown=0):
+        from .models import Job
+
+        # 作业在本进程的线程池中排队，记录提交节点并由心跳线程续约，
+        # 本进程存活期间 recover_stalled_jobs() 不会把排队中的作业重复提交到其他线程池
+        Job.objects.filter(id=job_record.id, status__in=['PENDING', 'RETRYING']).update(
+            worker_id=WORKER_ID, lease_expires_at=timezone.now() + timedelta(seconds=_lease_seconds())
+        )
+        _lease_keeper.add(job_record.id, queued=True)
+        pool = self._get_pool(job_record.queue)
+        if countdown:
+            timer = threading.Timer(countdown, pool.submit, args=(execute_job, job_record.id))
+            timer.daemon = True
+            timer.start()
+        else:
+            pool.submit(execute_job, job_record.id)
+
+    def revoke(self, job_record):
+        # 排队中的作业在执行前会检查状态，无需额外处理
+        pass
+
+
+class CeleryBackend:
+    """发送到 Celery，由 worker 进程执行"""
+
+    def submit(self, job_record, countdown=0):
+        from .tasks import run_job
+        run_job.apply_async(
+            args=[job_record.id],
+            queue=job_record.queue,
+            countdown=countdown or None,
+            task_id=f'job-{job_record.id}-{job_record.attempts}'
+        )
+
+    def revoke(self, job_record):
+        from backend.celery import app
+        app.control.revoke(f'job-{job_record.id}-{job_record.attempts}')
+
+
+_backends = {
+    'eager': EagerBackend,
+    'thread': ThreadBackend,
+    'celery': CeleryBackend,
+}
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_name = getattr(settings, 'JOB_BACKEND', 'thread')
+                if backend_name not in _backends:
+                    raise ValueError(f"不支持的作业后端: {backend_name}")
+                _backend = _backends[backend_name]()
+    return _backend
+
+
+def enqueue(name, *args, created_by=None, countdown=0, **kwargs):
+    """提交作业
+
+    参数必须可以JSON序列化（一般传模型ID），作业在事务提交后才会被发送执行。
+
+    Returns:
+        Job: 作业记录
+    """
+    from .models import Job
+
+    definition = get_definition(name)
+    job_record = Job.objects.create(
+        name=name,
+        queue=definition.queue,
+        args=list(args),
+        kwargs=kwargs,
+        max_retries=definition.max_retries,
+        scheduled_at=timezone.now() + timedelta(seconds=countdown),
+        created_by=created_by
+    )
+    backend = get_backend()
+    if isinstance(backend, EagerBackend):
+        backend.submit(job_record, countdown)
+    else:
+        transaction.on_commit(lambda: backend.submit(job_record, countdown))
+    return job_record
+
+
+def cancel(job_id):
+    """取消作业
+
+    排队中或等待重试的作业直接标记为已取消；执行中的作业设置取消标记，
+    由作业函数通过 check_cancelled() 在合适的位置自行退出。
+
+    Returns:
+        bool: 作业是否处于可取消的状态
+    """
+    from .models import Job
+
+    job_record = Job.objects.filter(id=job_id).first()
+    if job_record is None:
+        return False
+
+    cancelled = Job.objects.filter(id=job_id, status__in=['PENDING', 'RETRYING']).update(
+        status='CANCELLED', cancel_requested=True, finished_at=timezone.now()
+    )
+    if cancelled:
+        get_backend().revoke(job_record)
+        _notify_cancel(job_record, running=False)
+        return True
+
+    if Job.objects.filter(id=job_id, status='RUNNING').update(cancel_requested=True):
+        _notify_cancel(job_record, running=True)
+        return True
+    return False
+
+
+def _notify_cancel(job_record, running):
+    try:
+        definition = get_definition(job_record.name)
+        if definition.on_cancel is not None:
+            definition.on_cancel(job_record, running)
+    except Exception as e:
+        logger.warning(f"作业 {job_record.name}#{job_record.id} 的取消回调执行失败: {e}")
+
+
+def _lease_seconds():
+    return getattr(settings, 'JOB_LEASE_SECONDS', 60)
+
+
+class LeaseKeeper:
+    """心跳线程，为本进程正在执行的作业和在本进程线程池中排队的作业续约"""
+
+    def __init__(self):
+        self._job_ids = set()
+        self._queued_ids = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, job_id, queued=False):
+        with self._lock:
+            (self._queued_ids if queued else self._job_ids).add(job_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='job-lease-keeper', daemon=True)
+                self._thread.start()
+
+    def discard(self, job_id):
+        with self._lock:
+            self._job_ids.discard(job_id)
+            self._queued_ids.discard(job_id)
+
+    def renew(self):
+        from .models import Job
+
+        with self._lock:
+            job_ids = list(self._job_ids)
+            queued_ids = list(self._queued_ids)
+        lease_expires_at = timezone.now() + timedelta(seconds=_lease_seconds())
+        renewed = 0
+        if job_ids:
+            renewed += Job.objects.filter(id__in=job_ids, status='RUNNING', worker_id=WORKER_ID).update(
+                lease_expires_at=lease_expires_at
+            )
+        if queued_ids:
+            renewed += Job.objects.filter(
+                id__in=queued_ids, status__in=['PENDING', 'RETRYING'], worker_id=WORKER_ID
+            ).update(lease_expires_at=lease_expires_at)
+        return renewed
+
+    def _run(self):
+        while True:
+            time.sleep(max(_lease_seconds() / 3, 1))
+            try:
+                close_old_connections()
+                self.renew()
+            except Exception as e:
+                logger.warning(f"作业续约失败: {e}")
+
+
+_lease_keeper = LeaseKeeper()
+
+
+def recover_expired_jobs():
+    """重新提交租约已过期的作业（执行节点崩溃或失联）
+
+    多个节点同时回收时通过条件更新保证每个作业只被回收一次。
+
+    Returns:
+        int: 回收的作业数
+    """
+    from .models import Job
+
+    now = timezone.now()
+    recovered = 0
+    for job_record in Job.objects.filter(status='RUNNING', lease_expires_at__lt=now):
+        expired = Job.objects.filter(id=job_record.id, status='RUNNING', lease_expires_at__lt=now)
+        # 节点失联不是作业自身的失败，在重试次数之外额外允许接管一次
+        if job_record.attempts <= job_record.max_retries + 1:
+            if expired.update(status='RETRYING', worker_id='', lease_expires_at=None, scheduled_at=now):
+                logger.warning(f"作业 {job_record.name}#{job_record.id} 的执行节点 {job_record.worker_id} 已失联，重新提交")
+                job_record.refresh_from_db()
+                get_backend().submit(job_record)
+                recovered += 1
+        else:
+            expired.update(
+                status='FAILED', error_message=f'执行节点 {job_record.worker_id} 已失联', finished_at=now
+            )
+    return recovered
+
+
+def recover_stalled_jobs():
+    """重新提交计划执行时间已过去 JOB_RECOVER_GRACE_SECONDS 秒仍未开始的排队中/等待重试的作业
+
+    这些作业所在的进程可能已经重启（thread 后端）或消息已丢失。thread 后端的提交节点仍持有
+    有效租约（进程存活，作业只是在线程池中排队）的作业不会被重新提交，避免超出队列并发限制。
+    重新提交前把计划执行时间更新为当前时间，多个节点同时回收时每个作业只被提交一次，
+    下一次回收至少在宽限期之后。
+
+    Returns:
+        int: 重新提交的作业数
+    """
+    from .models import Job
+
+    now = timezone.now()
+    threshold = now - timedelta(seconds=getattr(settings, 'JOB_RECOVER_GRACE_SECONDS', 300))
+    stalled = Job.objects.filter(status__in=['PENDING', 'RETRYING']).filter(
+        Q(scheduled_at__lt=threshold) | Q(scheduled_at__isnull=True, created_at__lt=threshold)
+    ).filter(Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now))
+    recovered = 0
+    for job_record in stalled:
+        same = Job.objects.filter(id=job_record.id, status=job_record.status).filter(
+            Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now)
+        )
+        if job_record.scheduled_at is None:
+            same = same.filter(scheduled_at__isnull=True)
+        else:
+            same = same.filter(scheduled_at=job_record.scheduled_at)
+        if same.update(scheduled_at=now):
+            logger.warning(f"作业 {job_record.name}#{job_record.id} 超过计划执行时间仍未开始，重新提交")
+            get_backend().submit(job_record)
+            recovered += 1
+    return recovered
+
+
+def current_job_id():
+    """当前线程正在执行的作业ID，不在作业中执行时返回None"""
+    return getattr(_current, 'job_id', None)
+
+
+def is_cancel_requested(job_id=None):
+    from .models import Job
+
+    job_id = job_id or current_job_id()
+    if job_id is None:
+        return False
+    return Job.objects.filter(id=job_id, cancel_requested=True).exists()
+
+
+def check_cancelled():
+    """在作业函数中调用，作业被取消时抛出 JobCancelled"""
+    if is_cancel_requested():
+        raise JobCancelled()
+
+
+def _json_result(value):
+    if value is None or isinstance(value, (dict, list, str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def execute_job(job_id, manage_connections=True):
+    """执行作业（所有后端共用），由线程池或 Celery worker 调用
+
+    Args:
+        manage_connections: 在独立线程/进程中执行时为True，执行前后清理失效的数据库连接
+    """
+    from .models import Job
+
+    if manage_connections:
+        close_old_connections()
+    try:
+        # 只有排队中/等待重试或租约已过期的作业才能被领取，
+        # 已取消或已被其他worker领取的作业直接跳过（同一消息被重复投递时也只会执行一次）
+        now = timezone.now()
+        claimed = Job.objects.filter(
+            Q(status__in=['PENDING', 'RETRYING']) | Q(status='RUNNING', lease_expires_at__lt=now),
+            id=job_id
+        ).update(
+            status='RUNNING', started_at=now, attempts=F('attempts') + 1,
+            worker_id=WORKER_ID, lease_expires_at=now + timedelta(seconds=_lease_seconds())
+        )
+        _lease_keeper.discard(job_id)
+        if not claimed:
+            return
+        job_record = Job.objects.get(id=job_id)
+        definition = get_definition(job_record.name)
+        # 结果只在本节点仍持有租约时写入，避免覆盖已被其他节点接管的作业
+        owned = Job.objects.filter(id=job_id, status='RUNNING', worker_id=WORKER_ID, attempts=job_record.attempts)
+
+        _current.job_id = job_id
+        if manage_connections:
+            _lease_keeper.add(job_id)
+        try:
+            result = definition.func(*job_record.args, **job_record.kwargs)
+        except JobCancelled:
+            owned.update(status='CANCELLED', finished_at=timezone.now())
+            logger.info(f"作业 {job_record.name}#{job_id} 已取消")
+            return
+        except Exception as e:
+            logger.error(f"作业 {job_record.name}#{job_id} 执行失败: {e}", exc_info=True)
+            if job_record.attempts <= job_record.max_retries and not is_cancel_requested(job_id):
+                delay = definition.retry_delay * (2 ** (job_record.attempts - 1))
+                if owned.update(status='RETRYING', error_message=traceback.format_exc(), lease_expires_at=None,
+                                scheduled_at=timezone.now() + timedelta(seconds=delay)):
+                    job_record.refresh_from_db()
+                    get_backend().submit(job_record, countdown=delay)
+            else:
+                owned.update(status='FAILED', error_message=traceback.format_exc(), finished_at=timezone.now())
+            return
+        finally:
+            _current.job_id = None
+            _lease_keeper.discard(job_id)
+
+        if not owned.update(status='SUCCESS', result=_json_result(result), finished_at=timezone.now()):
+            logger.warning(f"作业 {job_record.name}#{job_id} 的租约已被其他节点接管，丢弃本次执行结果")
+    finally:
+        if manage_connections:
+            close_old_connections()
@@ -1,19 +1,16 @@
 """
-Django管理命令：预下载所有WebDriver
-用法：python manage.py download_webdrivers
+Django管理命令：预下载所有WebDriver，并登记到驱动注册表
+用法：python manage.py download_webdrivers [--browsers chrome firefox edge]
 """
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.firefox.service import Service as FirefoxService
-from selenium.webdriver.edge.service import Service as EdgeService
-from webdriver_manager.chrome import ChromeDriverManager
-from webdriver_manager.firefox import GeckoDriverManager
-from webdriver_manager.microsoft import EdgeChromiumDriverManager
 import time
 
+from apps.ui_automation import webdriver_registry
+
 
 class Command(BaseCommand):
-    help = '预下载所有浏览器的WebDriver驱动程序'
+    help = '预下载所有浏览器的WebDriver驱动程序，并登记到驱动注册表（UI_WEBDRIVER_REGISTRY）'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -32,50 +29,25 @@ class Command(BaseCommand):
         success_count = 0
         failed_browsers = []
 
-        if 'chrome' in browsers:
-            self.stdout.write('正在下载 ChromeDriver...')
-            try:
-                start_time = time.time()
-                driver_path = ChromeDriverManager().install()
-                elapsed = time.time() - start_time
-                self.stdout.write(self.style.SUCCESS(
-                    f'✓ ChromeDriver 下载成功 (耗时: {elapsed:.1f}秒)'
-                ))
-                self.stdout.write(f'  路径: {driver_path}\n')
-                success_count += 1
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'✗ ChromeDriver 下载失败: {str(e)}\n'))
-                failed_browsers.append(('Chrome', str(e)))
-
-        if 'firefox' in browsers:
-            self.stdout.write('正在下载 GeckoDriver (Firefox)...')
-            try:
-                start_time = time.time()
-                driver_path = GeckoDriverManager().install()
-                elapsed = time.time() - start_time
-                self.stdout.write(self.style.SUCCESS(
-                    f'✓ GeckoDriver 下载成功 (耗时: {elapsed:.1f}秒)'
-                ))
-                self.stdout.write(f'  路径: {driver_path}\n')
-                success_count += 1
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'✗ GeckoDriver 下载失败: {str(e)}\n'))
-                failed_browsers.append(('Firefox', str(e)))
-
-        if 'edge' in browsers:
-            self.stdout.write('正在下载 EdgeDriver...')
+        driver_names = {'chrome': 'ChromeDriver', 'firefox': 'GeckoDriver (Firefox)', 'edge': 'EdgeDriver'}
+        for browser in browsers:
+            if browser not in webdriver_registry.DRIVER_MANAGERS:
+                self.stdout.write(self.style.WARNING(f'跳过不支持的浏览器: {browser}\n'))
+                continue
+            self.stdout.write(f'正在下载 {driver_names[browser]}...')
             try:
                 start_time = time.time()
-                driver_path = EdgeChromiumDriverManager().install()
+                entry = webdriver_registry.resolve(browser)
                 elapsed = time.time() - start_time
                 self.stdout.write(self.style.SUCCESS(
-                    f'✓ EdgeDriver 下载成功 (耗时: {elapsed:.1f}秒)'
+                    f'✓ {driver_names[browser]} 下载成功 (耗时: {elapsed:.1f}秒)'
                 ))
-                self.stdout.write(f'  路径: {driver_path}\n')
+                self.stdout.write(f"  路径: {entry['driver_path']}")
+                self.stdout.write(f"  驱动版本: {entry['driver_version']}，浏览器版本: {entry['browser_version']}\n")
                 success_count += 1
             except Exception as e:
-                self.stdout.write(self.style.ERROR(f'✗ EdgeDriver 下载失败: {str(e)}\n'))
-                failed_browsers.append(('Edge', str(e)))
+                self.stdout.write(self.style.ERROR(f'✗ {driver_names[browser]} 下载失败: {str(e)}\n'))
+                failed_browsers.append((browser.capitalize(), str(e)))
 
         # 总结
         self.stdout.write('\n' + '='*60)
@@ -87,4 +59,4 @@ class Command(BaseCommand):
                 self.stdout.write(f'  - {browser}: {error}')
 
         self.stdout.write('\n' + '='*60)
-        self.stdout.write(self.style.SUCCESS('\n驱动程序已缓存，后续测试执行将会更快！'))
+        self.stdout.write(self.style.SUCCESS(f'\n驱动程序已登记到 {settings.UI_WEBDRIVER_REGISTRY}，后续创建浏览器会话不再解析驱动！'))
@@ -0,0 +1,38 @@
+"""
+Django管理命令：把执行记录中内嵌的 base64 截图转存到截图存储
+用法：python manage.py externalize_screenshots [--batch-size 100]
+"""
+from django.core.management.base import BaseCommand
+
+from apps.ui_automation.models import TestCaseExecution, TestExecution
+from apps.ui_automation.screenshot_store import externalize_screenshots
+
+
+class Command(BaseCommand):
+    help = '把UI自动化执行记录中的 data URL 截图转存到截图存储，记录中只保留引用'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='每批处理的记录数')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        count = 0
+        queryset = TestCaseExecution.objects.filter(screenshots__icontains='data:image').only('id', 'screenshots')
+        for execution in queryset.iterator(chunk_size=batch_size):
+            execution.screenshots = externalize_screenshots(execution.screenshots)
+            execution.save(update_fields=['screenshots'])
+            count += 1
+        self.stdout.write(f'用例执行记录: 已处理 {count} 条')
+
+        count = 0
+        queryset = TestExecution.objects.filter(result_data__icontains='data:image').only('id', 'result_data')
+        for execution in queryset.iterator(chunk_size=batch_size):
+            for case_result in execution.result_data.get('test_cases', []):
+                if case_result.get('screenshots'):
+                    case_result['screenshots'] = externalize_screenshots(case_result['screenshots'])
+            execution.save(update_fields=['result_data'])
+            count += 1
+        self.stdout.write(f'套件执行记录: 已处理 {count} 条')
+
+        self.stdout.write(self.style.SUCCESS('截图转存完成'))
@@ -61,3 +61,53 @@ class UnifiedNotificationConfig(models.Model):
                     bot_data['secret'] = bot_config.get('secret')
                 bots.append(bot_data)
         return bots
+
+
+class Job(models.Model):
+    """后台作业模型 - 记录通过作业队列执行的套件、定时任务和AI任务"""
+
+    STATUS_CHOICES = [
+        ('PENDING', '排队中'),
+        ('RUNNING', '执行中'),
+        ('RETRYING', '等待重试'),
+        ('SUCCESS', '成功'),
+        ('FAILED', '失败'),
+        ('CANCELLED', '已取消'),
+    ]
+
+    name = models.CharField(max_length=100, verbose_name='作业名称', help_text='注册的作业名，如 api.run_scheduled_task')
+    queue = models.CharField(max_length=20, verbose_name='队列')
+    args = models.JSONField(default=list, blank=True, verbose_name='位置参数')
+    kwargs = models.JSONField(default=dict, blank=True, verbose_name='关键字参数')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING', verbose_name='状态')
+    attempts = models.IntegerField(default=0, verbose_name='已执行次数')
+    max_retries = models.IntegerField(default=0, verbose_name='最大重试次数')
+    cancel_requested = models.BooleanField(default=False, verbose_name='是否请求取消')
+    result = models.JSONField(null=True, blank=True, verbose_name='执行结果')
+    error_message = models.TextField(blank=True, verbose_name='错误信息')
+    worker_id = models.CharField(max_length=100, blank=True, verbose_name='执行节点',
+                                 help_text='主机名:进程号，thread 后端排队中的作业为提交节点')
+    lease_expires_at = models.DateTimeField(null=True, blank=True, verbose_name='租约到期时间',
+                                            help_text='节点定期续约，过期说明节点已崩溃，作业可被其他节点接管')
+    scheduled_at = models.DateTimeField(null=True, blank=True, verbose_name='计划执行时间',
+                                        help_text='排队中的作业为提交时间，等待重试的作业为重试时间，超过后仍未执行的作业会被重新提交')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='创建者')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='开始时间')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='结束时间')
+
+    class Meta:
+        db_table = 'core_jobs'
+        verbose_name = '后台作业'
+        verbose_name_plural = '后台作业'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['queue', 'status']),
+            models.Index(fields=['status', 'lease_expires_at']),
+            models.Index(fields=['status', 'scheduled_at']),
+            models.Index(fields=['name']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} - {self.get_status_display()}"
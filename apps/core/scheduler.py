@@ -0,0 +1,292 @@
+"""
+事件驱动的定时任务调度器
+
+调度器在内存中维护一个按下次运行时间排序的最小堆，休眠到最早的任务到期时才查询
+数据库（status='ACTIVE' AND next_run_time <= now，使用 (status, next_run_time) 联合索引）。
+
+定时任务创建、修改、暂停或删除后（事务提交时），Web进程通过 UDP 向调度器发送唤醒消息，
+消息中带有任务最新的下次运行时间，调度器据此更新堆并重新计算休眠时间，空闲期间不产生
+数据库查询。唤醒消息丢失或绕过ORM修改的任务由定期全量同步（SCHEDULER_RESYNC_INTERVAL）兜底。
+
+可以同时运行多个调度器实例：到期任务通过条件更新 next_run_time 领取，领取和提交作业在
+同一个事务中完成，每次触发只有一个实例能领取成功；实例在提交前崩溃时事务回滚，任务由其他
+实例接管。调度器同时负责回收租约过期的作业和进程重启后未执行的作业
+（见 job_queue.recover_expired_jobs / recover_stalled_jobs）。
+"""
+import heapq
+import logging
+import select
+import socket
+import time
+from datetime import datetime, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 调度的任务类型 -> 定时任务模型
+TASK_MODELS = {
+    'api': 'api_testing.ScheduledTask',
+    'ui': 'ui_automation.UiScheduledTask',
+}
+
+# 分发失败（下次运行时间没有被推进）的任务多少秒后重试
+DISPATCH_RETRY_DELAY = 60
+
+
+def _wakeup_address():
+    address = getattr(settings, 'SCHEDULER_WAKEUP_ADDRESS', '')
+    if not address:
+        return None
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def _encode_message(kind, task_id, next_run_time):
+    return f"{kind}|{task_id}|{next_run_time.isoformat() if next_run_time else ''}".encode()
+
+
+def _decode_message(data):
+    kind, task_id, next_run_time = data.decode().split('|')
+    return kind, int(task_id), datetime.fromisoformat(next_run_time) if next_run_time else None
+
+
+def notify_task_changed(kind, task_id, next_run_time):
+    """通知调度器任务的下次运行时间已变化，next_run_time 为 None 表示不再调度"""
+    address = _wakeup_address()
+    if address is None:
+        return
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(_encode_message(kind, task_id, next_run_time), address)
+    except OSError as e:
+        # 调度器未运行或地址不可达时不影响业务操作，由定期同步兜底
+        logger.debug(f"发送调度器唤醒消息失败: {e}")
+
+
+def _make_handlers(kind):
+    def on_save(sender, instance, **kwargs):
+        next_run_time = instance.next_run_time if instance.status == 'ACTIVE' else None
+        transaction.on_commit(lambda: notify_task_changed(kind, instance.pk, next_run_time))
+
+    def on_delete(sender, instance, **kwargs):
+        task_id = instance.pk
+        transaction.on_commit(lambda: notify_task_changed(kind, task_id, None))
+
+    return on_save, on_delete
+
+
+def connect_signals():
+    """定时任务保存或删除时通知调度器"""
+    for kind, model_label in TASK_MODELS.items():
+        on_save, on_delete = _make_handlers(kind)
+        post_save.connect(on_save, sender=model_label, weak=False, dispatch_uid=f'scheduler_save_{kind}')
+        post_delete.connect(on_delete, sender=model_label, weak=False, dispatch_uid=f'scheduler_delete_{kind}')
+
+
+class TaskScheduler:
+    """定时任务调度器
+
+    Args:
+        dispatchers: 任务类型 -> 分发函数，分发函数接收已领取的任务（next_run_time 已推进），
+            在领取事务中提交执行，返回是否已提交；抛出异常时领取被回滚，任务稍后重试
+        resync_interval: 全量同步间隔（秒），0 表示只在启动时同步
+    """
+
+    def __init__(self, dispatchers, resync_interval=None):
+        self.dispatchers = dispatchers
+        if resync_interval is None:
+            resync_interval = getattr(settings, 'SCHEDULER_RESYNC_INTERVAL', 600)
+        self.resync_interval = resync_interval
+        self._heap = []
+        self._next_runs = {}
+        self._socket = None
+        self._last_sync = None
+        self._last_recover = None
+
+    def open(self):
+        """监听唤醒消息，端口被占用时退化为只依赖定期同步"""
+        address = _wakeup_address()
+        if address is None or self._socket is not None:
+            return
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.bind(address)
+        except OSError as e:
+            sock.close()
+            logger.warning(f"无法监听调度器唤醒地址 {address[0]}:{address[1]}: {e}，任务变更将在下次同步时生效")
+            return
+        sock.setblocking(False)
+        self._socket = sock
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def schedule(self, kind, task_id, next_run_time):
+        """更新任务的下次运行时间，旧的堆条目在弹出时被丢弃"""
+        key = (kind, task_id)
+        if next_run_time is None:
+            self._next_runs.pop(key, None)
+            return
+        self._next_runs[key] = next_run_time
+        heapq.heappush(self._heap, (next_run_time, kind, task_id))
+
+    def next_due_time(self):
+        """最早的下次运行时间，没有待调度任务时返回 None"""
+        while self._heap:
+            run_time, kind, task_id = self._heap[0]
+            if self._next_runs.get((kind, task_id)) == run_time:
+                return run_time
+            heapq.heappop(self._heap)
+        return None
+
+    def pending_count(self):
+        return len(self._next_runs)
+
+    def sync(self):
+        """从数据库加载所有激活任务的下次运行时间"""
+        self._heap = []
+        self._next_runs = {}
+        for kind, model_label in TASK_MODELS.items():
+            model = apps.get_model(model_label)
+            rows = model.objects.filter(status='ACTIVE', next_run_time__isnull=False).values_list('id', 'next_run_time')
+            for task_id, next_run_time in rows:
+                self.schedule(kind, task_id, next_run_time)
+        self._last_sync = time.monotonic()
+
+    def claim(self, model, task):
+        """领取到期任务：只有 next_run_time 仍是查询到的值时才能推进成功"""
+        next_run_time = task.calculate_next_run()
+        claimed = model.objects.filter(
+            pk=task.pk, status='ACTIVE', next_run_time=task.next_run_time
+        ).update(next_run_time=next_run_time)
+        if claimed:
+            task.next_run_time = next_run_time
+        return bool(claimed)
+
+    def dispatch(self, kind, model, task, now):
+        """领取并分发一个任务，返回是否已提交执行"""
+        try:
+            with transaction.atomic():
+                if not self.claim(model, task):
+                    # 已被其他调度器实例领取
+                    task.refresh_from_db(fields=['status', 'next_run_time'])
+                    return False
+                return bool(self.dispatchers[kind](task))
+        except Exception as e:
+            logger.error(f"分发定时任务 {kind}#{task.pk} 失败: {e}", exc_info=True)
+            task.next_run_time = now + timedelta(seconds=DISPATCH_RETRY_DELAY)
+            return False
+
+    def run_due(self, now=None, kinds=None):
+        """分发所有到期任务
+
+        Args:
+            kinds: 要检查的任务类型，默认为堆中已到期的类型
+
+        Returns:
+            dict: 任务类型 -> 提交的任务数
+        """
+        now = now or timezone.now()
+        popped = {}
+        while True:
+            run_time = self.next_due_time()
+            if run_time is None or run_time > now:
+                break
+            _, kind, task_id = heapq.heappop(self._heap)
+            self._next_runs.pop((kind, task_id), None)
+            popped.setdefault(kind, set()).add(task_id)
+
+        counts = {}
+        for kind in (kinds if kinds is not None else popped):
+            model = apps.get_model(TASK_MODELS[kind])
+            tasks = list(model.objects.filter(status='ACTIVE', next_run_time__lte=now).order_by('next_run_time'))
+            counts[kind] = 0
+            for task in tasks:
+                if self.dispatch(kind, model, task, now):
+                    counts[kind] += 1
+                self.schedule(kind, task.id, task.next_run_time if task.status == 'ACTIVE' else None)
+
+            # 堆中到期但数据库中已被修改的任务（唤醒消息丢失），按数据库中的时间重新调度
+            missing = popped.get(kind, set()) - {task.id for task in tasks}
+            if missing:
+                rows = model.objects.filter(id__in=missing, status='ACTIVE').values_list('id', 'next_run_time')
+                for task_id, next_run_time in rows:
+                    self.schedule(kind, task_id, next_run_time)
+        return counts
+
+    @property
+    def recover_interval(self):
+        return getattr(settings, 'JOB_LEASE_SECONDS', 60)
+
+    def recover_jobs(self):
+        from .job_queue import recover_expired_jobs, recover_stalled_jobs
+
+        recovered = recover_expired_jobs()
+        if recovered:
+            logger.warning(f"已重新提交 {recovered} 个执行节点失联的作业")
+        stalled = recover_stalled_jobs()
+        if stalled:
+            logger.warning(f"已重新提交 {stalled} 个超过计划执行时间仍未开始的作业")
+        self._last_recover = time.monotonic()
+
+    def wait(self, timeout):
+        """休眠到超时或收到唤醒消息，timeout 为 None 时一直等待"""
+        if self._socket is None:
+            time.sleep(timeout if timeout is not None else 60)
+            return
+        readable, _, _ = select.select([self._socket], [], [], timeout)
+        while readable:
+            try:
+                data, _ = self._socket.recvfrom(1024)
+            except BlockingIOError:
+                break
+            try:
+                kind, task_id, next_run_time = _decode_message(data)
+            except ValueError:
+                logger.warning(f"忽略无效的调度器唤醒消息: {data!r}")
+                continue
+            if kind in TASK_MODELS:
+                self.schedule(kind, task_id, next_run_time)
+
+    def run_forever(self, on_dispatch=None):
+        """持续调度，直到进程退出
+
+        Args:
+            on_dispatch: 每次分发后的回调，参数为 run_due 的返回值
+        """
+        self.open()
+        close_old_connections()
+        self.sync()
+        self.recover_jobs()
+        while True:
+            now = timezone.now()
+            due = self.next_due_time()
+            if due is not None and due <= now:
+                close_old_connections()
+                counts = self.run_due(now)
+                if on_dispatch:
+                    on_dispatch(counts)
+                continue
+
+            timeout = (due - now).total_seconds() if due is not None else None
+            recover_remaining = self._last_recover + self.recover_interval - time.monotonic()
+            if recover_remaining <= 0:
+                close_old_connections()
+                self.recover_jobs()
+                continue
+            timeout = recover_remaining if timeout is None else min(timeout, recover_remaining)
+            if self.resync_interval:
+                remaining = self._last_sync + self.resync_interval - time.monotonic()
+                if remaining <= 0:
+                    close_old_connections()
+                    self.sync()
+                    continue
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            self.wait(timeout)
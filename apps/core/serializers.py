@@ -2,7 +2,7 @@
 Core 应用序列化器
 """
 from rest_framework import serializers
-from .models import UnifiedNotificationConfig
+from .models import UnifiedNotificationConfig, Job
 
 
 class UnifiedNotificationConfigSerializer(serializers.ModelSerializer):
@@ -32,3 +32,19 @@ class UnifiedNotificationConfigSerializer(serializers.ModelSerializer):
                 'enable_api_testing': bot.get('enable_api_testing')
             })
         return display_list
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """后台作业序列化器"""
+
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'name', 'queue', 'args', 'kwargs', 'status', 'status_display',
+            'attempts', 'max_retries', 'cancel_requested', 'result', 'error_message',
+            'worker_id', 'lease_expires_at',
+            'created_by', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
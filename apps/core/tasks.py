@@ -0,0 +1,13 @@
+"""
+Core 应用的 Celery 任务
+
+所有注册的作业都通过 run_job 这一个 Celery 任务执行，作业名和参数保存在 Job 表中。
+"""
+from celery import shared_task
+
+from .job_queue import execute_job
+
+
+@shared_task(name='core.run_job', ignore_result=True)
+def run_job(job_id):
+    execute_job(job_id)
@@ -0,0 +1,235 @@
+import socket
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from apps.api_testing.models import ScheduledTask
+
+from . import job_queue
+from .event_broker import MemoryBroker
+from .job_queue import job, enqueue, cancel, check_cancelled
+from .models import Job
+from .scheduler import TaskScheduler, notify_task_changed
+
+User = get_user_model()
+
+_calls = []
+
+
+@job('test.add')
+def add_job(a, b):
+    _calls.append((a, b))
+    return a + b
+
+
+@job('test.flaky', max_retries=2, retry_delay=0)
+def flaky_job():
+    _calls.append('flaky')
+    if len(_calls) < 3:
+        raise RuntimeError('temporary error')
+    return 'done'
+
+
+@job('test.with_cancel_hook', on_cancel=lambda job_record, running: _calls.append(('cancelled', running)))
+def cancel_hook_job():
+    return 'done'
+
+
+@job('test.cancel_self')
+def cancel_self_job():
+    cancel(job_queue.current_job_id())
+    check_cancelled()
+
+
+@override_settings(JOB_BACKEND='eager')
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        _calls.clear()
+        job_queue._backend = None
+
+    def tearDown(self):
+        job_queue._backend = None
+
+    def test_enqueue_runs_job(self):
+        """测试提交的作业被执行并记录结果"""
+        job_record = enqueue('test.add', 1, b=2)
+        job_record.refresh_from_db()
+
+        self.assertEqual(job_record.status, 'SUCCESS')
+        self.assertEqual(job_record.result, 3)
+        self.assertEqual(job_record.attempts, 1)
+        self.assertEqual(_calls, [(1, 2)])
+
+    def test_failed_job_is_retried(self):
+        """测试失败的作业按重试次数重新执行"""
+        job_record = enqueue('test.flaky')
+        job_record.refresh_from_db()
+
+        self.assertEqual(job_record.status, 'SUCCESS')
+        self.assertEqual(job_record.attempts, 3)
+        self.assertEqual(job_record.result, 'done')
+
+    def test_expired_lease_is_recovered(self):
+        """测试执行节点失联后作业被重新提交"""
+        job_record = Job.objects.create(
+            name='test.add', queue='default', args=[2, 3], status='RUNNING', attempts=1,
+            worker_id='crashed-host:1', lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        fresh = Job.objects.create(
+            name='test.add', queue='default', args=[1, 1], status='RUNNING', attempts=1,
+            worker_id='other-host:1', lease_expires_at=timezone.now() + timedelta(seconds=60)
+        )
+
+        self.assertEqual(job_queue.recover_expired_jobs(), 1)
+        job_record.refresh_from_db()
+        self.assertEqual(job_record.status, 'SUCCESS')
+        self.assertEqual(job_record.result, 5)
+        self.assertEqual(job_record.worker_id, job_queue.WORKER_ID)
+        self.assertEqual(Job.objects.get(id=fresh.id).status, 'RUNNING')
+
+    def test_cancel_notifies_job(self):
+        """测试取消排队中和执行中的作业时调用作业的取消回调"""
+        pending = Job.objects.create(name='test.with_cancel_hook', queue='default')
+        running = Job.objects.create(name='test.with_cancel_hook', queue='default', status='RUNNING')
+
+        self.assertTrue(cancel(pending.id))
+        self.assertTrue(cancel(running.id))
+        self.assertEqual(_calls, [('cancelled', False), ('cancelled', True)])
+        self.assertTrue(Job.objects.get(id=running.id).cancel_requested)
+
+    def test_stalled_jobs_are_resubmitted(self):
+        """测试进程重启后未执行的排队中/等待重试的作业被重新提交"""
+        stale = timezone.now() - timedelta(seconds=600)
+        pending = Job.objects.create(name='test.add', queue='default', args=[1, 2], scheduled_at=stale)
+        retrying = Job.objects.create(name='test.add', queue='default', args=[3, 4], status='RETRYING',
+                                      attempts=1, max_retries=1, scheduled_at=stale)
+        fresh = Job.objects.create(name='test.add', queue='default', args=[5, 6], scheduled_at=timezone.now())
+        # 提交节点仍在续约：作业只是在该进程的线程池中排队，不重复提交
+        queued = Job.objects.create(name='test.add', queue='default', args=[7, 8], scheduled_at=stale,
+                                    worker_id='busy-host:1', lease_expires_at=timezone.now() + timedelta(seconds=60))
+        orphaned = Job.objects.create(name='test.add', queue='default', args=[9, 10], scheduled_at=stale,
+                                      worker_id='dead-host:1', lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(job_queue.recover_stalled_jobs(), 3)
+        self.assertEqual(Job.objects.get(id=pending.id).result, 3)
+        self.assertEqual(Job.objects.get(id=retrying.id).result, 7)
+        self.assertEqual(Job.objects.get(id=orphaned.id).result, 19)
+        self.assertEqual(Job.objects.get(id=fresh.id).status, 'PENDING')
+        self.assertEqual(Job.objects.get(id=queued.id).status, 'PENDING')
+        self.assertEqual(job_queue.recover_stalled_jobs(), 0)
+
+    def test_running_job_can_be_cancelled(self):
+        """测试执行中的作业在检查点退出"""
+        job_record = enqueue('test.cancel_self')
+        job_record.refresh_from_db()
+
+        self.assertEqual(job_record.status, 'CANCELLED')
+        self.assertFalse(cancel(job_record.id))
+        self.assertEqual(Job.objects.count(), 1)
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class TaskSchedulerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        self.now = timezone.now()
+        self.dispatched = []
+
+    def _create_task(self, name, next_run_time, status='ACTIVE'):
+        return ScheduledTask.objects.create(
+            name=name, task_type='API_REQUEST', trigger_type='INTERVAL', interval_seconds=30,
+            status=status, next_run_time=next_run_time, created_by=self.user
+        )
+
+    def _dispatch(self, task):
+        self.dispatched.append(task.name)
+        return True
+
+    def test_dispatch_due_tasks_and_reschedule(self):
+        """测试只分发到期任务并按新的运行时间重新入堆"""
+        self._create_task('已到期', self.now - timedelta(seconds=1))
+        later = self._create_task('未到期', self.now + timedelta(seconds=20))
+        self._create_task('已暂停', self.now - timedelta(seconds=5), status='PAUSED')
+
+        scheduler = TaskScheduler({'api': self._dispatch, 'ui': self._dispatch}, resync_interval=0)
+        scheduler.sync()
+        self.assertEqual(scheduler.pending_count(), 2)
+
+        counts = scheduler.run_due(self.now)
+        self.assertEqual(counts, {'api': 1})
+        self.assertEqual(self.dispatched, ['已到期'])
+        self.assertEqual(scheduler.next_due_time(), later.next_run_time)
+        self.assertEqual(scheduler.run_due(self.now), {})
+
+    def test_task_claimed_by_one_scheduler(self):
+        """测试多个调度器实例同时到期时只有一个领取成功"""
+        self._create_task('已到期', self.now - timedelta(seconds=1))
+        first = TaskScheduler({'api': self._dispatch, 'ui': self._dispatch}, resync_interval=0)
+        second = TaskScheduler({'api': self._dispatch, 'ui': self._dispatch}, resync_interval=0)
+        first.sync()
+        second.sync()
+
+        # 第二个实例查询到的是过期的任务快照
+        stale_task = ScheduledTask.objects.get()
+        self.assertEqual(first.run_due(self.now), {'api': 1})
+        self.assertFalse(second.dispatch('api', ScheduledTask, stale_task, self.now))
+        self.assertEqual(self.dispatched, ['已到期'])
+
+    def test_failed_dispatch_rolls_back_claim(self):
+        """测试提交失败时领取被回滚，任务稍后重试"""
+        task = self._create_task('已到期', self.now - timedelta(seconds=1))
+
+        def broken_dispatch(task):
+            raise RuntimeError('queue unavailable')
+
+        scheduler = TaskScheduler({'api': broken_dispatch, 'ui': broken_dispatch}, resync_interval=0)
+        scheduler.sync()
+        self.assertEqual(scheduler.run_due(self.now), {'api': 0})
+
+        self.assertEqual(ScheduledTask.objects.get().next_run_time, task.next_run_time)
+        self.assertEqual(scheduler.next_due_time(), self.now + timedelta(seconds=60))
+
+    def test_wakeup_message_updates_schedule(self):
+        """测试唤醒消息更新任务的下次运行时间"""
+        task = self._create_task('任务', self.now + timedelta(hours=1))
+
+        with override_settings(SCHEDULER_WAKEUP_ADDRESS=f'127.0.0.1:{_free_port()}'):
+            scheduler = TaskScheduler({'api': self._dispatch, 'ui': self._dispatch}, resync_interval=0)
+            scheduler.open()
+            try:
+                scheduler.sync()
+                soon = self.now + timedelta(seconds=5)
+                notify_task_changed('api', task.id, soon)
+                scheduler.wait(timeout=2)
+                self.assertEqual(scheduler.next_due_time(), soon)
+
+                notify_task_changed('api', task.id, None)
+                scheduler.wait(timeout=2)
+                self.assertIsNone(scheduler.next_due_time())
+            finally:
+                scheduler.close()
+
+
+class MemoryBrokerTestCase(SimpleTestCase):
+    @override_settings(EVENT_BROKER_TTL=0)
+    def test_idle_open_channel_keeps_sequence(self):
+        """测试长时间无活动的未关闭频道被清理后，事件ID继续递增"""
+        broker = MemoryBroker()
+        broker.publish('task-1', {'step': 1})
+        self.assertEqual(broker.publish('task-1', {'step': 2}), '2')
+        broker.publish('done', {})
+        broker.close('done')
+
+        # 创建其他频道时清理无活动的频道
+        broker.publish('task-2', {})
+        self.assertNotIn('task-1', broker._channels)
+        self.assertEqual(broker.publish('task-1', {'step': 3}), '3')
+        self.assertEqual(broker.read('task-1', '2', timeout=0), [('3', {'step': 3})])
+        self.assertNotIn('done', broker._last_seqs)
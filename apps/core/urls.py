@@ -4,10 +4,11 @@ Core 应用路由
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from .views import UnifiedNotificationConfigViewSet
+from .views import UnifiedNotificationConfigViewSet, JobViewSet
 
 router = DefaultRouter()
 router.register(r'notification-configs', UnifiedNotificationConfigViewSet, basename='unified-notification-config')
+router.register(r'jobs', JobViewSet, basename='job')
 
 urlpatterns = [
     path('', include(router.urls)),
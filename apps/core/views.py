@@ -8,8 +8,9 @@ from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 
-from .models import UnifiedNotificationConfig
-from .serializers import UnifiedNotificationConfigSerializer
+from .models import UnifiedNotificationConfig, Job
+from .serializers import UnifiedNotificationConfigSerializer, JobSerializer
+from . import job_queue
 
 import logging
 logger = logging.getLogger(__name__)
@@ -58,3 +59,31 @@ class UnifiedNotificationConfigViewSet(viewsets.ModelViewSet):
         configs = UnifiedNotificationConfig.objects.filter(is_active=True)
         serializer = self.get_serializer(configs, many=True)
         return Response(serializer.data)
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """后台作业视图集（只读，支持取消）"""
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['name', 'queue', 'status']
+    ordering_fields = ['created_at', 'started_at', 'finished_at']
+    ordering = ['-created_at']
+
+    def get_queryset(self):
+        """管理员可以看到所有作业，普通用户只能看到自己提交的作业"""
+        queryset = super().get_queryset()
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(created_by=self.request.user)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """取消作业"""
+        job = self.get_object()
+        if not job_queue.cancel(job.id):
+            return Response({'error': '作业已结束，无法取消'}, status=status.HTTP_400_BAD_REQUEST)
+        job.refresh_from_db()
+        logger.info(f"取消后台作业: {job.name}#{job.id}")
+        return Response(self.get_serializer(job).data)
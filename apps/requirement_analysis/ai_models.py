@@ -5,12 +5,12 @@ AI模型配置和服务
 
 from django.db import models
 from django.contrib.auth import get_user_model
-import json
 import httpx
-import asyncio
 from typing import Dict, Any, List
 import logging
 
+from .llm_gateway import get_gateway
+
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
@@ -141,11 +141,6 @@ class AIModelService:
     @staticmethod
     async def call_openai_compatible_api(config: AIModelConfig, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         """调用OpenAI兼容格式的API"""
-        headers = {
-            'Authorization': f'Bearer {config.api_key}',
-            'Content-Type': 'application/json'
-        }
-        
         data = {
             'model': config.model_name,
             'messages': messages,
@@ -154,35 +149,10 @@ class AIModelService:
             'top_p': config.top_p,
             'stream': False
         }
-        
-        # 确保base_url不以/结尾
-        base_url = config.base_url.rstrip('/')
-        # 如果用户没有输入完整的v1/chat/completions路径，尝试智能补全
-        if not base_url.endswith('/chat/completions'):
-            if base_url.endswith('/v1'):
-                url = f"{base_url}/chat/completions"
-            else:
-                # 默认假设是根路径，尝试添加 v1/chat/completions
-                # 但对于某些API（如DeepSeek），base_url可能已经是 https://api.deepseek.com
-                url = f"{base_url}/v1/chat/completions"
-        else:
-            url = base_url
-            
+
         try:
-            # Increase timeout to 120s for long generation tasks
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(
-                    url,
-                    headers=headers,
-                    json=data
-                )
-                
-                if response.status_code != 200:
-                    error_detail = response.text
-                    logger.error(f"API调用返回错误: Status={response.status_code}, Body={error_detail}")
-                    
-                response.raise_for_status()
-                return response.json()
+            # 通过网关调用：复用连接池，受全局和服务商并发限制，429/5xx自动重试
+            return await get_gateway().chat(config, data)
         except httpx.HTTPStatusError as e:
             provider_name = config.get_model_type_display()
             error_msg = f"{provider_name} API返回错误 {e.response.status_code}: {e.response.text}"
@@ -4,4 +4,11 @@ from django.apps import AppConfig
 class RequirementAnalysisConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.requirement_analysis'
-    verbose_name = '需求分析'
\ No newline at end of file
+    verbose_name = '需求分析'
+    def ready(self):
+        from django.db.models.signals import pre_save, post_save
+        from .progress import task_saving, task_saved
+        pre_save.connect(task_saving, sender='requirement_analysis.TestCaseGenerationTask',
+                         dispatch_uid='generation_task_progress_sync')
+        post_save.connect(task_saved, sender='requirement_analysis.TestCaseGenerationTask',
+                          dispatch_uid='generation_task_progress')
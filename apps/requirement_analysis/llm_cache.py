@@ -0,0 +1,200 @@
+"""
+大模型响应缓存
+
+缓存键是请求内容的哈希：base_url 加上除 stream 以外的全部请求参数（model、messages、
+temperature、top_p、max_tokens），同样的提示词和模型配置再次调用时直接返回缓存的响应。
+流式和非流式调用共用同一份缓存，流式命中时一次性输出完整内容。
+
+缓存默认关闭，由 settings.LLM_CACHE_BACKEND 开启：
+- db:   保存在 LLMResponseCache 表中，多进程共享
+- file: 保存在 LLM_CACHE_DIR 目录下，每个键一个JSON文件
+
+只缓存 temperature 不超过 LLM_CACHE_MAX_TEMPERATURE 的调用（默认只缓存 temperature=0 的确定性输出），
+缓存条目在 LLM_CACHE_TTL 秒后过期，超过 LLM_CACHE_MAX_ENTRIES 条时淘汰最久未使用的条目。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(config, payload):
+    """计算请求的缓存键"""
+    params = {key: value for key, value in payload.items() if key != 'stream'}
+    raw = json.dumps([config.base_url.rstrip('/'), params], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _ttl():
+    return getattr(settings, 'LLM_CACHE_TTL', 86400)
+
+
+def _max_entries():
+    return getattr(settings, 'LLM_CACHE_MAX_ENTRIES', 1000)
+
+
+class DatabaseCache:
+    """基于 LLMResponseCache 表的缓存"""
+
+    def get(self, key):
+        from .models import LLMResponseCache
+
+        now = timezone.now()
+        entry = LLMResponseCache.objects.filter(key=key, expires_at__gt=now).only('id', 'response').first()
+        if entry is None:
+            return None
+        LLMResponseCache.objects.filter(id=entry.id).update(
+            hit_count=F('hit_count') + 1, last_used_at=now
+        )
+        return entry.response
+
+    def set(self, key, model_name, response):
+        from .models import LLMResponseCache
+
+        now = timezone.now()
+        LLMResponseCache.objects.update_or_create(key=key, defaults={
+            'model_name': model_name,
+            'response': response,
+            'last_used_at': now,
+            'expires_at': now + timedelta(seconds=_ttl()),
+        })
+        LLMResponseCache.objects.filter(expires_at__lte=now).delete()
+        # 超出容量时淘汰最久未使用的条目
+        stale_ids = list(
+            LLMResponseCache.objects.order_by('-last_used_at').values_list('id', flat=True)[_max_entries():]
+        )
+        if stale_ids:
+            LLMResponseCache.objects.filter(id__in=stale_ids).delete()
+
+    def clear(self):
+        from .models import LLMResponseCache
+        LLMResponseCache.objects.all().delete()
+
+
+class FileCache:
+    """基于文件的缓存，文件修改时间作为最近使用时间"""
+
+    def __init__(self):
+        self.directory = getattr(settings, 'LLM_CACHE_DIR', os.path.join(settings.BASE_DIR, 'cache', 'llm'))
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['expires_at'] <= time.time():
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry['response']
+
+    def set(self, key, model_name, response):
+        path = self._path(key)
+        entry = {'model_name': model_name, 'response': response, 'expires_at': time.time() + _ttl()}
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+            if len(entries) <= _max_entries():
+                return
+            entries.sort()
+            for _, path in entries[:len(entries) - _max_entries()]:
+                self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                self._remove(os.path.join(self.directory, name))
+
+
+_backends = {
+    'db': DatabaseCache,
+    'file': FileCache,
+}
+_cache = None
+_cache_name = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """当前配置的缓存后端，未开启缓存时返回 None"""
+    global _cache, _cache_name
+    backend_name = getattr(settings, 'LLM_CACHE_BACKEND', '')
+    if not backend_name:
+        return None
+    if _cache is None or _cache_name != backend_name:
+        with _cache_lock:
+            if _cache is None or _cache_name != backend_name:
+                if backend_name not in _backends:
+                    raise ValueError(f"不支持的大模型缓存后端: {backend_name}")
+                _cache = _backends[backend_name]()
+                _cache_name = backend_name
+    return _cache
+
+
+def is_cacheable(payload):
+    """只缓存确定性（低温度）的调用"""
+    max_temperature = getattr(settings, 'LLM_CACHE_MAX_TEMPERATURE', 0.0)
+    return (payload.get('temperature') or 0) <= max_temperature
+
+
+def lookup(config, payload):
+    """查询缓存，返回 (缓存键, 缓存的响应)；不缓存该调用时缓存键为 None，读取失败按未命中处理"""
+    cache = get_cache()
+    if cache is None or not is_cacheable(payload):
+        return None, None
+    key = cache_key(config, payload)
+    try:
+        return key, cache.get(key)
+    except Exception as e:
+        logger.warning(f"读取大模型缓存失败: {e}")
+        return key, None
+
+
+def store(key, config, response):
+    """写入缓存，写入失败只记录日志"""
+    cache = get_cache()
+    if cache is None or key is None:
+        return
+    try:
+        cache.set(key, config.model_name, response)
+    except Exception as e:
+        logger.warning(f"写入大模型缓存失败: {e}")
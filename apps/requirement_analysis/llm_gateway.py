@@ -0,0 +1,400 @@
+"""
+大模型调用网关
+
+进程内所有 OpenAI 兼容接口的调用都经过同一个网关：
+- 网关在后台线程中运行一个常驻事件循环，每个 AIModelConfig 一个带连接池的 httpx.AsyncClient，
+  编写、评审、改进等调用复用同一组连接，不再每次调用新建客户端
+- 全局信号量（LLM_MAX_CONCURRENCY）限制进程内同时进行的调用数，按模型类型的信号量
+  （LLM_PROVIDER_MAX_CONCURRENCY）限制单个服务商的并发；流式调用在整个输出过程中占用名额
+- 429 和 5xx 响应、连接失败时按指数退避重试（优先使用 Retry-After），流式调用只在输出内容前重试
+- 按模型配置累计请求数、重试次数、token 用量和缓存命中次数
+- 开启 LLM_CACHE_BACKEND 后，相同请求直接返回缓存的响应（见 llm_cache）
+
+同步代码通过 run() 在网关的事件循环中执行协程；在其他事件循环中 await 网关的方法时，
+请求会被转交到网关的事件循环执行。
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from . import llm_cache
+
+logger = logging.getLogger(__name__)
+
+# 需要重试的响应状态码
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# 需要重试的网络异常（请求未被服务端处理）
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+
+TIMEOUT = httpx.Timeout(
+    connect=60.0,      # 连接超时：60秒
+    read=900.0,        # 读取超时：900秒（15分钟），支持大文档生成
+    write=60.0,        # 写入超时：60秒
+    pool=60.0          # 等待连接池空闲连接的超时：60秒
+)
+
+_STREAM_END = object()
+
+
+def build_chat_url(base_url):
+    """根据配置的 base_url 补全 chat/completions 地址"""
+    base_url = base_url.rstrip('/')
+    if base_url.endswith('/chat/completions'):
+        return base_url
+    if base_url.endswith('/v1'):
+        return f"{base_url}/chat/completions"
+    # 默认假设是根路径（如 https://api.deepseek.com），补全 v1/chat/completions
+    return f"{base_url}/v1/chat/completions"
+
+
+def _retry_after(response):
+    """解析 Retry-After 响应头（秒数或HTTP日期）"""
+    value = response.headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - timezone.now()).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class UsageStats:
+    """单个模型配置的调用统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_tokens = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def add_usage(self, usage):
+        if not usage:
+            return
+        self.prompt_tokens += usage.get('prompt_tokens') or 0
+        self.completion_tokens += usage.get('completion_tokens') or 0
+        self.total_tokens += usage.get('total_tokens') or 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class LLMGateway:
+    """大模型调用网关，通过 get_gateway() 获取进程内的实例"""
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._global_semaphore = None
+        self._provider_semaphores = {}
+        self._stats = defaultdict(UsageStats)
+
+    # ---- 事件循环 ----
+
+    def _ensure_loop(self):
+        if self._loop is not None:
+            return self._loop
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='llm-gateway', daemon=True)
+                thread.start()
+                self._thread = thread
+                self._loop = loop
+        return self._loop
+
+    def _in_loop(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def run(self, coro, timeout=None):
+        """在网关的事件循环中执行协程并等待结果（供同步代码调用）
+
+        超时后协程会被取消并抛出 asyncio.TimeoutError。
+        """
+        loop = self._ensure_loop()
+        if self._in_loop():
+            coro.close()
+            raise RuntimeError("不能在网关事件循环中同步等待网关调用")
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def close(self):
+        """关闭所有客户端并停止事件循环"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+            clients, self._clients = self._clients, {}
+            self._global_semaphore = None
+            self._provider_semaphores = {}
+        if loop is None:
+            return
+
+        async def close_clients():
+            for client in clients.values():
+                await client.aclose()
+
+        asyncio.run_coroutine_threadsafe(close_clients(), loop).result(10)
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(10)
+        loop.close()
+
+    # ---- 连接和并发控制（只在网关事件循环中调用） ----
+
+    def _client_key(self, config):
+        return config.pk or config.base_url
+
+    def _get_client(self, config):
+        key = self._client_key(config)
+        client = self._clients.get(key)
+        if client is None:
+            limits = httpx.Limits(
+                max_connections=getattr(settings, 'LLM_MAX_CONNECTIONS_PER_MODEL', 10),
+                max_keepalive_connections=getattr(settings, 'LLM_MAX_CONNECTIONS_PER_MODEL', 10),
+                keepalive_expiry=60.0
+            )
+            # 使用HTTP/1.1以提高兼容性
+            client = httpx.AsyncClient(timeout=TIMEOUT, limits=limits, http2=False)
+            self._clients[key] = client
+        return client
+
+    def _semaphores(self, config):
+        if self._global_semaphore is None:
+            self._global_semaphore = asyncio.Semaphore(getattr(settings, 'LLM_MAX_CONCURRENCY', 8))
+        provider = config.model_type
+        semaphore = self._provider_semaphores.get(provider)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(getattr(settings, 'LLM_PROVIDER_MAX_CONCURRENCY', 4))
+            self._provider_semaphores[provider] = semaphore
+        return self._global_semaphore, semaphore
+
+    def _backoff(self, attempt, response=None):
+        delay = getattr(settings, 'LLM_RETRY_BACKOFF', 2.0) * (2 ** attempt)
+        retry_after = _retry_after(response) if response is not None else None
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return min(delay, 60.0) * random.uniform(0.8, 1.2)
+
+    def _request_args(self, config, payload):
+        headers = {
+            'Authorization': f'Bearer {config.api_key}',
+            'Content-Type': 'application/json'
+        }
+        return build_chat_url(config.base_url), headers, payload
+
+    # ---- 调用 ----
+
+    async def _cache_lookup(self, config, payload, stats):
+        key, cached = await sync_to_async(llm_cache.lookup)(config, payload)
+        if cached is not None:
+            stats.cache_hits += 1
+        elif key is not None:
+            stats.cache_misses += 1
+        return key, cached
+
+    async def chat(self, config, payload, use_cache=True):
+        """非流式调用，返回响应JSON；HTTP错误抛出 httpx.HTTPStatusError
+
+        Args:
+            use_cache: 为 False 时不读写响应缓存（如连接测试）
+        """
+        self._ensure_loop()
+        if not self._in_loop():
+            return await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self.chat(config, payload, use_cache), self._loop)
+            )
+
+        stats = self._stats[self._client_key(config)]
+        key = None
+        if use_cache:
+            key, cached = await self._cache_lookup(config, payload, stats)
+            if cached is not None:
+                return cached
+
+        url, headers, payload = self._request_args(config, payload)
+        max_retries = getattr(settings, 'LLM_MAX_RETRIES', 3)
+        global_semaphore, provider_semaphore = self._semaphores(config)
+        attempt = 0
+        while True:
+            stats.requests += 1
+            try:
+                async with global_semaphore, provider_semaphore:
+                    response = await self._get_client(config).post(url, headers=headers, json=payload)
+            except RETRY_EXCEPTIONS as e:
+                if attempt >= max_retries:
+                    stats.failures += 1
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"{config.model_name} 请求失败（{e!r}），{delay:.1f}秒后重试")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+                    if response.status_code != 200:
+                        stats.failures += 1
+                        logger.error(f"API调用返回错误: Status={response.status_code}, Body={response.text}")
+                    response.raise_for_status()
+                    result = response.json()
+                    stats.add_usage(result.get('usage'))
+                    if key is not None:
+                        await sync_to_async(llm_cache.store)(key, config, result)
+                    return result
+                delay = self._backoff(attempt, response)
+                logger.warning(f"{config.model_name} 返回 {response.status_code}，{delay:.1f}秒后重试")
+            stats.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def stream(self, config, payload):
+        """流式调用，逐个产出 SSE 数据块（已解析的JSON）
+
+        已经产出数据后不再重试，出错直接抛出。
+        """
+        self._ensure_loop()
+        if not self._in_loop():
+            async for chunk in self._stream_from_gateway(config, payload):
+                yield chunk
+            return
+
+        stats = self._stats[self._client_key(config)]
+        key, cached = await self._cache_lookup(config, payload, stats)
+        if cached is not None:
+            # 命中缓存时一次性输出完整内容
+            choice = cached['choices'][0]
+            yield {'choices': [{
+                'index': 0,
+                'delta': {'role': 'assistant', 'content': choice['message']['content']},
+                'finish_reason': choice.get('finish_reason') or 'stop',
+            }]}
+            return
+
+        url, headers, payload = self._request_args(config, payload)
+        max_retries = getattr(settings, 'LLM_MAX_RETRIES', 3)
+        global_semaphore, provider_semaphore = self._semaphores(config)
+        attempt = 0
+        async with global_semaphore, provider_semaphore:
+            while True:
+                stats.requests += 1
+                delay = None
+                try:
+                    async with self._get_client(config).stream('POST', url, headers=headers, json=payload) as response:
+                        if response.status_code != 200:
+                            if response.status_code in RETRY_STATUS_CODES and attempt < max_retries:
+                                delay = self._backoff(attempt, response)
+                                logger.warning(f"{config.model_name} 返回 {response.status_code}，{delay:.1f}秒后重试")
+                            else:
+                                error_detail = await response.aread()
+                                stats.failures += 1
+                                logger.error(f"流式API调用返回错误: Status={response.status_code}, Body={error_detail.decode('utf-8', 'replace')}")
+                                response.raise_for_status()
+                        else:
+                            # 完整输出后写入缓存，格式与非流式响应相同
+                            parts, finish_reason, usage = [], None, None
+                            async for line in response.aiter_lines():
+                                if not line.startswith('data: '):
+                                    continue
+                                data_str = line[6:].strip()
+                                if data_str == '[DONE]':
+                                    break
+                                try:
+                                    chunk = json.loads(data_str)
+                                except json.JSONDecodeError:
+                                    continue
+                                stats.add_usage(chunk.get('usage'))
+                                usage = chunk.get('usage') or usage
+                                for choice in chunk.get('choices') or []:
+                                    parts.append((choice.get('delta') or {}).get('content') or '')
+                                    finish_reason = choice.get('finish_reason') or finish_reason
+                                yield chunk
+                            if key is not None and finish_reason:
+                                await sync_to_async(llm_cache.store)(key, config, {
+                                    'choices': [{
+                                        'index': 0,
+                                        'message': {'role': 'assistant', 'content': ''.join(parts)},
+                                        'finish_reason': finish_reason,
+                                    }],
+                                    'usage': usage,
+                                })
+                            return
+                except RETRY_EXCEPTIONS as e:
+                    if attempt >= max_retries:
+                        stats.failures += 1
+                        raise
+                    delay = self._backoff(attempt)
+                    logger.warning(f"{config.model_name} 请求失败（{e!r}），{delay:.1f}秒后重试")
+                stats.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def _stream_from_gateway(self, config, payload):
+        """在其他事件循环中读取网关事件循环中的流式调用"""
+        caller_loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        async def produce():
+            try:
+                async for chunk in self.stream(config, payload):
+                    caller_loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            except BaseException as e:
+                caller_loop.call_soon_threadsafe(queue.put_nowait, e)
+            else:
+                caller_loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+
+        future = asyncio.run_coroutine_threadsafe(produce(), self._loop)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def stats(self):
+        """各模型配置的调用统计：{配置ID: {...}}"""
+        return {key: stats.as_dict() for key, stats in self._stats.items()}
+
+
+_gateway = None
+_gateway_pid = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    global _gateway, _gateway_pid
+    # fork 出的子进程（如 Celery worker）不能复用父进程的事件循环线程
+    if _gateway is None or _gateway_pid != os.getpid():
+        with _gateway_lock:
+            if _gateway is None or _gateway_pid != os.getpid():
+                _gateway = LLMGateway()
+                _gateway_pid = os.getpid()
+    return _gateway
+
+
+def run(coro, timeout=None):
+    """在网关的事件循环中执行协程，见 LLMGateway.run"""
+    return get_gateway().run(coro, timeout)
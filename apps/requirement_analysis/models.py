@@ -8,6 +8,8 @@ import asyncio
 from typing import Dict, Any, List, AsyncIterator
 import logging
 
+from .llm_gateway import build_chat_url, get_gateway
+
 logger = logging.getLogger(__name__)
 
 
@@ -408,6 +410,57 @@ class TestCaseGenerationTask(models.Model):
         return f"{self.title} - {self.get_status_display()}"
 
 
+class GenerationStreamChunk(models.Model):
+    """生成任务流式输出分片 - 生成过程中只追加写入，任务结束后合并到任务的文本字段"""
+    FIELD_CHOICES = [
+        ('stream_buffer', '生成内容'),
+        ('review_feedback', '评审内容'),
+        ('final_test_cases', '最终用例'),
+    ]
+
+    task = models.ForeignKey(
+        TestCaseGenerationTask, on_delete=models.CASCADE,
+        related_name='stream_chunks', verbose_name='生成任务'
+    )
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES, verbose_name='所属字段')
+    seq = models.PositiveIntegerField(verbose_name='序号')
+    end_offset = models.PositiveIntegerField(verbose_name='结束位置', help_text='分片末尾在字段全文中的位置')
+    content = models.TextField(verbose_name='内容')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        db_table = 'testcase_generation_stream_chunk'
+        verbose_name = '生成任务流式分片'
+        verbose_name_plural = '生成任务流式分片'
+        ordering = ['task', 'field', 'seq']
+        unique_together = ['task', 'field', 'seq']
+        indexes = [
+            models.Index(fields=['task', 'field', 'end_offset']),
+        ]
+
+    def __str__(self):
+        return f"{self.task_id} - {self.field} #{self.seq}"
+
+
+class LLMResponseCache(models.Model):
+    """大模型响应缓存 - 以请求内容的哈希为键（LLM_CACHE_BACKEND='db' 时使用）"""
+    key = models.CharField(max_length=64, unique=True, verbose_name='缓存键')
+    model_name = models.CharField(max_length=100, verbose_name='模型名称')
+    response = models.JSONField(verbose_name='响应内容')
+    hit_count = models.PositiveIntegerField(default=0, verbose_name='命中次数')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    last_used_at = models.DateTimeField(db_index=True, verbose_name='最近使用时间')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='过期时间')
+
+    class Meta:
+        db_table = 'llm_response_cache'
+        verbose_name = '大模型响应缓存'
+        verbose_name_plural = '大模型响应缓存'
+
+    def __str__(self):
+        return f"{self.model_name} - {self.key[:12]}"
+
+
 class AIModelService:
     """AI模型服务类"""
     
@@ -415,7 +468,8 @@ class AIModelService:
     async def call_openai_compatible_api(
         config: AIModelConfig,
         messages: List[Dict[str, str]],
-        max_tokens: int = None
+        max_tokens: int = None,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
         调用OpenAI兼容格式的API
@@ -424,15 +478,11 @@ class AIModelService:
             config: AI模型配置
             messages: 消息列表
             max_tokens: 可选的最大token数，如果不指定则使用config.max_tokens
+            use_cache: 是否使用响应缓存（开启 LLM_CACHE_BACKEND 时生效）
 
         Returns:
             API响应字典
         """
-        headers = {
-            'Authorization': f'Bearer {config.api_key}',
-            'Content-Type': 'application/json'
-        }
-
         # 使用传入的max_tokens或默认使用config.max_tokens
         actual_max_tokens = max_tokens if max_tokens is not None else config.max_tokens
 
@@ -444,54 +494,18 @@ class AIModelService:
             'top_p': config.top_p,
             'stream': False
         }
-        
-        # 确保base_url不以/结尾
-        base_url = config.base_url.rstrip('/')
-        # 如果用户没有输入完整的v1/chat/completions路径，尝试智能补全
-        if not base_url.endswith('/chat/completions'):
-            if base_url.endswith('/v1'):
-                url = f"{base_url}/chat/completions"
-            else:
-                # 默认假设是根路径，尝试添加 v1/chat/completions
-                # 但对于某些API（如DeepSeek），base_url可能已经是 https://api.deepseek.com
-                url = f"{base_url}/v1/chat/completions"
-        else:
-            url = base_url
 
         logger.info(f"=== API调用详情 ===")
         logger.info(f"原始base_url: {config.base_url}")
-        logger.info(f"最终请求URL: {url}")
+        logger.info(f"最终请求URL: {build_chat_url(config.base_url)}")
         logger.info(f"模型名称: {config.model_name}")
         logger.info(f"请求参数: max_tokens={actual_max_tokens}, temperature={config.temperature}, top_p={config.top_p}")
 
         try:
-            # 增加HTTP超时时间到900秒（15分钟），支持大文档生成
-            # 禁用HTTP/2，使用HTTP/1.1以提高兼容性
-            # 显式设置所有超时参数，避免默认的连接超时导致请求失败
-            timeout_config = httpx.Timeout(
-                connect=60.0,      # 连接超时：60秒
-                read=900.0,        # 读取超时：900秒（15分钟）
-                write=60.0,        # 写入超时：60秒
-                pool=60.0          # 连接池超时：60秒
-            )
-            async with httpx.AsyncClient(timeout=timeout_config, http2=False) as client:
-                logger.info(f"发送POST请求到: {url}")
-                response = await client.post(
-                    url,
-                    headers=headers,
-                    json=data
-                )
-
-                logger.info(f"收到响应: status_code={response.status_code}")
-
-                if response.status_code != 200:
-                    error_detail = response.text
-                    logger.error(f"API调用返回错误: Status={response.status_code}, Body={error_detail}")
-
-                response.raise_for_status()
-                result = response.json()
-                logger.info(f"API调用成功，响应内容: {str(result)[:200]}...")
-                return result
+            # 通过网关调用：复用连接池，受全局和服务商并发限制，429/5xx自动重试
+            result = await get_gateway().chat(config, data, use_cache=use_cache)
+            logger.info(f"API调用成功，响应内容: {str(result)[:200]}...")
+            return result
         except httpx.HTTPStatusError as e:
             provider_name = config.get_model_type_display()
             error_msg = f"{provider_name} API返回错误 {e.response.status_code}: {e.response.text}"
@@ -527,24 +541,9 @@ class AIModelService:
         """
         流式调用OpenAI兼容格式的API，支持自动续写
         """
-        headers = {
-            'Authorization': f'Bearer {config.api_key}',
-            'Content-Type': 'application/json'
-        }
-
         # 使用传入的max_tokens或默认使用config.max_tokens
         actual_max_tokens = max_tokens if max_tokens is not None else config.max_tokens
 
-        # 确保base_url不以/结尾
-        base_url = config.base_url.rstrip('/')
-        if not base_url.endswith('/chat/completions'):
-            if base_url.endswith('/v1'):
-                url = f"{base_url}/chat/completions"
-            else:
-                url = f"{base_url}/v1/chat/completions"
-        else:
-            url = base_url
-
         # 续写控制
         current_messages = list(messages)  # 浅拷贝
         continuation_count = 0
@@ -566,51 +565,21 @@ class AIModelService:
             finish_reason = None
             
             try:
-                # 显式设置所有超时参数
-                timeout_config = httpx.Timeout(
-                    connect=60.0,      # 连接超时：60秒
-                    read=900.0,        # 读取超时：900秒（15分钟）
-                    write=60.0,        # 写入超时：60秒
-                    pool=60.0          # 连接池超时：60秒
-                )
-                async with httpx.AsyncClient(timeout=timeout_config, http2=False) as client:
-                    async with client.stream('POST', url, headers=headers, json=data) as response:
-                        if response.status_code != 200:
-                            error_detail = await response.aread()
-                            error_msg = error_detail.decode('utf-8')
-                            logger.error(f"流式API调用返回错误: Status={response.status_code}, Body={error_msg}")
-                            response.raise_for_status()
-
-                        async for line in response.aiter_lines():
-                            if not line.strip():
-                                continue
-
-                            if line.startswith('data: '):
-                                data_str = line[6:]
-                                if data_str.strip() == '[DONE]':
-                                    break
-
-                                try:
-                                    chunk_data = json.loads(data_str)
-                                    if 'choices' in chunk_data and len(chunk_data['choices']) > 0:
-                                        choice = chunk_data['choices'][0]
-                                        delta = choice.get('delta', {})
-                                        finish_reason = choice.get('finish_reason', None)
-                                        content = delta.get('content', '')
-
-                                        if content:
-                                            chunk_content_buffer += content
-                                            if callback:
-                                                await callback(content)
-                                            yield content
-                                            
-                                        # 如果在中途就收到了finish_reason（有些流式实现会在最后一条数据带上finish_reason）
-                                        if finish_reason:
-                                            pass 
-
-                                except json.JSONDecodeError:
-                                    continue
-            
+                # 通过网关调用：复用连接池，受全局和服务商并发限制，输出内容前遇到429/5xx自动重试
+                async for chunk_data in get_gateway().stream(config, data):
+                    if 'choices' in chunk_data and len(chunk_data['choices']) > 0:
+                        choice = chunk_data['choices'][0]
+                        delta = choice.get('delta') or {}
+                        # 有些流式实现只在最后一条数据带上finish_reason
+                        finish_reason = choice.get('finish_reason') or finish_reason
+                        content = delta.get('content', '')
+
+                        if content:
+                            chunk_content_buffer += content
+                            if callback:
+                                await callback(content)
+                            yield content
+
                 # 本次请求结束
                 # 检查 finish_reason
                 if finish_reason == 'length':
@@ -0,0 +1,244 @@
+"""
+测试用例生成任务的进度推送
+
+生成线程通过 ProgressPublisher 把流式输出的增量和状态变化发布到事件通道，
+SSE 连接直接订阅事件，不再轮询数据库。
+
+流式内容在检查点（间隔 GENERATION_CHECKPOINT_INTERVAL 秒、阶段结束）以分片形式追加写入
+GenerationStreamChunk，每次只写入新增的部分；任务的文本字段只在任务结束时写入完整内容，
+之后分片被删除。读取方通过 read_stream_text() 获取某个位置之后的内容。
+"""
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apps.core import event_broker
+
+# 流式文本字段 -> 推送给前端的事件类型
+TEXT_FIELDS = {
+    'stream_buffer': 'content',
+    'review_feedback': 'review_content',
+    'final_test_cases': 'final_content',
+}
+
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+def channel_name(task_id):
+    return f'testcase-generation:{task_id}'
+
+
+def publish_finished(task):
+    """推送任务结束事件并关闭频道"""
+    channel = channel_name(task.task_id)
+    event_broker.publish(channel, {'type': 'status', 'status': task.status, 'progress': task.progress})
+    event_broker.publish(channel, {'type': 'done'})
+    event_broker.close(channel)
+
+
+def read_stream_text(task, field, after=0):
+    """读取文本字段中 after 位置之后的内容
+
+    生成过程中从分片读取，只查询包含 after 之后内容的分片；
+    任务结束后分片已合并到任务字段，直接从字段读取。
+    """
+    from .models import GenerationStreamChunk, TestCaseGenerationTask
+
+    chunks = GenerationStreamChunk.objects.filter(
+        task_id=task.pk, field=field, end_offset__gt=after
+    ).order_by('seq').values_list('end_offset', 'content')
+    parts = []
+    for end_offset, content in chunks:
+        start = end_offset - len(content)
+        parts.append(content[max(0, after - start):])
+    if parts:
+        return ''.join(parts)
+
+    value = TestCaseGenerationTask.objects.filter(pk=task.pk).values_list(field, flat=True).first()
+    return (value or '')[after:]
+
+
+def finish_from_checkpoints(task, status):
+    """在生成线程之外结束任务（如取消）：把已写入的分片合并到任务的文本字段后删除分片
+
+    任务结束后进度接口和 SSE 从任务字段读取内容。生成线程内存中尚未到检查点的内容不包含在内。
+    """
+    from .models import GenerationStreamChunk
+
+    with transaction.atomic():
+        for field in TEXT_FIELDS:
+            setattr(task, field, read_stream_text(task, field))
+        task.stream_position = len(task.stream_buffer or '')
+        task.status = status
+        task.save(update_fields=['status', 'stream_position'] + list(TEXT_FIELDS))
+        GenerationStreamChunk.objects.filter(task_id=task.pk).delete()
+
+
+class _StreamText:
+    """一个文本字段的流式状态"""
+
+    def __init__(self, value):
+        self.parts = [value] if value else []
+        self.length = len(value)
+        # 最近一次同步到任务对象上的字符串，用于识别对字段的直接赋值
+        self.synced = value
+        # 尚未写入分片表的内容
+        self.pending = []
+        self.seq = 0
+        self.written = 0
+        self.reset = False
+
+    def text(self):
+        if len(self.parts) > 1:
+            self.parts = [''.join(self.parts)]
+        return self.parts[0] if self.parts else ''
+
+
+class ProgressPublisher:
+    """生成任务的进度发布器
+
+    创建后绑定到任务对象上：流式内容通过 append() 追加，任务保存前把内存中的内容
+    同步到任务对象，保存后推送状态变化。
+    """
+
+    def __init__(self, task):
+        self.task = task
+        self.channel = channel_name(task.task_id)
+        self._streams = {field: _StreamText(getattr(task, field) or '') for field in TEXT_FIELDS}
+        self._last_checkpoint = time.monotonic()
+        self._last_state = None
+        self._materialized = False
+        task._progress_publisher = self
+
+    def append(self, field, chunk):
+        """追加流式内容并推送增量
+
+        Returns:
+            bool: 是否到了写检查点的时间，调用方需要在同步上下文中调用 checkpoint()
+        """
+        if not chunk:
+            return False
+        stream = self._streams[field]
+        event_broker.publish(self.channel, {
+            'type': TEXT_FIELDS[field],
+            'field': field,
+            'offset': stream.length,
+            'content': chunk,
+        })
+        stream.parts.append(chunk)
+        stream.pending.append(chunk)
+        stream.length += len(chunk)
+        interval = getattr(settings, 'GENERATION_CHECKPOINT_INTERVAL', 2)
+        return time.monotonic() - self._last_checkpoint >= interval
+
+    def _replace(self, field, value):
+        """处理对任务文本字段的直接赋值"""
+        stream = self._streams[field]
+        current = stream.text()
+        if value == current:
+            return
+        if value.startswith(current):
+            suffix = value[len(current):]
+        else:
+            # 内容被清空或整体替换（如进入改进阶段、用例重新编号），通知订阅者从头接收
+            event_broker.publish(self.channel, {'type': 'reset', 'field': field, 'content_type': TEXT_FIELDS[field]})
+            stream.pending = []
+            stream.reset = True
+            stream.length = 0
+            suffix = value
+        if suffix:
+            event_broker.publish(self.channel, {
+                'type': TEXT_FIELDS[field],
+                'field': field,
+                'offset': stream.length,
+                'content': suffix,
+            })
+            stream.pending.append(suffix)
+        stream.parts = [value] if value else []
+        stream.length = len(value)
+
+    def sync(self):
+        """把内存中的流式内容同步到任务对象上（任务保存前自动调用）"""
+        task = self.task
+        for field, stream in self._streams.items():
+            value = getattr(task, field) or ''
+            if value is not stream.synced:
+                self._replace(field, value)
+            value = stream.text()
+            setattr(task, field, value)
+            stream.synced = value
+        task.stream_position = self._streams['stream_buffer'].length
+
+    def checkpoint(self):
+        """把新增的流式内容作为分片追加写入数据库"""
+        from .models import GenerationStreamChunk, TestCaseGenerationTask
+
+        self._last_checkpoint = time.monotonic()
+        reset_fields = [field for field, stream in self._streams.items() if stream.reset]
+        if reset_fields:
+            GenerationStreamChunk.objects.filter(task_id=self.task.pk, field__in=reset_fields).delete()
+
+        chunks = []
+        for field, stream in self._streams.items():
+            if stream.reset:
+                stream.reset = False
+                stream.seq = 0
+                stream.written = 0
+            if not stream.pending:
+                continue
+            content = ''.join(stream.pending)
+            stream.pending = []
+            stream.seq += 1
+            stream.written += len(content)
+            chunks.append(GenerationStreamChunk(
+                task_id=self.task.pk, field=field, seq=stream.seq,
+                end_offset=stream.written, content=content
+            ))
+        if not chunks:
+            return
+        GenerationStreamChunk.objects.bulk_create(chunks)
+
+        self.task.last_stream_update = timezone.now()
+        TestCaseGenerationTask.objects.filter(pk=self.task.pk).update(
+            stream_position=self._streams['stream_buffer'].length,
+            last_stream_update=self.task.last_stream_update
+        )
+
+    def flush(self):
+        """阶段结束时调用：写入检查点，并让任务对象上的文本字段反映完整内容"""
+        self.sync()
+        self.checkpoint()
+
+    def materialize(self):
+        """任务结束时把完整内容写入任务的文本字段"""
+        self.flush()
+        self._materialized = True
+        self.task.save(update_fields=list(TEXT_FIELDS) + ['stream_position'])
+
+    def on_saved(self, update_fields=None):
+        """任务保存后推送状态变化，任务结束且完整内容已写入后清理分片"""
+        task = self.task
+        state = (task.status, task.progress)
+        if state == self._last_state:
+            return
+        self._last_state = state
+        event_broker.publish(self.channel, {'type': 'progress', 'status': task.status, 'progress': task.progress})
+        if task.status in TERMINAL_STATUSES:
+            if update_fields is None or self._materialized:
+                from .models import GenerationStreamChunk
+                GenerationStreamChunk.objects.filter(task_id=task.pk).delete()
+            publish_finished(task)
+
+
+def task_saving(sender, instance, **kwargs):
+    publisher = getattr(instance, '_progress_publisher', None)
+    if publisher is not None:
+        publisher.sync()
+
+
+def task_saved(sender, instance, update_fields=None, **kwargs):
+    publisher = getattr(instance, '_progress_publisher', None)
+    if publisher is not None:
+        publisher.on_saved(update_fields)
@@ -1,3 +1,8 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from apps.projects.models import Project
@@ -102,4 +107,207 @@ class RequirementAnalysisTestCase(TestCase):
             expected_result='Test result'
         )
         self.assertEqual(test_case.case_id, 'TC-001')
-        self.assertEqual(test_case.status, 'generated')
\ No newline at end of file
+        self.assertEqual(test_case.status, 'generated')
+
+class GenerationProgressTestCase(TestCase):
+    def setUp(self):
+        from apps.core import event_broker
+        from .models import TestCaseGenerationTask
+
+        event_broker._broker = None
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        self.task = TestCaseGenerationTask.objects.create(
+            task_id='task-progress', title='进度推送', requirement_text='需求', created_by=self.user
+        )
+
+    def _events(self, last_id=None):
+        from apps.core import event_broker
+        from .progress import channel_name
+        return event_broker.read(channel_name(self.task.task_id), last_id, timeout=0)
+
+    def test_chunks_published_and_checkpointed(self):
+        """测试流式内容实时推送，检查点只追加写入新增的分片"""
+        from .models import GenerationStreamChunk
+        from .progress import ProgressPublisher, read_stream_text
+
+        publisher = ProgressPublisher(self.task)
+        with self.settings(GENERATION_CHECKPOINT_INTERVAL=3600):
+            self.assertFalse(publisher.append('stream_buffer', '用例1'))
+            self.assertFalse(publisher.append('stream_buffer', '用例2'))
+
+        events = self._events()
+        self.assertEqual([(e['offset'], e['content']) for _, e in events], [(0, '用例1'), (3, '用例2')])
+
+        publisher.checkpoint()
+        publisher.append('stream_buffer', '用例3')
+        publisher.checkpoint()
+        chunks = GenerationStreamChunk.objects.filter(task=self.task).values_list('seq', 'end_offset', 'content')
+        self.assertEqual(list(chunks), [(1, 6, '用例1用例2'), (2, 9, '用例3')])
+        self.assertEqual(read_stream_text(self.task, 'stream_buffer', 4), '例2用例3')
+
+        # 文本字段只在任务结束时写入完整内容，之后分片被清理
+        stored = type(self.task).objects.get(pk=self.task.pk)
+        self.assertEqual((stored.stream_buffer, stored.stream_position), ('', 9))
+        publisher.materialize()
+        self.task.status = 'completed'
+        self.task.save(update_fields=['status'])
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.stream_buffer, self.task.stream_position), ('用例1用例2用例3', 9))
+        self.assertFalse(GenerationStreamChunk.objects.filter(task=self.task).exists())
+
+    def test_cancel_keeps_checkpointed_content(self):
+        """测试在生成线程之外取消任务时，已写入分片的内容合并到任务字段"""
+        from .models import GenerationStreamChunk, TestCaseGenerationTask
+        from .progress import ProgressPublisher, finish_from_checkpoints, read_stream_text
+
+        publisher = ProgressPublisher(self.task)
+        publisher.append('stream_buffer', '用例1')
+        publisher.append('final_test_cases', '最终用例')
+        publisher.checkpoint()
+
+        task = TestCaseGenerationTask.objects.get(pk=self.task.pk)
+        finish_from_checkpoints(task, 'cancelled')
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'cancelled')
+        self.assertEqual((task.stream_buffer, task.final_test_cases, task.stream_position), ('用例1', '最终用例', 3))
+        self.assertFalse(GenerationStreamChunk.objects.filter(task=task).exists())
+        self.assertEqual(read_stream_text(task, 'final_test_cases'), '最终用例')
+
+    def test_status_change_and_resume(self):
+        """测试状态变化推送，并可以从指定事件之后继续接收"""
+        from .progress import ProgressPublisher
+
+        task = self.task
+        ProgressPublisher(task)
+        task.status, task.progress = 'generating', 10
+        task.save()
+        first_id = self._events()[-1][0]
+
+        task.final_test_cases = '最终用例'
+        task.status, task.progress = 'completed', 100
+        task.save()
+
+        types = [e['type'] for _, e in self._events(first_id)]
+        self.assertEqual(types, ['final_content', 'progress', 'status', 'done'])
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """模拟OpenAI兼容接口：第一次请求返回429，之后正常响应"""
+    protocol_version = 'HTTP/1.1'
+    calls = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.calls.append((self.client_address[1], payload['stream']))
+        if len(self.calls) == 1:
+            self._send(429, b'{}', {'Retry-After': '0'})
+        elif payload['stream']:
+            lines = [
+                {'choices': [{'delta': {'content': '用例'}, 'finish_reason': None}]},
+                {'choices': [{'delta': {'content': '1'}, 'finish_reason': 'stop'}]},
+                {'choices': [], 'usage': {'prompt_tokens': 5, 'completion_tokens': 2, 'total_tokens': 7}},
+            ]
+            body = ''.join(f'data: {json.dumps(line)}\n\n' for line in lines) + 'data: [DONE]\n\n'
+            self._send(200, body.encode(), {'Content-Type': 'text/event-stream'})
+        else:
+            body = {
+                'choices': [{'message': {'content': '连接成功'}}],
+                'usage': {'prompt_tokens': 10, 'completion_tokens': 3, 'total_tokens': 13},
+            }
+            self._send(200, json.dumps(body).encode(), {'Content-Type': 'application/json'})
+
+    def _send(self, status_code, body, headers):
+        self.send_response(status_code)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LLMGatewayTestCase(TestCase):
+    def setUp(self):
+        from .models import AIModelConfig
+
+        FakeLLMHandler.calls = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeLLMHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        user = User.objects.create_user(username='tester', password='testpass123')
+        self.config = AIModelConfig.objects.create(
+            name='编写模型', model_type='deepseek', role='writer', api_key='sk-test',
+            base_url=f'http://127.0.0.1:{self.server.server_port}/v1', model_name='deepseek-chat',
+            created_by=user
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_and_connection_reuse(self):
+        """测试429后重试成功、连接被复用并累计token用量"""
+        from .llm_gateway import LLMGateway
+        from .models import AIModelService
+
+        gateway = LLMGateway()
+        self.addCleanup(gateway.close)
+        with self.settings(LLM_RETRY_BACKOFF=0), \
+                mock.patch('apps.requirement_analysis.models.get_gateway', return_value=gateway):
+            first = gateway.run(AIModelService.call_openai_compatible_api(self.config, []))
+            second = gateway.run(AIModelService.call_openai_compatible_api(self.config, []))
+
+        self.assertEqual(first['choices'][0]['message']['content'], '连接成功')
+        self.assertEqual(second, first)
+        # 三次请求（含一次重试）使用同一个连接
+        self.assertEqual(len({port for port, _ in FakeLLMHandler.calls}), 1)
+        stats = gateway.stats()[self.config.pk]
+        self.assertEqual((stats['requests'], stats['retries'], stats['total_tokens']), (3, 1, 26))
+
+    def test_stream_from_other_event_loop(self):
+        """测试在其他事件循环中读取流式输出"""
+        import asyncio
+        from .llm_gateway import LLMGateway
+
+        gateway = LLMGateway()
+        self.addCleanup(gateway.close)
+
+        async def collect():
+            return [chunk async for chunk in gateway.stream(self.config, {'stream': True})]
+
+        with self.settings(LLM_RETRY_BACKOFF=0):
+            chunks = asyncio.run(collect())
+
+        self.assertEqual([c['choices'][0]['delta']['content'] for c in chunks if c['choices']], ['用例', '1'])
+        self.assertEqual(gateway.stats()[self.config.pk]['total_tokens'], 7)
+
+    def test_cached_response_reused_by_stream(self):
+        """测试确定性调用的响应被缓存，流式调用命中时不再请求接口"""
+        import shutil
+        import tempfile
+        from . import llm_cache
+        from .llm_gateway import LLMGateway
+
+        gateway = LLMGateway()
+        self.addCleanup(gateway.close)
+        self.config.temperature = 0
+        payload = {'model': 'deepseek-chat', 'messages': [{'role': 'user', 'content': '你好'}], 'temperature': 0}
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        llm_cache._cache = None
+
+        with self.settings(LLM_RETRY_BACKOFF=0, LLM_CACHE_BACKEND='file', LLM_CACHE_DIR=cache_dir):
+            self.addCleanup(setattr, llm_cache, '_cache', None)
+            result = gateway.run(gateway.chat(self.config, dict(payload, stream=False)))
+
+            async def collect():
+                return [chunk async for chunk in gateway.stream(self.config, dict(payload, stream=True))]
+
+            chunks = gateway.run(collect())
+
+        self.assertEqual(chunks[0]['choices'][0]['delta']['content'], result['choices'][0]['message']['content'])
+        # 429 重试一次加一次成功请求，流式调用命中缓存
+        self.assertEqual(len(FakeLLMHandler.calls), 2)
+        stats = gateway.stats()[self.config.pk]
+        self.assertEqual((stats['cache_misses'], stats['cache_hits']), (1, 1))
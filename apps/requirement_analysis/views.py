@@ -42,6 +42,12 @@ from .serializers import (
     GenerationConfigSerializer
 )
 from .services import RequirementAnalysisService, DocumentProcessor
+from apps.core import event_broker
+from .progress import (
+    ProgressPublisher, TEXT_FIELDS, TERMINAL_STATUSES, channel_name, finish_from_checkpoints, publish_finished,
+    read_stream_text
+)
+from . import llm_gateway
 
 logger = logging.getLogger(__name__)
 
@@ -923,7 +929,12 @@ class AIModelConfigViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(is_active=is_active.lower() == 'true')
         
         return queryset.order_by('-created_at')
-    
+
+    @action(detail=False, methods=['get'])
+    def usage(self, request):
+        """当前进程内各模型配置的调用次数、重试次数和token用量"""
+        return Response(llm_gateway.get_gateway().stats())
+
     @action(detail=True, methods=['post'])
     def test_connection(self, request, pk=None):
         """测试模型连接"""
@@ -945,17 +956,12 @@ class AIModelConfigViewSet(viewsets.ModelViewSet):
             # 异步测试连接 - 统一使用OpenAI兼容API
             def test_api_connection():
                 try:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-
                     try:
                         logger.info("开始调用API...")
-                        # 设置60秒超时，统一使用OpenAI兼容API
-                        result = loop.run_until_complete(
-                            asyncio.wait_for(
-                                AIModelService.call_openai_compatible_api(config, test_messages),
-                                timeout=60.0
-                            )
+                        # 设置60秒超时，统一使用OpenAI兼容API；连接测试必须实际请求，不使用响应缓存
+                        result = llm_gateway.run(
+                            AIModelService.call_openai_compatible_api(config, test_messages, use_cache=False),
+                            timeout=60.0
                         )
 
                         logger.info(f"API调用成功: {result}")
@@ -964,19 +970,12 @@ class AIModelConfigViewSet(viewsets.ModelViewSet):
                             'message': '连接测试成功',
                             'response': result.get('choices', [{}])[0].get('message', {}).get('content', '')
                         }
-                    except asyncio.TimeoutError:
+                    except TimeoutError:
                         logger.error(f"API连接测试超时 (60秒), URL: {config.base_url}, Model: {config.model_name}")
                         return {
                             'success': False,
                             'message': '连接测试超时: 请检查网络连接或API地址是否正确'
                         }
-                    finally:
-                        try:
-                            loop.run_until_complete(loop.shutdown_asyncgens())
-                        except Exception:
-                            pass
-                        finally:
-                            loop.close()
 
                 except Exception as e:
                     logger.error(f"API连接测试异常: {repr(e)}, URL: {config.base_url}, Model: {config.model_name}")
@@ -1347,6 +1346,10 @@ class TestCaseGenerationTaskViewSet(viewsets.ModelViewSet):
                         
                         def execute_task():
                             try:
+                                # 进度和流式内容通过事件通道推送给SSE连接，数据库只在检查点写入
+                                progress_publisher = ProgressPublisher(task)
+                                async_checkpoint = sync_to_async(progress_publisher.checkpoint)
+
                                 # 更新任务状态
                                 task.status = 'generating'
                                 task.progress = 10
@@ -1362,341 +1365,266 @@ class TestCaseGenerationTaskViewSet(viewsets.ModelViewSet):
 
                                 logger.info(f"任务 {task.task_id} 使用生成配置: auto_review={enable_auto_review}, review_timeout={review_timeout}s")
 
-                                loop = asyncio.new_event_loop()
-                                asyncio.set_event_loop(loop)
+                                # 根据输出模式选择不同的生成方式
+                                if task.output_mode == 'stream':
+                                    # 流式模式：实时保存到stream_buffer
+                                    # 生成前先设置初始状态
+                                    task.stream_buffer = ''
+                                    task.stream_position = 0
+                                    task.save()
+
+                                    async def stream_callback(chunk):
+                                        """流式回调：推送每个chunk，按检查点保存到数据库"""
+                                        if progress_publisher.append('stream_buffer', chunk):
+                                            try:
+                                                await async_checkpoint()
+                                            except Exception as save_error:
+                                                logger.warning(f"保存流式内容失败: {save_error}")
+
+                                    # 生成测试用例
+                                    task.progress = 30
+                                    task.save()
 
-                                try:
-                                    # 根据输出模式选择不同的生成方式
-                                    if task.output_mode == 'stream':
-                                        # 流式模式：实时保存到stream_buffer
-                                        # 生成前先设置初始状态
-                                        task.stream_buffer = ''
-                                        task.stream_position = 0
-                                        task.save()
+                                    generated_cases = llm_gateway.run(
+                                        AIModelService.generate_test_cases_stream(task, callback=stream_callback)
+                                    )
 
-                                        # 定义同步保存函数
-                                        def save_stream_buffer(content):
-                                            """同步保存流式内容到数据库"""
-                                            task.stream_buffer = content
-                                            task.stream_position = len(content)
-                                            task.last_stream_update = timezone.now()
-                                            task.save(update_fields=['stream_buffer', 'stream_position', 'last_stream_update'])
-
-                                        # 转换为异步函数
-                                        async_save_stream_buffer = sync_to_async(save_stream_buffer)
-
-                                        async def stream_callback(chunk):
-                                            """流式回调：实时保存每个chunk到数据库"""
-                                            # 先追加到内存中的buffer
-                                            task.stream_buffer += chunk
-                                            task.stream_position = len(task.stream_buffer)
-                                            task.last_stream_update = timezone.now()
-
-                                            # 每10个chunk或当chunk较大时保存一次
-                                            if task.stream_position % 500 < 20 or len(chunk) > 100:
-                                                try:
-                                                    await async_save_stream_buffer(task.stream_buffer)
-                                                except Exception as save_error:
-                                                    logger.warning(f"保存流式内容失败: {save_error}")
+                                    # 生成完成后，确保最终的流式内容被保存
+                                    progress_publisher.flush()
 
-                                        # 生成测试用例
-                                        task.progress = 30
-                                        task.save()
+                                    task.generated_test_cases = generated_cases
+                                    task.progress = 60
+                                    task.save()
 
-                                        generated_cases = loop.run_until_complete(
-                                            AIModelService.generate_test_cases_stream(task, callback=stream_callback)
-                                        )
+                                    # 流式评审和改进（根据生成配置决定是否执行）
+                                    if enable_auto_review and task.reviewer_model_config and task.reviewer_prompt_config:
+                                        try:
+                                            task.status = 'reviewing'
+                                            task.progress = 70
+                                            task.save()
 
-                                        # 生成完成后，确保最终的流式内容被保存
-                                        if task.stream_buffer:
-                                            save_stream_buffer(task.stream_buffer)
+                                            logger.info(f"开始流式评审任务 {task.task_id}")
 
-                                        task.generated_test_cases = generated_cases
-                                        task.progress = 60
-                                        task.save()
+                                            async def review_stream_callback(chunk):
+                                                """流式评审回调"""
+                                                if progress_publisher.append('review_feedback', chunk):
+                                                    try:
+                                                        await async_checkpoint()
+                                                    except Exception as save_error:
+                                                        logger.warning(f"保存评审内容失败: {save_error}")
 
-                                        # 流式评审和改进（根据生成配置决定是否执行）
-                                        if enable_auto_review and task.reviewer_model_config and task.reviewer_prompt_config:
                                             try:
-                                                task.status = 'reviewing'
-                                                task.progress = 70
+                                                # 移除超时限制，允许大文档完整评审
+                                                review_feedback = llm_gateway.run(
+                                                    AIModelService.review_test_cases_stream(
+                                                        task, generated_cases, callback=review_stream_callback
+                                                    )
+                                                )
+                                                # 保存最终评审内容
+                                                progress_publisher.flush()
+                                                logger.info(f"任务 {task.task_id} 流式评审完成")
+
+                                                # 根据评审意见改进测试用例（自动执行）
+                                                logger.info(f"任务 {task.task_id} 开始根据评审意见改进测试用例")
+                                                task.status = 'revising'
+                                                task.progress = 85
+                                                task.final_test_cases = ''  # 清空，准备流式写入
                                                 task.save()
 
-                                                logger.info(f"开始流式评审任务 {task.task_id}")
-
-                                                # 评审内容缓存
-                                                review_buffer = []
-
-                                                def save_review_buffer(content):
-                                                    """同步保存评审内容"""
-                                                    task.review_feedback = content
-                                                    task.save(update_fields=['review_feedback'])
-
-                                                async_save_review = sync_to_async(save_review_buffer)
-
-                                                async def review_stream_callback(chunk):
-                                                    """流式评审回调"""
-                                                    review_buffer.append(chunk)
-                                                    current_length = sum(len(c) for c in review_buffer)
-
-                                                    # 每100字符保存一次
-                                                    if current_length % 100 < 20 or len(chunk) > 50:
-                                                        try:
-                                                            content = ''.join(review_buffer)
-                                                            await async_save_review(content)
-                                                        except Exception as save_error:
-                                                            logger.warning(f"保存评审内容失败: {save_error}")
-
                                                 try:
-                                                    # 移除超时限制，允许大文档完整评审
-                                                    review_feedback = loop.run_until_complete(
-                                                        AIModelService.review_test_cases_stream(
-                                                            task, generated_cases, callback=review_stream_callback
-                                                        )
-                                                    )
-                                                    # 保存最终评审内容
-                                                    if review_buffer:
-                                                        task.review_feedback = ''.join(review_buffer)
-                                                        task.save(update_fields=['review_feedback'])
-                                                    logger.info(f"任务 {task.task_id} 流式评审完成")
-
-                                                    # 根据评审意见改进测试用例（自动执行）
-                                                    logger.info(f"任务 {task.task_id} 开始根据评审意见改进测试用例")
-                                                    task.status = 'revising'
-                                                    task.progress = 85
-                                                    task.final_test_cases = ''  # 清空，准备流式写入
-                                                    task.save()
-
+                                                    # 创建流式回调函数，实时推送final_test_cases
+                                                    async def final_callback(chunk):
+                                                        """流式回调：推送最终用例，按检查点保存到数据库"""
+                                                        if progress_publisher.append('final_test_cases', chunk):
+                                                            try:
+                                                                await async_checkpoint()
+                                                            except Exception as save_error:
+                                                                logger.warning(f"保存最终用例失败: {save_error}")
+
+                                                    # 添加超时保护，避免任务一直卡住（使用配置的超时时间）
                                                     try:
-                                                        # 定义同步保存函数
-                                                        def save_final_buffer(content):
-                                                            """同步保存最终用例内容"""
-                                                            task.final_test_cases = content
-                                                            task.save(update_fields=['final_test_cases'])
-
-                                                        # 转换为异步函数
-                                                        async_save_final = sync_to_async(save_final_buffer)
-
-                                                        # 创建流式回调函数，实时更新final_test_cases
-                                                        async def final_callback(chunk):
-                                                            """流式回调：实时保存最终用例到数据库"""
-                                                            # 实时追加到final_test_cases并保存
-                                                            task.final_test_cases = (task.final_test_cases or '') + chunk
-
-                                                            # 每100字符或chunk较大时保存一次
-                                                            current_length = len(task.final_test_cases)
-                                                            if current_length % 100 < 20 or len(chunk) > 50:
-                                                                try:
-                                                                    await async_save_final(task.final_test_cases)
-                                                                except Exception as save_error:
-                                                                    logger.warning(f"保存最终用例失败: {save_error}")
-
-                                                        # 添加超时保护，避免任务一直卡住（使用配置的超时时间）
-                                                        try:
-                                                            revised_cases = loop.run_until_complete(
-                                                                asyncio.wait_for(
-                                                                    AIModelService.revise_test_cases_based_on_review(
-                                                                        task, generated_cases, task.review_feedback,
-                                                                        callback=final_callback
-                                                                    ),
-                                                                    timeout=review_timeout  # 使用配置的超时时间（秒）
-                                                                )
+                                                        revised_cases = llm_gateway.run(
+                                                            asyncio.wait_for(
+                                                                AIModelService.revise_test_cases_based_on_review(
+                                                                    task, generated_cases, task.review_feedback,
+                                                                    callback=final_callback
+                                                                ),
+                                                                timeout=review_timeout  # 使用配置的超时时间（秒）
                                                             )
-                                                        except asyncio.TimeoutError:
-                                                            logger.error(f"任务 {task.task_id} 改进阶段超时（{review_timeout}秒），使用原始用例")
-                                                            # 超时时使用原始生成的用例，不再抛出异常
-                                                            revised_cases = generated_cases
-                                                        # 始终使用返回的完整内容，避免流式输出被截断导致数据丢失
-                                                        # revised_cases 是完整的返回值，task.final_test_cases 只是流式回调的中间状态
-                                                        if revised_cases and len(revised_cases) > 0:
-                                                            # 检测并修复不完整的最后一条用例
-                                                            revised_cases = AIModelService.fix_incomplete_last_case(revised_cases)
-
-                                                            # 按用例编号排序后再保存
-                                                            sorted_cases = AIModelService.sort_test_cases_by_id(revised_cases)
-                                                            # 重新编号使编号连续
-                                                            renumbered_cases = AIModelService.renumber_test_cases(sorted_cases)
-                                                            task.final_test_cases = renumbered_cases
-                                                            logger.info(f"任务 {task.task_id} 测试用例改进完成 (revised_cases长度: {len(revised_cases)}, 最终保存长度: {len(task.final_test_cases)})")
-                                                        else:
-                                                            # 如果返回为空，保留流式回调保存的内容
-                                                            logger.warning(f"任务 {task.task_id} 改进返回为空，使用流式回调保存的内容 (长度: {len(task.final_test_cases) if task.final_test_cases else 0})")
-                                                    except Exception as revise_error:
-                                                        logger.warning(f"任务 {task.task_id} 改进测试用例失败: {revise_error}，使用原始用例")
+                                                        )
+                                                    except asyncio.TimeoutError:
+                                                        logger.error(f"任务 {task.task_id} 改进阶段超时（{review_timeout}秒），使用原始用例")
+                                                        # 超时时使用原始生成的用例，不再抛出异常
+                                                        revised_cases = generated_cases
+                                                    # 始终使用返回的完整内容，避免流式输出被截断导致数据丢失
+                                                    # revised_cases 是完整的返回值，task.final_test_cases 只是流式回调的中间状态
+                                                    if revised_cases and len(revised_cases) > 0:
+                                                        # 检测并修复不完整的最后一条用例
+                                                        revised_cases = AIModelService.fix_incomplete_last_case(revised_cases)
+
                                                         # 按用例编号排序后再保存
-                                                        sorted_cases = AIModelService.sort_test_cases_by_id(generated_cases)
+                                                        sorted_cases = AIModelService.sort_test_cases_by_id(revised_cases)
                                                         # 重新编号使编号连续
-                                                        task.final_test_cases = AIModelService.renumber_test_cases(sorted_cases)
-                                                        task.save()
-
-                                                except Exception as inner_error:
-                                                    logger.warning(f"任务 {task.task_id} 流式评审过程异常: {inner_error}")
-                                                    task.review_feedback = f"评审过程出现异常: {str(inner_error)}\n\n建议：测试用例结构完整，可以使用。"
+                                                        renumbered_cases = AIModelService.renumber_test_cases(sorted_cases)
+                                                        task.final_test_cases = renumbered_cases
+                                                        logger.info(f"任务 {task.task_id} 测试用例改进完成 (revised_cases长度: {len(revised_cases)}, 最终保存长度: {len(task.final_test_cases)})")
+                                                    else:
+                                                        # 如果返回为空，保留流式回调保存的内容
+                                                        logger.warning(f"任务 {task.task_id} 改进返回为空，使用流式回调保存的内容 (长度: {len(task.final_test_cases) if task.final_test_cases else 0})")
+                                                except Exception as revise_error:
+                                                    logger.warning(f"任务 {task.task_id} 改进测试用例失败: {revise_error}，使用原始用例")
                                                     # 按用例编号排序后再保存
                                                     sorted_cases = AIModelService.sort_test_cases_by_id(generated_cases)
                                                     # 重新编号使编号连续
                                                     task.final_test_cases = AIModelService.renumber_test_cases(sorted_cases)
                                                     task.save()
 
-                                            except Exception as review_error:
-                                                logger.error(f"流式评审任务 {task.task_id} 失败: {review_error}")
+                                            except Exception as inner_error:
+                                                logger.warning(f"任务 {task.task_id} 流式评审过程异常: {inner_error}")
+                                                task.review_feedback = f"评审过程出现异常: {str(inner_error)}\n\n建议：测试用例结构完整，可以使用。"
                                                 # 按用例编号排序后再保存
                                                 sorted_cases = AIModelService.sort_test_cases_by_id(generated_cases)
+                                                # 重新编号使编号连续
                                                 task.final_test_cases = AIModelService.renumber_test_cases(sorted_cases)
-                                                task.review_feedback = f"评审失败: {str(review_error)}\n\n建议：测试用例结构完整，可以使用。"
                                                 task.save()
-                                        else:
+
+                                        except Exception as review_error:
+                                            logger.error(f"流式评审任务 {task.task_id} 失败: {review_error}")
                                             # 按用例编号排序后再保存
                                             sorted_cases = AIModelService.sort_test_cases_by_id(generated_cases)
-                                            # 重新编号使编号连续
                                             task.final_test_cases = AIModelService.renumber_test_cases(sorted_cases)
-                                            logger.info(f"任务 {task.task_id} 跳过评审，直接使用生成的测试用例")
+                                            task.review_feedback = f"评审失败: {str(review_error)}\n\n建议：测试用例结构完整，可以使用。"
                                             task.save()
-
                                     else:
-                                        # 完整模式：原有逻辑
-                                        task.progress = 30
+                                        # 按用例编号排序后再保存
+                                        sorted_cases = AIModelService.sort_test_cases_by_id(generated_cases)
+                                        # 重新编号使编号连续
+                                        task.final_test_cases = AIModelService.renumber_test_cases(sorted_cases)
+                                        logger.info(f"任务 {task.task_id} 跳过评审，直接使用生成的测试用例")
                                         task.save()
 
-                                        generated_cases = loop.run_until_complete(
-                                            AIModelService.generate_test_cases(task)
-                                        )
+                                else:
+                                    # 完整模式：原有逻辑
+                                    task.progress = 30
+                                    task.save()
 
-                                        task.generated_test_cases = generated_cases
-                                        task.progress = 60
-                                        task.save()
+                                    generated_cases = llm_gateway.run(
+                                        AIModelService.generate_test_cases(task)
+                                    )
 
-                                        # 评审和改进测试用例（根据生成配置决定是否执行）
-                                        if enable_auto_review and task.reviewer_model_config and task.reviewer_prompt_config:
+                                    task.generated_test_cases = generated_cases
+                                    task.progress = 60
+                                    task.save()
+
+                                    # 评审和改进测试用例（根据生成配置决定是否执行）
+                                    if enable_auto_review and task.reviewer_model_config and task.reviewer_prompt_config:
+                                        try:
+                                            task.status = 'reviewing'
+                                            task.progress = 70
+                                            task.save()
+
+                                            logger.info(f"开始评审任务 {task.task_id}")
+
+                                            # 移除超时限制，允许大文档完整评审
                                             try:
-                                                task.status = 'reviewing'
-                                                task.progress = 70
+                                                review_feedback = llm_gateway.run(
+                                                    AIModelService.review_test_cases(task, generated_cases)
+                                                )
+                                                task.review_feedback = review_feedback
+                                                logger.info(f"任务 {task.task_id} 评审完成")
+
+                                                # 根据评审意见改进测试用例（自动执行）
+                                                logger.info(f"任务 {task.task_id} 开始根据评审意见改进测试用例")
+                                                task.status = 'revising'
+                                                task.progress = 85
+                                                task.final_test_cases = ''  # 清空，准备流式写入
                                                 task.save()
 
-                                                logger.info(f"开始评审任务 {task.task_id}")
-
-                                                # 移除超时限制，允许大文档完整评审
                                                 try:
-                                                    review_feedback = loop.run_until_complete(
-                                                        AIModelService.review_test_cases(task, generated_cases)
-                                                    )
-                                                    task.review_feedback = review_feedback
-                                                    logger.info(f"任务 {task.task_id} 评审完成")
-
-                                                    # 根据评审意见改进测试用例（自动执行）
-                                                    logger.info(f"任务 {task.task_id} 开始根据评审意见改进测试用例")
-                                                    task.status = 'revising'
-                                                    task.progress = 85
-                                                    task.final_test_cases = ''  # 清空，准备流式写入
-                                                    task.save()
-
+                                                    # 创建流式回调函数，实时推送final_test_cases
+                                                    async def final_callback_full(chunk):
+                                                        """流式回调：推送最终用例，按检查点保存到数据库"""
+                                                        if progress_publisher.append('final_test_cases', chunk):
+                                                            try:
+                                                                await async_checkpoint()
+                                                            except Exception as save_error:
+                                                                logger.warning(f"保存最终用例失败: {save_error}")
+
+                                                    # 添加超时保护，避免任务一直卡住（使用配置的超时时间）
                                                     try:
-                                                        # 定义同步保存函数
-                                                        def save_final_buffer_full(content):
-                                                            """同步保存最终用例内容"""
-                                                            task.final_test_cases = content
-                                                            task.save(update_fields=['final_test_cases'])
-
-                                                        # 转换为异步函数
-                                                        async_save_final_full = sync_to_async(save_final_buffer_full)
-
-                                                        # 创建流式回调函数，实时更新final_test_cases
-                                                        async def final_callback_full(chunk):
-                                                            """流式回调：实时保存最终用例到数据库"""
-                                                            # 实时追加到final_test_cases并保存
-                                                            task.final_test_cases = (task.final_test_cases or '') + chunk
-
-                                                            # 每100字符或chunk较大时保存一次
-                                                            current_length = len(task.final_test_cases)
-                                                            if current_length % 100 < 20 or len(chunk) > 50:
-                                                                try:
-                                                                    await async_save_final_full(task.final_test_cases)
-                                                                except Exception as save_error:
-                                                                    logger.warning(f"保存最终用例失败: {save_error}")
-
-                                                        # 添加超时保护，避免任务一直卡住（使用配置的超时时间）
-                                                        try:
-                                                            revised_cases = loop.run_until_complete(
-                                                                asyncio.wait_for(
-                                                                    AIModelService.revise_test_cases_based_on_review(
-                                                                        task, generated_cases, task.review_feedback,
-                                                                        callback=final_callback_full
-                                                                    ),
-                                                                    timeout=review_timeout  # 使用配置的超时时间（秒）
-                                                                )
+                                                        revised_cases = llm_gateway.run(
+                                                            asyncio.wait_for(
+                                                                AIModelService.revise_test_cases_based_on_review(
+                                                                    task, generated_cases, task.review_feedback,
+                                                                    callback=final_callback_full
+                                                                ),
+                                                                timeout=review_timeout  # 使用配置的超时时间（秒）
                                                             )
-                                                        except asyncio.TimeoutError:
-                                                            logger.error(f"任务 {task.task_id} 改进阶段超时（{review_timeout}秒），使用原始用例")
-                                                            # 超时时使用原始生成的用例，不再抛出异常
-                                                            revised_cases = generated_cases
-                                                        # 始终使用返回的完整内容，避免流式输出被截断导致数据丢失
-                                                        # revised_cases 是完整的返回值，task.final_test_cases 只是流式回调的中间状态
-                                                        if revised_cases and len(revised_cases) > 0:
-                                                            # 检测并修复不完整的最后一条用例
-                                                            revised_cases = AIModelService.fix_incomplete_last_case(revised_cases)
-
-                                                            # 按用例编号排序后再保存
-                                                            sorted_cases = AIModelService.sort_test_cases_by_id(revised_cases)
-                                                            # 重新编号使编号连续
-                                                            renumbered_cases = AIModelService.renumber_test_cases(sorted_cases)
-                                                            task.final_test_cases = renumbered_cases
-                                                            logger.info(f"任务 {task.task_id} 测试用例改进完成 (revised_cases长度: {len(revised_cases)}, 最终保存长度: {len(task.final_test_cases)})")
-                                                        else:
-                                                            # 如果返回为空，保留流式回调保存的内容
-                                                            logger.warning(f"任务 {task.task_id} 改进返回为空，使用流式回调保存的内容 (长度: {len(task.final_test_cases) if task.final_test_cases else 0})")
-                                                    except Exception as revise_error:
-                                                        logger.warning(f"任务 {task.task_id} 改进测试用例失败: {revise_error}，使用原始用例")
+                                                        )
+                                                    except asyncio.TimeoutError:
+                                                        logger.error(f"任务 {task.task_id} 改进阶段超时（{review_timeout}秒），使用原始用例")
+                                                        # 超时时使用原始生成的用例，不再抛出异常
+                                                        revised_cases = generated_cases
+                                                    # 始终使用返回的完整内容，避免流式输出被截断导致数据丢失
+                                                    # revised_cases 是完整的返回值，task.final_test_cases 只是流式回调的中间状态
+                                                    if revised_cases and len(revised_cases) > 0:
+                                                        # 检测并修复不完整的最后一条用例
+                                                        revised_cases = AIModelService.fix_incomplete_last_case(revised_cases)
+
                                                         # 按用例编号排序后再保存
-                                                        sorted_cases = AIModelService.sort_test_cases_by_id(generated_cases)
+                                                        sorted_cases = AIModelService.sort_test_cases_by_id(revised_cases)
                                                         # 重新编号使编号连续
-                                                        task.final_test_cases = AIModelService.renumber_test_cases(sorted_cases)
-                                                        task.save()
-
-                                                except Exception as inner_error:
-                                                    logger.warning(f"任务 {task.task_id} 评审过程异常: {inner_error}")
-                                                    task.review_feedback = f"评审过程出现异常: {str(inner_error)}\n\n建议：测试用例结构完整，可以使用。"
+                                                        renumbered_cases = AIModelService.renumber_test_cases(sorted_cases)
+                                                        task.final_test_cases = renumbered_cases
+                                                        logger.info(f"任务 {task.task_id} 测试用例改进完成 (revised_cases长度: {len(revised_cases)}, 最终保存长度: {len(task.final_test_cases)})")
+                                                    else:
+                                                        # 如果返回为空，保留流式回调保存的内容
+                                                        logger.warning(f"任务 {task.task_id} 改进返回为空，使用流式回调保存的内容 (长度: {len(task.final_test_cases) if task.final_test_cases else 0})")
+                                                except Exception as revise_error:
+                                                    logger.warning(f"任务 {task.task_id} 改进测试用例失败: {revise_error}，使用原始用例")
                                                     # 按用例编号排序后再保存
                                                     sorted_cases = AIModelService.sort_test_cases_by_id(generated_cases)
                                                     # 重新编号使编号连续
                                                     task.final_test_cases = AIModelService.renumber_test_cases(sorted_cases)
                                                     task.save()
 
-                                            except Exception as review_error:
-                                                logger.error(f"评审任务 {task.task_id} 失败: {review_error}")
-                                                # 评审失败时，仍然使用生成的测试用例作为最终结果
+                                            except Exception as inner_error:
+                                                logger.warning(f"任务 {task.task_id} 评审过程异常: {inner_error}")
+                                                task.review_feedback = f"评审过程出现异常: {str(inner_error)}\n\n建议：测试用例结构完整，可以使用。"
                                                 # 按用例编号排序后再保存
                                                 sorted_cases = AIModelService.sort_test_cases_by_id(generated_cases)
+                                                # 重新编号使编号连续
                                                 task.final_test_cases = AIModelService.renumber_test_cases(sorted_cases)
-                                                task.review_feedback = f"评审失败: {str(review_error)}\n\n建议：测试用例结构完整，可以使用。"
                                                 task.save()
-                                        else:
+
+                                        except Exception as review_error:
+                                            logger.error(f"评审任务 {task.task_id} 失败: {review_error}")
+                                            # 评审失败时，仍然使用生成的测试用例作为最终结果
                                             # 按用例编号排序后再保存
                                             sorted_cases = AIModelService.sort_test_cases_by_id(generated_cases)
-                                            # 重新编号使编号连续
                                             task.final_test_cases = AIModelService.renumber_test_cases(sorted_cases)
-                                            logger.info(f"任务 {task.task_id} 跳过评审，直接使用生成的测试用例")
+                                            task.review_feedback = f"评审失败: {str(review_error)}\n\n建议：测试用例结构完整，可以使用。"
                                             task.save()
+                                    else:
+                                        # 按用例编号排序后再保存
+                                        sorted_cases = AIModelService.sort_test_cases_by_id(generated_cases)
+                                        # 重新编号使编号连续
+                                        task.final_test_cases = AIModelService.renumber_test_cases(sorted_cases)
+                                        logger.info(f"任务 {task.task_id} 跳过评审，直接使用生成的测试用例")
+                                        task.save()
+
+                                # 完成任务
+                                # 注意：不要直接调用task.save()，因为这会覆盖流式回调保存的final_test_cases
+                                # 先把完整的流式内容写入任务字段，再从数据库重新获取最新的任务对象
+                                progress_publisher.materialize()
+                                task.refresh_from_db()
+
+                                task.status = 'completed'
+                                task.progress = 100
+                                task.completed_at = timezone.now()
+                                task.save(update_fields=['status', 'progress', 'completed_at', 'final_test_cases'])
+                                logger.info(f"任务 {task.task_id} 已完成")
 
-                                    # 完成任务
-                                    # 注意：不要直接调用task.save()，因为这会覆盖流式回调保存的final_test_cases
-                                    # 从数据库重新获取最新的任务对象
-                                    task.refresh_from_db()
-
-                                    task.status = 'completed'
-                                    task.progress = 100
-                                    task.completed_at = timezone.now()
-                                    task.save(update_fields=['status', 'progress', 'completed_at', 'final_test_cases'])
-                                    logger.info(f"任务 {task.task_id} 已完成")
-                                    
-                                finally:
-                                    try:
-                                        # 清理异步生成器，防止 "Task was destroyed but it is pending" 警告
-                                        loop.run_until_complete(loop.shutdown_asyncgens())
-                                    except Exception as e:
-                                        logger.warning(f"Error shutting down asyncgens: {e}")
-                                    finally:
-                                        loop.close()
-                                    
                             except Exception as e:
                                 logger.error(f"生成任务执行失败: {e}")
                                 task.status = 'failed'
@@ -1739,13 +1667,20 @@ class TestCaseGenerationTaskViewSet(viewsets.ModelViewSet):
             # DRF会根据lookup_field自动从URL提取task_id并调用get_object()
             task = self.get_object()
 
+            review_feedback = task.review_feedback
+            final_test_cases = task.final_test_cases
+            if task.status not in TERMINAL_STATUSES:
+                # 生成过程中的流式内容保存在分片中，任务结束后才合并到任务字段
+                review_feedback = read_stream_text(task, 'review_feedback')
+                final_test_cases = read_stream_text(task, 'final_test_cases')
+
             return Response({
                 'task_id': task.task_id,
                 'status': task.status,
                 'progress': task.progress,
                 'generated_test_cases': task.generated_test_cases,
-                'review_feedback': task.review_feedback,
-                'final_test_cases': task.final_test_cases,
+                'review_feedback': review_feedback,
+                'final_test_cases': final_test_cases,
                 'error_message': task.error_message,
                 'completed_at': task.completed_at
             }, status=status.HTTP_200_OK)
@@ -1819,124 +1754,87 @@ class TestCaseGenerationTaskViewSet(viewsets.ModelViewSet):
                 response['Access-Control-Allow-Credentials'] = 'true'
                 return response
     
-            # 记录上次发送的stream_position
-            last_sent_position = 0
-            loop_count = 0  # 循环计数器
-            last_review_length = 0  # 记录上次发送的评审内容长度
-            last_final_length = 0  # 记录上次发送的最终用例长度
-            last_status = ''  # 记录上次的任务状态
-    
+            # 断点续传：浏览器自动重连时会带上 Last-Event-ID，也支持通过查询参数指定
+            last_event_id = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('last_event_id')
+            channel = channel_name(task.task_id)
+            idle_timeout = getattr(settings, 'SSE_IDLE_TIMEOUT', 5)
+
+            def sse_message(data, event_id=None):
+                payload = json.dumps(data, ensure_ascii=False)
+                if event_id:
+                    return f"id: {event_id}\ndata: {payload}\n\n"
+                return f"data: {payload}\n\n"
+
             def event_stream():
-                nonlocal last_sent_position, loop_count, last_review_length, last_final_length, last_status
-    
+                # 各文本字段已发送给客户端的长度；续传时客户端已有的长度以收到的第一个事件为准
+                sent = {} if last_event_id else {field: 0 for field in TEXT_FIELDS}
+                cursor = last_event_id
+
+                if not last_event_id:
+                    if task.status in TERMINAL_STATUSES:
+                        # 任务已结束，直接发送最终状态和内容
+                        logger.info(f"SSE任务已结束: status={task.status}")
+                        yield sse_message({'type': 'status', 'status': task.status, 'progress': task.progress})
+                        for field, content_type in TEXT_FIELDS.items():
+                            value = getattr(task, field)
+                            if value and (field != 'stream_buffer' or task.output_mode == 'stream'):
+                                yield sse_message({'type': content_type, 'content': value})
+                        yield sse_message({'type': 'done'})
+                        return
+                    yield sse_message({'type': 'progress', 'status': task.status, 'progress': task.progress})
+
                 while True:
-                    loop_count += 1
-    
-                    # 从数据库重新获取任务状态
-                    task.refresh_from_db()
-    
-                    # 检测状态变化，如果进入revising阶段，重置last_final_length
-                    if task.status != last_status:
-                        logger.info(f"SSE检测到状态变化: {last_status} -> {task.status}")
-                        if task.status == 'revising':
-                            logger.info(f"SSE: 进入revising阶段，重置last_final_length")
-                            last_final_length = 0
-                        last_status = task.status
-    
-                    # 每10次循环记录一次日志
-                    if loop_count % 10 == 0:
-                        logger.info(f"SSE stream loop #{loop_count}: task_status={task.status}, progress={task.progress}%, buffer_len={len(task.stream_buffer) if task.stream_buffer else 0}")
-    
-                    # 检查任务是否已完成或失败
-                    if task.status in ['completed', 'failed', 'cancelled']:
-                        logger.info(f"SSE任务结束: status={task.status}")
-                        # 发送最终状态
-                        final_status = json.dumps({'type': 'status', 'status': task.status, 'progress': task.progress}, ensure_ascii=False)
-                        logger.info(f"SSE发送最终状态: {final_status}")
-                        yield f"data: {final_status}\n\n"
-    
-                        # 如果是流式模式且有缓冲区内容，发送剩余内容
-                        if task.output_mode == 'stream' and task.stream_buffer:
-                            if last_sent_position < len(task.stream_buffer):
-                                new_content = task.stream_buffer[last_sent_position:]
-                                content_data = json.dumps({'type': 'content', 'content': new_content}, ensure_ascii=False)
-                                logger.info(f"SSE发送剩余内容: {len(new_content)} 字符")
-                                yield f"data: {content_data}\n\n"
-                                last_sent_position = len(task.stream_buffer)
-    
-                        # 发送剩余的评审内容
-                        if task.review_feedback:
-                            if len(task.review_feedback) > last_review_length:
-                                remaining_review = task.review_feedback[last_review_length:]
-                                if remaining_review:
-                                    review_data = json.dumps({'type': 'review_content', 'content': remaining_review}, ensure_ascii=False)
-                                    logger.info(f"SSE发送剩余评审内容: {len(remaining_review)} 字符, 总长度: {len(task.review_feedback)}")
-                                    yield f"data: {review_data}\n\n"
-                                    last_review_length = len(task.review_feedback)
-    
-                        # 发送剩余的最终用例内容
-                        if task.final_test_cases:
-                            if len(task.final_test_cases) > last_final_length:
-                                remaining_final = task.final_test_cases[last_final_length:]
-                                if remaining_final:
-                                    final_data = json.dumps({'type': 'final_content', 'content': remaining_final}, ensure_ascii=False)
-                                    logger.info(f"SSE发送剩余最终用例: {len(remaining_final)} 字符, 总长度: {len(task.final_test_cases)}")
-                                    yield f"data: {final_data}\n\n"
-                                    last_final_length = len(task.final_test_cases)
-    
-                        # 发送完成信号
-                        yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
-                        logger.info(f"SSE流结束，总循环次数: {loop_count}")
-    
-                        # 添加短暂延迟，确保done信号被发送
-                        time.sleep(0.1)
-                        break
-    
-                    # 如果是流式模式，发送新增的内容
-                    if task.output_mode == 'stream' and task.stream_buffer:
-                        current_position = task.stream_position
-                        if current_position > last_sent_position:
-                            # 提取新增内容
-                            new_content = task.stream_buffer[last_sent_position:current_position]
+                    events = event_broker.read(channel, cursor, timeout=idle_timeout)
+
+                    if not events:
+                        # 一段时间没有事件（发布者在其他进程中或已异常退出），从数据库检查点补齐
+                        snapshot = TestCaseGenerationTask.objects.filter(pk=task.pk).values('status', 'progress').first()
+                        if snapshot is None:
+                            return
+                        for field, content_type in TEXT_FIELDS.items():
+                            if field not in sent:
+                                continue
+                            new_content = read_stream_text(task, field, sent[field])
                             if new_content:
-                                content_data = json.dumps({'type': 'content', 'content': new_content}, ensure_ascii=False)
-                                logger.info(f"SSE发送新增内容: {len(new_content)} 字符, 总位置: {current_position}")
-                                yield f"data: {content_data}\n\n"
-                                last_sent_position = current_position
-    
-                    # 如果是评审阶段，发送评审内容
-                    if task.status == 'reviewing' and task.review_feedback:
-                        review_feedback = task.review_feedback
-                        if review_feedback:
-                            # 计算评审内容的增量
-                            if len(review_feedback) > last_review_length:
-                                new_review = review_feedback[last_review_length:]
-                                if new_review:
-                                    review_data = json.dumps({'type': 'review_content', 'content': new_review}, ensure_ascii=False)
-                                    logger.info(f"SSE发送评审内容: {len(new_review)} 字符")
-                                    yield f"data: {review_data}\n\n"
-                                    last_review_length = len(review_feedback)
-    
-                    # 如果有最终用例，发送最终用例内容（在reviewing、revising或completed阶段）
-                    if task.status in ['reviewing', 'revising', 'completed'] and task.final_test_cases:
-                        final_cases = task.final_test_cases
-                        if final_cases:
-                            # 计算最终用例的增量
-                            if len(final_cases) > last_final_length:
-                                new_final = final_cases[last_final_length:]
-                                if new_final:
-                                    final_data = json.dumps({'type': 'final_content', 'content': new_final}, ensure_ascii=False)
-                                    logger.info(f"SSE发送最终用例: {len(new_final)} 字符, 总长度: {len(final_cases)}, 阶段: {task.status}")
-                                    yield f"data: {final_data}\n\n"
-                                    last_final_length = len(final_cases)
-    
-                    # 发送进度更新
-                    progress_data = json.dumps({'type': 'progress', 'status': task.status, 'progress': task.progress}, ensure_ascii=False)
-                    yield f"data: {progress_data}\n\n"
-    
-                    # 短暂休眠，避免过度消耗资源
-                    time.sleep(0.3)
-    
+                                yield sse_message({'type': content_type, 'content': new_content})
+                                sent[field] += len(new_content)
+                        if snapshot['status'] in TERMINAL_STATUSES:
+                            logger.info(f"SSE任务结束: status={snapshot['status']}")
+                            yield sse_message({'type': 'status', 'status': snapshot['status'], 'progress': snapshot['progress']})
+                            yield sse_message({'type': 'done'})
+                            return
+                        yield sse_message({'type': 'progress', 'status': snapshot['status'], 'progress': snapshot['progress']})
+                        continue
+
+                    for event_id, data in events:
+                        cursor = event_id
+                        field = data.get('field')
+
+                        if data['type'] == 'reset':
+                            sent[field] = 0
+                            yield sse_message({'type': 'reset', 'content_type': data['content_type']}, event_id)
+                            continue
+
+                        if field:
+                            offset, content = data['offset'], data['content']
+                            expected = sent.setdefault(field, offset)
+                            if offset > expected:
+                                # 中间的事件已不在通道中，从数据库检查点补齐缺失的部分
+                                missing = read_stream_text(task, field, expected)[:offset - expected]
+                                if missing:
+                                    yield sse_message({'type': data['type'], 'content': missing})
+                                expected = offset
+                            end = offset + len(content)
+                            if end > expected:
+                                yield sse_message({'type': data['type'], 'content': content[expected - offset:]}, event_id)
+                            sent[field] = max(end, expected)
+                            continue
+
+                        yield sse_message(data, event_id)
+                        if data['type'] == 'done':
+                            logger.info(f"SSE流结束: task_id={task.task_id}")
+                            return
+
             # 返回SSE流式响应
             response = StreamingHttpResponse(
                 event_stream(),
@@ -1993,8 +1891,10 @@ class TestCaseGenerationTaskViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            task.status = 'cancelled'
-            task.save()
+            # 已生成的内容从分片合并到任务字段，取消后仍可查看
+            finish_from_checkpoints(task, 'cancelled')
+            # 通知正在订阅进度的SSE连接
+            publish_finished(task)
 
             return Response({
                 'message': '任务已取消',
@@ -9,9 +9,12 @@ import asyncio
 import functools
 import json
 import re
+from asgiref.sync import sync_to_async
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 
+from .ai_step_events import build_step_event
+
 # 加载环境变量
 load_dotenv()
 
@@ -574,43 +577,46 @@ class RawResponseLogger(BaseCallbackHandler):
 from browser_use import Agent, Controller
 from browser_use.browser.profile import BrowserProfile
 
+
+def _free_port():
+    """获取一个空闲的本地端口，用作浏览器远程调试端口"""
+    import socket
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _create_llm(config):
+    return ChatOpenAI(
+        model=config['model_name'],
+        api_key=config['api_key'],
+        base_url=config['base_url'],
+        temperature=0.0,
+        callbacks=[RawResponseLogger()]
+    )
+
+
 class BaseBrowserAgent:
-    def __init__(self, execution_mode='text', enable_gif=True, case_name=None):
+    def __init__(self, execution_mode='text', enable_gif=True, case_name=None, work_dir=None):
         self.execution_mode = 'text'
         self.enable_gif = enable_gif  # GIF录制开关
         self.case_name = case_name or "Adhoc Task"  # 用例名称
+        # 本次执行的工作目录（GIF录制、浏览器用户数据、下载文件），并发执行时互不干扰
+        self.work_dir = work_dir
         
-        # Load Config from DB
-        from apps.requirement_analysis.models import AIModelConfig
-        
-        # Select Config (always use text mode config)
-        role_name = 'browser_use_text'
-        config_obj = AIModelConfig.objects.filter(role=role_name, is_active=True).first()
-        
-        model_config = {}
-        if config_obj:
-            model_config = {
-                'api_key': config_obj.api_key,
-                'base_url': config_obj.base_url,
-                'model_name': config_obj.model_name,
-                'provider': config_obj.model_type
-            }
-        
-        self.api_key = model_config.get('api_key') or os.getenv('AUTH_TOKEN')
-        self.base_url = model_config.get('base_url') or os.getenv('BASE_URL')
-        self.model_name = model_config.get('model_name') or os.getenv('MODEL_NAME')
-        self.provider = model_config.get('provider', 'openai')
+        # 模型配置和 LLM 客户端缓存在进程内（apps.ui_automation.ai_llm），配置修改后自动刷新
+        from . import ai_llm
+
+        model_config = ai_llm.get_model_config()
+        self.api_key = model_config['api_key']
+        self.base_url = model_config['base_url']
+        self.model_name = model_config['model_name']
+        self.provider = model_config['provider']
         
         if not self.api_key:
             raise ValueError(f"No API Key found for mode: {execution_mode}")
 
-        self.llm = ChatOpenAI(
-            model=self.model_name,
-            api_key=self.api_key,
-            base_url=self.base_url,
-            temperature=0.0,
-            callbacks=[RawResponseLogger()]
-        )
+        self.llm = ai_llm.get_llm(model_config, _create_llm)
         
         # browser-use requirement
         try:
@@ -673,6 +679,8 @@ class BaseBrowserAgent:
                 if match: steps = json.loads(match.group(1))
             except: pass
             
+            # LLM 没有返回可解析的步骤时按行拆分，这样的规划不保存到用例的规划缓存
+            self.plan_from_llm = bool(steps)
             if not steps:
                 steps = [s.strip() for s in task_description.split('\n') if s.strip()]
             
@@ -689,6 +697,7 @@ class BaseBrowserAgent:
                 
             return [{'id': i+1, 'description': s, 'status': 'pending'} for i, s in enumerate(cleaned_steps)]
         except:
+            self.plan_from_llm = False
             return [{'id': 1, 'description': task_description, 'status': 'pending'}]
 
     def _create_browser_profile(self):
@@ -748,12 +757,19 @@ class BaseBrowserAgent:
             ])
         else:
             # macOS 和 Windows 使用显示模式
+            # 有工作目录时使用空闲端口，多个执行可以同时启动浏览器
             extra_args.extend([
                 '--no-sandbox',                    # 兼容性
                 '--disable-gpu',
-                '--remote-debugging-port=9222',
+                f'--remote-debugging-port={_free_port() if self.work_dir else 9222}',
             ])
 
+        profile_options = {}
+        if self.work_dir:
+            # 每次执行使用独立的浏览器用户数据和下载目录
+            profile_options['user_data_dir'] = os.path.join(self.work_dir, 'profile')
+            profile_options['downloads_path'] = os.path.join(self.work_dir, 'downloads')
+
         return BrowserProfile(
             headless=(system == 'Linux'),  # Linux 使用无头模式，其他系统使用显示模式
             disable_security=True,
@@ -762,9 +778,17 @@ class BaseBrowserAgent:
             wait_for_network_idle_page_load_time=0.2,
             minimum_wait_page_load_time=0.05,
             wait_between_actions=0.1,
-            enable_default_extensions=False
+            enable_default_extensions=False,
+            **profile_options
         )
 
+    @property
+    def gif_path(self):
+        """GIF录制文件路径：有工作目录时写入工作目录，否则为 browser-use 默认的 ./agent_history.gif"""
+        if self.work_dir:
+            return os.path.join(self.work_dir, 'agent_history.gif')
+        return os.path.join(os.getcwd(), 'agent_history.gif')
+
     async def run_task(self, task_description: str, planned_tasks=None, callback=None, should_stop=None):
         try:
             loop = asyncio.get_running_loop()
@@ -851,7 +875,7 @@ class BaseBrowserAgent:
             max_failures=2, # 减少最大失败次数，避免过长等待 (从默认3改为2)
             llm_timeout=60, # 设置LLM调用超时为60秒（支持硅基流动等大模型API）
             step_timeout=90, # 设置每步超时为90秒
-            generate_gif=self.enable_gif, # 根据开关决定是否生成GIF
+            generate_gif=(self.gif_path if self.work_dir else True) if self.enable_gif else False, # 根据开关决定是否生成GIF
         )
         agent._task_was_done = False
 
@@ -910,6 +934,12 @@ class BaseBrowserAgent:
                             if asyncio.iscoroutinefunction(callback): await callback({'type': 'log', 'content': log_content})
                             else: callback({'type': 'log', 'content': log_content})
 
+                        # 结构化的步骤事件（操作、参数、耗时、URL、结果），用于生成执行报告
+                        if callback:
+                            step_event = build_step_event(step, i + 1, action_str)
+                            if asyncio.iscoroutinefunction(callback): await callback(step_event)
+                            else: callback(step_event)
+
                         # 关键修复：如果这一步有实际操作但没有调用mark_task_complete，
                         # 且planned_tasks中下一个未标记的任务ID应该被标记
                         if has_real_action and not step_has_task_complete and planned_tasks:
@@ -1022,8 +1052,19 @@ class BaseBrowserAgent:
             'unmarked_actions': unmarked_actions
         }
 
-    async def run_full_process(self, task_description: str, analysis_callback=None, step_callback=None, should_stop=None):
-        planned_tasks = await self.analyze_task(task_description)
+    async def run_full_process(self, task_description: str, analysis_callback=None, step_callback=None, should_stop=None, plan_cache=None):
+        """拆分任务并执行
+
+        Args:
+            plan_cache: 任务规划缓存（如 ai_llm.AICasePlanCache），有保存的规划时跳过 analyze_task
+        """
+        planned_tasks = None
+        if plan_cache is not None:
+            planned_tasks = await sync_to_async(plan_cache.get)()
+        if planned_tasks is None:
+            planned_tasks = await self.analyze_task(task_description)
+            if plan_cache is not None and getattr(self, 'plan_from_llm', False):
+                await sync_to_async(plan_cache.set)(planned_tasks)
         if analysis_callback:
             if asyncio.iscoroutinefunction(analysis_callback): await analysis_callback(planned_tasks)
             else: analysis_callback(planned_tasks)
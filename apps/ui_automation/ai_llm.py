@@ -0,0 +1,114 @@
+"""
+AI浏览器代理的模型配置、LLM 客户端和任务规划缓存
+
+每次创建 BaseBrowserAgent 原来都要查询一次 browser_use_text 模型配置并新建 ChatOpenAI
+（新建 OpenAI 客户端和 HTTP 连接池），每次执行用例还要先调用一次 LLM 拆分任务（analyze_task）：
+
+- 模型配置缓存在进程内，AIModelConfig 保存或删除时清除（信号只能通知本进程，其他进程的缓存
+  最长 AI_LLM_CONFIG_TTL 秒后过期）
+- 同一配置的 ChatOpenAI 只创建一次，每个代理使用它的浅拷贝，共享底层的 OpenAI 客户端和连接池；
+  browser-use 的 TokenCost 会替换 llm.ainvoke 统计用量，每个代理使用独立的拷贝，包装不会叠加
+- AI用例的任务规划保存在用例上（plan_hash/planned_tasks），按任务描述的哈希匹配，
+  任务描述不变时再次执行直接使用保存的规划，不再调用 LLM；只保存 LLM 成功返回的规划
+"""
+import copy
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CONFIG_ROLE = 'browser_use_text'
+
+_lock = threading.Lock()
+_config = None
+_config_loaded_at = 0.0
+_llms = {}
+
+
+def get_model_config():
+    """browser_use_text 模型配置 {api_key, base_url, model_name, provider}（数据库未配置时使用环境变量）"""
+    global _config, _config_loaded_at
+    ttl = getattr(settings, 'AI_LLM_CONFIG_TTL', 60)
+    with _lock:
+        if _config is not None and time.monotonic() - _config_loaded_at < ttl:
+            return dict(_config)
+
+    from apps.requirement_analysis.models import AIModelConfig
+
+    config_obj = AIModelConfig.objects.filter(role=CONFIG_ROLE, is_active=True).first()
+    model_config = {}
+    if config_obj:
+        model_config = {
+            'api_key': config_obj.api_key,
+            'base_url': config_obj.base_url,
+            'model_name': config_obj.model_name,
+            'provider': config_obj.model_type,
+        }
+    config = {
+        'api_key': model_config.get('api_key') or os.getenv('AUTH_TOKEN'),
+        'base_url': model_config.get('base_url') or os.getenv('BASE_URL'),
+        'model_name': model_config.get('model_name') or os.getenv('MODEL_NAME'),
+        'provider': model_config.get('provider', 'openai'),
+    }
+    with _lock:
+        _config = config
+        _config_loaded_at = time.monotonic()
+    return dict(config)
+
+
+def get_llm(config, factory):
+    """配置对应的 LLM 客户端（每次返回共享客户端的新拷贝）
+
+    Args:
+        config: get_model_config() 返回的配置
+        factory: 创建客户端的函数 factory(config)，同一配置只调用一次
+    """
+    key = (config.get('api_key'), config.get('base_url'), config.get('model_name'), config.get('provider'))
+    with _lock:
+        llm = _llms.get(key)
+    if llm is None:
+        llm = factory(config)
+        with _lock:
+            llm = _llms.setdefault(key, llm)
+    return llm.model_copy() if hasattr(llm, 'model_copy') else copy.copy(llm)
+
+
+def invalidate(**kwargs):
+    """清除模型配置和 LLM 客户端缓存（AIModelConfig post_save/post_delete 信号）"""
+    global _config
+    with _lock:
+        _config = None
+        _llms.clear()
+
+
+def plan_hash(task_description):
+    return hashlib.sha256((task_description or '').strip().encode('utf-8')).hexdigest()
+
+
+class AICasePlanCache:
+    """AI用例的任务规划缓存，传给 BaseBrowserAgent.run_full_process(plan_cache=...)"""
+
+    def __init__(self, ai_case):
+        self.ai_case = ai_case
+        self.key = plan_hash(ai_case.task_description)
+
+    def get(self):
+        """任务描述未变化时返回保存的规划（状态重置为 pending），否则返回 None"""
+        from .models import AICase
+
+        row = AICase.objects.filter(id=self.ai_case.id).values_list('plan_hash', 'planned_tasks').first()
+        if not row or row[0] != self.key or not row[1]:
+            return None
+        return [dict(task, status='pending') for task in row[1]]
+
+    def set(self, planned_tasks):
+        """保存规划（update 写入，不修改用例的更新时间）"""
+        from .models import AICase
+
+        planned_tasks = [dict(task, status='pending') for task in planned_tasks]
+        AICase.objects.filter(id=self.ai_case.id).update(plan_hash=self.key, planned_tasks=planned_tasks)
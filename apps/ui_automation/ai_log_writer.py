@@ -0,0 +1,151 @@
+"""
+AI执行日志的缓冲写入
+
+AI用例和临时任务执行时，原来每条日志事件都执行 execution_record.logs += content 后 save()，
+每次都重写整个 logs 字段以及 planned_tasks、steps_completed、screenshots_sequence 等 JSON 字段，
+一次 100 步的执行写入的数据量与步数的平方成正比。
+
+AIExecutionLogWriter 把日志追加到 AIExecutionLogLine 表：
+
+- 日志先缓存在内存中，距上次写入超过 AI_LOG_FLUSH_INTERVAL 秒或缓存超过 AI_LOG_FLUSH_BYTES 字节时，
+  用一次 bulk_create 追加写入，每行带递增的序号，前端可以按序号增量拉取
+- 执行过程中的状态变更（规划任务的状态等）只记录改动的字段，随日志一起用 update_fields 保存
+- 结构化的步骤事件（apps.ui_automation.ai_step_events）随日志一起写入 AIStepEvent 表，执行结束后保留
+- 执行结束时把全部日志合并到执行记录的 logs 字段，与最终结果一起保存一次，然后删除日志行
+"""
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AIExecutionLogWriter:
+    """一次AI执行的日志写入器"""
+
+    def __init__(self, record, flush_interval=None, flush_bytes=None):
+        if flush_interval is None:
+            flush_interval = getattr(settings, 'AI_LOG_FLUSH_INTERVAL', 1)
+        if flush_bytes is None:
+            flush_bytes = getattr(settings, 'AI_LOG_FLUSH_BYTES', 4096)
+        self.record = record
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self._base = record.logs or ''
+        self._parts = []
+        self._pending = []
+        self._pending_bytes = 0
+        self._events = []
+        self._dirty = set()
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    @property
+    def text(self):
+        """目前为止的完整日志"""
+        return self._base + ''.join(self._parts)
+
+    def append(self, content):
+        """追加一条日志，在下一次 flush 时写入"""
+        from .models import AIExecutionLogLine
+
+        if not content:
+            return
+        with self._lock:
+            self._seq += 1
+            self._parts.append(content)
+            self._pending.append(AIExecutionLogLine(record_id=self.record.pk, seq=self._seq, content=content))
+            self._pending_bytes += len(content.encode('utf-8'))
+
+    def add_event(self, event):
+        """记录一条步骤事件，在下一次 flush 时写入"""
+        from .models import AIStepEvent
+
+        with self._lock:
+            self._events.append(AIStepEvent(
+                record_id=self.record.pk,
+                step_number=event['step_number'],
+                actions=event.get('actions') or [],
+                action_text=event.get('action_text') or '',
+                url=(event.get('url') or '')[:2000],
+                duration_ms=event.get('duration_ms'),
+                outcome=event.get('outcome') or 'success',
+                error=event.get('error') or '',
+            ))
+
+    def update(self, **fields):
+        """修改执行记录的字段，在下一次 flush 时只保存改动的字段"""
+        for name, value in fields.items():
+            setattr(self.record, name, value)
+        with self._lock:
+            self._dirty.update(fields)
+
+    def due(self):
+        with self._lock:
+            if not self._pending and not self._events and not self._dirty:
+                return False
+            return (self._pending_bytes >= self.flush_bytes
+                    or time.monotonic() - self._last_flush >= self.flush_interval)
+
+    def flush(self):
+        """写入缓存的日志行、步骤事件和改动的字段"""
+        from .models import AIExecutionLogLine, AIStepEvent
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+            events, self._events = self._events, []
+            dirty, self._dirty = self._dirty, set()
+            self._pending_bytes = 0
+            self._last_flush = time.monotonic()
+        try:
+            if pending:
+                AIExecutionLogLine.objects.bulk_create(pending)
+            if events:
+                AIStepEvent.objects.bulk_create(events, ignore_conflicts=True)
+            if dirty:
+                self.record.save(update_fields=sorted(dirty))
+        except Exception as e:
+            logger.error(f"写入AI执行日志失败: {e}")
+
+    async def aflush(self, force=False):
+        """在异步回调中使用：达到写入间隔或缓存大小（或 force）时写入"""
+        if force or self.due():
+            await sync_to_async(self.flush)()
+
+    def finish(self):
+        """执行结束：写入剩余的步骤事件，把全部日志合并到 logs 字段并保存执行记录，然后删除日志行
+
+        执行期间记录可能已被强制标记为停止（stop_task 认为执行节点已失效），这时保留停止状态。
+        """
+        from .models import AIExecutionLogLine, AIStepEvent
+
+        stored_status = type(self.record).objects.filter(pk=self.record.pk).values_list('status', flat=True).first()
+        if stored_status == 'stopped' and self.record.status != 'stopped':
+            self.record.status = 'stopped'
+            self.append("\n[System] 任务执行期间已被强制标记为停止。")
+        with self._lock:
+            events, self._events = self._events, []
+            self._pending = []
+            self._pending_bytes = 0
+            self._dirty = set()
+        if events:
+            AIStepEvent.objects.bulk_create(events, ignore_conflicts=True)
+        self.record.logs = self.text
+        self.record.save()
+        AIExecutionLogLine.objects.filter(record_id=self.record.pk).delete()
+
+
+def read_logs(record):
+    """完整日志：执行中的记录为 logs 字段加上已写入的日志行"""
+    if record.status != 'running':
+        return record.logs or ''
+    return (record.logs or '') + ''.join(record.log_lines.values_list('content', flat=True))
+
+
+def read_log_lines(record, after=0):
+    """序号大于 after 的日志行 [{seq, content}]（执行结束后日志行已合并到 logs 字段，返回空列表）"""
+    return list(record.log_lines.filter(seq__gt=after).values('seq', 'content'))
@@ -0,0 +1,179 @@
+"""
+AI执行报告的缓存
+
+generate_report 和 export_pdf 原来每次请求都重新生成报告，PDF 还要在请求线程中用 reportlab 渲染。
+执行记录进入结束状态（passed/failed/stopped）后内容不再变化，报告只需生成一次：
+
+- 执行结束时提交 ai.build_reports 后台作业，生成三种报告（summary/detailed/performance）的
+  JSON 响应和 PDF，保存在 AI_REPORT_ROOT/<记录ID>/<报告类型>-<记录版本>.json|.pdf
+- 记录版本由状态、结束时间、时长、规划任务和 GIF 路径计算，记录被修改（如强制停止）后版本变化，重新生成
+- 接口直接读取文件返回，带 ETag 和 Last-Modified，客户端缓存有效时返回 304
+- 执行中的记录不缓存，每次实时生成
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+REPORT_TYPES = ('summary', 'detailed', 'performance')
+TERMINAL_STATUSES = ('passed', 'failed', 'stopped')
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _lock(key):
+    with _locks_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def is_terminal(record):
+    return record.status in TERMINAL_STATUSES
+
+
+def record_version(record):
+    """执行记录的版本，内容变化时版本变化"""
+    payload = json.dumps([
+        record.status,
+        record.end_time.isoformat() if record.end_time else None,
+        record.duration,
+        record.planned_tasks,
+        record.gif_path,
+    ], cls=DjangoJSONEncoder, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def _dir(record):
+    return os.path.join(settings.AI_REPORT_ROOT, str(record.pk))
+
+
+def artifact_path(record, report_type, ext, version=None):
+    return os.path.join(_dir(record), f'{report_type}-{version or record_version(record)}.{ext}')
+
+
+def etag(record, report_type, ext):
+    return f'"{record.pk}-{report_type}-{record_version(record)}-{ext}"'
+
+
+def build_report(record, report_type):
+    """实时生成报告数据"""
+    from .reports import AIExecutionReportGenerator
+
+    generator = AIExecutionReportGenerator(record)
+    if report_type == 'detailed':
+        return generator.generate_detailed_report()
+    if report_type == 'performance':
+        return generator.generate_performance_report()
+    return generator.generate_summary_report()
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _remove_stale(record, version):
+    """删除旧版本的报告文件"""
+    try:
+        names = os.listdir(_dir(record))
+    except FileNotFoundError:
+        return
+    for name in names:
+        if not name.endswith('.tmp') and f'-{version}.' not in name:
+            try:
+                os.remove(os.path.join(_dir(record), name))
+            except OSError:
+                pass
+
+
+def report_json(record, report_type):
+    """已结束的记录的报告响应文件路径（不存在时生成）"""
+    version = record_version(record)
+    path = artifact_path(record, report_type, 'json', version)
+    if os.path.exists(path):
+        return path
+    with _lock(path):
+        if not os.path.exists(path):
+            payload = {'success': True, 'data': build_report(record, report_type), 'report_type': report_type}
+            _write(path, json.dumps(payload, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8'))
+            _remove_stale(record, version)
+    return path
+
+
+def report_pdf(record, report_type):
+    """已结束的记录的 PDF 文件路径（不存在时生成）"""
+    from .pdf_generator import AIReportPDFGenerator
+
+    version = record_version(record)
+    path = artifact_path(record, report_type, 'pdf', version)
+    if os.path.exists(path):
+        return path
+    json_path = report_json(record, report_type)
+    with _lock(path):
+        if not os.path.exists(path):
+            with open(json_path, encoding='utf-8') as f:
+                report_data = json.load(f)['data']
+            _write(path, AIReportPDFGenerator(report_data, report_type).generate().getvalue())
+    return path
+
+
+def build_all(record):
+    """生成全部报告的 JSON 和 PDF（后台作业中调用）"""
+    for report_type in REPORT_TYPES:
+        report_json(record, report_type)
+    for report_type in REPORT_TYPES:
+        try:
+            report_pdf(record, report_type)
+        except ImportError as e:
+            logger.warning(f"跳过PDF生成: {e}")
+            break
+
+
+def progress(record):
+    """报告的生成进度"""
+    version = record_version(record)
+    artifacts = {
+        report_type: {ext: os.path.exists(artifact_path(record, report_type, ext, version)) for ext in ('json', 'pdf')}
+        for report_type in REPORT_TYPES
+    }
+    done = sum(ready for item in artifacts.values() for ready in item.values())
+    total = len(REPORT_TYPES) * 2
+    return {
+        'version': version,
+        'terminal': is_terminal(record),
+        'artifacts': artifacts,
+        'done': done,
+        'total': total,
+        'ready': done == total,
+    }
+
+
+def remove(record_id):
+    """删除执行记录的报告文件"""
+    shutil.rmtree(os.path.join(settings.AI_REPORT_ROOT, str(record_id)), ignore_errors=True)
+
+
+def schedule(record):
+    """提交后台作业生成报告，已有排队或执行中的作业时不重复提交"""
+    from apps.core.job_queue import enqueue
+    from apps.core.models import Job
+
+    try:
+        active = Job.objects.filter(name='ai.build_reports', status__in=['PENDING', 'RUNNING', 'RETRYING'])
+        for job_record in active.only('args'):
+            if job_record.args == [record.pk]:
+                return job_record
+        return enqueue('ai.build_reports', record.pk)
+    except Exception as e:
+        logger.warning(f"提交AI报告生成作业失败: {e}")
+        return None
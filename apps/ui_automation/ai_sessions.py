@@ -0,0 +1,126 @@
+"""
+AI浏览器代理的并发执行
+
+原来 AI 用例执行有两个问题，同时执行多个用例时会互相干扰：
+
+- browser-use 把 GIF 录制固定写到 os.getcwd()/agent_history.gif，并发的执行会覆盖彼此的录制文件；
+  非 Linux 系统上浏览器固定使用 9222 调试端口，第二个浏览器无法启动
+- 停止信号保存在进程内的 STOP_SIGNALS 字典中，作业在其他 worker 进程中执行时收不到停止请求
+
+每次执行通过 start_session() 获得一个 AIRunSession，执行结束后调用 close()：
+
+- 独立的工作目录 AI_RUN_ROOT/<执行记录ID>，存放 GIF 录制、浏览器用户数据和下载文件，执行结束后删除
+- 停止请求写入执行记录的 stop_requested 字段（跨进程可见），代理每一步结束时检查
+- 进程内同时执行的代理数量不超过 AI_AGENT_MAX_SESSIONS，超出时排队等待
+"""
+import logging
+import os
+import shutil
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+AI_JOB_NAMES = ('ai.run_ai_case', 'ai.run_adhoc_task')
+
+_semaphore = None
+_semaphore_lock = threading.Lock()
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        with _semaphore_lock:
+            if _semaphore is None:
+                _semaphore = threading.BoundedSemaphore(getattr(settings, 'AI_AGENT_MAX_SESSIONS', 2))
+    return _semaphore
+
+
+class AIRunSession:
+    """一次AI执行的工作目录和停止信号"""
+
+    def __init__(self, record_id):
+        self.record_id = record_id
+        self.work_dir = os.path.join(settings.AI_RUN_ROOT, str(record_id))
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    @property
+    def gif_path(self):
+        return os.path.join(self.work_dir, 'agent_history.gif')
+
+    def stop_requested(self):
+        """是否已请求停止（停止请求或被强制标记为停止）"""
+        from .models import AIExecutionRecord
+
+        row = AIExecutionRecord.objects.filter(id=self.record_id).values_list('stop_requested', 'status').first()
+        return row is None or row[0] or row[1] == 'stopped'
+
+    async def astop_requested(self):
+        """在代理的异步回调中使用"""
+        return await sync_to_async(self.stop_requested)()
+
+    def close(self):
+        """释放执行名额并删除工作目录"""
+        _get_semaphore().release()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def start_session(record_id):
+    """获取执行名额（没有空闲名额时等待）并创建工作目录"""
+    semaphore = _get_semaphore()
+    if not semaphore.acquire(blocking=False):
+        logger.info(f"AI执行 #{record_id} 等待空闲名额（上限 {getattr(settings, 'AI_AGENT_MAX_SESSIONS', 2)}）")
+        semaphore.acquire()
+    try:
+        return AIRunSession(record_id)
+    except Exception:
+        semaphore.release()
+        raise
+
+
+def on_job_cancelled(record_id, running):
+    """AI执行作业被取消：执行中的作业通过停止信号退出，尚未开始的作业直接把执行记录标记为停止"""
+    from django.utils import timezone
+    from .models import AIExecutionRecord
+
+    records = AIExecutionRecord.objects.filter(id=record_id)
+    if running:
+        records.update(stop_requested=True)
+    else:
+        records.filter(status='running').update(stop_requested=True, status='stopped', end_time=timezone.now())
+
+
+def find_active_job(record_id):
+    """执行记录对应的排队中或执行中的作业"""
+    from apps.core.models import Job
+
+    active = Job.objects.filter(name__in=AI_JOB_NAMES, status__in=['PENDING', 'RUNNING', 'RETRYING'])
+    for job_record in active.only('name', 'args', 'status', 'lease_expires_at'):
+        args = job_record.args or []
+        # ai.run_ai_case(case_id, execution_record_id)；ai.run_adhoc_task(execution_record_id, ...)
+        execution_id = args[1] if job_record.name == 'ai.run_ai_case' and len(args) > 1 else (args[0] if args else None)
+        if execution_id == record_id:
+            return job_record
+    return None
+
+
+def request_stop(record_id):
+    """请求停止执行（任何进程中的执行都会在下一步结束时退出）
+
+    Returns:
+        str: running 执行中，已发送停止信号；pending 尚未开始或执行节点已失效，作业已取消；None 没有对应的作业
+    """
+    from django.utils import timezone
+    from apps.core import job_queue
+    from .models import AIExecutionRecord
+
+    AIExecutionRecord.objects.filter(id=record_id).update(stop_requested=True)
+    job_record = find_active_job(record_id)
+    if job_record is None:
+        return None
+    if job_record.status == 'RUNNING' and job_record.lease_expires_at and job_record.lease_expires_at > timezone.now():
+        return 'running'
+    job_queue.cancel(job_record.id)
+    return 'pending'
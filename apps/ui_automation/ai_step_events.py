@@ -0,0 +1,95 @@
+"""
+AI执行的结构化步骤事件
+
+BaseBrowserAgent.run_task 在每一步结束时除了输出日志，还通过回调发送一条步骤事件
+（{'type': 'step', ...}），包括操作名称和参数、步骤耗时、页面URL和执行结果。
+事件随执行日志一起批量写入 AIStepEvent 表（每步一行），AI执行报告直接读取事件生成，
+不再对整个 logs 文本做正则匹配。没有步骤事件的旧执行记录仍按日志解析。
+"""
+
+# 操作名称 -> 报告中的操作类型
+ACTION_CATEGORIES = {
+    'click_element': 'click',
+    'click': 'click',
+    'input_text': 'input',
+    'input': 'input',
+    'scroll_down': 'scroll',
+    'scroll_up': 'scroll',
+    'scroll': 'scroll',
+    'wait': 'wait',
+    'switch_tab': 'switch_tab',
+    'go_to_url': 'navigate',
+    'navigate': 'navigate',
+    'go_back': 'navigate',
+    'open_new_tab': 'open_tab',
+    'done': 'done',
+    'Done': 'done',
+}
+
+# 不计入操作分布的记录类操作
+BOOKKEEPING_ACTIONS = {'mark_task_complete'}
+
+DISTRIBUTION_KEYS = ['click', 'input', 'scroll', 'wait', 'switch_tab', 'navigate', 'open_tab', 'done', 'other']
+
+
+def categorize(action_name):
+    return ACTION_CATEGORIES.get(action_name, 'other')
+
+
+def _action_dict(action):
+    if hasattr(action, 'model_dump'):
+        return action.model_dump() or {}
+    if hasattr(action, '_action_dict'):
+        return action._action_dict or {}
+    if hasattr(action, '_dict'):
+        return action._dict or {}
+    if isinstance(action, dict):
+        return action
+    return {}
+
+
+def build_step_event(step, step_number, action_text):
+    """根据 browser-use 的一步执行历史构建步骤事件
+
+    Args:
+        step: browser-use AgentHistory
+        step_number: 步骤序号（从 1 开始）
+        action_text: 步骤操作的可读描述（与日志中的一致）
+    """
+    raw = getattr(getattr(step, 'model_output', None), 'action', None) or []
+    actions = []
+    for action in (raw if isinstance(raw, list) else [raw]):
+        for name, params in _action_dict(action).items():
+            if params is None:
+                continue
+            actions.append({'name': name, 'params': params if isinstance(params, dict) else {'value': params}})
+
+    errors = [str(result.error) for result in (getattr(step, 'result', None) or []) if getattr(result, 'error', None)]
+
+    duration_ms = None
+    metadata = getattr(step, 'metadata', None)
+    started = getattr(metadata, 'step_start_time', None)
+    ended = getattr(metadata, 'step_end_time', None)
+    if started is not None and ended is not None:
+        duration_ms = max(0, round((ended - started) * 1000))
+
+    return {
+        'type': 'step',
+        'step_number': step_number,
+        'actions': actions,
+        'action_text': action_text,
+        'url': getattr(getattr(step, 'state', None), 'url', None) or '',
+        'duration_ms': duration_ms,
+        'outcome': 'error' if errors else 'success',
+        'error': '\n'.join(errors),
+    }
+
+
+def action_distribution(events):
+    """统计步骤事件中各类操作的数量"""
+    distribution = dict.fromkeys(DISTRIBUTION_KEYS, 0)
+    for event in events:
+        for action in event.actions:
+            if action.get('name') not in BOOKKEEPING_ACTIONS:
+                distribution[categorize(action.get('name'))] += 1
+    return distribution
@@ -4,4 +4,11 @@ from django.apps import AppConfig
 class UiAutomationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.ui_automation'
-    verbose_name = 'UI自动化测试'
\ No newline at end of file
+    verbose_name = 'UI自动化测试'
+    def ready(self):
+        from django.db.models.signals import post_save, post_delete
+        from .ai_llm import invalidate
+        post_save.connect(invalidate, sender='requirement_analysis.AIModelConfig',
+                          dispatch_uid='ai_llm_config_cache')
+        post_delete.connect(invalidate, sender='requirement_analysis.AIModelConfig',
+                            dispatch_uid='ai_llm_config_cache_delete')
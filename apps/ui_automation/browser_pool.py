@@ -0,0 +1,179 @@
+"""
+Playwright 浏览器池
+
+套件执行不再为每个用例启动和关闭浏览器进程，而是从浏览器池中复用已启动的浏览器，
+每个用例使用一个全新的 BrowserContext（Cookie、存储、缓存互相隔离）。
+
+Playwright 同步 API 的对象只能在创建它的线程中使用，因此浏览器池按线程维护：
+每个执行线程（作业线程池或 Celery worker 中的线程）对每种 (浏览器, 是否无头) 组合保留一个常驻浏览器，
+进程内常驻浏览器的数量等于 UI 执行线程数。
+
+- 浏览器累计创建 BROWSER_POOL_MAX_CONTEXTS 个上下文后重启，避免长时间运行导致的内存增长
+- 取用前检查浏览器连接状态，浏览器崩溃或创建上下文失败时重新启动
+- 空闲超过 BROWSER_POOL_IDLE_TIMEOUT 秒的浏览器在下次取用时关闭
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 浏览器名称 -> (Playwright 浏览器类型, 启动参数)
+BROWSER_TYPES = {
+    'chrome': ('chromium', {'args': ['--disable-blink-features=AutomationControlled']}),
+    'edge': ('chromium', {'args': ['--disable-blink-features=AutomationControlled']}),
+    'firefox': ('firefox', {}),
+    'safari': ('webkit', {}),
+}
+
+
+class _PooledBrowser:
+    def __init__(self, browser):
+        self.browser = browser
+        self.contexts_created = 0
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+    def is_healthy(self):
+        try:
+            return self.browser.is_connected()
+        except Exception:
+            return False
+
+    def close(self):
+        try:
+            self.browser.close()
+        except Exception as e:
+            logger.debug(f"关闭浏览器失败: {e}")
+
+
+class BrowserPool:
+    """当前线程的浏览器池，通过 get_browser_pool() 获取"""
+
+    def __init__(self):
+        self._playwright = None
+        self._browsers = {}
+        self._owners = {}
+
+    def _get_playwright(self):
+        if self._playwright is None:
+            from playwright.sync_api import sync_playwright
+            self._playwright = sync_playwright().start()
+        return self._playwright
+
+    def _launch(self, browser_name, headless):
+        browser_type, options = BROWSER_TYPES.get(browser_name, BROWSER_TYPES['chrome'])
+        browser = getattr(self._get_playwright(), browser_type).launch(headless=headless, **options)
+        logger.info(f"浏览器池启动浏览器: {browser_name} (headless={headless})")
+        return _PooledBrowser(browser)
+
+    def _close_idle(self, now):
+        idle_timeout = getattr(settings, 'BROWSER_POOL_IDLE_TIMEOUT', 300)
+        for key, pooled in list(self._browsers.items()):
+            if not pooled.in_use and now - pooled.last_used > idle_timeout:
+                pooled.close()
+                del self._browsers[key]
+
+    def _acquire_browser(self, key):
+        pooled = self._browsers.get(key)
+        max_contexts = getattr(settings, 'BROWSER_POOL_MAX_CONTEXTS', 50)
+        if pooled is not None and not pooled.in_use:
+            if not pooled.is_healthy():
+                logger.warning(f"浏览器 {key[0]} 已断开，重新启动")
+                pooled.close()
+                pooled = None
+            elif pooled.contexts_created >= max_contexts:
+                pooled.close()
+                pooled = None
+        if pooled is None:
+            pooled = self._launch(*key)
+            self._browsers[key] = pooled
+        return pooled
+
+    def new_context(self, browser_name='chrome', headless=True, **options):
+        """创建一个隔离的浏览器上下文，用完后调用 release() 归还
+
+        Args:
+            browser_name: chrome / edge / firefox / safari
+            options: 传给 Browser.new_context 的参数（viewport、user_agent 等）
+        """
+        if not getattr(settings, 'BROWSER_POOL_ENABLED', True):
+            pooled = self._launch(browser_name, headless)
+            context = pooled.browser.new_context(**options)
+            self._owners[id(context)] = (None, pooled)
+            return context
+
+        now = time.monotonic()
+        self._close_idle(now)
+        key = (browser_name, headless)
+        pooled = self._acquire_browser(key)
+        try:
+            context = pooled.browser.new_context(**options)
+        except Exception as e:
+            if pooled.in_use:
+                raise
+            # 浏览器进程异常（如崩溃后连接状态尚未更新），重启后再试一次
+            logger.warning(f"浏览器 {browser_name} 创建上下文失败，重新启动: {e}")
+            pooled.close()
+            pooled = self._launch(browser_name, headless)
+            self._browsers[key] = pooled
+            context = pooled.browser.new_context(**options)
+        pooled.contexts_created += 1
+        pooled.in_use += 1
+        pooled.last_used = now
+        self._owners[id(context)] = (key, pooled)
+        return context
+
+    def release(self, context):
+        """关闭上下文并把浏览器归还到池中"""
+        key, pooled = self._owners.pop(id(context), (None, None))
+        try:
+            context.close()
+        except Exception as e:
+            logger.debug(f"关闭浏览器上下文失败: {e}")
+        if pooled is None:
+            return
+        if key is None:
+            # 未启用浏览器池时，上下文独占浏览器
+            pooled.close()
+            return
+        pooled.in_use -= 1
+        pooled.last_used = time.monotonic()
+        if not pooled.is_healthy() and self._browsers.get(key) is pooled:
+            pooled.close()
+            del self._browsers[key]
+
+    def close(self):
+        """关闭池中所有浏览器和 Playwright 驱动进程"""
+        for pooled in self._browsers.values():
+            pooled.close()
+        self._browsers = {}
+        self._owners = {}
+        if self._playwright is not None:
+            try:
+                self._playwright.stop()
+            except Exception as e:
+                logger.debug(f"停止 Playwright 失败: {e}")
+            self._playwright = None
+
+
+_local = threading.local()
+
+
+def get_browser_pool():
+    """当前线程的浏览器池"""
+    pool = getattr(_local, 'pool', None)
+    if pool is None:
+        pool = BrowserPool()
+        _local.pool = pool
+    return pool
+
+
+def close_browser_pool():
+    """关闭当前线程的浏览器池"""
+    pool = getattr(_local, 'pool', None)
+    if pool is not None:
+        pool.close()
+        _local.pool = None
@@ -0,0 +1,109 @@
+"""
+UI套件执行记录的批量写入
+
+套件执行时原来为每个用例单独 INSERT 一条 TestCaseExecution，执行过程中每个用例再 save() 多次
+（开始执行、执行完成），并行执行数百个用例时在 MySQL 上产生大量行锁竞争。
+
+ExecutionRecorder 把这些写入合并：
+
+- 执行前用一次 bulk_create 创建全部 pending 记录，记录带有本次执行的批次号，
+  MySQL 不返回自增主键时按批次号重新查询（同一套件同时执行多次时不会取到其他执行的记录）
+- 状态变更只修改内存中的对象并记录改动的字段，距上次写入超过 UI_RECORDER_FLUSH_INTERVAL 秒
+  或执行结束时，按字段分组用 bulk_update 一次写入；写入失败（如死锁）的修改保留到下次写入，
+  执行结束时的写入失败后重试，仍然失败时抛出异常
+
+每个用例的数据库往返次数与用例数无关，并行的执行线程共用同一个 ExecutionRecorder。
+"""
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionRecorder:
+    """批量写入一次套件执行中的用例执行记录"""
+
+    def __init__(self, flush_interval=None):
+        if flush_interval is None:
+            flush_interval = getattr(settings, 'UI_RECORDER_FLUSH_INTERVAL', 2)
+        self.flush_interval = flush_interval
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def create_pending(self, test_suite, test_cases_data, **fields):
+        """为每个用例创建 pending 状态的执行记录，返回 {用例ID: TestCaseExecution}"""
+        from .models import TestCaseExecution
+
+        batch_id = uuid.uuid4().hex
+        executions = TestCaseExecution.objects.bulk_create([
+            TestCaseExecution(
+                test_case_id=case_data['id'],
+                project_id=case_data['project_id'],
+                test_suite=test_suite,
+                status='pending',
+                batch_id=batch_id,
+                **fields
+            )
+            for case_data in test_cases_data
+        ])
+        if executions and executions[0].pk is None:
+            # MySQL 的 bulk_create 不返回自增主键，按批次号重新查询刚创建的记录
+            created = TestCaseExecution.objects.filter(batch_id=batch_id).order_by('id')
+            executions = {execution.test_case_id: execution for execution in created}
+            return {case_data['id']: executions[case_data['id']] for case_data in test_cases_data}
+        return {execution.test_case_id: execution for execution in executions}
+
+    def update(self, execution, **fields):
+        """修改执行记录的字段，在下一次 flush 时写入"""
+        for name, value in fields.items():
+            setattr(execution, name, value)
+        with self._lock:
+            _, dirty_fields = self._dirty.setdefault(id(execution), (execution, set()))
+            dirty_fields.update(fields)
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self, final=False):
+        """写入所有未保存的修改，相同字段组合的记录用一次 bulk_update 写入
+
+        写入失败的修改放回待写入列表，下次写入时重试。final 为 True（执行结束）时
+        失败后重试 UI_RECORDER_FLUSH_RETRIES 次，仍然失败时抛出异常。
+        """
+        attempts = getattr(settings, 'UI_RECORDER_FLUSH_RETRIES', 3) + 1 if final else 1
+        for attempt in range(attempts):
+            error = self._flush_once()
+            if error is None:
+                return
+            if attempt + 1 < attempts:
+                time.sleep(0.5 * (2 ** attempt))
+        if final:
+            raise error
+
+    def _flush_once(self):
+        """写入一次，返回最后一个写入失败的异常（全部成功时返回 None）"""
+        from .models import TestCaseExecution
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            self._last_flush = time.monotonic()
+        groups = {}
+        for execution, fields in dirty.values():
+            groups.setdefault(tuple(sorted(fields)), []).append(execution)
+        error = None
+        for fields, executions in groups.items():
+            try:
+                TestCaseExecution.objects.bulk_update(executions, list(fields))
+            except Exception as e:
+                logger.error(f"批量写入用例执行记录失败，下次写入时重试: {e}")
+                error = e
+                with self._lock:
+                    for execution in executions:
+                        _, dirty_fields = self._dirty.setdefault(id(execution), (execution, set()))
+                        dirty_fields.update(fields)
+        return error
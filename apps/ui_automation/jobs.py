@@ -0,0 +1,82 @@
+"""
+UI自动化模块的后台作业
+"""
+from apps.core.job_queue import job
+
+
+@job('ui.run_test_suite', queue='ui')
+def run_test_suite(suite_id, engine, browser, headless, user_id):
+    """执行测试套件"""
+    from django.contrib.auth import get_user_model
+    from .models import TestSuite
+    from .test_executor import TestExecutor
+
+    executor = TestExecutor(
+        test_suite=TestSuite.objects.get(id=suite_id),
+        engine=engine,
+        browser=browser,
+        headless=headless,
+        executed_by=get_user_model().objects.filter(id=user_id).first()
+    )
+    executor.run()
+    return {'suite_id': suite_id}
+
+
+@job('ui.run_scheduled_task', queue='ui')
+def run_scheduled_task(task_id):
+    """执行UI定时任务"""
+    from .models import UiScheduledTask
+    from .views import UiScheduledTaskViewSet
+
+    task = UiScheduledTask.objects.get(id=task_id)
+    UiScheduledTaskViewSet()._run_scheduled_task(task)
+    return {'task_id': task_id}
+
+
+def _stop_ai_case(job_record, running):
+    from .ai_sessions import on_job_cancelled
+    on_job_cancelled(job_record.args[1], running)
+
+
+def _stop_adhoc_task(job_record, running):
+    from .ai_sessions import on_job_cancelled
+    on_job_cancelled(job_record.args[0], running)
+
+
+@job('ai.run_ai_case', queue='ai', on_cancel=_stop_ai_case)
+def run_ai_case(case_id, execution_record_id):
+    """执行AI用例"""
+    from .models import AICase, AIExecutionRecord
+    from .views import AICaseViewSet
+
+    AICaseViewSet()._run_ai_case(
+        AICase.objects.get(id=case_id),
+        AIExecutionRecord.objects.get(id=execution_record_id)
+    )
+    return {'execution_id': execution_record_id}
+
+
+@job('ai.run_adhoc_task', queue='ai', on_cancel=_stop_adhoc_task)
+def run_adhoc_task(execution_record_id, execution_mode, enable_gif):
+    """执行临时AI任务"""
+    from .models import AIExecutionRecord
+    from .views import AIExecutionRecordViewSet
+
+    AIExecutionRecordViewSet()._run_adhoc_task(
+        AIExecutionRecord.objects.get(id=execution_record_id),
+        execution_mode,
+        enable_gif
+    )
+    return {'execution_id': execution_record_id}
+
+
+@job('ai.build_reports', queue='default')
+def build_ai_reports(execution_record_id):
+    """生成已结束的AI执行记录的报告和PDF"""
+    from .models import AIExecutionRecord
+    from . import ai_report_cache
+
+    record = AIExecutionRecord.objects.get(id=execution_record_id)
+    if ai_report_cache.is_terminal(record):
+        ai_report_cache.build_all(record)
+    return {'execution_id': execution_record_id}
@@ -0,0 +1,114 @@
+"""
+UI项目登录状态缓存
+
+大多数用例都以相同的登录步骤开头，每个用例都在全新的浏览器上下文中重新登录，要多花几秒到几十秒。
+项目配置了登录用例（UiProject.login_case）后：
+
+- 套件执行时运行一次登录用例，保存登录后的状态（Playwright storage_state：Cookie 和 localStorage；
+  Selenium 采集相同格式的数据），状态保存在 UiLoginState 中，有效期为 UiProject.login_state_ttl 秒
+- 以登录用例的步骤开头的用例，使用缓存的状态创建浏览器上下文，并跳过这些登录步骤
+- 打开页面后检查 UiProject.login_check_selector 是否可见，不可见说明登录状态已失效，清除缓存重新登录
+- 同一进程内同一项目同时只运行一次登录用例，并行执行的线程等待并复用其结果；锁只在进程内有效，
+  多个 worker 进程同时执行同一项目的套件时各自登录一次，后保存的状态覆盖先保存的
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import timedelta
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock(project_id, engine):
+    with _locks_guard:
+        return _locks.setdefault((project_id, engine), threading.Lock())
+
+
+def step_signature(step_data):
+    """用于比较两个步骤是否相同的特征"""
+    element = step_data.get('element') or {}
+    return (
+        step_data.get('action_type'),
+        element.get('id'),
+        step_data.get('input_value') or '',
+        step_data.get('assert_type') or '',
+        step_data.get('assert_value') or '',
+    )
+
+
+def login_prefix_length(login_steps, steps):
+    """用例以登录用例的全部步骤开头时返回登录步骤数，否则返回 0"""
+    if not login_steps or len(steps) < len(login_steps):
+        return 0
+    for login_step, step in zip(login_steps, steps):
+        if step_signature(login_step) != step_signature(step):
+            return 0
+    return len(login_steps)
+
+
+def get_state(project_id, engine):
+    """未过期的登录状态，没有时返回 None"""
+    from .models import UiLoginState
+
+    login_state = UiLoginState.objects.filter(
+        project_id=project_id, engine=engine, expires_at__gt=timezone.now()
+    ).first()
+    return login_state.state if login_state else None
+
+
+def state_hash(state):
+    return hashlib.sha256(json.dumps(state, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def save_state(project_id, engine, state, ttl):
+    from .models import UiLoginState
+
+    UiLoginState.objects.update_or_create(
+        project_id=project_id, engine=engine,
+        defaults={
+            'state': state,
+            'state_hash': state_hash(state),
+            'expires_at': timezone.now() + timedelta(seconds=ttl),
+        }
+    )
+
+
+def invalidate(project_id, engine=None, state=None):
+    """清除登录状态缓存
+
+    指定 state 时只在缓存仍是该状态时清除（按状态哈希条件删除），避免清除其他线程刚刚刷新的状态。
+    """
+    from .models import UiLoginState
+
+    queryset = UiLoginState.objects.filter(project_id=project_id)
+    if engine:
+        queryset = queryset.filter(engine=engine)
+    if state is not None:
+        queryset = queryset.filter(state_hash=state_hash(state))
+    queryset.delete()
+
+
+def get_or_login(project_id, engine, ttl, login):
+    """获取登录状态，缓存不存在或已过期时调用 login() 登录并缓存
+
+    login() 返回登录后的状态，登录失败返回 None（不缓存）。
+    """
+    state = get_state(project_id, engine)
+    if state is not None:
+        return state
+    with _lock(project_id, engine):
+        # 等待锁期间可能已由其他线程完成登录
+        state = get_state(project_id, engine)
+        if state is not None:
+            return state
+        logger.info(f"项目 {project_id} 的登录状态不存在或已过期，运行登录用例 ({engine})")
+        state = login()
+        if state is not None:
+            save_state(project_id, engine, state, ttl)
+        return state
@@ -14,6 +14,11 @@ class UiProject(models.Model):
         ('COMPLETED', '已结束'),
     ]
 
+    WAIT_STRATEGY_CHOICES = [
+        ('smart', '智能等待'),
+        ('fixed', '固定等待'),
+    ]
+
     name = models.CharField(max_length=200, verbose_name='项目名称')
     description = models.TextField(blank=True, verbose_name='项目描述')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, verbose_name='项目状态', default='IN_PROGRESS')
@@ -22,6 +27,18 @@ class UiProject(models.Model):
     end_date = models.DateField(null=True, blank=True, verbose_name='结束日期')
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='owned_ui_projects', verbose_name='负责人')
     members = models.ManyToManyField(User, blank=True, related_name='ui_projects', verbose_name='团队成员')
+    wait_strategy = models.CharField(max_length=20, choices=WAIT_STRATEGY_CHOICES, default='smart', verbose_name='等待策略',
+                                     help_text='smart 按页面状态等待，fixed 使用固定等待时长')
+
+    # 登录状态缓存：套件执行时运行一次登录用例，后续用例直接使用登录后的 Cookie/localStorage
+    login_case = models.ForeignKey('TestCase', on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+                                   verbose_name='登录用例',
+                                   help_text='以该用例的步骤开头的用例，使用缓存的登录状态并跳过这些步骤')
+    login_state_ttl = models.PositiveIntegerField(default=3600, verbose_name='登录状态有效期(秒)')
+    login_check_selector = models.CharField(max_length=500, blank=True, verbose_name='登录校验选择器',
+                                            help_text='登录后才可见的元素（CSS选择器），使用缓存状态打开页面后不可见则重新登录')
+    network_profile = models.JSONField(default=dict, blank=True, verbose_name='网络配置',
+                                       help_text='拦截的资源类型/URL、HAR 文件、是否缓存静态资源，见 network_profiles 模块')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
 
@@ -35,6 +52,27 @@ class UiProject(models.Model):
         return self.name
 
 
+class UiLoginState(models.Model):
+    """UI项目登录状态缓存"""
+    project = models.ForeignKey(UiProject, on_delete=models.CASCADE, related_name='login_states', verbose_name='所属项目')
+    engine = models.CharField(max_length=20, verbose_name='执行引擎')
+    state = models.JSONField(default=dict, verbose_name='登录状态',
+                             help_text='Playwright storage_state 格式：cookies 以及各 origin 的 localStorage')
+    state_hash = models.CharField(max_length=64, blank=True, default='', verbose_name='登录状态哈希',
+                                  help_text='按状态清除缓存时用于条件删除')
+    expires_at = models.DateTimeField(verbose_name='过期时间')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        db_table = 'ui_login_states'
+        verbose_name = 'UI登录状态缓存'
+        verbose_name_plural = 'UI登录状态缓存'
+        unique_together = ['project', 'engine']
+
+    def __str__(self):
+        return f'{self.project.name} - {self.engine}'
+
+
 class LocatorStrategy(models.Model):
     """元素定位策略模型"""
     name = models.CharField(max_length=50, verbose_name='策略名称')
@@ -417,6 +455,9 @@ class TestSuite(models.Model):
     passed_count = models.IntegerField(default=0, verbose_name='通过数')
     failed_count = models.IntegerField(default=0, verbose_name='失败数')
 
+    # 执行配置
+    workers = models.PositiveIntegerField(default=1, verbose_name='并行数', help_text='同时执行的用例数，1为串行执行')
+
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
 
@@ -591,6 +632,8 @@ class TestCase(models.Model):
     project = models.ForeignKey(UiProject, on_delete=models.CASCADE, related_name='test_cases', verbose_name='所属项目')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft', verbose_name='状态')
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='medium', verbose_name='优先级')
+    parallel_safe = models.BooleanField(default=True, verbose_name='可并行执行',
+                                        help_text='依赖共享数据或有执行顺序要求的用例应关闭，并行执行套件时串行执行')
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_test_cases', verbose_name='创建人')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
@@ -634,6 +677,8 @@ class TestCaseStep(models.Model):
     element = models.ForeignKey(Element, on_delete=models.CASCADE, null=True, blank=True, verbose_name='目标元素')
     input_value = models.TextField(blank=True, verbose_name='输入值')
     wait_time = models.IntegerField(default=1000, verbose_name='等待时间(毫秒)')
+    wait_strategy = models.CharField(max_length=20, choices=UiProject.WAIT_STRATEGY_CHOICES, blank=True,
+                                     verbose_name='等待策略', help_text='为空时使用项目的等待策略')
     assert_type = models.CharField(max_length=20, choices=ASSERT_TYPE_CHOICES, blank=True, verbose_name='断言类型')
     assert_value = models.TextField(blank=True, verbose_name='断言期望值')
     description = models.TextField(blank=True, verbose_name='步骤描述')
@@ -683,6 +728,10 @@ class TestCaseExecution(models.Model):
     error_message = models.TextField(null=True, blank=True, verbose_name='错误信息')
     screenshots = models.JSONField(default=list, blank=True, verbose_name='截图列表')
     execution_time = models.FloatField(null=True, blank=True, verbose_name='执行时长(秒)')
+    trace_file = models.CharField(max_length=255, blank=True, verbose_name='Trace文件',
+                                  help_text='失败时保存的 Playwright Trace（UI_TRACE_ROOT 下的相对路径）')
+    batch_id = models.CharField(max_length=32, blank=True, db_index=True, verbose_name='执行批次',
+                                help_text='同一次套件执行批量创建的记录使用相同的批次号')
     started_at = models.DateTimeField(null=True, blank=True, verbose_name='开始时间')
     finished_at = models.DateTimeField(null=True, blank=True, verbose_name='完成时间')
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='test_case_executions', verbose_name='执行人')
@@ -698,6 +747,32 @@ class TestCaseExecution(models.Model):
         return f"{self.test_case.name} - {self.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
 
 
+class UiStepTiming(models.Model):
+    """UI用例步骤耗时（每次执行的每个步骤一条，用于统计最慢的步骤和元素）"""
+    execution = models.ForeignKey(TestCaseExecution, on_delete=models.CASCADE, related_name='step_timings', verbose_name='用例执行记录')
+    project = models.ForeignKey(UiProject, on_delete=models.CASCADE, related_name='+', verbose_name='项目')
+    test_case = models.ForeignKey(TestCase, on_delete=models.CASCADE, related_name='+', verbose_name='测试用例')
+    step_number = models.PositiveIntegerField(verbose_name='步骤序号')
+    action_type = models.CharField(max_length=50, verbose_name='操作类型')
+    element = models.ForeignKey(Element, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='元素')
+    success = models.BooleanField(default=True, verbose_name='是否成功')
+    total_ms = models.PositiveIntegerField(default=0, verbose_name='总耗时(毫秒)')
+    locate_ms = models.PositiveIntegerField(default=0, verbose_name='定位耗时(毫秒)')
+    action_ms = models.PositiveIntegerField(default=0, verbose_name='操作耗时(毫秒)')
+    wait_ms = models.PositiveIntegerField(default=0, verbose_name='等待耗时(毫秒)')
+    assert_ms = models.PositiveIntegerField(default=0, verbose_name='断言耗时(毫秒)')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        db_table = 'ui_step_timings'
+        verbose_name = 'UI步骤耗时'
+        verbose_name_plural = 'UI步骤耗时'
+        indexes = [models.Index(fields=['project', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.test_case_id}#{self.step_number} {self.total_ms}ms"
+
+
 class OperationRecord(models.Model):
     """操作记录模型"""
     OPERATION_TYPE_CHOICES = [
@@ -789,6 +864,8 @@ class UiScheduledTask(models.Model):
                              help_text='playwright或selenium')
     browser = models.CharField(max_length=20, default='chrome', verbose_name='浏览器类型')
     headless = models.BooleanField(default=False, verbose_name='无头模式')
+    workers = models.PositiveIntegerField(null=True, blank=True, verbose_name='并行数',
+                                          help_text='为空时使用测试套件的并行数')
 
     # 通知配置
     NOTIFICATION_TYPE_CHOICES = [
@@ -824,6 +901,10 @@ class UiScheduledTask(models.Model):
         verbose_name = 'UI定时任务'
         verbose_name_plural = 'UI定时任务'
         ordering = ['-created_at']
+        indexes = [
+            # 调度器按 status='ACTIVE' AND next_run_time <= now 查询到期任务
+            models.Index(fields=['status', 'next_run_time']),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.get_task_type_display()})"
@@ -1008,6 +1089,8 @@ class AICase(models.Model):
     name = models.CharField(max_length=200, verbose_name='用例名称')
     description = models.TextField(blank=True, null=True, verbose_name='描述')
     task_description = models.TextField(verbose_name='任务描述', help_text='自然语言任务描述')
+    plan_hash = models.CharField(max_length=64, blank=True, default='', verbose_name='任务规划对应的任务描述哈希')
+    planned_tasks = models.JSONField(default=list, blank=True, verbose_name='任务规划缓存')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, verbose_name='创建者')
@@ -1046,6 +1129,7 @@ class AIExecutionRecord(models.Model):
     executed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, verbose_name='执行人')
     gif_path = models.CharField(max_length=500, null=True, blank=True, verbose_name='GIF录制路径')
     screenshots_sequence = models.JSONField(default=list, verbose_name='截图序列')
+    stop_requested = models.BooleanField(default=False, verbose_name='是否请求停止', help_text='由停止接口设置，执行中的代理在每一步结束时检查')
 
     class Meta:
         db_table = 'ui_ai_execution_records'
@@ -1056,3 +1140,49 @@ class AIExecutionRecord(models.Model):
     def __str__(self):
         return f"{self.case_name} - {self.get_status_display()}"
 
+
+class AIExecutionLogLine(models.Model):
+    """AI执行日志行（执行过程中追加写入，执行结束后合并到执行记录的 logs 字段）"""
+    record = models.ForeignKey(AIExecutionRecord, on_delete=models.CASCADE, related_name='log_lines', verbose_name='执行记录')
+    seq = models.PositiveIntegerField(verbose_name='序号')
+    content = models.TextField(verbose_name='日志内容')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        db_table = 'ui_ai_execution_log_lines'
+        verbose_name = 'AI执行日志行'
+        verbose_name_plural = 'AI执行日志行'
+        unique_together = ['record', 'seq']
+        ordering = ['seq']
+
+    def __str__(self):
+        return f"{self.record_id}#{self.seq}"
+
+
+class AIStepEvent(models.Model):
+    """AI执行的步骤事件（每步一条，用于生成执行报告）"""
+    OUTCOME_CHOICES = [
+        ('success', '成功'),
+        ('error', '出错'),
+    ]
+
+    record = models.ForeignKey(AIExecutionRecord, on_delete=models.CASCADE, related_name='step_events', verbose_name='执行记录')
+    step_number = models.PositiveIntegerField(verbose_name='步骤序号')
+    actions = models.JSONField(default=list, verbose_name='操作列表')  # [{'name': 'click_element', 'params': {'index': 3}}]
+    action_text = models.TextField(blank=True, default='', verbose_name='操作描述')
+    url = models.CharField(max_length=2000, blank=True, default='', verbose_name='页面URL')
+    duration_ms = models.PositiveIntegerField(null=True, blank=True, verbose_name='步骤耗时(毫秒)')
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES, default='success', verbose_name='执行结果')
+    error = models.TextField(blank=True, default='', verbose_name='错误信息')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        db_table = 'ui_ai_step_events'
+        verbose_name = 'AI步骤事件'
+        verbose_name_plural = 'AI步骤事件'
+        unique_together = ['record', 'step_number']
+        ordering = ['step_number']
+
+    def __str__(self):
+        return f"{self.record_id}#{self.step_number} {self.outcome}"
+
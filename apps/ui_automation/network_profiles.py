@@ -0,0 +1,320 @@
+"""
+UI自动化网络配置（资源拦截与静态资源缓存）
+
+无头执行时页面仍会加载全部图片、字体、视频和统计脚本，拖慢每次打开页面和网络空闲等待。
+项目配置了 UiProject.network_profile 后，执行用例时按配置处理页面发出的请求：
+
+    {
+        "block_resource_types": ["image", "font", "media"],   # 按资源类型拦截
+        "block_url_patterns": ["*google-analytics.com*"],      # 按URL通配符拦截
+        "har_path": "static.har",                              # 从本地 HAR 文件返回已录制的响应
+        "cache_static": true                                   # 进程内缓存静态资源，供后续用例复用
+    }
+
+- Playwright：通过 BrowserContext.route() 拦截请求，支持以上全部配置
+- Selenium：Chrome 通过 CDP（Network.setBlockedURLs）按URL拦截，资源类型换算为扩展名通配符，
+  按资源类型拦截只是近似（URL 中没有对应扩展名的资源不会被拦截）；
+  HAR 和静态资源缓存需要修改响应，Selenium 不支持
+- 每个用例的统计（请求数、拦截数、本地返回数、节省的字节数）保存在用例结果的 network 字段中
+
+HAR 文件只能放在 UI_NETWORK_HAR_ROOT 目录下，har_path 为相对该目录的路径。
+"""
+import base64
+import fnmatch
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_TYPES = ['document', 'stylesheet', 'image', 'media', 'font', 'script', 'xhr', 'fetch', 'websocket', 'other']
+
+# 可以缓存的静态资源类型
+STATIC_RESOURCE_TYPES = {'stylesheet', 'script', 'image', 'font'}
+
+
+def _extension_patterns(*extensions):
+    """扩展名通配符，只匹配路径以该扩展名结尾的URL（可带查询参数），*.js 不会匹配 .json、.jsp"""
+    patterns = []
+    for extension in extensions:
+        patterns.extend([f'*.{extension}', f'*.{extension}?*'])
+    return patterns
+
+
+# Selenium 无法按资源类型拦截，换算为扩展名通配符。这只是近似：没有扩展名的资源
+# （如 /api/avatar?id=1 返回的图片、动态加载的脚本）不会被拦截
+RESOURCE_TYPE_PATTERNS = {
+    'image': _extension_patterns('png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'bmp'),
+    'font': _extension_patterns('woff', 'woff2', 'ttf', 'otf', 'eot'),
+    'media': _extension_patterns('mp4', 'webm', 'ogg', 'mp3', 'wav', 'm3u8'),
+    'stylesheet': _extension_patterns('css'),
+    'script': _extension_patterns('js', 'mjs'),
+}
+
+# 响应体已解码，去掉与原始传输相关的响应头
+_DROP_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+_har_cache = {}
+_har_lock = threading.Lock()
+
+_static_cache = OrderedDict()
+_static_cache_bytes = 0
+_static_lock = threading.Lock()
+
+
+def validate_config(config):
+    """校验网络配置，返回错误信息列表"""
+    if not config:
+        return []
+    if not isinstance(config, dict):
+        return ['网络配置必须是 JSON 对象']
+    errors = []
+    unknown = set(config.get('block_resource_types') or []) - set(RESOURCE_TYPES)
+    if unknown:
+        errors.append(f"不支持的资源类型: {', '.join(sorted(unknown))}")
+    if not isinstance(config.get('block_url_patterns') or [], list):
+        errors.append('block_url_patterns 必须是列表')
+    if config.get('har_path') and _har_file(config['har_path']) is None:
+        errors.append(f"HAR 文件不存在或不在 UI_NETWORK_HAR_ROOT 目录下: {config['har_path']}")
+    return errors
+
+
+def _har_file(har_path):
+    """HAR 文件的绝对路径，不在 UI_NETWORK_HAR_ROOT 下或不存在时返回 None"""
+    root = os.path.realpath(settings.UI_NETWORK_HAR_ROOT)
+    path = os.path.realpath(os.path.join(root, har_path))
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+
+def _load_har(har_path):
+    """读取 HAR 文件，返回 {(方法, URL): 响应}，文件修改后重新读取"""
+    path = _har_file(har_path)
+    if path is None:
+        logger.warning(f"HAR 文件不可用: {har_path}")
+        return {}
+    mtime = os.path.getmtime(path)
+    with _har_lock:
+        cached = _har_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with open(path, encoding='utf-8') as f:
+            har = json.load(f)
+        index = {}
+        for entry in har.get('log', {}).get('entries', []):
+            request, response = entry.get('request', {}), entry.get('response', {})
+            content = response.get('content', {})
+            text = content.get('text')
+            if text is None:
+                continue
+            body = base64.b64decode(text) if content.get('encoding') == 'base64' else text.encode('utf-8')
+            headers = {
+                header['name']: header['value'] for header in response.get('headers', [])
+                if header['name'].lower() not in _DROP_HEADERS
+            }
+            index[(request.get('method', 'GET'), request.get('url'))] = {
+                'status': response.get('status', 200), 'headers': headers, 'body': body,
+            }
+        _har_cache[path] = (mtime, index)
+        logger.info(f"已加载 HAR 文件 {har_path}: {len(index)} 个响应")
+        return index
+
+
+def _cache_get(url):
+    with _static_lock:
+        entry = _static_cache.get(url)
+        if entry is not None:
+            _static_cache.move_to_end(url)
+        return entry
+
+
+def _cache_put(url, entry):
+    """缓存静态资源，超出 UI_NETWORK_CACHE_MAX_BYTES 时淘汰最久未使用的资源"""
+    global _static_cache_bytes
+    max_bytes = getattr(settings, 'UI_NETWORK_CACHE_MAX_BYTES', 100 * 1024 * 1024)
+    size = len(entry['body'])
+    if size > max_bytes:
+        return
+    with _static_lock:
+        old = _static_cache.pop(url, None)
+        if old is not None:
+            _static_cache_bytes -= len(old['body'])
+        _static_cache[url] = entry
+        _static_cache_bytes += size
+        while _static_cache_bytes > max_bytes:
+            _, evicted = _static_cache.popitem(last=False)
+            _static_cache_bytes -= len(evicted['body'])
+
+
+def clear_static_cache():
+    global _static_cache_bytes
+    with _static_lock:
+        _static_cache.clear()
+        _static_cache_bytes = 0
+
+
+def _cacheable(status, headers):
+    cache_control = {k.lower(): v for k, v in headers.items()}.get('cache-control', '').lower()
+    return status == 200 and 'no-store' not in cache_control
+
+
+class NetworkProfile:
+    """一个用例的网络配置，记录该用例的拦截统计"""
+
+    def __init__(self, config):
+        self.block_types = set(config.get('block_resource_types') or [])
+        self.block_patterns = list(config.get('block_url_patterns') or [])
+        self.har = _load_har(config['har_path']) if config.get('har_path') else {}
+        self.cache_static = bool(config.get('cache_static'))
+        self.stats = {'requests': 0, 'blocked': 0, 'from_har': 0, 'from_cache': 0, 'bytes_saved': 0}
+
+    @classmethod
+    def from_config(cls, config):
+        """未配置时返回 None"""
+        if not config:
+            return None
+        try:
+            return cls(config)
+        except Exception as e:
+            logger.warning(f"网络配置无效，不拦截请求: {e}")
+            return None
+
+    def is_blocked(self, resource_type, url):
+        return resource_type in self.block_types or any(fnmatch.fnmatch(url, p) for p in self.block_patterns)
+
+    def resolve(self, resource_type, method, url):
+        """决定如何处理请求，返回 (处理方式, 响应)
+
+        处理方式：block 拦截、fulfill 返回本地响应、fetch 请求后缓存、continue 正常请求
+        """
+        self.stats['requests'] += 1
+        if self.is_blocked(resource_type, url):
+            self.stats['blocked'] += 1
+            known = self.har.get((method, url)) or _cache_get(url)
+            if known is not None:
+                self.stats['bytes_saved'] += len(known['body'])
+            return 'block', None
+        entry = self.har.get((method, url))
+        if entry is not None:
+            self.stats['from_har'] += 1
+            self.stats['bytes_saved'] += len(entry['body'])
+            return 'fulfill', entry
+        if self.cache_static and method == 'GET' and resource_type in STATIC_RESOURCE_TYPES:
+            entry = _cache_get(url)
+            if entry is not None:
+                self.stats['from_cache'] += 1
+                self.stats['bytes_saved'] += len(entry['body'])
+                return 'fulfill', entry
+            return 'fetch', None
+        return 'continue', None
+
+    def remember(self, url, status, headers, body):
+        if _cacheable(status, headers):
+            headers = {k: v for k, v in headers.items() if k.lower() not in _DROP_HEADERS}
+            _cache_put(url, {'status': status, 'headers': headers, 'body': body})
+
+    def apply_playwright(self, context):
+        """在 Playwright（同步 API）浏览器上下文上拦截请求"""
+        def handle(route):
+            request = route.request
+            try:
+                action, entry = self.resolve(request.resource_type, request.method, request.url)
+                if action == 'block':
+                    route.abort('blockedbyclient')
+                elif action == 'fulfill':
+                    route.fulfill(status=entry['status'], headers=entry['headers'], body=entry['body'])
+                elif action == 'fetch':
+                    response = route.fetch()
+                    body = response.body()
+                    self.remember(request.url, response.status, response.headers, body)
+                    route.fulfill(response=response, body=body)
+                else:
+                    route.continue_()
+            except Exception as e:
+                logger.debug(f"处理请求 {request.url} 失败: {e}")
+                try:
+                    route.continue_()
+                except Exception:
+                    pass
+
+        context.route('**/*', handle)
+
+    async def apply_playwright_async(self, context):
+        """在 Playwright（异步 API）浏览器上下文上拦截请求"""
+        async def handle(route):
+            request = route.request
+            try:
+                action, entry = self.resolve(request.resource_type, request.method, request.url)
+                if action == 'block':
+                    await route.abort('blockedbyclient')
+                elif action == 'fulfill':
+                    await route.fulfill(status=entry['status'], headers=entry['headers'], body=entry['body'])
+                elif action == 'fetch':
+                    response = await route.fetch()
+                    body = await response.body()
+                    self.remember(request.url, response.status, response.headers, body)
+                    await route.fulfill(response=response, body=body)
+                else:
+                    await route.continue_()
+            except Exception as e:
+                logger.debug(f"处理请求 {request.url} 失败: {e}")
+                try:
+                    await route.continue_()
+                except Exception:
+                    pass
+
+        await context.route('**/*', handle)
+
+    def selenium_patterns(self):
+        patterns = list(self.block_patterns)
+        for resource_type in sorted(self.block_types):
+            patterns.extend(RESOURCE_TYPE_PATTERNS.get(resource_type, []))
+        return patterns
+
+    def apply_selenium(self, driver):
+        """通过 CDP 在 Selenium Chrome 中按URL拦截请求，浏览器不支持 CDP 时返回 False"""
+        patterns = self.selenium_patterns()
+        if not patterns or not hasattr(driver, 'execute_cdp_cmd'):
+            return False
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+        return True
+
+    def collect_selenium(self, driver):
+        """从 Chrome 性能日志中统计请求数和被拦截的请求数（读取后日志即清空）"""
+        try:
+            entries = driver.get_log('performance')
+        except Exception:
+            return
+        for entry in entries:
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            if message.get('method') == 'Network.requestWillBeSent':
+                self.stats['requests'] += 1
+            elif message.get('method') == 'Network.loadingFailed' \
+                    and message.get('params', {}).get('blockedReason') == 'inspector':
+                self.stats['blocked'] += 1
+
+    def report(self):
+        return dict(self.stats)
+
+
+def selenium_logging_prefs(options):
+    """开启 Chrome 性能日志，用于统计被拦截的请求"""
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+
+def summarize(case_results):
+    """汇总各用例的网络统计，没有用例启用网络配置时返回 None"""
+    reports = [result['network'] for result in case_results if result.get('network')]
+    if not reports:
+        return None
+    return {key: sum(report.get(key, 0) for report in reports) for key in reports[0]}
@@ -10,22 +10,32 @@ from typing import Dict, List, Optional, Tuple
 from playwright.async_api import async_playwright, Page, Browser, BrowserContext, TimeoutError as PlaywrightTimeout
 import logging
 from .variable_resolver import resolve_variables
+from .network_profiles import NetworkProfile
+from .tracing import traced_step
+from .wait_strategies import AsyncPlaywrightWaiter
 
 logger = logging.getLogger(__name__)
 
 class PlaywrightTestEngine:
     """Playwright测试执行引擎"""
 
-    def __init__(self, browser_type='chromium', headless=True):
+    def __init__(self, browser_type='chromium', headless=True, network_profile=None, wait_strategy=None):
         """
         初始化测试引擎
 
         Args:
             browser_type: 浏览器类型 (chromium, firefox, webkit)
             headless: 是否无头模式
+            network_profile: 项目的网络配置（UiProject.network_profile）
+            wait_strategy: 项目的等待策略（UiProject.wait_strategy），步骤配置的策略优先
         """
         self.browser_type = browser_type
         self.headless = headless
+        self.network = NetworkProfile.from_config(network_profile)
+        # 最近一个步骤的耗时（毫秒），见 tracing.traced_step
+        self.last_step_timing = None
+        # 操作后的等待，见 wait_strategies
+        self.waiter = AsyncPlaywrightWaiter(wait_strategy)
         self.playwright = None
         self.browser: Optional[Browser] = None
         self.context: Optional[BrowserContext] = None
@@ -58,6 +68,10 @@ class PlaywrightTestEngine:
                 user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
             )
 
+            # 按项目网络配置拦截请求
+            if self.network is not None:
+                await self.network.apply_playwright_async(self.context)
+
             # 创建页面
             self.page = await self.context.new_page()
 
@@ -82,6 +96,7 @@ class PlaywrightTestEngine:
         except Exception as e:
             logger.error(f"关闭浏览器失败: {str(e)}")
 
+    @traced_step
     async def execute_step(self, step, element_data: Dict) -> Tuple[bool, str, Optional[str]]:
         """
         执行单个测试步骤
@@ -94,6 +109,7 @@ class PlaywrightTestEngine:
             (是否成功, 日志信息, 截图base64)
         """
         action_type = step.action_type
+        strategy = getattr(step, 'wait_strategy', None) or None
         
         # 预先解析变量
         resolved_input_value = step.input_value
@@ -286,7 +302,7 @@ class PlaywrightTestEngine:
                         wrapper_locator = locator.locator('.el-select__wrapper, input').first
                         await wrapper_locator.click(timeout=timeout_ms, no_wait_after=False)
                         # 等待下拉框展开动画
-                        await asyncio.sleep(0.5)
+                        await self.waiter.dropdown_open(self.page, strategy)
                         
                         execution_time = round(time.time() - start_time, 2)
                         log = f"✓ 点击下拉框触发器 '{element_name}' 成功\n"
@@ -310,7 +326,7 @@ class PlaywrightTestEngine:
                                     events.forEach(event => element.dispatchEvent(event));
                                 }
                             """)
-                            await asyncio.sleep(0.5)
+                            await self.waiter.dropdown_open(self.page, strategy)
                             execution_time = round(time.time() - start_time, 2)
                             log = f"✓ 点击下拉框触发器 '{element_name}' 成功（事件链）\n"
                             log += f"  - 定位器: {locator_strategy}={locator_value}\n"
@@ -326,7 +342,7 @@ class PlaywrightTestEngine:
                     logger.info(f"检测到下拉框选项，使用 Playwright + Vue 数据更新策略...")
                     
                     # 等待下拉框完全展开并渲染
-                    await asyncio.sleep(0.8)
+                    await self.waiter.dropdown_open(self.page, strategy)
                     
                     try:
                         # 等待元素在 DOM 中（不要求可见）
@@ -418,7 +434,7 @@ class PlaywrightTestEngine:
 
                         # 检查并关闭多选下拉框
                         try:
-                            await asyncio.sleep(0.5)
+                            await self.waiter.dropdown_closed(self.page, strategy)
                             dropdown = self.page.locator('.el-select-dropdown').first
                             if await dropdown.is_visible():
                                 logger.info(f"多选下拉框未自动关闭，点击空白处关闭...")
@@ -440,7 +456,7 @@ class PlaywrightTestEngine:
                         logger.info(f"JS执行结果: {js_result}")
                         
                         # 等待 Vue 响应式更新完成
-                        await asyncio.sleep(0.8)
+                        await self.waiter.after_action(self.page, 'click', strategy)
                         
                         # 检查并关闭多选下拉框
                         try:
@@ -448,7 +464,7 @@ class PlaywrightTestEngine:
                             if await dropdown.is_visible():
                                 logger.info(f"多选下拉框未自动关闭，点击空白处关闭...")
                                 await self.page.click('body', position={'x': 10, 'y': 10}, timeout=3000)
-                                await asyncio.sleep(0.5)
+                                await self.waiter.dropdown_closed(self.page, strategy)
                                 auto_close_msg = " + 自动关闭"
                             else:
                                 auto_close_msg = ""
@@ -513,9 +529,9 @@ class PlaywrightTestEngine:
                 await locator.fill(resolved_input_value, timeout=timeout_ms, force=force_action)
                 execution_time = round(time.time() - start_time, 2)
 
-                # 输入成功后短暂等待，确保表单验证生效
+                # 输入成功后等待页面稳定，确保表单验证生效
                 # 特别是在服务器环境下，需要给Vue/React等框架时间处理
-                await asyncio.sleep(0.3)
+                await self.waiter.after_action(self.page, 'fill', strategy)
 
                 log = f"✓ 在元素 '{element_name}' 中输入文本成功\n"
                 log += f"  - 定位器: {locator_strategy}={locator_value}\n"
@@ -678,20 +694,12 @@ class PlaywrightTestEngine:
             (是否成功, 日志信息)
         """
         try:
-            # 检测是否在Linux服务器环境
-            import platform
-            is_linux = platform.system() == 'Linux'
-
-            # 使用 networkidle 等待页面加载完成
-            await self.page.goto(url, wait_until='networkidle', timeout=30000)
-
-            # 额外等待，确保动态内容加载（Vue/React等SPA应用）
-            # 服务器无头模式需要更长的等待时间
-            extra_wait = 3 if is_linux else 2
-            await asyncio.sleep(extra_wait)
+            # 按等待策略等待页面就绪（fixed：networkidle + 额外 2~3 秒，smart：网络空闲 + DOM 静默）
+            await self.waiter.navigate(self.page, url)
+            wait = self.waiter.drain()[-1]
 
             log = f"✓ 成功导航到: {url}\n"
-            log += f"  - 等待页面加载完成（networkidle + 额外{extra_wait}秒）"
+            log += f"  - 等待页面就绪（{wait['strategy']}，{wait['duration_ms']}ms）"
             return True, log
         except Exception as e:
             log = f"✗ 导航失败: {url}\n  - 错误: {str(e)}"
@@ -705,7 +713,10 @@ class PlaywrightTestEngine:
             截图的base64字符串
         """
         try:
-            screenshot = await self.page.screenshot(full_page=True)
+            # 默认只截取可视区域，整页截图可能有数 MB
+            from django.conf import settings
+            full_page = getattr(settings, 'UI_SCREENSHOT_FULL_PAGE', False)
+            screenshot = await self.page.screenshot(full_page=full_page)
             return f"data:image/png;base64,{base64.b64encode(screenshot).decode()}"
         except Exception as e:
             logger.error(f"捕获截图失败: {str(e)}")
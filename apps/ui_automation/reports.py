@@ -1,6 +1,8 @@
 """
 AI测试报告生成器
 用于生成AI智能测试执行的各类报告
+
+报告优先使用执行过程中记录的结构化步骤事件（AIStepEvent），没有步骤事件的旧执行记录按日志解析
 """
 from datetime import datetime
 from typing import Dict, List, Any, Optional
@@ -8,6 +10,8 @@ import logging
 import re
 import json
 
+from .ai_step_events import action_distribution
+
 logger = logging.getLogger('django')
 
 
@@ -22,6 +26,13 @@ class AIExecutionReportGenerator:
             execution_record: AIExecutionRecord 实例
         """
         self.record = execution_record
+        self._step_events = None
+
+    def _get_step_events(self) -> List[Any]:
+        """执行记录的步骤事件（只查询一次），旧的执行记录返回空列表"""
+        if self._step_events is None:
+            self._step_events = list(self.record.step_events.all()) if self.record.pk else []
+        return self._step_events
 
     def generate_summary_report(self) -> Dict[str, Any]:
         """
@@ -123,6 +134,14 @@ class AIExecutionReportGenerator:
         Returns:
             步骤信息字典
         """
+        events = self._get_step_events()
+        if events:
+            return {
+                'total_steps': len(events),
+                'total_actions': sum(len(event.actions) for event in events),
+                'steps': [{'step_number': event.step_number, 'actions': event.action_text} for event in events]
+            }
+
         steps = []
         total_actions = 0
 
@@ -317,6 +336,27 @@ class AIExecutionReportGenerator:
 
     def _parse_detailed_steps(self, logs: str, steps_completed: List) -> List[Dict[str, Any]]:
         """解析详细步骤信息"""
+        events = self._get_step_events()
+        if events:
+            # 按步骤顺序合并 steps_completed 中的思考过程和截图
+            detailed_steps = []
+            for event in events:
+                index = event.step_number - 1
+                extra = steps_completed[index] if 0 <= index < len(steps_completed) else {}
+                detailed_steps.append({
+                    'step_number': event.step_number,
+                    'action': event.action_text,
+                    'element': extra.get('element', ''),
+                    'status': 'failed' if event.outcome == 'error' else 'completed',
+                    'timestamp': event.created_at.isoformat() if event.created_at else '',
+                    'thinking': extra.get('thinking', ''),
+                    'screenshot': extra.get('screenshot', ''),
+                    'url': event.url,
+                    'duration': round(event.duration_ms / 1000, 2) if event.duration_ms is not None else None,
+                    'error': event.error,
+                })
+            return detailed_steps
+
         detailed_steps = []
 
         # 先从 steps_completed 中提取信息
@@ -348,6 +388,13 @@ class AIExecutionReportGenerator:
 
     def _parse_errors(self, logs: str) -> List[Dict[str, Any]]:
         """解析错误信息"""
+        events = self._get_step_events()
+        if events:
+            return [
+                {'message': event.error, 'type': 'error', 'step_number': event.step_number}
+                for event in events if event.outcome == 'error'
+            ]
+
         errors = []
 
         # 查找错误行
@@ -406,9 +453,23 @@ class AIExecutionReportGenerator:
         """分析步骤性能 - 基于操作复杂度分配时间权重"""
         performance = []
 
-        # 收集所有步骤（优先从 steps_completed，否则从日志解析）
+        # 步骤事件记录了每步的实际耗时
+        events = self._get_step_events()
+        if events and all(event.duration_ms is not None for event in events):
+            return [
+                {
+                    'step_number': event.step_number,
+                    'action': event.action_text,
+                    'estimated_duration': round(event.duration_ms / 1000, 2),
+                }
+                for event in events
+            ]
+
+        # 收集所有步骤（优先从步骤事件和 steps_completed，否则从日志解析）
         all_steps = []
-        if steps_completed:
+        if events:
+            all_steps = [{'step_number': event.step_number, 'action': event.action_text} for event in events]
+        elif steps_completed:
             for i, step in enumerate(steps_completed):
                 action_desc = step.get('action', '')
                 if not action_desc:
@@ -530,6 +591,10 @@ class AIExecutionReportGenerator:
 
     def _analyze_action_distribution(self, logs: str) -> Dict[str, int]:
         """分析操作类型分布"""
+        events = self._get_step_events()
+        if events:
+            return action_distribution(events)
+
         distribution = {
             'click': 0,
             'input': 0,
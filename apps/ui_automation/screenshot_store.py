@@ -0,0 +1,214 @@
+"""
+UI自动化截图存储
+
+截图原来以 data:image/png;base64 URL 的形式直接写在 TestCaseExecution.screenshots 和
+TestExecution.result_data 中，一张截图就让记录增大数百 KB 到数 MB，列表和详情接口每次都要传输这些数据。
+
+现在截图写入独立的存储，执行记录中只保存引用：
+
+- 内容寻址：按原始截图的 SHA-256 命名，相同的截图只保存一次
+- 压缩：转换为 UI_SCREENSHOT_FORMAT（webp / jpeg / png）格式保存，同时生成宽度为 UI_SCREENSHOT_THUMBNAIL_WIDTH 的缩略图
+- 存储后端：默认保存在 UI_SCREENSHOT_ROOT（MEDIA_ROOT/ui_screenshots），
+  UI_SCREENSHOT_STORAGE 可以指定其他 Django Storage 类（如对象存储）
+- 按需加载：引用中的 url / thumbnail_url 指向截图接口，前端显示时才下载图片
+- 访问控制：执行记录返回给前端时，截图地址带上有效期为 UI_SCREENSHOT_URL_MAX_AGE 秒的签名
+  （<img> 标签无法携带 JWT 认证头）；没有有效签名时，只有能访问截图所属项目的登录用户可以下载
+"""
+import base64
+import hashlib
+import io
+import logging
+import threading
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+# 格式 -> (Pillow 格式名, 扩展名, Content-Type)
+FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+    'png': ('PNG', 'png', 'image/png'),
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """截图存储（Django Storage 实例）"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                storage_path = getattr(settings, 'UI_SCREENSHOT_STORAGE', '')
+                if storage_path:
+                    from django.utils.module_loading import import_string
+                    _storage = import_string(storage_path)()
+                else:
+                    from django.core.files.storage import FileSystemStorage
+                    _storage = FileSystemStorage(location=settings.UI_SCREENSHOT_ROOT)
+    return _storage
+
+
+def _path(sha256, fmt, thumbnail=False):
+    suffix = '_thumb' if thumbnail else ''
+    return f'{sha256[:2]}/{sha256[2:4]}/{sha256}{suffix}.{FORMATS[fmt][1]}'
+
+
+def _encode(data, fmt):
+    """压缩截图并生成缩略图，返回 (图片, 缩略图)"""
+    from PIL import Image
+
+    pil_format = FORMATS[fmt][0]
+    quality = getattr(settings, 'UI_SCREENSHOT_QUALITY', 80)
+    thumbnail_width = getattr(settings, 'UI_SCREENSHOT_THUMBNAIL_WIDTH', 320)
+
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    def dump(img):
+        buffer = io.BytesIO()
+        if pil_format == 'PNG':
+            img.save(buffer, format=pil_format, optimize=True)
+        else:
+            img.save(buffer, format=pil_format, quality=quality)
+        return buffer.getvalue()
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail((thumbnail_width, thumbnail_width * 4))
+    return dump(image), dump(thumbnail)
+
+
+def _save(storage, path, content):
+    name = storage.save(path, ContentFile(content))
+    if name != path:
+        # 其他线程/进程同时写入了相同内容的截图，删除存储后端自动改名产生的副本
+        storage.delete(name)
+
+
+def save_screenshot(data):
+    """保存截图（PNG/JPEG 原始字节），返回截图引用
+
+    返回的引用包含 sha256、url、thumbnail_url、content_type，可直接放入 screenshots 列表。
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    fmt = getattr(settings, 'UI_SCREENSHOT_FORMAT', 'webp')
+    if fmt not in FORMATS:
+        fmt = 'webp'
+    storage = get_storage()
+    path = _path(sha256, fmt)
+    if not storage.exists(path):
+        try:
+            image, thumbnail = _encode(data, fmt)
+        except Exception as e:
+            # 无法识别的图片原样保存
+            logger.warning(f"截图压缩失败，保存原始数据: {e}")
+            fmt = 'png'
+            path = _path(sha256, fmt)
+            image = thumbnail = data
+        _save(storage, path, image)
+        _save(storage, _path(sha256, fmt, thumbnail=True), thumbnail)
+    return screenshot_ref(sha256, fmt)
+
+
+def screenshot_ref(sha256, fmt):
+    url = reverse('screenshot-blob', kwargs={'sha256': sha256})
+    return {
+        'sha256': sha256,
+        'url': url,
+        'thumbnail_url': f'{url}?thumbnail=1',
+        'content_type': FORMATS[fmt][2],
+    }
+
+
+SIGNING_SALT = 'ui_automation.screenshot'
+
+
+def _signer():
+    return signing.TimestampSigner(salt=SIGNING_SALT)
+
+
+def url_signature(sha256):
+    """截图地址的签名（时间戳:签名）"""
+    return _signer().sign(sha256).split(':', 1)[1]
+
+
+def check_signature(sha256, sig):
+    """签名有效且未过期"""
+    if not sig:
+        return False
+    try:
+        _signer().unsign(f'{sha256}:{sig}', max_age=getattr(settings, 'UI_SCREENSHOT_URL_MAX_AGE', 3600))
+        return True
+    except signing.BadSignature:
+        return False
+
+
+def sign_screenshot_urls(data):
+    """为数据中（任意嵌套的列表/字典）的截图引用生成带签名的地址，返回新的数据
+
+    签名地址有有效期，只在返回给前端时生成，不保存到执行记录中。
+    """
+    if isinstance(data, list):
+        return [sign_screenshot_urls(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+    sha256 = data.get('sha256')
+    if isinstance(sha256, str) and len(sha256) == 64 and 'url' in data:
+        sig = url_signature(sha256)
+        url = reverse('screenshot-blob', kwargs={'sha256': sha256})
+        return {**data, 'url': f'{url}?sig={sig}', 'thumbnail_url': f'{url}?thumbnail=1&sig={sig}'}
+    return {key: sign_screenshot_urls(value) for key, value in data.items()}
+
+
+def user_can_access(user, sha256):
+    """用户能否访问截图（截图被用户有权限的项目中的执行记录引用）"""
+    from django.db.models import Q, TextField
+    from django.db.models.functions import Cast
+    from .models import TestCaseExecution, TestExecution, UiProject
+
+    if not user or not user.is_authenticated:
+        return False
+    projects = UiProject.objects.filter(Q(owner=user) | Q(members=user)).values('id')
+    if TestCaseExecution.objects.filter(project__in=projects).annotate(
+            screenshots_text=Cast('screenshots', TextField())).filter(screenshots_text__contains=sha256).exists():
+        return True
+    return TestExecution.objects.filter(project__in=projects).annotate(
+        result_text=Cast('result_data', TextField())).filter(result_text__contains=sha256).exists()
+
+
+def open_screenshot(sha256, thumbnail=False):
+    """打开已保存的截图，返回 (文件对象, Content-Type)，不存在时返回 (None, None)"""
+    storage = get_storage()
+    for fmt, (_, _, content_type) in FORMATS.items():
+        path = _path(sha256, fmt, thumbnail=thumbnail)
+        if storage.exists(path):
+            return storage.open(path, 'rb'), content_type
+    return None, None
+
+
+def externalize_screenshots(screenshots):
+    """把截图列表中的 data URL 转存到截图存储，替换为引用
+
+    已经是引用（或 url 为空）的条目原样保留，返回新的列表。
+    """
+    result = []
+    for item in screenshots or []:
+        url = item.get('url') if isinstance(item, dict) else item
+        if isinstance(url, str) and url.startswith('data:image'):
+            try:
+                data = base64.b64decode(url.split(',', 1)[1])
+                ref = save_screenshot(data)
+            except Exception as e:
+                logger.warning(f"截图转存失败: {e}")
+                result.append(item)
+                continue
+            item = {**item, **ref} if isinstance(item, dict) else ref
+        result.append(item)
+    return result
@@ -5,6 +5,10 @@ Selenium自动化测试执行引擎
 import base64
 import time
 from .variable_resolver import resolve_variables
+from .tracing import traced_step
+from .wait_strategies import SeleniumWaiter
+from . import webdriver_registry
+from .selenium_pool import get_selenium_pool
 import os
 import shutil
 from datetime import datetime
@@ -23,17 +27,22 @@ logger = logging.getLogger(__name__)
 class SeleniumTestEngine:
     """Selenium测试执行引擎"""
 
-    def __init__(self, browser_type='chrome', headless=True):
+    def __init__(self, browser_type='chrome', headless=True, wait_strategy=None):
         """
         初始化测试引擎
 
         Args:
             browser_type: 浏览器类型 (chrome, firefox, safari, edge)
             headless: 是否无头模式
+            wait_strategy: 项目的等待策略（UiProject.wait_strategy），步骤配置的策略优先
         """
         self.browser_type = browser_type
         self.headless = headless
         self.driver = None
+        # 最近一个步骤的耗时（毫秒），见 tracing.traced_step
+        self.last_step_timing = None
+        # 操作后的等待，见 wait_strategies
+        self.waiter = SeleniumWaiter(wait_strategy)
 
     @staticmethod
     def check_browser_available(browser_type='chrome'):
@@ -46,6 +55,9 @@ class SeleniumTestEngine:
         Returns:
             (是否可用, 错误信息)
         """
+        # 驱动已登记的浏览器在登记时已确认可用，不再检查
+        if webdriver_registry.is_registered(browser_type):
+            return True, None
         try:
             if browser_type == 'chrome':
                 # 检查 Chrome 浏览器是否安装
@@ -106,6 +118,10 @@ class SeleniumTestEngine:
             return True, None  # 检查出错时跳过，让实际启动时处理
 
     def start(self):
+        """从 Selenium 会话池取用浏览器，没有可复用的会话时启动"""
+        self.driver = get_selenium_pool().acquire(('engine', self.browser_type, self.headless), self._launch)
+
+    def _launch(self):
         """启动浏览器"""
         try:
             import os
@@ -129,7 +145,6 @@ class SeleniumTestEngine:
             if self.browser_type == 'chrome':
                 from selenium.webdriver.chrome.options import Options
                 from selenium.webdriver.chrome.service import Service
-                from webdriver_manager.chrome import ChromeDriverManager
 
                 options = Options()
                 if self.headless:
@@ -171,13 +186,12 @@ class SeleniumTestEngine:
                 options.add_argument('--disable-notifications')  # 禁用所有通知
 
                 # 使用缓存优先策略
-                service = Service(ChromeDriverManager().install())
+                service = Service(webdriver_registry.driver_path('chrome'))
                 self.driver = webdriver.Chrome(service=service, options=options)
 
             elif self.browser_type == 'firefox':
                 from selenium.webdriver.firefox.options import Options
                 from selenium.webdriver.firefox.service import Service
-                from webdriver_manager.firefox import GeckoDriverManager
 
                 options = Options()
                 if self.headless:
@@ -201,13 +215,12 @@ class SeleniumTestEngine:
                 options.set_preference('extensions.update.autoUpdateDefault', False)
 
                 # 使用缓存优先策略
-                service = Service(GeckoDriverManager().install())
+                service = Service(webdriver_registry.driver_path('firefox'))
                 self.driver = webdriver.Firefox(service=service, options=options)
 
             elif self.browser_type == 'edge':
                 from selenium.webdriver.edge.options import Options
                 from selenium.webdriver.edge.service import Service
-                from webdriver_manager.microsoft import EdgeChromiumDriverManager
 
                 options = Options()
                 if self.headless:
@@ -216,7 +229,7 @@ class SeleniumTestEngine:
                 options.add_argument('--window-size=1920,1080')
 
                 # 使用缓存优先策略，7天内不重新下载
-                service = Service(EdgeChromiumDriverManager().install())
+                service = Service(webdriver_registry.driver_path('edge'))
                 self.driver = webdriver.Edge(service=service, options=options)
 
             elif self.browser_type == 'safari':
@@ -243,7 +256,6 @@ class SeleniumTestEngine:
                 # 默认使用Chrome
                 from selenium.webdriver.chrome.options import Options
                 from selenium.webdriver.chrome.service import Service
-                from webdriver_manager.chrome import ChromeDriverManager
 
                 options = Options()
                 if self.headless:
@@ -274,26 +286,28 @@ class SeleniumTestEngine:
                 options.add_argument('--disable-features=TranslateUI')  # 禁用翻译提示
                 options.add_argument('--disable-infobars')  # 禁用信息栏
 
-                service = Service(ChromeDriverManager().install())
+                service = Service(webdriver_registry.driver_path('chrome'))
                 self.driver = webdriver.Chrome(service=service, options=options)
 
             # 设置隐式等待
             self.driver.implicitly_wait(3)
 
             logger.info(f"浏览器启动成功: {self.browser_type}, headless={self.headless}")
+            return self.driver
 
         except Exception as e:
             logger.error(f"启动浏览器失败: {str(e)}")
             raise
 
     def stop(self):
-        """关闭浏览器"""
+        """重置浏览器并归还会话池（不能复用的会话直接关闭）"""
         try:
             if self.driver:
-                self.driver.quit()
-            logger.info("浏览器已关闭")
+                get_selenium_pool().release(self.driver)
+                self.driver = None
+            logger.info("浏览器已归还会话池")
         except Exception as e:
-            logger.error(f"关闭浏览器失败: {str(e)}")
+            logger.error(f"归还浏览器失败: {str(e)}")
 
     def _get_locator(self, locator_strategy: str, locator_value: str) -> Tuple[str, str]:
         """
@@ -343,6 +357,7 @@ class SeleniumTestEngine:
 
         return by_type, locator_value
 
+    @traced_step
     def execute_step(self, step, element_data: Dict) -> Tuple[bool, str, Optional[str]]:
         """
         执行单个测试步骤
@@ -356,6 +371,7 @@ class SeleniumTestEngine:
         """
         print(f"\n🔵 开始执行步骤: action_type={step.action_type}")
         action_type = step.action_type
+        strategy = getattr(step, 'wait_strategy', None) or None
         
         # 预先解析变量
         resolved_input_value = step.input_value
@@ -515,7 +531,7 @@ class SeleniumTestEngine:
                                 self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", element)
                             else:
                                 self.driver.execute_script("arguments[0].scrollIntoView(true);", element)
-                            time.sleep(0.3)  # 等待滚动完成
+                            self.waiter.element_stable(self.driver, element, strategy)  # 等待滚动完成
                             element.click()
                             execution_time = round(time.time() - start_time, 2)
                             log = f"✓ 点击元素 '{element_name}' 成功\n"
@@ -527,10 +543,8 @@ class SeleniumTestEngine:
                         if attempt < max_retries - 1:
                             # 重新定位元素
                             logger.warning(f"⚠️ 元素过期（Stale Element），正在重试... (尝试 {attempt + 2}/{max_retries})")
-                            # 增加等待时间，让页面 DOM 稳定（对于 Vue/React 应用很重要）
-                            wait_time = 1.0 if attempt == 0 else 1.5  # 第一次重试等1秒，第二次重试等1.5秒
-                            logger.info(f"等待 {wait_time}秒 让页面稳定...")
-                            time.sleep(wait_time)
+                            # 等待页面 DOM 稳定（对于 Vue/React 应用很重要），fixed 策略第一次重试等1秒，第二次重试等1.5秒
+                            self.waiter.dom_settled(self.driver, 1000 if attempt == 0 else 1500, strategy)
 
                             # 根据类型重新定位
                             if 'dropdown' in by_value.lower() or 'el-select' in by_value.lower():
@@ -545,7 +559,7 @@ class SeleniumTestEngine:
                                 element = wait.until(EC.element_to_be_clickable((by_type, by_value)))
 
                             # 等待元素状态稳定（确保 DOM 不再变化）
-                            time.sleep(0.3)
+                            self.waiter.element_stable(self.driver, element, strategy)
                             logger.info(f"✓ 元素重新定位成功: '{element_name}'")
                         else:
                             raise
@@ -563,7 +577,7 @@ class SeleniumTestEngine:
                                 return True, log, None
                             except:
                                 if attempt < max_retries - 1:
-                                    time.sleep(0.5)
+                                    self.waiter.dom_settled(self.driver, 500, strategy)
                                     if 'dropdown' in by_value.lower() or 'el-select' in by_value.lower():
                                         element = wait.until(EC.visibility_of_element_located((by_type, by_value)))
                                     else:
@@ -608,20 +622,18 @@ class SeleniumTestEngine:
                             log += f"  - 超时设置: {timeout_seconds}秒\n"
                             log += f"  - 执行时间: {execution_time}秒"
 
-                        # 输入成功后短暂等待，确保表单验证生效
+                        # 输入成功后等待页面稳定，确保表单验证生效
                         # 特别是在服务器环境下，需要给Vue/React等框架时间处理
-                        time.sleep(0.3)
+                        self.waiter.after_action(self.driver, 'fill', strategy)
 
                         return True, log, None
                     except StaleElementReferenceException:
                         if attempt < max_retries - 1:
                             logger.warning(f"⚠️ 元素过期（Stale Element），正在重试... (尝试 {attempt + 2}/{max_retries})")
-                            # 增加等待时间，让页面 DOM 稳定
-                            wait_time = 1.0 if attempt == 0 else 1.5
-                            logger.info(f"等待 {wait_time}秒 让页面稳定...")
-                            time.sleep(wait_time)
+                            # 等待页面 DOM 稳定
+                            self.waiter.dom_settled(self.driver, 1000 if attempt == 0 else 1500, strategy)
                             element = wait.until(EC.presence_of_element_located((by_type, by_value)))
-                            time.sleep(0.3)  # 确保元素状态稳定
+                            self.waiter.element_stable(self.driver, element, strategy)  # 确保元素状态稳定
                             logger.info(f"✓ 元素重新定位成功")
                         else:
                             raise
@@ -642,12 +654,10 @@ class SeleniumTestEngine:
                     except StaleElementReferenceException:
                         if attempt < max_retries - 1:
                             logger.warning(f"⚠️ 元素过期（Stale Element），正在重试... (尝试 {attempt + 2}/{max_retries})")
-                            # 增加等待时间，让页面 DOM 稳定
-                            wait_time = 1.0 if attempt == 0 else 1.5
-                            logger.info(f"等待 {wait_time}秒 让页面稳定...")
-                            time.sleep(wait_time)
+                            # 等待页面 DOM 稳定
+                            self.waiter.dom_settled(self.driver, 1000 if attempt == 0 else 1500, strategy)
                             element = wait.until(EC.presence_of_element_located((by_type, by_value)))
-                            time.sleep(0.3)  # 确保元素状态稳定
+                            self.waiter.element_stable(self.driver, element, strategy)  # 确保元素状态稳定
                             logger.info(f"✓ 元素重新定位成功")
                         else:
                             raise
@@ -694,7 +704,7 @@ class SeleniumTestEngine:
             elif action_type == 'scroll':
                 # 滚动到元素
                 self.driver.execute_script("arguments[0].scrollIntoView(true);", element)
-                time.sleep(0.3)  # 等待滚动完成
+                self.waiter.element_stable(self.driver, element, strategy)  # 等待滚动完成
                 execution_time = round(time.time() - start_time, 2)
                 log = f"✓ 滚动到元素 '{element_name}' 成功\n"
                 log += f"  - 定位器: {locator_strategy}={locator_value}\n"
@@ -987,29 +997,12 @@ class SeleniumTestEngine:
             (是否成功, 日志信息)
         """
         try:
-            self.driver.get(url)
-
-            # 等待页面基本加载完成
-            # 在服务器环境（特别是无头模式）需要更长的等待时间
-            import platform
-            is_linux = platform.system() == 'Linux'
-
-            # 等待 document.readyState 为 complete
-            try:
-                WebDriverWait(self.driver, 15 if is_linux else 10).until(
-                    lambda driver: driver.execute_script("return document.readyState") == "complete"
-                )
-            except:
-                # 即使超时也继续执行
-                pass
-
-            # 额外等待，确保动态内容加载（Vue/React等SPA应用）
-            # 服务器无头模式需要更长的等待时间
-            extra_wait = 3 if is_linux else 2
-            time.sleep(extra_wait)
+            # 按等待策略等待页面就绪（fixed：readyState complete + 额外 2~3 秒，smart：网络空闲 + DOM 静默）
+            self.waiter.navigate(self.driver, url)
+            wait = self.waiter.drain()[-1]
 
             log = f"✓ 成功导航到: {url}\n"
-            log += f"  - 等待页面加载完成（基础等待+额外{extra_wait}秒）"
+            log += f"  - 等待页面就绪（{wait['strategy']}，{wait['duration_ms']}ms）"
             return True, log
         except Exception as e:
             log = f"✗ 导航失败: {url}\n  - 错误: {str(e)}"
@@ -0,0 +1,206 @@
+"""
+Selenium 会话池
+
+套件、单用例执行（TestCaseViewSet.run）和定时任务原来每次都要冷启动一个 WebDriver 会话（启动驱动进程和浏览器，
+耗时数秒）。会话池在进程内保留用完的会话，按 (来源, 浏览器, 是否无头, 选项) 分组复用：
+
+- 归还时重置会话：关闭多余的窗口，清除 Cookie 和当前站点的 localStorage/sessionStorage，打开 about:blank，
+  重置失败的会话直接关闭
+- 会话创建超过 SELENIUM_POOL_MAX_AGE 秒、使用超过 SELENIUM_POOL_MAX_USES 次，
+  或空闲超过 SELENIUM_POOL_IDLE_TIMEOUT 秒后关闭，下次取用时重新启动
+- 进程内同时存在的会话（使用中 + 空闲）不超过 SELENIUM_POOL_MAX_SESSIONS 个，达到上限时优先关闭其他分组的
+  空闲会话，没有空闲会话时等待其他执行归还
+- Safari 不支持会话复用，取用时直接启动，归还时关闭
+
+WebDriver 会话通过 HTTP 调用驱动进程，可以跨线程使用，但同一时间只能由一个执行使用。
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+RESET_STORAGE_JS = "try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}"
+
+
+class _Session:
+    def __init__(self, key, driver):
+        self.key = key
+        self.driver = driver
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.uses = 1
+
+
+def _quit(driver):
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.debug(f"关闭 Selenium 会话失败: {e}")
+
+
+def reset_session(driver):
+    """重置会话状态，供下一个执行使用"""
+    handles = driver.window_handles
+    for handle in handles[1:]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(handles[0])
+    driver.execute_script(RESET_STORAGE_JS)
+    driver.delete_all_cookies()
+    if hasattr(driver, 'execute_cdp_cmd'):
+        # Chrome/Edge 清除所有域名的 Cookie（delete_all_cookies 只能清除当前域名的）
+        try:
+            driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        except Exception:
+            pass
+    driver.get('about:blank')
+
+
+def _healthy(driver):
+    try:
+        driver.window_handles
+        return True
+    except Exception:
+        return False
+
+
+class SeleniumSessionPool:
+    """进程内的 Selenium 会话池，通过 get_selenium_pool() 获取"""
+
+    def __init__(self):
+        self._idle = []
+        self._in_use = {}
+        self._starting = 0
+        self._cond = threading.Condition()
+
+    def _expired(self, session, now):
+        return (
+            now - session.created > getattr(settings, 'SELENIUM_POOL_MAX_AGE', 1800)
+            or session.uses >= getattr(settings, 'SELENIUM_POOL_MAX_USES', 50)
+            or now - session.last_used > getattr(settings, 'SELENIUM_POOL_IDLE_TIMEOUT', 300)
+        )
+
+    def _total(self):
+        return len(self._idle) + len(self._in_use) + self._starting
+
+    def acquire(self, key, factory):
+        """取用一个会话，没有可复用的会话时调用 factory() 创建，用完后调用 release() 归还
+
+        Args:
+            key: 会话分组，(来源, 浏览器, 是否无头, 选项...)，第二项为浏览器名称
+            factory: 创建 WebDriver 的函数
+        """
+        if not getattr(settings, 'SELENIUM_POOL_ENABLED', True) or key[1] == 'safari':
+            driver = factory()
+            with self._cond:
+                self._in_use[id(driver)] = _Session(None, driver)
+            return driver
+
+        max_sessions = getattr(settings, 'SELENIUM_POOL_MAX_SESSIONS', 4)
+        timeout = getattr(settings, 'SELENIUM_POOL_ACQUIRE_TIMEOUT', 300)
+        deadline = time.monotonic() + timeout
+        while True:
+            to_quit = []
+            session = None
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    for idle in [s for s in self._idle if self._expired(s, now)]:
+                        self._idle.remove(idle)
+                        to_quit.append(idle.driver)
+                    session = next((s for s in self._idle if s.key == key), None)
+                    if session is not None:
+                        self._idle.remove(session)
+                        session.uses += 1
+                        session.last_used = now
+                        self._in_use[id(session.driver)] = session
+                        break
+                    if self._total() < max_sessions:
+                        self._starting += 1
+                        break
+                    if self._idle:
+                        # 关闭其他分组中最久未使用的空闲会话，腾出名额
+                        oldest = min(self._idle, key=lambda s: s.last_used)
+                        self._idle.remove(oldest)
+                        to_quit.append(oldest.driver)
+                        continue
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise TimeoutError(f"等待 Selenium 会话超时（会话数上限 {max_sessions}）")
+                    self._cond.wait(remaining)
+
+            for driver in to_quit:
+                _quit(driver)
+
+            if session is None:
+                try:
+                    driver = factory()
+                except Exception:
+                    with self._cond:
+                        self._starting -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._starting -= 1
+                    self._in_use[id(driver)] = _Session(key, driver)
+                logger.info(f"Selenium 会话池创建会话: {key[1]}")
+                return driver
+
+            if _healthy(session.driver):
+                return session.driver
+            # 浏览器已崩溃或会话已失效，关闭后重新取用
+            logger.warning(f"Selenium 会话已失效，重新创建: {key[1]}")
+            self._discard(session)
+
+    def _discard(self, session):
+        with self._cond:
+            self._in_use.pop(id(session.driver), None)
+            self._cond.notify()
+        _quit(session.driver)
+
+    def release(self, driver):
+        """重置会话并放回池中（不能复用的会话直接关闭）"""
+        with self._cond:
+            session = self._in_use.get(id(driver))
+        if session is None:
+            _quit(driver)
+            return
+        if session.key is None or self._expired(session, time.monotonic()):
+            self._discard(session)
+            return
+        try:
+            reset_session(driver)
+        except Exception as e:
+            logger.warning(f"重置 Selenium 会话失败，关闭会话: {e}")
+            self._discard(session)
+            return
+        with self._cond:
+            self._in_use.pop(id(driver), None)
+            session.last_used = time.monotonic()
+            self._idle.append(session)
+            self._cond.notify()
+
+    def close(self):
+        """关闭所有空闲会话"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            _quit(session.driver)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_selenium_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SeleniumSessionPool()
+                atexit.register(_pool.close)
+    return _pool
@@ -29,16 +29,34 @@ class UiProjectSerializer(serializers.ModelSerializer):
         read_only_fields = ('created_at', 'updated_at')
 
 
+def validate_network_profile(value):
+    """校验项目的网络配置"""
+    from .network_profiles import validate_config
+
+    errors = validate_config(value)
+    if errors:
+        raise serializers.ValidationError(errors)
+    return value or {}
+
+
 class UiProjectCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = UiProject
-        fields = ('name', 'description', 'status', 'base_url', 'start_date', 'end_date', 'owner', 'members')
+        fields = ('name', 'description', 'status', 'base_url', 'start_date', 'end_date', 'owner', 'members', 'wait_strategy',
+                  'login_case', 'login_state_ttl', 'login_check_selector', 'network_profile')
+
+    def validate_network_profile(self, value):
+        return validate_network_profile(value)
 
 
 class UiProjectUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = UiProject
-        fields = ('name', 'description', 'status', 'base_url', 'start_date', 'end_date', 'members')
+        fields = ('name', 'description', 'status', 'base_url', 'start_date', 'end_date', 'members', 'wait_strategy',
+                  'login_case', 'login_state_ttl', 'login_check_selector', 'network_profile')
+
+    def validate_network_profile(self, value):
+        return validate_network_profile(value)
 
 
 class LocatorStrategySerializer(serializers.ModelSerializer):
@@ -201,14 +219,14 @@ class TestSuiteSerializer(serializers.ModelSerializer):
 class TestSuiteCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = TestSuite
-        fields = ('id', 'project', 'name', 'description')
+        fields = ('id', 'project', 'name', 'description', 'workers')
         read_only_fields = ('id',)
 
 
 class TestSuiteUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = TestSuite
-        fields = ('name', 'description')
+        fields = ('name', 'description', 'workers')
 
 
 class TestSuiteWithScriptsSerializer(serializers.ModelSerializer):
@@ -255,6 +273,13 @@ class TestExecutionSerializer(serializers.ModelSerializer):
         """获取通过率"""
         return obj.pass_rate
 
+    def to_representation(self, instance):
+        from .screenshot_store import sign_screenshot_urls
+
+        data = super().to_representation(instance)
+        data['result_data'] = sign_screenshot_urls(data.get('result_data'))
+        return data
+
 
 class TestExecutionCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -533,7 +558,7 @@ class TestCaseStepSerializer(serializers.ModelSerializer):
         model = TestCaseStep
         fields = [
             'id', 'step_number', 'action_type', 'element', 'element_name', 'element_locator',
-            'input_value', 'wait_time', 'assert_type', 'assert_value', 'description', 'created_at'
+            'input_value', 'wait_time', 'wait_strategy', 'assert_type', 'assert_value', 'description', 'created_at'
         ]
 
 
@@ -546,7 +571,7 @@ class TestCaseSerializer(serializers.ModelSerializer):
     class Meta:
         model = TestCase
         fields = [
-            'id', 'name', 'description', 'project', 'project_name', 'status', 'priority',
+            'id', 'name', 'description', 'project', 'project_name', 'status', 'priority', 'parallel_safe',
             'created_by', 'created_by_name', 'created_at', 'updated_at', 'steps'
         ]
         read_only_fields = ['created_by']
@@ -569,10 +594,10 @@ class TestCaseExecutionSerializer(serializers.ModelSerializer):
             'id', 'test_case', 'test_case_name', 'project', 'project_name',
             'test_suite', 'test_suite_name', 'execution_source', 'status',
             'engine', 'browser', 'headless', 'execution_logs', 'error_message',
-            'screenshots', 'execution_time', 'started_at', 'finished_at',
+            'screenshots', 'execution_time', 'trace_file', 'started_at', 'finished_at',
             'created_by', 'created_by_name', 'created_at'
         ]
-        read_only_fields = ['created_by']
+        read_only_fields = ['created_by', 'trace_file']
     
     def get_test_suite_name(self, obj):
         """获取测试套件名称"""
@@ -582,11 +607,30 @@ class TestCaseExecutionSerializer(serializers.ModelSerializer):
         """获取创建人姓名"""
         return obj.created_by.username if obj.created_by else '-'
 
+    def to_representation(self, instance):
+        from .screenshot_store import sign_screenshot_urls
+
+        data = super().to_representation(instance)
+        data['screenshots'] = sign_screenshot_urls(data.get('screenshots'))
+        return data
+
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
 
 
+class SlowestStepsQuerySerializer(serializers.Serializer):
+    """最慢步骤统计的查询参数"""
+    days = serializers.IntegerField(min_value=1, max_value=365, default=7)
+    limit = serializers.IntegerField(min_value=1, default=20)
+    group_by = serializers.ChoiceField(choices=['step', 'element'], default='step')
+
+
+class AILogLinesQuerySerializer(serializers.Serializer):
+    """增量获取AI执行日志的查询参数"""
+    after = serializers.IntegerField(min_value=0, default=0)
+
+
 class TestCaseRunSerializer(serializers.Serializer):
     """测试用例运行序列化器"""
     test_case_id = serializers.IntegerField()
@@ -643,7 +687,7 @@ class UiScheduledTaskSerializer(serializers.ModelSerializer):
             'trigger_type', 'trigger_type_display', 'cron_expression',
             'interval_seconds', 'execute_at', 'project', 'project_name',
             'test_suite', 'test_suite_name', 'test_cases',
-            'engine', 'browser', 'headless',
+            'engine', 'browser', 'headless', 'workers',
             'notify_on_success', 'notify_on_failure', 'notification_type', 'notification_type_display', 'notify_emails',
             'status', 'status_display',
             'last_run_time', 'next_run_time', 'total_runs',
@@ -806,7 +850,7 @@ class AICaseSerializer(serializers.ModelSerializer):
     class Meta:
         model = AICase
         fields = '__all__'
-        read_only_fields = ('created_at', 'updated_at', 'created_by')
+        read_only_fields = ('created_at', 'updated_at', 'created_by', 'plan_hash', 'planned_tasks')
 
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
@@ -822,6 +866,7 @@ class AIExecutionRecordSerializer(serializers.ModelSerializer):
     project_name = serializers.CharField(source='project.name', read_only=True)
     ai_case_name = serializers.CharField(source='ai_case.name', read_only=True)
     executed_by_name = serializers.CharField(source='executed_by.username', read_only=True)
+    logs = serializers.SerializerMethodField()
 
     class Meta:
         model = AIExecutionRecord
@@ -834,6 +879,11 @@ class AIExecutionRecordSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ('start_time', 'end_time', 'duration', 'executed_by', 'gif_path', 'screenshots_sequence')
 
+    def get_logs(self, obj):
+        """执行中的记录包含已追加写入的日志行"""
+        from .ai_log_writer import read_logs
+        return read_logs(obj)
+
 
 
 class UiNotificationLogSerializer(serializers.ModelSerializer):
@@ -5,9 +5,13 @@ UI自动化测试执行服务
 import time
 import json
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import queue
+import threading
+from django.conf import settings
 from django.utils import timezone
 from django.db import connection
-from playwright.sync_api import sync_playwright
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -22,21 +26,50 @@ from .models import (
     TestCaseExecution, Element
 )
 from .variable_resolver import resolve_variables
+from .browser_pool import get_browser_pool, close_browser_pool
+from .wait_strategies import PlaywrightWaiter, SeleniumWaiter
+from .screenshot_store import save_screenshot
+from . import login_cache
+from .network_profiles import NetworkProfile, selenium_logging_prefs, summarize
+from .selenium_pool import get_selenium_pool
+from .tracing import StepSpan, save_step_timings
+from .execution_recorder import ExecutionRecorder
+from apps.core.job_queue import JobCancelled, current_job_id, is_cancel_requested
 
 
 
 class TestExecutor:
     """测试执行器基类"""
 
-    def __init__(self, test_suite, engine='playwright', browser='chrome', headless=False, executed_by=None):
+    def __init__(self, test_suite, engine='playwright', browser='chrome', headless=False, executed_by=None,
+                 workers=None):
         self.test_suite = test_suite
         self.engine = engine
         self.browser = browser
         self.headless = headless
         self.executed_by = executed_by
+        # 并行执行的用例数，为空时使用套件配置
+        max_workers = getattr(settings, 'UI_SUITE_MAX_WORKERS', 4)
+        self.workers = max(1, min(workers or test_suite.workers or 1, max_workers))
         self.execution = None
         self.test_cases = []
         self.results = []
+        # 当前用例的等待策略，执行每个用例前创建
+        self.waiter = None
+        # 项目登录用例的数据，见 prepare_login_fixture
+        self.login_case_data = None
+        self.login_failed = False
+        # 当前用例的网络配置（Playwright），未配置时为 None；Selenium 驱动是否已通过 CDP 拦截请求
+        self.network = None
+        self.selenium_network_applied = False
+        # 当前步骤的耗时记录；当前浏览器上下文是否在录制 Playwright Trace
+        self.step_span = None
+        self.tracing = False
+        # 用例执行记录的批量写入，见 execution_recorder
+        self.recorder = None
+        # 在作业中执行时的作业ID，每个用例开始前检查作业是否已被取消（并行线程共用同一个取消标记）
+        self.job_id = current_job_id()
+        self.cancelled = threading.Event()
 
     def create_execution_record(self):
         """创建测试执行记录"""
@@ -72,13 +105,19 @@ class TestExecutor:
                 'pass_rate': round((passed / self.execution.total_cases * 100) if self.execution.total_cases > 0 else 0, 2)
             }
         }
-        self.execution.save()
+        network = summarize(self.results)
+        if network:
+            self.execution.result_data['summary']['network'] = network
+        self.execution.save(update_fields=[
+            'status', 'passed_cases', 'failed_cases', 'skipped_cases', 'total_cases',
+            'duration', 'finished_at', 'error_message', 'result_data'
+        ])
 
         # 更新套件统计
         self.test_suite.passed_count = passed
         self.test_suite.failed_count = failed
         self.test_suite.execution_status = 'passed' if failed == 0 and passed > 0 else 'failed'
-        self.test_suite.save()
+        self.test_suite.save(update_fields=['passed_count', 'failed_count', 'execution_status', 'updated_at'])
 
     def get_test_cases(self):
         """获取测试套件中的所有测试用例"""
@@ -89,6 +128,213 @@ class TestExecutor:
             print(f"  {i}. {tc.name} (ID: {tc.id})")
         return self.test_cases
 
+    @staticmethod
+    def count_results(results):
+        """统计通过/失败/跳过的用例数"""
+        passed = sum(1 for r in results if r['status'] == 'passed')
+        failed = sum(1 for r in results if r['status'] == 'failed')
+        return passed, failed, len(results) - passed - failed
+
+    def cancellable(self, entries):
+        """依次取出待执行的用例，作业被取消后不再取出"""
+        for entry in entries:
+            if self.cancelled.is_set() or (self.job_id and is_cancel_requested(self.job_id)):
+                self.cancelled.set()
+                return
+            yield entry
+
+    def mark_cancelled_cases(self, entries, results):
+        """作业取消后未执行的用例记为跳过"""
+        for i, case_data, case_execution in entries:
+            if i in results:
+                continue
+            now = datetime.now().isoformat()
+            results[i] = {
+                'test_case_id': case_data['id'],
+                'test_case_name': case_data['name'],
+                'status': 'skipped',
+                'steps': [],
+                'error': '作业已取消，用例未执行',
+                'start_time': now,
+                'end_time': now,
+                'screenshots': []
+            }
+            self.mark_case_finished(case_execution, 'error', results[i]['error'])
+
+    def finish_cases(self, results, start_time):
+        """统计用例结果并保存套件执行结果，作业被取消时抛出 JobCancelled"""
+        passed, failed, skipped = self.count_results(results)
+        duration = time.time() - start_time
+        if self.cancelled.is_set():
+            self.update_execution_result('ABORTED', passed, failed, skipped, duration, error_msg='作业已取消')
+            raise JobCancelled()
+        status = 'SUCCESS' if failed == 0 else 'FAILED'
+        self.update_execution_result(status, passed, failed, skipped, duration)
+
+    def run_cases(self, test_cases_data, case_executions, run_batch):
+        """按并行数执行用例，返回按套件顺序排列的用例结果
+
+        run_batch 为执行器方法名，该方法在当前线程中依次执行 entries（(序号, 用例数据, 执行记录) 的可迭代对象），
+        返回 {序号: 用例结果}。并行执行时每个线程使用执行器的副本，各自驱动独立的浏览器；
+        标记为不可并行的用例在并行部分结束后依次执行。用例执行记录的状态变更交给 self.recorder
+        （ExecutionRecorder.update），按 UI_RECORDER_FLUSH_INTERVAL 批量写入，调用方在全部用例结束后
+        调用 recorder.flush(final=True) 写入剩余的修改。作业被取消后未执行的用例记为跳过。
+        最终结果按套件顺序排列，与串行执行一致。
+        """
+        entries = [
+            (i, case_data, case_executions[case_data['id']])
+            for i, case_data in enumerate(test_cases_data, 1)
+        ]
+        parallel_entries = [e for e in entries if e[1].get('parallel_safe', True)]
+        serial_entries = [e for e in entries if not e[1].get('parallel_safe', True)]
+        workers = min(self.workers, len(parallel_entries))
+
+        if workers <= 1:
+            results = getattr(self, run_batch)(self.cancellable(entries))
+            self.mark_cancelled_cases(entries, results)
+            return [results[i] for i, _, _ in entries]
+
+        print(f"并行执行 {len(parallel_entries)} 个用例（{workers} 个线程），{len(serial_entries)} 个用例串行执行")
+        # 在主线程中预先加载关联对象，避免工作线程各自查询
+        self.test_suite.project
+
+        pending = queue.Queue()
+        for entry in parallel_entries:
+            pending.put(entry)
+
+        def take():
+            while True:
+                try:
+                    yield pending.get_nowait()
+                except queue.Empty:
+                    return
+
+        def worker():
+            executor = copy.copy(self)
+            try:
+                return getattr(executor, run_batch)(executor.cancellable(take()))
+            finally:
+                # 浏览器池和数据库连接都属于当前线程，线程结束前关闭
+                close_browser_pool()
+                connection.close()
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ui-suite') as pool:
+            futures = [pool.submit(worker) for _ in range(workers)]
+            for future in futures:
+                results.update(future.result())
+        if serial_entries:
+            results.update(getattr(self, run_batch)(self.cancellable(serial_entries)))
+        self.mark_cancelled_cases(entries, results)
+        return [results[i] for i, _, _ in entries]
+
+    def create_case_executions(self, test_cases_data):
+        """批量创建本次套件执行的用例执行记录，返回 {用例ID: TestCaseExecution}"""
+        self.recorder = ExecutionRecorder()
+        return self.recorder.create_pending(
+            self.test_suite, test_cases_data,
+            execution_source='suite',
+            engine=self.engine,
+            browser=self.browser,
+            headless=self.headless,
+            created_by=self.executed_by
+        )
+
+    def mark_case_running(self, case_execution):
+        self.recorder.update(case_execution, status='running', started_at=timezone.now())
+
+    def mark_case_finished(self, case_execution, status, error_message=None, case_result=None):
+        """记录用例执行结束，执行记录在 recorder 下次写入时保存"""
+        finished_at = timezone.now()
+        started_at = case_execution.started_at or finished_at
+        fields = {
+            'status': status,
+            'finished_at': finished_at,
+            'execution_time': (finished_at - started_at).total_seconds(),
+        }
+        if error_message:
+            fields['error_message'] = error_message
+        if case_result is not None:
+            fields['execution_logs'] = json.dumps(case_result['steps'], ensure_ascii=False)
+            if case_result.get('screenshots'):
+                fields['screenshots'] = case_result['screenshots']
+        self.recorder.update(case_execution, **fields)
+
+    def prepare_case_data(self, test_case):
+        """预先加载用例及其步骤数据，执行过程中不再访问ORM"""
+        case_data = {
+            'id': test_case.id,
+            'name': test_case.name,
+            'project_id': self.test_suite.project.id,
+            'parallel_safe': test_case.parallel_safe,
+            'wait_strategy': self.test_suite.project.wait_strategy,
+            'steps': []
+        }
+
+        # 获取步骤并预先加载所有相关数据
+        steps = test_case.steps.select_related('element', 'element__locator_strategy').order_by('step_number')
+        for step in steps:
+            step_data = {
+                'id': step.id,
+                'step_number': step.step_number,
+                'action_type': step.action_type,
+                'description': step.description,
+                'input_value': step.input_value,
+                'wait_time': step.wait_time,
+                'wait_strategy': step.wait_strategy,
+                'assert_type': step.assert_type,
+                'assert_value': step.assert_value,
+                'element': None
+            }
+
+            # 如果有元素，预先获取元素数据
+            if step.element:
+                step_data['element'] = {
+                    'id': step.element.id,
+                    'name': step.element.name,
+                    'locator_value': step.element.locator_value,
+                    'locator_strategy': step.element.locator_strategy.name if step.element.locator_strategy else 'css'
+                }
+
+            case_data['steps'].append(step_data)
+
+        return case_data
+
+    def prepare_login_fixture(self, test_cases_data):
+        """项目配置了登录用例时，记录每个用例开头可以跳过的登录步骤数（login_steps）"""
+        self.login_case_data = None
+        project = self.test_suite.project
+        if not project.login_case_id:
+            return
+        self.login_case_data = self.prepare_case_data(project.login_case)
+        for case_data in test_cases_data:
+            if case_data['id'] != project.login_case_id:
+                case_data['login_steps'] = login_cache.login_prefix_length(
+                    self.login_case_data['steps'], case_data['steps']
+                )
+
+    @staticmethod
+    def save_step_timings(case_execution, case_data, case_result):
+        """保存用例各步骤的耗时，用于统计最慢的步骤和元素"""
+        element_ids = {step['step_number']: step['element']['id'] for step in case_data['steps'] if step['element']}
+        try:
+            save_step_timings(case_execution, case_result['steps'], element_ids)
+        except Exception as e:
+            print(f"⚠️  保存步骤耗时失败: {str(e)}")
+
+    @staticmethod
+    def skipped_login_step(step_data):
+        """已使用缓存的登录状态而跳过的步骤结果"""
+        return {
+            'step_number': step_data['step_number'],
+            'action_type': step_data['action_type'],
+            'description': step_data['description'],
+            'success': True,
+            'skipped': True,
+            'error': None,
+            'message': '已使用缓存的登录状态，跳过登录步骤'
+        }
+
     def run(self):
         """执行测试套件"""
         try:
@@ -112,6 +358,9 @@ class TestExecutor:
             else:
                 self.run_with_selenium()
 
+        except JobCancelled:
+            print("测试套件执行已取消")
+            raise
         except Exception as e:
             print(f"测试执行失败: {str(e)}")
             import traceback
@@ -122,8 +371,12 @@ class TestExecutor:
                     error_msg=f"执行失败: {str(e)}"
                 )
         finally:
-            # 确保关闭数据库连接
-            connection.close()
+            # 写入尚未保存的用例执行记录，并关闭数据库连接
+            try:
+                if self.recorder is not None:
+                    self.recorder.flush(final=True)
+            finally:
+                connection.close()
 
     def run_with_playwright(self):
         """使用 Playwright 执行测试（同步版本）"""
@@ -169,202 +422,207 @@ class TestExecutor:
             return
 
         # 预先获取所有测试用例的步骤数据，避免在Playwright上下文中访问ORM
-        test_cases_data = []
-        for test_case in self.test_cases:
-            case_data = {
-                'id': test_case.id,
-                'name': test_case.name,
-                'project_id': self.test_suite.project.id,
-                'steps': []
-            }
+        test_cases_data = [self.prepare_case_data(test_case) for test_case in self.test_cases]
+        self.prepare_login_fixture(test_cases_data)
+        # 预先批量创建所有测试用例执行记录（pending 状态，不设置 started_at，等实际执行时再设置）
+        case_executions = self.create_case_executions(test_cases_data)
 
-            # 获取步骤并预先加载所有相关数据
-            steps = test_case.steps.select_related('element', 'element__locator_strategy').order_by('step_number')
-            for step in steps:
-                step_data = {
-                    'id': step.id,
-                    'step_number': step.step_number,
-                    'action_type': step.action_type,
-                    'description': step.description,
-                    'input_value': step.input_value,
-                    'wait_time': step.wait_time,
-                    'assert_type': step.assert_type,
-                    'assert_value': step.assert_value,
-                    'element': None
-                }
+        # 执行每个测试用例，浏览器从浏览器池复用，每个用例使用独立的浏览器上下文
+        print(f"准备执行 {len(test_cases_data)} 个测试用例")
+        self.results = self.run_cases(test_cases_data, case_executions, '_run_playwright_cases')
+        self.recorder.flush(final=True)
 
-                # 如果有元素，预先获取元素数据
-                if step.element:
-                    step_data['element'] = {
-                        'id': step.element.id,
-                        'name': step.element.name,
-                        'locator_value': step.element.locator_value,
-                        'locator_strategy': step.element.locator_strategy.name if step.element.locator_strategy else 'css'
-                    }
+        # 注意：每个用例的执行记录已在执行过程中通过 recorder 批量写入，不需要在这里统一更新
 
-                case_data['steps'].append(step_data)
+        self.finish_cases(self.results, start_time)
 
-            test_cases_data.append(case_data)
+    def _run_playwright_cases(self, entries):
+        """在当前线程中依次执行一批用例（Playwright），返回 {用例序号: 用例结果}"""
+        pool = get_browser_pool()
+        results = {}
+        for i, case_data, case_execution in entries:
+            results[i] = self._run_playwright_case(pool, i, case_data, case_execution)
+        return results
 
-        # 预先创建所有测试用例执行记录（不设置 started_at，等实际执行时再设置）
-        case_executions = {}
-        for case_data in test_cases_data:
-            case_execution = TestCaseExecution.objects.create(
-                test_case_id=case_data['id'],
-                project_id=case_data['project_id'],
-                test_suite=self.test_suite,
-                execution_source='suite',
-                status='pending',  # 初始状态为 pending
-                engine=self.engine,
-                browser=self.browser,
-                headless=self.headless,
-                created_by=self.executed_by
-                # 注意：不设置 started_at，等用例实际开始执行时再设置
-            )
-            case_executions[case_data['id']] = case_execution
+    def _run_playwright_case(self, pool, i, case_data, case_execution):
+        """执行单个用例并更新其执行记录（Playwright）"""
+        print(f"\n{'='*60}")
+        print(f"正在执行第 {i}/{len(self.test_cases)} 个用例: {case_data['name']}")
+        print(f"{'='*60}")
 
-        # 执行每个测试用例，为每个用例单独启动和关闭浏览器
-        print(f"准备执行 {len(test_cases_data)} 个测试用例")
+        # 记录用例实际开始执行时间
+        self.mark_case_running(case_execution)
 
-        with sync_playwright() as p:
-            for i, case_data in enumerate(test_cases_data, 1):
-                print(f"\n{'='*60}")
-                print(f"正在执行第 {i}/{len(test_cases_data)} 个用例: {case_data['name']}")
-                print(f"{'='*60}")
-                
-                # 记录用例实际开始执行时间
-                case_execution = case_executions[case_data['id']]
-                case_execution.started_at = timezone.now()
-                case_execution.status = 'running'
-                case_execution.save()
-
-                # 为每个测试用例启动新的浏览器实例
-                try:
-                    # 选择浏览器
-                    if self.browser == 'firefox':
-                        browser = p.firefox.launch(headless=self.headless)
-                    elif self.browser == 'safari':
-                        browser = p.webkit.launch(headless=self.headless)
-                    else:  # chrome or edge
-                        # 添加防检测参数
-                        browser = p.chromium.launch(
-                            headless=self.headless,
-                            args=['--disable-blink-features=AutomationControlled']
-                        )
-
-                    print(f"✓ 浏览器已启动")
-
-                    # 配置上下文（User Agent 和 Viewport）
-                    self.context = browser.new_context(
-                        viewport={'width': 1920, 'height': 1080},
-                        user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
-                    )
-                    self.current_page = self.context.new_page()
+        # 为每个测试用例创建独立的浏览器上下文（浏览器进程由浏览器池复用）
+        self.context = None
+        try:
+            # 用例以项目登录用例的步骤开头时，使用缓存的登录状态创建上下文
+            login_state = self._playwright_login_state(pool, case_data)
+            navigation_waits, navigation_error = self._open_playwright_page(pool, case_data, login_state)
+            if navigation_error is None and login_state is not None and not self._login_state_valid(self.current_page):
+                print(f"⚠️  缓存的登录状态已失效，重新登录")
+                login_cache.invalidate(self.test_suite.project.id, 'playwright', login_state)
+                pool.release(self.context)
+                self.context = None
+                login_state = self._playwright_login_state(pool, case_data)
+                navigation_waits, navigation_error = self._open_playwright_page(pool, case_data, login_state)
+
+            if navigation_error is not None:
+                # 导航失败，记录错误并继续下一个用例
+                self.mark_case_finished(case_execution, 'failed', f"导航到基础URL失败: {navigation_error}")
+                return {
+                    'test_case_id': case_data['id'],
+                    'test_case_name': case_data['name'],
+                    'status': 'failed',
+                    'steps': [],
+                    'error': f"导航到基础URL失败: {navigation_error}",
+                    'start_time': datetime.now().isoformat(),
+                    'end_time': datetime.now().isoformat(),
+                    'screenshots': []
+                }
 
-                    # 导航到项目基础URL
-                    if self.test_suite.project.base_url:
-                        try:
-                            print(f"正在导航到: {self.test_suite.project.base_url}")
+            # 执行测试用例（不再传递page参数，使用self.current_page）
+            skip_steps = case_data.get('login_steps', 0) if login_state is not None else 0
+            case_result = self.execute_test_case_playwright_no_db(case_data, skip_steps=skip_steps)
+            if navigation_waits:
+                case_result['waits'] = navigation_waits
+            if self.network is not None:
+                case_result['network'] = self.network.report()
+            print(f"✓ 用例执行完成，状态: {case_result['status']}")
 
-                            # 检测是否在Linux服务器环境
-                            import platform
-                            is_linux = platform.system() == 'Linux'
+            # 更新该用例的执行记录（包含准确的执行时间）
+            self.mark_case_finished(case_execution, case_result['status'], case_result['error'], case_result)
+            self.save_step_timings(case_execution, case_data, case_result)
 
-                            # 使用 networkidle 等待页面加载完成
-                            self.current_page.goto(self.test_suite.project.base_url, wait_until='networkidle', timeout=30000)
+            print(f"⏱️  执行时长: {case_execution.execution_time:.2f}秒")
+            return case_result
 
-                            # 额外等待，确保动态内容加载（Vue/React等SPA应用）
-                            # 服务器无头模式需要更长的等待时间
-                            extra_wait = 3 if is_linux else 2
-                            time.sleep(extra_wait)
+        except Exception as e:
+            print(f"✗ 用例执行出现异常: {str(e)}")
+            # 更新执行记录
+            self.mark_case_finished(case_execution, 'failed', f"用例执行异常: {str(e)}")
 
-                            print(f"✓ 成功导航到: {self.test_suite.project.base_url} (已等待页面加载完成，额外{extra_wait}秒)")
-                        except Exception as e:
-                            print(f"✗ 导航失败: {str(e)}")
-                            # 导航失败，记录错误并继续下一个用例
-                            self.results.append({
-                                'test_case_id': case_data['id'],
-                                'test_case_name': case_data['name'],
-                                'status': 'failed',
-                                'steps': [],
-                                'error': f"导航到基础URL失败: {str(e)}",
-                                'start_time': datetime.now().isoformat(),
-                                'end_time': datetime.now().isoformat(),
-                                'screenshots': []
-                            })
-                            failed += 1
-                            browser.close()
-                            print(f"✓ 浏览器已关闭")
-                            continue
-
-                    # 执行测试用例（不再传递page参数，使用self.current_page）
-                    case_result = self.execute_test_case_playwright_no_db(case_data)
-                    self.results.append(case_result)
-                    print(f"✓ 用例执行完成，状态: {case_result['status']}")
-
-                    # 立即更新该用例的执行记录（包含准确的执行时间）
-                    case_execution = case_executions[case_data['id']]
-                    case_execution.status = case_result['status']
-                    case_execution.finished_at = timezone.now()
-                    case_execution.execution_time = (case_execution.finished_at - case_execution.started_at).total_seconds()
-                    case_execution.execution_logs = json.dumps(case_result['steps'], ensure_ascii=False)
-                    if case_result['error']:
-                        case_execution.error_message = case_result['error']
-                    if case_result.get('screenshots'):
-                        case_execution.screenshots = case_result['screenshots']
-                    case_execution.save()
-                    
-                    print(f"⏱️  执行时长: {case_execution.execution_time:.2f}秒")
+            # 记录异常
+            return {
+                'test_case_id': case_data['id'],
+                'test_case_name': case_data['name'],
+                'status': 'failed',
+                'steps': [],
+                'error': f"用例执行异常: {str(e)}",
+                'start_time': datetime.now().isoformat(),
+                'end_time': datetime.now().isoformat(),
+                'screenshots': []
+            }
 
-                    if case_result['status'] == 'passed':
-                        passed += 1
-                    elif case_result['status'] == 'failed':
-                        failed += 1
-                    else:
-                        skipped += 1
+        finally:
+            # 每个用例执行后关闭上下文，浏览器归还到池中供下一个用例使用
+            if self.context is not None:
+                self._stop_trace(case_execution)
+                pool.release(self.context)
+                print(f"✓ 浏览器上下文已关闭\n")
+
+    def _open_playwright_page(self, pool, case_data, storage_state=None):
+        """创建浏览器上下文并打开项目基础URL，返回 (导航等待记录, 导航错误)"""
+        options = {'storage_state': storage_state} if storage_state is not None else {}
+        # 配置上下文（User Agent 和 Viewport）
+        self.context = pool.new_context(
+            self.browser, self.headless,
+            viewport={'width': 1920, 'height': 1080},
+            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
+            **options
+        )
+        print(f"✓ 浏览器上下文已创建" + ("（使用缓存的登录状态）" if storage_state is not None else ""))
+        # 按项目网络配置拦截图片、字体、统计脚本等请求
+        self.network = NetworkProfile.from_config(self.test_suite.project.network_profile)
+        if self.network is not None:
+            self.network.apply_playwright(self.context)
+        # 录制 Playwright Trace，用例失败时才保存
+        self.tracing = getattr(settings, 'UI_TRACE_ON_FAILURE', False)
+        if self.tracing:
+            self.context.tracing.start(screenshots=True, snapshots=True)
+        self.current_page = self.context.new_page()
+        self.waiter = PlaywrightWaiter(case_data.get('wait_strategy'))
+
+        # 导航到项目基础URL
+        if not self.test_suite.project.base_url:
+            return [], None
+        try:
+            print(f"正在导航到: {self.test_suite.project.base_url}")
 
-                except Exception as e:
-                    print(f"✗ 用例执行出现异常: {str(e)}")
-                    # 记录异常
-                    self.results.append({
-                        'test_case_id': case_data['id'],
-                        'test_case_name': case_data['name'],
-                        'status': 'failed',
-                        'steps': [],
-                        'error': f"用例执行异常: {str(e)}",
-                        'start_time': datetime.now().isoformat(),
-                        'end_time': datetime.now().isoformat(),
-                        'screenshots': []
-                    })
-                    failed += 1
-                    
-                    # 更新执行记录
-                    case_execution = case_executions[case_data['id']]
-                    case_execution.status = 'failed'
-                    case_execution.finished_at = timezone.now()
-                    case_execution.execution_time = (case_execution.finished_at - case_execution.started_at).total_seconds()
-                    case_execution.error_message = f"用例执行异常: {str(e)}"
-                    case_execution.save()
-
-                finally:
-                    # 确保每个用例执行后都关闭浏览器
-                    try:
-                        browser.close()
-                        print(f"✓ 浏览器已关闭\n")
-                    except:
-                        pass
+            # 打开页面并按等待策略等待页面就绪（确保 Vue/React 等 SPA 应用的动态内容加载完成）
+            self.waiter.navigate(self.current_page, self.test_suite.project.base_url)
+            navigation_waits = self.waiter.drain()
 
-        # 注意：每个用例的执行记录已在执行过程中实时更新，不需要在这里统一更新
+            print(f"✓ 成功导航到: {self.test_suite.project.base_url} (等待页面就绪 {navigation_waits[-1]['duration_ms']}ms)")
+            return navigation_waits, None
+        except Exception as e:
+            print(f"✗ 导航失败: {str(e)}")
+            return [], str(e)
 
-        duration = time.time() - start_time
-        status = 'SUCCESS' if failed == 0 else 'FAILED'
-        self.update_execution_result(status, passed, failed, skipped, duration)
+    def _stop_trace(self, case_execution):
+        """停止录制 Trace，用例未通过时保存到 UI_TRACE_ROOT"""
+        if not self.tracing:
+            return
+        self.tracing = False
+        try:
+            if case_execution.status == 'passed':
+                self.context.tracing.stop()
+                return
+            import os
+            trace_file = f"{timezone.now():%Y%m%d}/{case_execution.id}.zip"
+            path = os.path.join(settings.UI_TRACE_ROOT, trace_file)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.context.tracing.stop(path=path)
+            self.recorder.update(case_execution, trace_file=trace_file)
+            print(f"✓ Trace 已保存: {trace_file}")
+        except Exception as e:
+            print(f"⚠️  保存 Trace 失败: {str(e)}")
+
+    def _playwright_login_state(self, pool, case_data):
+        """用例可以使用登录状态缓存时返回 storage_state，缓存不存在时运行一次登录用例"""
+        if not case_data.get('login_steps') or self.login_failed:
+            return None
+        project = self.test_suite.project
+        state = login_cache.get_or_login(project.id, 'playwright', project.login_state_ttl,
+                                         lambda: self._run_playwright_login(pool))
+        # 登录用例失败时本次执行不再重试，用例照常执行自己的登录步骤
+        self.login_failed = state is None
+        return state
+
+    def _run_playwright_login(self, pool):
+        """在独立的上下文中运行登录用例，成功时返回登录后的 storage_state"""
+        print(f"🔑 运行登录用例: {self.login_case_data['name']}")
+        try:
+            _, navigation_error = self._open_playwright_page(pool, self.login_case_data)
+            if navigation_error is not None:
+                return None
+            result = self.execute_test_case_playwright_no_db(self.login_case_data)
+            if result['status'] != 'passed':
+                print(f"✗ 登录用例执行失败: {result['error']}")
+                return None
+            print(f"✓ 登录状态已缓存")
+            return self.context.storage_state()
+        finally:
+            pool.release(self.context)
+            self.context = None
+
+    def _login_state_valid(self, page):
+        """使用缓存的登录状态打开页面后，检查登录校验元素是否可见"""
+        selector = self.test_suite.project.login_check_selector
+        if not selector:
+            return True
+        try:
+            page.wait_for_selector(selector, state='visible', timeout=5000)
+            return True
+        except Exception:
+            return False
 
-    def execute_test_case_playwright_no_db(self, case_data):
+    def execute_test_case_playwright_no_db(self, case_data, skip_steps=0):
         """使用 Playwright 执行单个测试用例（不访问数据库）
 
         Args:
             case_data: 预先准备的用例数据字典，包含id, name, project_id, steps等
+            skip_steps: 跳过开头的步骤数（已使用缓存的登录状态时跳过登录步骤）
             
         Note:
             使用 self.current_page 作为当前活动页面，switchTab会更新这个实例变量
@@ -378,43 +636,40 @@ class TestExecutor:
             'start_time': datetime.now().isoformat(),
             'screenshots': []
         }
+        if self.waiter is None:
+            self.waiter = PlaywrightWaiter(case_data.get('wait_strategy'))
+        result['steps'] = [self.skipped_login_step(step_data) for step_data in case_data['steps'][:skip_steps]]
 
         try:
             # 遍历预先准备好的步骤数据
             just_switched_tab = False  # 跟踪是否刚切换了标签页
-            for step_data in case_data['steps']:
+            for step_data in case_data['steps'][skip_steps:]:
                 # 如果刚切换了标签页，传递这个信息
                 step_data['_just_switched_tab'] = just_switched_tab
                 just_switched_tab = False  # 重置标志
                 
+                self.step_span = StepSpan(step_data['action_type'])
                 step_result = self.execute_step_playwright(step_data)
-                
-                # Debug: Log which page we're using
-                print(f"📄 步骤 {step_data['step_number']} 执行完成")
-                print(f"   使用的page URL: {self.current_page.url}")
-                print(f"   使用的page 标题: {self.current_page.title()}")
-                
                 result['steps'].append(step_result)
                 
                 # 显式更新self.current_page，确保引用正确
                 if step_result.get('switched_page'):
                     self.current_page = step_result['switched_page']
-                    print(f"🔄 页面切换确认: {self.current_page.title()}")
-                    print(f"   当前页面URL: {self.current_page.url}")
-                    print(f"   Page ID: {id(self.current_page)}")
+                    print(f"🔄 页面切换确认: {self.current_page.url}")
                     del step_result['switched_page']
                     just_switched_tab = True
                 
-                # 步骤执行完后添加短暂延迟，确保页面状态稳定
+                # 步骤执行完后等待页面状态稳定
                 # 特别是点击操作后，可能触发动画、下拉框展开等
                 if step_result['success'] and step_data['action_type'] in ['click', 'fill', 'hover']:
-                    import asyncio
-                    import time as sync_time
-                    # 点击操作后等待更长时间（下拉框展开动画）
-                    if step_data['action_type'] == 'click':
-                        self.current_page.wait_for_timeout(800)  # 等待800ms，确保下拉框完全展开
-                    else:
-                        self.current_page.wait_for_timeout(300)  # 其他操作等待300ms
+                    self.waiter.after_action(self.current_page, step_data['action_type'], step_data.get('wait_strategy'))
+                # 记录本步骤中各次等待的实际耗时
+                waits = self.waiter.drain()
+                if waits:
+                    step_result['waits'] = waits
+                self.step_span.add('wait', sum(wait['duration_ms'] for wait in waits))
+                step_result['timing'] = self.step_span.finish()
+                print(f"📄 步骤 {step_data['step_number']} 执行完成 ({step_result['timing']['total']}ms)")
 
                 # 如果步骤失败，捕获失败截图
                 if not step_result['success']:
@@ -424,30 +679,25 @@ class TestExecutor:
 
                     # 捕获失败截图（改进版）
                     try:
-                        import base64
                         # 增加超时设置，避免截图等待时间过长
-                        print(f"🔍 开始捕获失败截图 (步骤 {step_data['step_number']})...")
-                        print(f"   当前page对象URL: {self.current_page.url}")
-                        print(f"   当前page对象标题: {self.current_page.title()}")
+                        print(f"🔍 开始捕获失败截图 (步骤 {step_data['step_number']}, {self.current_page.url})...")
                         screenshot_bytes = self.current_page.screenshot(timeout=5000)  # 5秒超时
                         print(f"   截图字节大小: {len(screenshot_bytes)} bytes")
 
-                        screenshot_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
-                        print(f"   Base64 编码大小: {len(screenshot_base64)} characters")
+                        # 验证截图数据是否有效
+                        if len(screenshot_bytes) < 100:
+                            raise Exception(f"截图数据异常短 ({len(screenshot_bytes)} bytes)，可能截图失败")
 
-                        # 验证 base64 编码是否有效
-                        if len(screenshot_base64) < 100:
-                            raise Exception(f"Base64 编码异常短 ({len(screenshot_base64)} chars)，可能截图失败")
-
-                        screenshot_url = f'data:image/png;base64,{screenshot_base64}'
+                        # 截图写入截图存储，结果中只保存引用
+                        screenshot = save_screenshot(screenshot_bytes)
                         result['screenshots'].append({
-                            'url': screenshot_url,
+                            **screenshot,
                             'description': f'步骤 {step_data["step_number"]} 失败截图: {step_data.get("description", "")}',
                             'step_number': step_data['step_number'],
                             'timestamp': datetime.now().isoformat()
                         })
                         print(f"✓ 失败截图已捕获 (步骤 {step_data['step_number']})")
-                        print(f"   截图 URL 长度: {len(screenshot_url)} characters")
+                        print(f"   截图地址: {screenshot['url']}")
                     except Exception as screenshot_error:
                         error_msg = f"捕获失败截图失败: {str(screenshot_error)}"
                         print(f"⚠️  {error_msg}")
@@ -470,28 +720,25 @@ class TestExecutor:
 
             # 捕获异常截图（改进版）
             try:
-                import base64
                 # 增加超时设置，避免截图等待时间过长
                 print(f"🔍 开始捕获异常截图...")
                 screenshot_bytes = self.current_page.screenshot(timeout=5000)  # 5秒超时
                 print(f"   截图字节大小: {len(screenshot_bytes)} bytes")
 
-                screenshot_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
-                print(f"   Base64 编码大小: {len(screenshot_base64)} characters")
-
-                # 验证 base64 编码是否有效
-                if len(screenshot_base64) < 100:
-                    raise Exception(f"Base64 编码异常短 ({len(screenshot_base64)} chars)，可能截图失败")
+                # 验证截图数据是否有效
+                if len(screenshot_bytes) < 100:
+                    raise Exception(f"截图数据异常短 ({len(screenshot_bytes)} bytes)，可能截图失败")
 
-                screenshot_url = f'data:image/png;base64,{screenshot_base64}'
+                # 截图写入截图存储，结果中只保存引用
+                screenshot = save_screenshot(screenshot_bytes)
                 result['screenshots'].append({
-                    'url': screenshot_url,
+                    **screenshot,
                     'description': f'异常截图: {str(e)}',
                     'step_number': None,
                     'timestamp': datetime.now().isoformat()
                 })
                 print(f"✓ 异常截图已捕获")
-                print(f"   截图 URL 长度: {len(screenshot_url)} characters")
+                print(f"   截图地址: {screenshot['url']}")
             except Exception as screenshot_error:
                 error_msg = f"捕获异常截图失败: {str(screenshot_error)}"
                 print(f"⚠️  {error_msg}")
@@ -511,6 +758,7 @@ class TestExecutor:
 
     def execute_test_case_playwright(self, page, case_data):
         self.current_page = page
+        self.waiter = PlaywrightWaiter(case_data.get('wait_strategy'))
         """使用 Playwright 执行单个测试用例（同步版本） - 已弃用，保留用于向后兼容
 
         Args:
@@ -687,7 +935,7 @@ class TestExecutor:
                         js_result = self.current_page.evaluate(js_code)
                         
                         if js_result.get('success'):
-                            self.current_page.wait_for_timeout(800)  # 等待下拉框展开
+                            self.waiter.dropdown_open(self.current_page, step_data.get('wait_strategy'))  # 等待下拉框展开
                             step_result['success'] = True
                         else:
                             step_result['error'] = f"✗ 下拉框触发器点击失败: {js_result.get('error')}"
@@ -695,7 +943,7 @@ class TestExecutor:
                     elif is_dropdown_option:
                         # 下拉框选项：使用 Playwright 原生方法（更可靠）
                         # 之前使用 JS click() 可能无法触发 Element Plus 的事件监听
-                        self.current_page.wait_for_timeout(800)  # 等待下拉框展开
+                        self.waiter.dropdown_open(self.current_page, step_data.get('wait_strategy'))  # 等待下拉框展开
                         
                         print(f"[Playwright-调试] 下拉框选项处理: {locator_strategy}={locator_value}")
                         
@@ -753,7 +1001,7 @@ class TestExecutor:
                                 if self.current_page.locator('.el-select-dropdown').first.is_visible():
                                     # 点击空白处关闭
                                     self.current_page.click('body', position={'x': 10, 'y': 10}, timeout=3000)
-                                    self.current_page.wait_for_timeout(500)
+                                    self.waiter.dropdown_closed(self.current_page, step_data.get('wait_strategy'))
                             except:
                                 pass
                         
@@ -980,8 +1228,8 @@ class TestExecutor:
                         except Exception as e2:
                             print(f"  - 页面加载状态: 超时，继续执行 ({str(e2)[:50]})")
                     
-                    # 额外等待一小段时间，确保页面完全稳定
-                    target_page.wait_for_timeout(1500)  # 使用 wait_for_timeout 代替 sleep
+                    # 等待新页面的网络请求和渲染稳定
+                    self.waiter.page_settled(target_page, step_data.get('wait_strategy'))
                     
                     # 验证页面确实已切换
                     print(f"  - 当前活动页面URL: {target_page.url}")
@@ -1103,8 +1351,8 @@ class TestExecutor:
                         except Exception as e2:
                             print(f"  - 页面加载状态: 超时，继续执行 ({str(e2)[:50]})")
                     
-                    # 额外等待一小段时间，确保页面完全稳定
-                    target_page.wait_for_timeout(1500)  # 使用 wait_for_timeout 代替 sleep
+                    # 等待新页面的网络请求和渲染稳定
+                    self.waiter.page_settled(target_page, step_data.get('wait_strategy'))
                     
                     # 验证页面确实已切换
                     print(f"  - 当前活动页面URL: {target_page.url}")
@@ -1180,78 +1428,38 @@ class TestExecutor:
         skipped = 0
 
         # 预先获取所有测试用例的步骤数据，避免在Selenium上下文中访问ORM
-        test_cases_data = []
-        for test_case in self.test_cases:
-            case_data = {
-                'id': test_case.id,
-                'name': test_case.name,
-                'project_id': self.test_suite.project.id,
-                'steps': []
-            }
+        test_cases_data = [self.prepare_case_data(test_case) for test_case in self.test_cases]
+        self.prepare_login_fixture(test_cases_data)
+        # 预先批量创建所有测试用例执行记录（pending 状态，不设置 started_at，等实际执行时再设置）
+        case_executions = self.create_case_executions(test_cases_data)
 
-            # 获取步骤并预先加载所有相关数据
-            steps = test_case.steps.select_related('element', 'element__locator_strategy').order_by('step_number')
-            for step in steps:
-                step_data = {
-                    'id': step.id,
-                    'step_number': step.step_number,
-                    'action_type': step.action_type,
-                    'description': step.description,
-                    'input_value': step.input_value,
-                    'wait_time': step.wait_time,
-                    'assert_type': step.assert_type,
-                    'assert_value': step.assert_value,
-                    'element': None
-                }
+        print(f"准备执行 {len(test_cases_data)} 个测试用例")
+        self.results = self.run_cases(test_cases_data, case_executions, '_run_selenium_cases')
+        self.recorder.flush(final=True)
 
-                # 如果有元素，预先获取元素数据
-                if step.element:
-                    step_data['element'] = {
-                        'id': step.element.id,
-                        'name': step.element.name,
-                        'locator_value': step.element.locator_value,
-                        'locator_strategy': step.element.locator_strategy.name if step.element.locator_strategy else 'css'
-                    }
+        # 注意：每个用例的执行记录已在执行过程中通过 recorder 批量写入，不需要在这里统一更新
 
-                case_data['steps'].append(step_data)
+        self.finish_cases(self.results, start_time)
 
-            test_cases_data.append(case_data)
+    def _run_selenium_cases(self, entries):
+        """在当前线程中依次执行一批用例（Selenium），返回 {用例序号: 用例结果}"""
+        results = {}
 
-        # 预先创建所有测试用例执行记录（不设置 started_at，等实际执行时再设置）
-        case_executions = {}
-        for case_data in test_cases_data:
-            case_execution = TestCaseExecution.objects.create(
-                test_case_id=case_data['id'],
-                project_id=case_data['project_id'],
-                test_suite=self.test_suite,
-                execution_source='suite',
-                status='pending',  # 初始状态为 pending
-                engine=self.engine,
-                browser=self.browser,
-                headless=self.headless,
-                created_by=self.executed_by
-                # 注意：不设置 started_at，等用例实际开始执行时再设置
-            )
-            case_executions[case_data['id']] = case_execution
-
-        # 优化：整个测试套件共用一个浏览器实例，避免频繁启动/关闭
+        # 优化：同一批用例共用一个浏览器实例，避免频繁启动/关闭
         # 注意：Safari 不支持浏览器复用（会话管理问题），需要每个用例独立启动
-        print(f"准备执行 {len(test_cases_data)} 个测试用例")
-        
-        # Safari 需要独立浏览器实例，其他浏览器可以复用
         use_browser_reuse = self.browser != 'safari'
-        
+
+        driver = None
         if use_browser_reuse:
-            # 在套件开始时启动一次浏览器（Chrome/Firefox/Edge）
-            driver = None
+            # 在开始时从会话池取用一个浏览器（Chrome/Firefox/Edge），没有可复用的会话时启动
             try:
-                driver = self.create_selenium_driver()
-                print(f"✓ 浏览器已启动（将复用于所有用例）\n")
+                driver = self.acquire_selenium_driver()
+                print(f"✓ 浏览器已就绪（将复用于所有用例）\n")
             except Exception as e:
                 print(f"✗ 浏览器启动失败: {str(e)}")
                 # 标记所有用例为失败
-                for case_data in test_cases_data:
-                    self.results.append({
+                for i, case_data, case_execution in entries:
+                    results[i] = {
                         'test_case_id': case_data['id'],
                         'test_case_name': case_data['name'],
                         'status': 'failed',
@@ -1260,205 +1468,247 @@ class TestExecutor:
                         'start_time': datetime.now().isoformat(),
                         'end_time': datetime.now().isoformat(),
                         'screenshots': []
-                    })
-                    failed += 1
-                # 更新执行记录并返回
-                for case_result in self.results:
-                    case_execution = case_executions[case_result['test_case_id']]
-                    case_execution.status = 'failed'
-                    case_execution.finished_at = timezone.now()
-                    case_execution.execution_time = 0
-                    case_execution.error_message = case_result['error']
-                    case_execution.save()
-                duration = time.time() - start_time
-                self.update_execution_result('FAILED', 0, len(test_cases_data), 0, duration)
-                return
+                    }
+                    self.mark_case_finished(case_execution, 'failed', results[i]['error'])
+                return results
         else:
             # Safari：不预先启动浏览器，每个用例独立启动
-            driver = None
             print(f"ℹ️  Safari 浏览器将为每个用例独立启动（Safari 不支持浏览器复用）\n")
 
-        # 执行所有测试用例
-        for i, case_data in enumerate(test_cases_data, 1):
-            print(f"\n{'='*60}")
-            print(f"正在执行第 {i}/{len(test_cases_data)} 个用例: {case_data['name']}")
-            print(f"{'='*60}")
-            
-            # 记录用例实际开始执行时间
-            case_execution = case_executions[case_data['id']]
-            case_execution.started_at = timezone.now()
-            case_execution.status = 'running'
-            case_execution.save()
-
-            # Safari：为每个用例启动新的浏览器
-            if not use_browser_reuse:
+        try:
+            for n, (i, case_data, case_execution) in enumerate(entries):
+                results[i] = self._run_selenium_case(driver, use_browser_reuse, n == 0, i, case_data, case_execution)
+        finally:
+            # 所有用例执行完毕后，重置浏览器并归还会话池（仅对复用浏览器的情况）
+            if use_browser_reuse and driver:
                 try:
-                    driver = self.create_selenium_driver()
-                    print(f"✓ Safari 浏览器已启动")
+                    get_selenium_pool().release(driver)
+                    print(f"✓ 浏览器已归还会话池\n")
                 except Exception as e:
-                    print(f"✗ Safari 浏览器启动失败: {str(e)}")
-                    self.results.append({
-                        'test_case_id': case_data['id'],
-                        'test_case_name': case_data['name'],
-                        'status': 'failed',
-                        'steps': [],
-                        'error': f"浏览器启动失败: {str(e)}",
-                        'start_time': datetime.now().isoformat(),
-                        'end_time': datetime.now().isoformat(),
-                        'screenshots': []
-                    })
-                    failed += 1
-                    # 更新执行记录
-                    case_execution.status = 'failed'
-                    case_execution.finished_at = timezone.now()
-                    case_execution.execution_time = (case_execution.finished_at - case_execution.started_at).total_seconds()
-                    case_execution.error_message = f"浏览器启动失败: {str(e)}"
-                    case_execution.save()
-                    continue
+                    print(f"✗ 归还浏览器时出错: {str(e)}")
+        return results
 
-            try:
-                # 在每个用例开始前清理浏览器状态（仅对复用浏览器的情况，且跳过第1个用例）
-                # 第1个用例浏览器刚启动，无需清理；从第2个用例开始才需要清理
-                if use_browser_reuse and i > 1:
-                    try:
-                        print(f"🧹 清理浏览器状态...")
-                        # 清除所有 Cookie
-                        driver.delete_all_cookies()
-                        # 清除 localStorage 和 sessionStorage
-                        driver.execute_script("window.localStorage.clear();")
-                        driver.execute_script("window.sessionStorage.clear();")
-                        print(f"✓ 浏览器状态已清理")
-                    except Exception as clean_error:
-                        print(f"⚠️  清理浏览器状态失败: {str(clean_error)}，继续执行...")
-                        pass  # 如果清理失败，继续执行
-                
-                # 导航到项目基础URL
-                if self.test_suite.project.base_url:
-                    try:
-                        print(f"正在导航到: {self.test_suite.project.base_url}")
+    def _run_selenium_case(self, driver, use_browser_reuse, is_first, i, case_data, case_execution):
+        """执行单个用例并更新其执行记录（Selenium）"""
+        print(f"\n{'='*60}")
+        print(f"正在执行第 {i}/{len(self.test_cases)} 个用例: {case_data['name']}")
+        print(f"{'='*60}")
 
-                        # 检测是否在Linux服务器环境
-                        import platform
-                        is_linux = platform.system() == 'Linux'
-
-                        # 导航到URL
-                        driver.get(self.test_suite.project.base_url)
-
-                        # 等待页面基本加载完成
-                        # 在服务器环境（特别是无头模式）需要更长的等待时间
-                        try:
-                            WebDriverWait(driver, 15 if is_linux else 10).until(
-                                lambda d: d.execute_script("return document.readyState") == "complete"
-                            )
-                        except:
-                            pass  # 即使超时也继续执行
-
-                        # 额外等待，确保动态内容加载（Vue/React等SPA应用）
-                        extra_wait = 3 if is_linux else 2
-                        time.sleep(extra_wait)
-
-                        print(f"✓ 成功导航到: {self.test_suite.project.base_url} (已等待页面加载完成，额外{extra_wait}秒)")
-                    except Exception as e:
-                        print(f"✗ 导航失败: {str(e)}")
-                        # 导航失败，记录错误并继续下一个用例
-                        self.results.append({
-                            'test_case_id': case_data['id'],
-                            'test_case_name': case_data['name'],
-                            'status': 'failed',
-                            'steps': [],
-                            'error': f"导航到基础URL失败: {str(e)}",
-                            'start_time': datetime.now().isoformat(),
-                            'end_time': datetime.now().isoformat(),
-                            'screenshots': []
-                        })
-                        failed += 1
-                        continue
-
-                # 执行测试用例
-                case_result = self.execute_test_case_selenium_no_db(driver, case_data)
-                self.results.append(case_result)
-                print(f"✓ 用例执行完成，状态: {case_result['status']}")
-
-                # 立即更新该用例的执行记录（包含准确的执行时间）
-                case_execution = case_executions[case_data['id']]
-                case_execution.status = case_result['status']
-                case_execution.finished_at = timezone.now()
-                case_execution.execution_time = (case_execution.finished_at - case_execution.started_at).total_seconds()
-                case_execution.execution_logs = json.dumps(case_result['steps'], ensure_ascii=False)
-                if case_result['error']:
-                    case_execution.error_message = case_result['error']
-                if case_result.get('screenshots'):
-                    case_execution.screenshots = case_result['screenshots']
-                case_execution.save()
-                
-                print(f"⏱️  执行时长: {case_execution.execution_time:.2f}秒")
-
-                if case_result['status'] == 'passed':
-                    passed += 1
-                elif case_result['status'] == 'failed':
-                    failed += 1
-                else:
-                    skipped += 1
+        # 记录用例实际开始执行时间
+        self.mark_case_running(case_execution)
 
+        # Safari：为每个用例启动新的浏览器
+        if not use_browser_reuse:
+            try:
+                driver = self.create_selenium_driver()
+                print(f"✓ Safari 浏览器已启动")
             except Exception as e:
-                print(f"✗ 用例执行出现异常: {str(e)}")
-                # 记录异常
-                self.results.append({
+                print(f"✗ Safari 浏览器启动失败: {str(e)}")
+                # 更新执行记录
+                self.mark_case_finished(case_execution, 'failed', f"浏览器启动失败: {str(e)}")
+                return {
                     'test_case_id': case_data['id'],
                     'test_case_name': case_data['name'],
                     'status': 'failed',
                     'steps': [],
-                    'error': f"用例执行异常: {str(e)}",
+                    'error': f"浏览器启动失败: {str(e)}",
                     'start_time': datetime.now().isoformat(),
                     'end_time': datetime.now().isoformat(),
                     'screenshots': []
-                })
-                failed += 1
-                
-                # 更新执行记录
-                case_execution = case_executions[case_data['id']]
-                case_execution.status = 'failed'
-                case_execution.finished_at = timezone.now()
-                case_execution.execution_time = (case_execution.finished_at - case_execution.started_at).total_seconds()
-                case_execution.error_message = f"用例执行异常: {str(e)}"
-                case_execution.save()
-            
-            finally:
-                # Safari：每个用例执行完都关闭浏览器
-                if not use_browser_reuse and driver:
-                    try:
-                        driver.quit()
-                        print(f"✓ Safari 浏览器已关闭\n")
-                    except Exception as e:
-                        print(f"✗ 关闭 Safari 浏览器时出错: {str(e)}\n")
-                    driver = None
+                }
+
+        try:
+            # 在每个用例开始前清理浏览器状态（仅对复用浏览器的情况，且跳过第1个用例）
+            # 第1个用例浏览器刚启动，无需清理；从第2个用例开始才需要清理
+            if use_browser_reuse and not is_first:
+                self._clear_selenium_state(driver)
+
+            # 用例以项目登录用例的步骤开头时，使用缓存的登录状态
+            login_state = self._selenium_login_state(driver, case_data)
+            navigation_waits, navigation_error = self._open_selenium_page(driver, case_data, login_state)
+            if navigation_error is None and login_state is not None and not self._selenium_login_state_valid(driver):
+                print(f"⚠️  缓存的登录状态已失效，重新登录")
+                login_cache.invalidate(self.test_suite.project.id, 'selenium', login_state)
+                self._clear_selenium_state(driver)
+                login_state = self._selenium_login_state(driver, case_data)
+                navigation_waits, navigation_error = self._open_selenium_page(driver, case_data, login_state)
+
+            if navigation_error is not None:
+                # 导航失败，记录错误并继续下一个用例
+                self.mark_case_finished(case_execution, 'failed', f"导航到基础URL失败: {navigation_error}")
+                return {
+                    'test_case_id': case_data['id'],
+                    'test_case_name': case_data['name'],
+                    'status': 'failed',
+                    'steps': [],
+                    'error': f"导航到基础URL失败: {navigation_error}",
+                    'start_time': datetime.now().isoformat(),
+                    'end_time': datetime.now().isoformat(),
+                    'screenshots': []
+                }
+
+            # 执行测试用例
+            skip_steps = case_data.get('login_steps', 0) if login_state is not None else 0
+            case_result = self.execute_test_case_selenium_no_db(driver, case_data, skip_steps=skip_steps)
+            if navigation_waits:
+                case_result['waits'] = navigation_waits
+            if self.selenium_network_applied:
+                network = NetworkProfile.from_config(self.test_suite.project.network_profile)
+                network.collect_selenium(driver)
+                case_result['network'] = network.report()
+            print(f"✓ 用例执行完成，状态: {case_result['status']}")
+
+            # 更新该用例的执行记录（包含准确的执行时间）
+            self.mark_case_finished(case_execution, case_result['status'], case_result['error'], case_result)
+            self.save_step_timings(case_execution, case_data, case_result)
+
+            print(f"⏱️  执行时长: {case_execution.execution_time:.2f}秒")
+            return case_result
+
+        except Exception as e:
+            print(f"✗ 用例执行出现异常: {str(e)}")
+            # 更新执行记录
+            self.mark_case_finished(case_execution, 'failed', f"用例执行异常: {str(e)}")
+
+            # 记录异常
+            return {
+                'test_case_id': case_data['id'],
+                'test_case_name': case_data['name'],
+                'status': 'failed',
+                'steps': [],
+                'error': f"用例执行异常: {str(e)}",
+                'start_time': datetime.now().isoformat(),
+                'end_time': datetime.now().isoformat(),
+                'screenshots': []
+            }
+
+        finally:
+            # Safari：每个用例执行完都关闭浏览器
+            if not use_browser_reuse and driver:
+                try:
+                    driver.quit()
+                    print(f"✓ Safari 浏览器已关闭\n")
+                except Exception as e:
+                    print(f"✗ 关闭 Safari 浏览器时出错: {str(e)}\n")
+
+    def _clear_selenium_state(self, driver):
+        """清理复用浏览器中上一个用例留下的 Cookie 和存储"""
+        try:
+            print(f"🧹 清理浏览器状态...")
+            # 清除所有 Cookie
+            driver.delete_all_cookies()
+            # 清除 localStorage 和 sessionStorage
+            driver.execute_script("window.localStorage.clear();")
+            driver.execute_script("window.sessionStorage.clear();")
+            print(f"✓ 浏览器状态已清理")
+        except Exception as clean_error:
+            print(f"⚠️  清理浏览器状态失败: {str(clean_error)}，继续执行...")
+            pass  # 如果清理失败，继续执行
+
+    def _open_selenium_page(self, driver, case_data, login_state=None):
+        """打开项目基础URL（有登录状态时先写入 Cookie 和 localStorage），返回 (导航等待记录, 导航错误)"""
+        self.waiter = SeleniumWaiter(case_data.get('wait_strategy'))
+
+        # 导航到项目基础URL
+        base_url = self.test_suite.project.base_url
+        if not base_url:
+            return [], None
+        try:
+            if login_state is not None:
+                # Cookie 只能写入当前域名，先打开站点再写入登录状态
+                driver.get(base_url)
+                self._seed_selenium_state(driver, login_state)
+                print(f"✓ 已写入缓存的登录状态")
 
-        # 所有用例执行完毕后，关闭浏览器（仅对复用浏览器的情况）
-        if use_browser_reuse and driver:
+            print(f"正在导航到: {base_url}")
+
+            # 打开页面并按等待策略等待页面就绪（确保 Vue/React 等 SPA 应用的动态内容加载完成）
+            self.waiter.navigate(driver, base_url)
+            navigation_waits = self.waiter.drain()
+
+            print(f"✓ 成功导航到: {base_url} (等待页面就绪 {navigation_waits[-1]['duration_ms']}ms)")
+            return navigation_waits, None
+        except Exception as e:
+            print(f"✗ 导航失败: {str(e)}")
+            return [], str(e)
+
+    def _selenium_login_state(self, driver, case_data):
+        """用例可以使用登录状态缓存时返回登录状态，缓存不存在时运行一次登录用例"""
+        if not case_data.get('login_steps') or self.login_failed:
+            return None
+        project = self.test_suite.project
+        state = login_cache.get_or_login(project.id, 'selenium', project.login_state_ttl,
+                                         lambda: self._run_selenium_login(driver))
+        # 登录用例失败时本次执行不再重试，用例照常执行自己的登录步骤
+        self.login_failed = state is None
+        return state
+
+    def _run_selenium_login(self, driver):
+        """在当前浏览器中运行登录用例，成功时返回与 Playwright storage_state 格式相同的登录状态"""
+        print(f"🔑 运行登录用例: {self.login_case_data['name']}")
+        _, navigation_error = self._open_selenium_page(driver, self.login_case_data)
+        if navigation_error is not None:
+            return None
+        result = self.execute_test_case_selenium_no_db(driver, self.login_case_data)
+        if result['status'] != 'passed':
+            print(f"✗ 登录用例执行失败: {result['error']}")
+            self._clear_selenium_state(driver)
+            return None
+        local_storage = driver.execute_script(
+            "return Object.keys(localStorage).map(name => ({name: name, value: localStorage.getItem(name)}));"
+        )
+        origin = driver.execute_script("return window.location.origin;")
+        print(f"✓ 登录状态已缓存")
+        return {
+            'cookies': driver.get_cookies(),
+            'origins': [{'origin': origin, 'localStorage': local_storage}],
+        }
+
+    def _seed_selenium_state(self, driver, login_state):
+        """把登录状态写入当前页面所在的站点"""
+        cookie_keys = ('name', 'value', 'path', 'domain', 'secure', 'httpOnly', 'expiry', 'sameSite')
+        for cookie in login_state.get('cookies', []):
             try:
-                print(f"\n{'='*60}")
-                print(f"正在关闭浏览器...")
-                driver.quit()
-                print(f"✓ 浏览器已关闭")
-                print(f"{'='*60}\n")
+                driver.add_cookie({key: cookie[key] for key in cookie_keys if key in cookie})
             except Exception as e:
-                print(f"✗ 关闭浏览器时出错: {str(e)}")
+                print(f"⚠️  写入 Cookie {cookie.get('name')} 失败: {str(e)}")
+        origin = driver.execute_script("return window.location.origin;")
+        for item in login_state.get('origins', []):
+            if item.get('origin') == origin:
+                driver.execute_script(
+                    "arguments[0].forEach(item => localStorage.setItem(item.name, item.value));",
+                    item.get('localStorage', [])
+                )
 
-        # 注意：每个用例的执行记录已在执行过程中实时更新，不需要在这里统一更新
-        
-        duration = time.time() - start_time
-        status = 'SUCCESS' if failed == 0 else 'FAILED'
-        self.update_execution_result(status, passed, failed, skipped, duration)
+    def _selenium_login_state_valid(self, driver):
+        """使用缓存的登录状态打开页面后，检查登录校验元素是否可见"""
+        selector = self.test_suite.project.login_check_selector
+        if not selector:
+            return True
+        try:
+            WebDriverWait(driver, 5).until(EC.visibility_of_element_located((By.CSS_SELECTOR, selector)))
+            return True
+        except Exception:
+            return False
+
+    def acquire_selenium_driver(self):
+        """从会话池取用 Selenium WebDriver，按浏览器、无头模式和项目的请求拦截规则分组复用"""
+        network = NetworkProfile.from_config(self.test_suite.project.network_profile)
+        patterns = tuple(network.selenium_patterns()) if network is not None else ()
+        driver = get_selenium_pool().acquire(
+            ('suite', self.browser, self.headless, patterns), self.create_selenium_driver
+        )
+        # 复用的会话保留创建时通过 CDP 设置的请求拦截
+        self.selenium_network_applied = bool(patterns) and self.browser == 'chrome'
+        return driver
 
     def create_selenium_driver(self):
         """创建 Selenium WebDriver"""
         from selenium.webdriver.chrome.service import Service as ChromeService
         from selenium.webdriver.firefox.service import Service as FirefoxService
         from selenium.webdriver.edge.service import Service as EdgeService
-        from webdriver_manager.chrome import ChromeDriverManager
-        from webdriver_manager.firefox import GeckoDriverManager
-        from webdriver_manager.microsoft import EdgeChromiumDriverManager
         from apps.ui_automation.selenium_engine import SeleniumTestEngine
+        from apps.ui_automation import webdriver_registry
         import os
         
         # 配置webdriver_manager使用本地缓存，避免每次下载
@@ -1466,7 +1716,7 @@ class TestExecutor:
         os.environ['WDM_LOG_LEVEL'] = '0'  # 减少日志输出
         os.environ['WDM_PRINT_FIRST_LINE'] = 'False'  # 不打印首行信息
         
-        # 检查浏览器是否可用
+        # 检查浏览器是否可用（驱动已登记的浏览器直接返回可用）
         is_available, error_msg = SeleniumTestEngine.check_browser_available(self.browser)
         if not is_available:
             # 提供安装建议
@@ -1479,6 +1729,9 @@ class TestExecutor:
             full_error = f"{error_msg}\n\n💡 安装命令（macOS）：{tip}" if tip else error_msg
             raise Exception(full_error)
         
+        # 项目网络配置：Chrome 通过 CDP 按URL拦截请求
+        network = NetworkProfile.from_config(self.test_suite.project.network_profile)
+
         if self.browser == 'chrome':
             options = ChromeOptions()
             if self.headless:
@@ -1538,8 +1791,11 @@ class TestExecutor:
             options.add_argument('--disable-renderer-backgrounding')
             options.add_argument('--disable-device-discovery-notifications')
             
-            # 使用缓存优先策略
-            service = ChromeService(ChromeDriverManager().install())
+            if network is not None and network.selenium_patterns():
+                selenium_logging_prefs(options)
+
+            # 使用驱动注册表中登记的驱动
+            service = ChromeService(webdriver_registry.driver_path('chrome'))
             driver = webdriver.Chrome(service=service, options=options)
         elif self.browser == 'firefox':
             options = FirefoxOptions()
@@ -1563,8 +1819,8 @@ class TestExecutor:
             options.set_preference('extensions.update.enabled', False)
             options.set_preference('extensions.update.autoUpdateDefault', False)
             
-            # 使用缓存优先策略
-            service = FirefoxService(GeckoDriverManager().install())
+            # 使用驱动注册表中登记的驱动
+            service = FirefoxService(webdriver_registry.driver_path('firefox'))
             driver = webdriver.Firefox(service=service, options=options)
         elif self.browser == 'safari':
             # Safari 不支持 headless 模式
@@ -1594,8 +1850,8 @@ class TestExecutor:
             options.add_argument('--disable-dev-shm-usage')
             options.add_argument('--window-size=1920,1080')
             
-            # 使用缓存优先策略
-            service = EdgeService(EdgeChromiumDriverManager().install())
+            # 使用驱动注册表中登记的驱动
+            service = EdgeService(webdriver_registry.driver_path('edge'))
             driver = webdriver.Edge(service=service, options=options)
         else:
             # 默认使用Chrome
@@ -1628,18 +1884,28 @@ class TestExecutor:
             options.add_argument('--disable-features=TranslateUI')  # 禁用翻译提示
             options.add_argument('--disable-infobars')  # 禁用信息栏
             
-            # 使用缓存优先策略
-            service = ChromeService(ChromeDriverManager().install())
+            if network is not None and network.selenium_patterns():
+                selenium_logging_prefs(options)
+
+            # 使用驱动注册表中登记的驱动
+            service = ChromeService(webdriver_registry.driver_path('chrome'))
             driver = webdriver.Chrome(service=service, options=options)
 
+        self.selenium_network_applied = False
+        if network is not None and self.browser not in ('firefox', 'safari', 'edge'):
+            try:
+                self.selenium_network_applied = network.apply_selenium(driver)
+            except Exception as e:
+                print(f"⚠️  设置请求拦截失败: {str(e)}，继续执行...")
         return driver
 
-    def execute_test_case_selenium_no_db(self, driver, case_data):
+    def execute_test_case_selenium_no_db(self, driver, case_data, skip_steps=0):
         """使用 Selenium 执行单个测试用例（不访问数据库）
 
         Args:
             driver: Selenium WebDriver对象
             case_data: 预先准备的用例数据字典，包含id, name, project_id, steps等
+            skip_steps: 跳过开头的步骤数（已使用缓存的登录状态时跳过登录步骤）
         """
         result = {
             'test_case_id': case_data['id'],
@@ -1650,21 +1916,27 @@ class TestExecutor:
             'start_time': datetime.now().isoformat(),
             'screenshots': []
         }
+        if self.waiter is None:
+            self.waiter = SeleniumWaiter(case_data.get('wait_strategy'))
+        result['steps'] = [self.skipped_login_step(step_data) for step_data in case_data['steps'][:skip_steps]]
 
         try:
             # 遍历预先准备好的步骤数据
-            for step_data in case_data['steps']:
+            for step_data in case_data['steps'][skip_steps:]:
+                self.step_span = StepSpan(step_data['action_type'])
                 step_result = self.execute_step_selenium(driver, step_data)
                 result['steps'].append(step_result)
                 
-                # 步骤执行完后添加短暂延迟，确保页面状态稳定
+                # 步骤执行完后等待页面状态稳定
                 # 特别是点击操作后，可能触发动画、下拉框展开等
                 if step_result['success'] and step_data['action_type'] in ['click', 'fill', 'hover']:
-                    # 点击操作后等待更长时间（下拉框展开动画）
-                    if step_data['action_type'] == 'click':
-                        time.sleep(0.8)  # 等待800ms，确保下拉框完全展开
-                    else:
-                        time.sleep(0.3)  # 其他操作等待300ms
+                    self.waiter.after_action(driver, step_data['action_type'], step_data.get('wait_strategy'))
+                # 记录本步骤中各次等待的实际耗时
+                waits = self.waiter.drain()
+                if waits:
+                    step_result['waits'] = waits
+                self.step_span.add('wait', sum(wait['duration_ms'] for wait in waits))
+                step_result['timing'] = self.step_span.finish()
 
                 # 如果步骤失败,捕获失败截图
                 if not step_result['success']:
@@ -1674,11 +1946,9 @@ class TestExecutor:
 
                     # 捕获失败截图
                     try:
-                        import base64
                         screenshot_bytes = driver.get_screenshot_as_png()
-                        screenshot_base64 = base64.b64encode(screenshot_bytes).decode()
                         result['screenshots'].append({
-                            'url': f'data:image/png;base64,{screenshot_base64}',
+                            **save_screenshot(screenshot_bytes),
                             'description': f'步骤 {step_data["step_number"]} 失败截图: {step_data.get("description", "")}',
                             'step_number': step_data['step_number'],
                             'timestamp': datetime.now().isoformat()
@@ -1694,11 +1964,9 @@ class TestExecutor:
 
             # 捕获异常截图
             try:
-                import base64
                 screenshot_bytes = driver.get_screenshot_as_png()
-                screenshot_base64 = base64.b64encode(screenshot_bytes).decode()
                 result['screenshots'].append({
-                    'url': f'data:image/png;base64,{screenshot_base64}',
+                    **save_screenshot(screenshot_bytes),
                     'description': f'异常截图: {str(e)}',
                     'step_number': None,
                     'timestamp': datetime.now().isoformat()
@@ -1724,6 +1992,7 @@ class TestExecutor:
             'error': None,
             'start_time': datetime.now().isoformat()
         }
+        self.waiter = SeleniumWaiter(case_data.get('wait_strategy'))
 
         case_execution = TestCaseExecution.objects.create(
             test_case_id=case_data['id'],
@@ -1792,8 +2061,10 @@ class TestExecutor:
                 locator_strategy = element['locator_strategy'].lower()
                 element_name = element.get('name', '未知元素')
 
-                # 根据定位策略获取元素
+                # 根据定位策略获取元素（等待元素的耗时计入步骤的 locate 阶段）
                 wait = WebDriverWait(driver, step_data['wait_time'] / 1000)
+                if self.step_span is not None:
+                    wait = self.step_span.timed_wait(wait)
 
                 # 自动修正定位策略：如果值以 // 开头，强制使用 XPath
                 if locator_value.startswith('//') or locator_value.startswith('xpath='):
@@ -1857,9 +2128,9 @@ class TestExecutor:
                                 if found_visible:
                                     break
                                     
-                                time.sleep(0.5)
+                                time.sleep(0.1)
                             except:
-                                time.sleep(0.5)
+                                time.sleep(0.1)
                         
                         if not found_visible:
                             # 如果没找到可见元素，回退到默认行为（可能会抛出超时）
@@ -1880,24 +2151,23 @@ class TestExecutor:
                             # 每次重试都重新查找元素（解决stale element问题）
                             if attempt > 0:
                                 print(f"⚠️  重新查找元素（Stale Element 重试）... (尝试 {attempt + 1}/{max_retries})")
-                                # 增加等待时间，让页面 DOM 稳定（对于 Vue/React 应用很重要）
-                                wait_time = 1.0 if attempt == 1 else 1.5  # 第一次重试等1秒，第二次重试等1.5秒
-                                print(f"等待 {wait_time}秒 让页面稳定...")
-                                time.sleep(wait_time)
+                                # 等待页面 DOM 稳定（对于 Vue/React 应用很重要），fixed 策略下第一次重试等1秒，第二次重试等1.5秒
+                                print(f"等待页面稳定...")
+                                self.waiter.dom_settled(driver, 1000 if attempt == 1 else 1500, step_data.get('wait_strategy'))
                                 # 重新定位元素
                                 if is_dropdown_option:
                                     element_obj = wait.until(EC.visibility_of_element_located((by, locator_value)))
                                 else:
                                     element_obj = wait.until(EC.element_to_be_clickable((by, locator_value)))
                                 # 等待元素状态稳定
-                                time.sleep(0.3)
+                                self.waiter.element_stable(driver, element_obj, step_data.get('wait_strategy'))
                                 print(f"✓ 元素重新定位成功")
                             
                             # 对于下拉框选项，先滚动到可视区域
                             if 'dropdown' in locator_value.lower() or 'el-select' in locator_value.lower() or '下拉' in element_name or '选项' in element_name:
                                 try:
                                     driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", element_obj)
-                                    time.sleep(0.3)  # 等待滚动完成
+                                    self.waiter.element_stable(driver, element_obj, step_data.get('wait_strategy'))  # 等待滚动完成
                                 except:
                                     pass
                             
@@ -1963,12 +2233,11 @@ class TestExecutor:
                         except StaleElementReferenceException:
                             if attempt < max_retries - 1:
                                 print(f"⚠️  元素过期（Stale Element），正在重试... (尝试 {attempt + 2}/{max_retries})")
-                                # 增加等待时间，让页面 DOM 稳定
-                                wait_time = 1.0 if attempt == 0 else 1.5
-                                print(f"等待 {wait_time}秒 让页面稳定...")
-                                time.sleep(wait_time)
+                                # 等待页面 DOM 稳定，fixed 策略下第一次重试等1秒，第二次重试等1.5秒
+                                print(f"等待页面稳定...")
+                                self.waiter.dom_settled(driver, 1000 if attempt == 0 else 1500, step_data.get('wait_strategy'))
                                 element_obj = wait.until(EC.presence_of_element_located((by, locator_value)))
-                                time.sleep(0.3)  # 确保元素状态稳定
+                                self.waiter.element_stable(driver, element_obj, step_data.get('wait_strategy'))  # 确保元素状态稳定
                                 print(f"✓ 元素重新定位成功")
                             else:
                                 raise
@@ -1983,12 +2252,11 @@ class TestExecutor:
                         except StaleElementReferenceException:
                             if attempt < max_retries - 1:
                                 print(f"⚠️  元素过期（Stale Element），正在重试... (尝试 {attempt + 2}/{max_retries})")
-                                # 增加等待时间，让页面 DOM 稳定
-                                wait_time = 1.0 if attempt == 0 else 1.5
-                                print(f"等待 {wait_time}秒 让页面稳定...")
-                                time.sleep(wait_time)
+                                # 等待页面 DOM 稳定，fixed 策略下第一次重试等1秒，第二次重试等1.5秒
+                                print(f"等待页面稳定...")
+                                self.waiter.dom_settled(driver, 1000 if attempt == 0 else 1500, step_data.get('wait_strategy'))
                                 element_obj = wait.until(EC.presence_of_element_located((by, locator_value)))
-                                time.sleep(0.3)  # 确保元素状态稳定
+                                self.waiter.element_stable(driver, element_obj, step_data.get('wait_strategy'))  # 确保元素状态稳定
                                 print(f"✓ 元素重新定位成功")
                             else:
                                 raise
@@ -2003,12 +2271,11 @@ class TestExecutor:
                         except StaleElementReferenceException:
                             if attempt < max_retries - 1:
                                 print(f"⚠️  元素过期（Stale Element），正在重试... (尝试 {attempt + 2}/{max_retries})")
-                                # 增加等待时间，让页面 DOM 稳定
-                                wait_time = 1.0 if attempt == 0 else 1.5
-                                print(f"等待 {wait_time}秒 让页面稳定...")
-                                time.sleep(wait_time)
+                                # 等待页面 DOM 稳定，fixed 策略下第一次重试等1秒，第二次重试等1.5秒
+                                print(f"等待页面稳定...")
+                                self.waiter.dom_settled(driver, 1000 if attempt == 0 else 1500, step_data.get('wait_strategy'))
                                 element_obj = wait.until(EC.presence_of_element_located((by, locator_value)))
-                                time.sleep(0.3)  # 确保元素状态稳定
+                                self.waiter.element_stable(driver, element_obj, step_data.get('wait_strategy'))  # 确保元素状态稳定
                                 print(f"✓ 元素重新定位成功")
                             else:
                                 raise
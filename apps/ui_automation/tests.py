@@ -0,0 +1,843 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from .ai_log_writer import AIExecutionLogWriter, read_log_lines, read_logs
+from .ai_step_events import build_step_event
+from . import ai_llm, ai_report_cache, ai_sessions, login_cache, network_profiles, screenshot_store, webdriver_registry
+from .execution_recorder import ExecutionRecorder
+from .browser_pool import BrowserPool
+from .selenium_pool import SeleniumSessionPool
+from .models import AICase, AIExecutionRecord, AIStepEvent, TestCase as UiTestCase, TestCaseExecution, UiLoginState, UiProject, UiStepTiming
+from .reports import AIExecutionReportGenerator
+from .test_executor import TestExecutor
+from .tracing import StepSpan, save_step_timings
+from .wait_strategies import AsyncPlaywrightWaiter, PlaywrightWaiter
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.contexts = []
+
+    def is_connected(self):
+        return self.connected
+
+    def new_context(self, **options):
+        context = FakeContext(self)
+        self.contexts.append(context)
+        return context
+
+    def close(self):
+        self.connected = False
+
+
+class FakeBrowserType:
+    def __init__(self):
+        self.launched = []
+
+    def launch(self, **options):
+        browser = FakeBrowser()
+        self.launched.append(browser)
+        return browser
+
+
+class FakePlaywright:
+    def __init__(self):
+        self.chromium = FakeBrowserType()
+        self.firefox = FakeBrowserType()
+        self.webkit = FakeBrowserType()
+
+    def stop(self):
+        pass
+
+
+class BrowserPoolTestCase(SimpleTestCase):
+    def setUp(self):
+        self.pool = BrowserPool()
+        self.pool._playwright = self.playwright = FakePlaywright()
+
+    def _run_case(self, browser_name='chrome'):
+        context = self.pool.new_context(browser_name, True)
+        self.pool.release(context)
+        return context
+
+    def test_browser_reused_with_fresh_context(self):
+        """测试用例之间复用浏览器，每个用例使用新的上下文"""
+        first = self._run_case()
+        second = self._run_case()
+
+        self.assertEqual(len(self.playwright.chromium.launched), 1)
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed and second.closed)
+        self._run_case('firefox')
+        self.assertEqual(len(self.playwright.firefox.launched), 1)
+
+    def test_recycle_and_replace_crashed_browser(self):
+        """测试达到上下文数上限后重启浏览器，崩溃的浏览器被替换"""
+        with self.settings(BROWSER_POOL_MAX_CONTEXTS=2):
+            self._run_case()
+            self._run_case()
+            third = self._run_case()
+            self.assertEqual(len(self.playwright.chromium.launched), 2)
+            self.assertFalse(self.playwright.chromium.launched[0].connected)
+
+            third.browser.connected = False
+            fourth = self._run_case()
+
+        self.assertEqual(len(self.playwright.chromium.launched), 3)
+        self.assertIs(fourth.browser, self.playwright.chromium.launched[2])
+
+
+class FakeSuiteExecutor(TestExecutor):
+    def _run_fake_cases(self, entries):
+        results = {}
+        for i, case_data, case_execution in entries:
+            time.sleep(0.01)
+            case_execution.thread = threading.current_thread().name
+            results[i] = {'test_case_id': case_data['id'], 'status': case_data['status']}
+        return results
+
+
+class RunCasesTestCase(SimpleTestCase):
+    def _run(self, workers):
+        suite = SimpleNamespace(workers=workers, project=None)
+        executor = FakeSuiteExecutor(suite)
+        cases = [
+            {'id': n, 'status': 'failed' if n == 2 else 'passed', 'parallel_safe': n != 4}
+            for n in range(1, 7)
+        ]
+        executions = {n: SimpleNamespace() for n in range(1, 7)}
+        results = executor.run_cases(cases, executions, '_run_fake_cases')
+        return executor, results, executions
+
+    def test_parallel_results_match_sequential(self):
+        """测试并行执行的结果顺序与串行一致，不可并行的用例在当前线程串行执行"""
+        _, sequential, _ = self._run(1)
+        executor, parallel, executions = self._run(3)
+
+        self.assertEqual(executor.workers, 3)
+        self.assertEqual(parallel, sequential)
+        self.assertEqual(executor.count_results(parallel), (5, 1, 0))
+        self.assertEqual(executions[4].thread, threading.current_thread().name)
+        worker_threads = {executions[n].thread for n in (1, 2, 3, 5, 6)}
+        self.assertTrue(all(name.startswith('ui-suite') for name in worker_threads))
+        self.assertGreater(len(worker_threads), 1)
+
+    def test_cancelled_job_skips_remaining_cases(self):
+        """测试作业被取消后剩余用例不再执行，记为跳过"""
+        executor = FakeSuiteExecutor(SimpleNamespace(workers=1, project=None))
+        executor.job_id = 1
+        executor.recorder = mock.Mock()
+        cases = [{'id': n, 'name': f'case-{n}', 'status': 'passed', 'parallel_safe': True} for n in range(1, 4)]
+        executions = {n: SimpleNamespace(started_at=None) for n in range(1, 4)}
+        checks = iter([False, True])
+        with mock.patch('apps.ui_automation.test_executor.is_cancel_requested',
+                        side_effect=lambda job_id: next(checks)):
+            results = executor.run_cases(cases, executions, '_run_fake_cases')
+
+        self.assertEqual([r['status'] for r in results], ['passed', 'skipped', 'skipped'])
+        self.assertTrue(executor.cancelled.is_set())
+        self.assertFalse(hasattr(executions[2], 'thread'))
+        self.assertEqual(executor.recorder.update.call_count, 2)
+
+
+class FakePage:
+    def __init__(self, result=True):
+        self.result = result
+        self.sleeps = []
+        self.scripts = []
+
+    def wait_for_timeout(self, ms):
+        self.sleeps.append(ms)
+
+    def evaluate(self, js, arg):
+        self.scripts.append(arg)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class WaiterTestCase(SimpleTestCase):
+    def test_fixed_and_smart_strategies(self):
+        """测试 fixed 策略保持原固定等待，smart 策略按条件等待，步骤配置优先于项目配置"""
+        page = FakePage()
+        waiter = PlaywrightWaiter('fixed')
+        waiter.after_action(page, 'click')
+        waiter.after_action(page, 'fill', strategy='smart')
+        self.assertEqual(page.sleeps, [800])
+        self.assertEqual(len(page.scripts), 1)
+
+        records = waiter.drain()
+        self.assertEqual([(r['wait'], r['strategy'], r['satisfied']) for r in records],
+                         [('after_click', 'fixed', True), ('after_fill', 'smart', True)])
+        self.assertTrue(all(r['duration_ms'] >= 0 for r in records))
+        self.assertEqual(waiter.drain(), [])
+
+    def test_smart_falls_back_to_fixed_wait_on_error(self):
+        """测试条件检查出错（如页面跳转中）时退回固定等待"""
+        page = FakePage(result=RuntimeError('Execution context was destroyed'))
+        waiter = PlaywrightWaiter()
+        self.assertFalse(waiter.dropdown_open(page))
+        self.assertEqual(page.sleeps, [800])
+        self.assertEqual(waiter.drain()[0]['satisfied'], False)
+
+    def test_async_waiter_for_engines(self):
+        """测试执行引擎使用的异步等待策略与同步版本行为一致"""
+        class AsyncFakePage(FakePage):
+            async def wait_for_timeout(self, ms):
+                FakePage.wait_for_timeout(self, ms)
+
+            async def evaluate(self, js, arg):
+                return FakePage.evaluate(self, js, arg)
+
+        page = AsyncFakePage()
+        waiter = AsyncPlaywrightWaiter('fixed')
+        asyncio.run(waiter.after_action(page, 'fill'))
+        self.assertTrue(asyncio.run(waiter.page_settled(page, strategy='smart')))
+        self.assertEqual(page.sleeps, [300])
+        self.assertEqual(len(page.scripts), 2)
+        self.assertEqual([(r['wait'], r['strategy']) for r in waiter.drain()],
+                         [('after_fill', 'fixed'), ('page_settled', 'smart')])
+
+
+class ScreenshotStoreTestCase(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        override = self.settings(UI_SCREENSHOT_ROOT=tempdir.name, UI_SCREENSHOT_STORAGE='', UI_SCREENSHOT_FORMAT='webp')
+        override.enable()
+        self.addCleanup(override.disable)
+        screenshot_store._storage = None
+        self.addCleanup(setattr, screenshot_store, '_storage', None)
+
+    def _png(self):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', (1280, 720), (200, 30, 30)).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def test_dedup_compress_and_serve(self):
+        """测试截图按内容去重、压缩并生成缩略图，执行记录只保存引用，接口按需返回图片"""
+        data = self._png()
+        ref = screenshot_store.save_screenshot(data)
+        self.assertEqual(screenshot_store.save_screenshot(data), ref)
+        self.assertEqual(ref['content_type'], 'image/webp')
+
+        screenshots = screenshot_store.externalize_screenshots([
+            {'url': 'data:image/png;base64,' + base64.b64encode(data).decode(), 'step_number': 2},
+            {'url': None, 'error': '截图失败'},
+        ])
+        self.assertEqual(screenshots[0], {**ref, 'step_number': 2})
+        self.assertEqual(screenshots[1], {'url': None, 'error': '截图失败'})
+
+        # 未签名的地址需要登录
+        self.assertIn(self.client.get(ref['url']).status_code, (401, 403))
+        ref = screenshot_store.sign_screenshot_urls([ref])[0]
+        response = self.client.get(ref['url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertTrue(response['Cache-Control'].startswith('private'))
+        self.assertLess(len(b''.join(response.streaming_content)), len(data) + 1)
+
+        from PIL import Image
+        response = self.client.get(ref['thumbnail_url'])
+        thumbnail = Image.open(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(thumbnail.size, (320, 180))
+
+        response = self.client.get(ref['url'], HTTP_IF_NONE_MATCH=response['ETag'].replace('-thumb', ''))
+        self.assertEqual(response.status_code, 304)
+        missing = screenshot_store.sign_screenshot_urls([{**ref, 'sha256': '0' * 64}])[0]
+        self.assertEqual(self.client.get(missing['url']).status_code, 404)
+        # 签名不能用于其他截图
+        self.assertIn(self.client.get(ref['url'].replace(ref['sha256'], '0' * 64)).status_code, (401, 403))
+
+    def test_project_member_access(self):
+        """测试没有签名时只有能访问截图所属项目的用户可以下载"""
+        ref = screenshot_store.save_screenshot(self._png())
+        owner = get_user_model().objects.create_user(username='owner', password='x')
+        other = get_user_model().objects.create_user(username='other', password='x')
+        project = UiProject.objects.create(name='项目', base_url='http://example.com', owner=owner)
+        test_case = UiTestCase.objects.create(project=project, name='用例', created_by=owner)
+        TestCaseExecution.objects.create(test_case=test_case, project=project, screenshots=[ref], created_by=owner)
+
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(ref['url']).status_code, 403)
+        self.client.force_login(owner)
+        self.assertEqual(self.client.get(ref['url']).status_code, 200)
+
+
+class LoginCacheTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user(username='owner', password='x')
+        self.project = UiProject.objects.create(name='项目', base_url='http://example.com', owner=owner)
+        self.logins = 0
+
+    def _login(self):
+        self.logins += 1
+        return {'cookies': [{'name': 'token', 'value': str(self.logins)}], 'origins': []}
+
+    def _get(self, ttl=3600):
+        return login_cache.get_or_login(self.project.id, 'playwright', ttl, self._login)
+
+    def test_login_once_then_reuse_until_invalidated(self):
+        """测试登录状态只在缓存缺失、过期或失效时重新登录"""
+        state = self._get()
+        self.assertEqual(self._get(), state)
+        self.assertEqual(self.logins, 1)
+
+        # 其他线程已刷新的状态不会被旧状态的失效清除
+        login_cache.invalidate(self.project.id, 'playwright', {'cookies': [], 'origins': []})
+        self.assertEqual(self._get(), state)
+        login_cache.invalidate(self.project.id, 'playwright', state)
+        self.assertNotEqual(self._get(ttl=0), state)
+        self.assertEqual(self.logins, 2)
+
+        # 已过期
+        self._get()
+        self.assertEqual(self.logins, 3)
+        self.assertEqual(UiLoginState.objects.count(), 1)
+
+    def test_login_prefix_length(self):
+        """测试只有以登录用例的全部步骤开头的用例才跳过登录步骤"""
+        def step(action, element_id=None, value=''):
+            return {'action_type': action, 'element': {'id': element_id} if element_id else None, 'input_value': value}
+
+        login_steps = [step('fill', 1, 'admin'), step('click', 2)]
+        self.assertEqual(login_cache.login_prefix_length(login_steps, login_steps + [step('click', 3)]), 2)
+        self.assertEqual(login_cache.login_prefix_length(login_steps, [step('fill', 1, 'guest'), step('click', 2)]), 0)
+        self.assertEqual(login_cache.login_prefix_length(login_steps, login_steps[:1]), 0)
+
+
+class FakeRoute:
+    def __init__(self, url, resource_type='document', method='GET'):
+        self.request = SimpleNamespace(url=url, resource_type=resource_type, method=method)
+        self.handled = None
+
+    def abort(self, error_code):
+        self.handled = ('abort', error_code)
+
+    def fulfill(self, status=200, headers=None, body=None, response=None):
+        self.handled = ('fulfill', body)
+
+    def continue_(self):
+        self.handled = ('continue', None)
+
+    def fetch(self):
+        return SimpleNamespace(status=200, headers={'content-type': 'text/css'}, body=lambda: b'body{}')
+
+
+class FakeRoutedContext:
+    def route(self, pattern, handler):
+        self.handler = handler
+
+    def request(self, *args):
+        route = FakeRoute(*args)
+        self.handler(route)
+        return route.handled
+
+
+class NetworkProfileTestCase(SimpleTestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        override = self.settings(UI_NETWORK_HAR_ROOT=tempdir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        network_profiles.clear_static_cache()
+        self.addCleanup(network_profiles.clear_static_cache)
+
+        har = {'log': {'entries': [{
+            'request': {'method': 'GET', 'url': 'http://example.com/api/config'},
+            'response': {'status': 200, 'headers': [{'name': 'Content-Encoding', 'value': 'gzip'}],
+                         'content': {'text': '{"debug": false}'}},
+        }]}}
+        with open(os.path.join(tempdir.name, 'static.har'), 'w', encoding='utf-8') as f:
+            json.dump(har, f)
+        self.config = {
+            'block_resource_types': ['image'],
+            'block_url_patterns': ['*analytics*'],
+            'har_path': 'static.har',
+            'cache_static': True,
+        }
+
+    def _context(self):
+        profile = network_profiles.NetworkProfile.from_config(self.config)
+        context = FakeRoutedContext()
+        profile.apply_playwright(context)
+        return profile, context
+
+    def test_block_serve_har_and_cache_static(self):
+        """测试按类型/URL拦截请求，从 HAR 返回响应，静态资源跨用例缓存，并统计节省的请求和字节"""
+        first, context = self._context()
+        self.assertEqual(context.request('http://example.com/logo.png', 'image')[0], 'abort')
+        self.assertEqual(context.request('http://cdn.analytics.com/a.js', 'script')[0], 'abort')
+        self.assertEqual(context.request('http://example.com/api/config', 'fetch'), ('fulfill', b'{"debug": false}'))
+        self.assertEqual(context.request('http://example.com/app.css', 'stylesheet'), ('fulfill', b'body{}'))
+        self.assertEqual(context.request('http://example.com/', 'document')[0], 'continue')
+
+        second, context = self._context()
+        self.assertEqual(context.request('http://example.com/app.css', 'stylesheet'), ('fulfill', b'body{}'))
+
+        self.assertEqual(first.report(), {'requests': 5, 'blocked': 2, 'from_har': 1, 'from_cache': 0, 'bytes_saved': 16})
+        self.assertEqual(second.report()['from_cache'], 1)
+        summary = network_profiles.summarize([{'network': first.report()}, {'network': second.report()}, {}])
+        self.assertEqual(summary['requests'], 6)
+        self.assertEqual(summary['bytes_saved'], 22)
+
+    def test_validate_config(self):
+        """测试网络配置校验：资源类型必须有效，HAR 文件必须在 UI_NETWORK_HAR_ROOT 下"""
+        self.assertEqual(network_profiles.validate_config(self.config), [])
+        errors = network_profiles.validate_config({'block_resource_types': ['video'], 'har_path': '../../etc/passwd'})
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(network_profiles.NetworkProfile(self.config).selenium_patterns()[:3],
+                         ['*analytics*', '*.png', '*.png?*'])
+
+    def test_selenium_type_patterns_match_extension_only(self):
+        """测试 Selenium 资源类型通配符只匹配扩展名结尾的URL"""
+        # CDP Network.setBlockedURLs 只支持 * 通配符，? 按普通字符匹配
+        patterns = [re.compile('.*'.join(map(re.escape, pattern.split('*'))))
+                    for pattern in network_profiles.RESOURCE_TYPE_PATTERNS['script']]
+        matches = lambda url: any(pattern.fullmatch(url) for pattern in patterns)
+        self.assertTrue(matches('http://example.com/app.js'))
+        self.assertTrue(matches('http://example.com/app.mjs?v=2'))
+        self.assertFalse(matches('http://example.com/data.json'))
+        self.assertFalse(matches('http://example.com/index.jsp?page=1'))
+
+
+class FakeWebDriverWait:
+    def until(self, method):
+        time.sleep(0.02)
+        return method()
+
+
+class StepTimingTestCase(TestCase):
+    def test_step_phases(self):
+        """测试步骤耗时按定位、等待和操作/断言阶段拆分"""
+        span = StepSpan('click')
+        self.assertEqual(span.timed_wait(FakeWebDriverWait()).until(lambda: 'element'), 'element')
+        span.add('wait', 30)
+        timing = span.finish()
+        self.assertGreaterEqual(timing['locate'], 20)
+        self.assertEqual(timing['wait'], 30)
+        self.assertEqual(set(timing), {'total', 'locate', 'wait', 'action'})
+        self.assertEqual(StepSpan('assert').finish().keys(), {'total', 'assert'})
+
+    def test_slowest_steps_api(self):
+        """测试按步骤和元素统计最近执行中最慢的步骤"""
+        from rest_framework.test import APIClient
+
+        owner = get_user_model().objects.create_user(username='owner', password='x')
+        project = UiProject.objects.create(name='项目', base_url='http://example.com', owner=owner)
+        case = UiTestCase.objects.create(name='用例', project=project, created_by=owner)
+        for total in (100, 300):
+            execution = TestCaseExecution.objects.create(test_case=case, project=project, created_by=owner)
+            save_step_timings(execution, [
+                {'step_number': 1, 'action_type': 'click', 'success': True, 'timing': {'total': total, 'action': total}},
+                {'step_number': 2, 'action_type': 'fill', 'success': True, 'timing': {'total': 50, 'locate': 40, 'action': 10}},
+                {'step_number': 3, 'action_type': 'click', 'success': True, 'skipped': True},
+            ], {})
+        self.assertEqual(UiStepTiming.objects.count(), 4)
+
+        client = APIClient()
+        client.force_authenticate(owner)
+        response = client.get(f'/api/ui-automation/projects/{project.id}/slowest-steps/')
+        results = response.json()['results']
+        self.assertEqual([(r['step_number'], r['runs'], r['avg_ms'], r['max_ms']) for r in results],
+                         [(1, 2, 200, 300), (2, 2, 50, 50)])
+        self.assertEqual(results[1]['avg_locate_ms'], 40)
+        for query in ('days=abc', 'days=-1', 'limit=0'):
+            self.assertEqual(client.get(f'/api/ui-automation/projects/{project.id}/slowest-steps/?{query}').status_code, 400)
+
+
+class ExecutionRecorderTestCase(TestCase):
+    def test_batched_writes(self):
+        """测试执行记录批量创建，状态变更在 flush 时按字段分组批量写入"""
+        from django.utils import timezone
+
+        owner = get_user_model().objects.create_user(username='owner', password='x')
+        project = UiProject.objects.create(name='项目', base_url='http://example.com', owner=owner)
+        cases = [UiTestCase.objects.create(name=f'用例{n}', project=project, created_by=owner) for n in range(3)]
+        cases_data = [{'id': case.id, 'project_id': project.id} for case in cases]
+
+        recorder = ExecutionRecorder(flush_interval=3600)
+        with self.assertNumQueries(1):
+            executions = recorder.create_pending(None, cases_data, created_by=owner, execution_source='suite')
+        self.assertEqual(set(executions), {case.id for case in cases})
+
+        with self.assertNumQueries(0):
+            for execution in executions.values():
+                recorder.update(execution, status='running', started_at=timezone.now())
+                recorder.update(execution, status='passed', execution_logs='[]')
+        recorder.update(executions[cases[0].id], error_message='失败', status='failed')
+        self.assertEqual(TestCaseExecution.objects.filter(status='pending').count(), 3)
+
+        recorder.flush()
+        self.assertEqual(sorted(TestCaseExecution.objects.values_list('status', flat=True)), ['failed', 'passed', 'passed'])
+        self.assertEqual(TestCaseExecution.objects.get(status='failed').error_message, '失败')
+
+    @mock.patch('apps.ui_automation.execution_recorder.time.sleep')
+    def test_failed_flush_is_retried(self, sleep):
+        """测试写入失败（如死锁）的修改保留到下次写入，执行结束时的写入重试"""
+        from django.db import OperationalError
+
+        owner = get_user_model().objects.create_user(username='owner', password='x')
+        project = UiProject.objects.create(name='项目', base_url='http://example.com', owner=owner)
+        case = UiTestCase.objects.create(name='用例', project=project, created_by=owner)
+        recorder = ExecutionRecorder(flush_interval=3600)
+        execution = recorder.create_pending(None, [{'id': case.id, 'project_id': project.id}], created_by=owner)[case.id]
+        self.assertTrue(TestCaseExecution.objects.get(id=execution.id).batch_id)
+
+        recorder.update(execution, status='passed')
+        bulk_update = TestCaseExecution.objects.bulk_update
+        with mock.patch.object(TestCaseExecution.objects, 'bulk_update', side_effect=OperationalError('Deadlock')):
+            recorder.flush()
+            with self.assertRaises(OperationalError):
+                recorder.flush(final=True)
+        self.assertEqual(TestCaseExecution.objects.get(id=execution.id).status, 'pending')
+
+        calls = []
+
+        def deadlock_once(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise OperationalError('Deadlock')
+            return bulk_update(*args)
+
+        with mock.patch.object(TestCaseExecution.objects, 'bulk_update', side_effect=deadlock_once):
+            recorder.flush(final=True)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(TestCaseExecution.objects.get(id=execution.id).status, 'passed')
+
+
+class FakeDriverManager:
+    installs = []
+
+    def __init__(self, driver_version=None):
+        self.driver_version = driver_version
+
+    def install(self):
+        self.installs.append(self.driver_version)
+        return FakeDriverManager.path
+
+
+class WebDriverRegistryTestCase(SimpleTestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        FakeDriverManager.path = os.path.join(tempdir.name, 'chromedriver')
+        open(FakeDriverManager.path, 'w').close()
+        FakeDriverManager.installs = []
+        override = self.settings(UI_WEBDRIVER_REGISTRY=os.path.join(tempdir.name, 'webdrivers.json'),
+                                 UI_WEBDRIVER_VERSIONS={'chrome': ''})
+        override.enable()
+        self.addCleanup(override.disable)
+        patcher = mock.patch.dict(webdriver_registry.DRIVER_MANAGERS, {
+            'chrome': (f'{__name__}.FakeDriverManager', 'driver_version', 'google-chrome')
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        version_patcher = mock.patch.object(webdriver_registry, '_version_of', return_value='119.0.1')
+        version_patcher.start()
+        self.addCleanup(version_patcher.stop)
+        webdriver_registry.reset()
+        self.addCleanup(webdriver_registry.reset)
+
+    def test_resolve_once_and_pin_version(self):
+        """测试驱动只解析一次并持久化，固定的版本变化时重新解析"""
+        self.assertFalse(webdriver_registry.is_registered('chrome'))
+        with mock.patch('webdriver_manager.core.os_manager.OperationSystemManager.get_browser_version_from_os',
+                        return_value='119.0'):
+            self.assertEqual(webdriver_registry.driver_path('chrome'), FakeDriverManager.path)
+            self.assertEqual(webdriver_registry.driver_path('chrome'), FakeDriverManager.path)
+            self.assertEqual(FakeDriverManager.installs, [None])
+
+            # 其他进程直接读取注册表文件
+            webdriver_registry.reset()
+            self.assertTrue(webdriver_registry.is_registered('chrome'))
+            self.assertEqual(webdriver_registry.entries()['chrome']['browser_version'], '119.0')
+
+            with self.settings(UI_WEBDRIVER_VERSIONS={'chrome': '120.0.2'}):
+                self.assertFalse(webdriver_registry.is_registered('chrome'))
+                webdriver_registry.driver_path('chrome')
+                self.assertEqual(FakeDriverManager.installs, [None, '120.0.2'])
+                self.assertEqual(webdriver_registry.entries()['chrome']['driver_version'], '120.0.2')
+
+
+class FakeWebDriver:
+    def __init__(self):
+        self.window_handles = ['main', 'popup']
+        self.cookies = ['session']
+        self.url = 'https://example.com/'
+        self.quit_called = False
+        self.switch_to = SimpleNamespace(window=lambda handle: setattr(self, 'current', handle))
+
+    def close(self):
+        self.window_handles.remove(self.current)
+
+    def execute_script(self, script):
+        pass
+
+    def delete_all_cookies(self):
+        self.cookies = []
+
+    def get(self, url):
+        self.url = url
+
+    def quit(self):
+        self.quit_called = True
+
+
+class SeleniumSessionPoolTestCase(SimpleTestCase):
+    def test_reuse_reset_and_recycle(self):
+        """测试会话归还时重置并复用，达到使用次数上限后关闭，会话数达到上限时关闭其他分组的空闲会话"""
+        pool = SeleniumSessionPool()
+        key = ('suite', 'chrome', True, ())
+        with self.settings(SELENIUM_POOL_MAX_SESSIONS=1, SELENIUM_POOL_MAX_USES=2):
+            driver = pool.acquire(key, FakeWebDriver)
+            pool.release(driver)
+            self.assertEqual(driver.window_handles, ['main'])
+            self.assertEqual(driver.cookies, [])
+            self.assertEqual(driver.url, 'about:blank')
+
+            self.assertIs(pool.acquire(key, FakeWebDriver), driver)
+            pool.release(driver)
+            self.assertTrue(driver.quit_called)
+
+            chrome = pool.acquire(key, FakeWebDriver)
+            self.assertIsNot(chrome, driver)
+            pool.release(chrome)
+            firefox = pool.acquire(('suite', 'firefox', True, ()), FakeWebDriver)
+            self.assertTrue(chrome.quit_called)
+
+            # 会话数达到上限且没有空闲会话时等待归还
+            with self.settings(SELENIUM_POOL_ACQUIRE_TIMEOUT=0.1):
+                with self.assertRaises(TimeoutError):
+                    pool.acquire(key, FakeWebDriver)
+            pool.release(firefox)
+            pool.close()
+            self.assertTrue(firefox.quit_called)
+
+
+class AIExecutionLogWriterTestCase(TestCase):
+    def test_buffer_append_and_finish(self):
+        """测试日志缓存后按序号追加写入，状态变更只保存改动的字段，结束时合并到 logs 字段"""
+        record = AIExecutionRecord.objects.create(case_name='adhoc', status='running', logs='正在分析任务...\n')
+        writer = AIExecutionLogWriter(record, flush_interval=60, flush_bytes=10)
+        writer.append('step 1\n')
+        self.assertFalse(writer.due())
+        self.assertEqual(read_logs(record), '正在分析任务...\n')
+
+        writer.append('step 2\n')
+        writer.update(planned_tasks=[{'id': 1, 'status': 'completed'}])
+        self.assertTrue(writer.due())
+        with self.assertNumQueries(2):
+            writer.flush()
+        self.assertEqual(read_logs(record), '正在分析任务...\nstep 1\nstep 2\n')
+        self.assertEqual(read_log_lines(record, after=1), [{'seq': 2, 'content': 'step 2\n'}])
+
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username='viewer', password='x'))
+        url = f'/api/ui-automation/ai-execution-records/{record.id}/log-lines/'
+        self.assertEqual(client.get(url, {'after': 1}).json()['last_seq'], 2)
+        self.assertEqual(client.get(url, {'after': 'abc'}).status_code, 400)
+        record.refresh_from_db()
+        self.assertEqual(record.planned_tasks[0]['status'], 'completed')
+
+        writer.append('\n执行完成。')
+        record.status = 'passed'
+        writer.finish()
+        record.refresh_from_db()
+        self.assertEqual(record.logs, '正在分析任务...\nstep 1\nstep 2\n\n执行完成。')
+        self.assertFalse(record.log_lines.exists())
+
+    def test_finish_keeps_forced_stop(self):
+        """测试执行期间被强制标记为停止的记录，执行结束时不会被覆盖为其他状态"""
+        record = AIExecutionRecord.objects.create(case_name='adhoc', status='running')
+        writer = AIExecutionLogWriter(record)
+        writer.append('step 1\n')
+        AIExecutionRecord.objects.filter(id=record.id).update(status='stopped')
+
+        record.status = 'passed'
+        writer.finish()
+        record.refresh_from_db()
+        self.assertEqual(record.status, 'stopped')
+        self.assertTrue(record.logs.startswith('step 1\n'))
+
+
+class AIStepEventTestCase(TestCase):
+    def test_reports_from_step_events(self):
+        """测试步骤事件的构建和写入，报告从步骤事件生成"""
+        record = AIExecutionRecord.objects.create(case_name='adhoc', status='running', duration=3)
+        writer = AIExecutionLogWriter(record)
+        steps = [
+            SimpleNamespace(
+                model_output=SimpleNamespace(action=[{'go_to_url': {'url': 'https://example.com'}, 'click_element': None}]),
+                result=[SimpleNamespace(error=None)],
+                state=SimpleNamespace(url='https://example.com/'),
+                metadata=SimpleNamespace(step_start_time=10.0, step_end_time=11.5),
+            ),
+            SimpleNamespace(
+                model_output=SimpleNamespace(action=[{'click_element': {'index': 3}}, {'mark_task_complete': {'task_id': 1}}]),
+                result=[SimpleNamespace(error='Element 3 not found')],
+                state=SimpleNamespace(url='https://example.com/'),
+                metadata=SimpleNamespace(step_start_time=11.5, step_end_time=12.0),
+            ),
+        ]
+        for i, step in enumerate(steps):
+            writer.add_event(build_step_event(step, i + 1, f'action {i + 1}'))
+        writer.flush()
+        self.assertEqual(AIStepEvent.objects.filter(record=record).count(), 2)
+
+        generator = AIExecutionReportGenerator(record)
+        performance = generator.generate_performance_report()
+        self.assertEqual([s['estimated_duration'] for s in performance['step_performance']], [1.5, 0.5])
+        self.assertEqual(performance['action_distribution']['navigate'], 1)
+        self.assertEqual(performance['action_distribution']['click'], 1)
+        self.assertEqual(performance['action_distribution']['other'], 0)
+
+        detailed = generator.generate_detailed_report()
+        self.assertEqual(detailed['detailed_steps'][1]['status'], 'failed')
+        self.assertEqual(detailed['errors'], [{'message': 'Element 3 not found', 'type': 'error', 'step_number': 2}])
+        self.assertEqual(generator.generate_summary_report()['steps']['total_steps'], 2)
+
+
+class AIReportCacheTestCase(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        override = self.settings(AI_REPORT_ROOT=tempdir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_report_materialized_and_served_with_etag(self):
+        """测试已结束的记录的报告只生成一次，带 ETag 返回，记录变化后重新生成"""
+        from django.utils import timezone
+        from rest_framework.test import APIClient
+
+        user = get_user_model().objects.create_user(username='reporter', password='x')
+        record = AIExecutionRecord.objects.create(case_name='adhoc', status='passed', duration=2,
+                                                  end_time=timezone.now(), executed_by=user)
+        client = APIClient()
+        client.force_authenticate(user)
+        url = f'/api/ui-automation/ai-execution-records/{record.id}/report/?report_type=detailed'
+
+        with mock.patch.object(ai_report_cache, 'build_report', wraps=ai_report_cache.build_report) as build:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(b''.join(response.streaming_content))['report_type'], 'detailed')
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+            self.assertEqual(client.get(url).status_code, 200)
+            self.assertEqual(build.call_count, 1)
+
+            progress = client.get(f'/api/ui-automation/ai-execution-records/{record.id}/report-status/').data
+            self.assertTrue(progress['artifacts']['detailed']['json'])
+            self.assertFalse(progress['ready'])
+
+            record.status = 'failed'
+            record.save()
+            self.assertNotEqual(client.get(url)['ETag'], response['ETag'])
+            self.assertEqual(build.call_count, 2)
+            self.assertEqual(len(os.listdir(os.path.join(ai_report_cache.settings.AI_REPORT_ROOT, str(record.id)))), 1)
+
+
+class AISessionTestCase(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        override = self.settings(AI_RUN_ROOT=tempdir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_work_dir_and_cross_process_stop(self):
+        """测试每次执行使用独立的工作目录，停止信号通过执行记录和作业传递"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from apps.core.models import Job
+
+        record = AIExecutionRecord.objects.create(case_name='adhoc', status='running')
+        other = AIExecutionRecord.objects.create(case_name='adhoc', status='running')
+        run = ai_sessions.start_session(record.id)
+        other_run = ai_sessions.start_session(other.id)
+        self.assertNotEqual(run.gif_path, other_run.gif_path)
+        self.assertTrue(os.path.isdir(run.work_dir))
+
+        job_record = Job.objects.create(name='ai.run_adhoc_task', queue='ai', args=[record.id, 'text', True],
+                                        status='RUNNING', lease_expires_at=timezone.now() + timedelta(minutes=1))
+        self.assertFalse(run.stop_requested())
+        self.assertEqual(ai_sessions.request_stop(record.id), 'running')
+        self.assertTrue(run.stop_requested())
+        self.assertFalse(other_run.stop_requested())
+
+        # 作业尚未开始时直接取消
+        Job.objects.create(name='ai.run_ai_case', queue='ai', args=[1, other.id])
+        self.assertEqual(ai_sessions.request_stop(other.id), 'pending')
+        self.assertFalse(Job.objects.filter(status='PENDING').exists())
+        self.assertEqual(Job.objects.get(id=job_record.id).status, 'RUNNING')
+
+        run.close()
+        other_run.close()
+        self.assertFalse(os.path.exists(run.work_dir))
+
+
+class AILLMCacheTestCase(TestCase):
+    def setUp(self):
+        ai_llm.invalidate()
+        self.addCleanup(ai_llm.invalidate)
+
+    def test_config_cache_invalidated_on_save(self):
+        """测试模型配置缓存在配置修改后刷新，LLM 客户端按配置复用"""
+        from apps.requirement_analysis.models import AIModelConfig
+
+        user = get_user_model().objects.create_user(username='llm-admin', password='x')
+        config_obj = AIModelConfig.objects.create(name='browser', model_type='openai', role='browser_use_text',
+                                                  api_key='key-1', base_url='http://llm', model_name='m1',
+                                                  created_by=user)
+        self.assertEqual(ai_llm.get_model_config()['model_name'], 'm1')
+        with self.assertNumQueries(0):
+            ai_llm.get_model_config()
+
+        factory = mock.Mock(side_effect=lambda config: SimpleNamespace(model=config['model_name']))
+        first = ai_llm.get_llm(ai_llm.get_model_config(), factory)
+        second = ai_llm.get_llm(ai_llm.get_model_config(), factory)
+        self.assertEqual(factory.call_count, 1)
+        self.assertIsNot(first, second)
+
+        config_obj.model_name = 'm2'
+        config_obj.save()
+        self.assertEqual(ai_llm.get_model_config()['model_name'], 'm2')
+        self.assertEqual(ai_llm.get_llm(ai_llm.get_model_config(), factory).model, 'm2')
+
+    def test_plan_cache_keyed_by_task_description(self):
+        """测试任务规划按任务描述的哈希缓存，描述修改后失效"""
+        ai_case = AICase.objects.create(name='login', task_description='打开首页\n登录')
+        plan_cache = ai_llm.AICasePlanCache(ai_case)
+        self.assertIsNone(plan_cache.get())
+
+        plan_cache.set([{'id': 1, 'description': '打开首页', 'status': 'completed'}])
+        self.assertEqual(plan_cache.get(), [{'id': 1, 'description': '打开首页', 'status': 'pending'}])
+
+        ai_case.task_description = '打开首页\n注册'
+        ai_case.save()
+        self.assertIsNone(ai_llm.AICasePlanCache(ai_case).get())
@@ -0,0 +1,125 @@
+"""
+UI自动化执行耗时记录
+
+记录每个步骤各阶段的耗时，写入步骤结果的 timing 字段，并按步骤保存到 UiStepTiming 用于跨执行统计：
+
+- locate：查找元素（Selenium 中 WebDriverWait 等待元素的时间；Playwright 的定位包含在操作的自动等待中，计入 action）
+- wait：等待策略的等待（操作后等待、下拉框展开、页面就绪等，来自 Waiter 的等待记录）
+- action / assert：步骤本身的操作或断言，为步骤总耗时减去以上阶段
+- total：步骤总耗时
+
+耗时只用本地计时器统计，不会增加浏览器调用。
+"""
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+
+
+def main_phase(action_type):
+    """步骤的主要阶段：断言步骤为 assert，固定等待步骤为 wait，其余为 action"""
+    if action_type == 'assert':
+        return 'assert'
+    if action_type == 'wait':
+        return 'wait'
+    return 'action'
+
+
+class StepSpan:
+    """一个步骤的耗时记录"""
+
+    def __init__(self, action_type):
+        self.action_type = action_type
+        self.phases = {}
+        self.started = time.perf_counter()
+
+    def add(self, phase, duration_ms):
+        self.phases[phase] = self.phases.get(phase, 0) + duration_ms
+
+    @contextmanager
+    def phase(self, phase):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, (time.perf_counter() - started) * 1000)
+
+    def timed_wait(self, wait):
+        """包装 WebDriverWait，until() 的耗时计入 locate 阶段"""
+        return _TimedWait(wait, self)
+
+    def finish(self):
+        """结束计时，返回 {total, locate, wait, action/assert}（毫秒）"""
+        total = (time.perf_counter() - self.started) * 1000
+        phases = dict(self.phases)
+        main = main_phase(self.action_type)
+        phases[main] = phases.get(main, 0) + max(0, total - sum(self.phases.values()))
+        timing = {'total': round(total)}
+        timing.update({phase: round(ms) for phase, ms in phases.items()})
+        return timing
+
+
+class _TimedWait:
+    def __init__(self, wait, span):
+        self._wait = wait
+        self._span = span
+
+    def until(self, *args, **kwargs):
+        with self._span.phase('locate'):
+            return self._wait.until(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._wait, name)
+
+
+def traced_step(func):
+    """执行引擎 execute_step 的装饰器，步骤耗时保存到 engine.last_step_timing（支持同步和异步方法）"""
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(self, step, *args, **kwargs):
+            span = StepSpan(step.action_type)
+            try:
+                return await func(self, step, *args, **kwargs)
+            finally:
+                self.last_step_timing = span.finish()
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, step, *args, **kwargs):
+        span = StepSpan(step.action_type)
+        try:
+            return func(self, step, *args, **kwargs)
+        finally:
+            self.last_step_timing = span.finish()
+    return wrapper
+
+
+def save_step_timings(case_execution, steps, element_ids):
+    """保存一次用例执行中各步骤的耗时
+
+    Args:
+        case_execution: TestCaseExecution
+        steps: 步骤结果列表（带 timing 的步骤才会保存，跳过的登录步骤没有 timing）
+        element_ids: {步骤序号: 元素ID}
+    """
+    from .models import UiStepTiming
+
+    rows = [
+        UiStepTiming(
+            execution=case_execution,
+            project_id=case_execution.project_id,
+            test_case_id=case_execution.test_case_id,
+            step_number=step['step_number'],
+            action_type=step['action_type'],
+            element_id=element_ids.get(step['step_number']),
+            success=bool(step.get('success')),
+            total_ms=step['timing'].get('total', 0),
+            locate_ms=step['timing'].get('locate', 0),
+            action_ms=step['timing'].get('action', 0),
+            wait_ms=step['timing'].get('wait', 0),
+            assert_ms=step['timing'].get('assert', 0),
+        )
+        for step in steps if step.get('timing')
+    ]
+    if rows:
+        UiStepTiming.objects.bulk_create(rows)
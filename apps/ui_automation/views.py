@@ -1,10 +1,10 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import BasePermission, IsAuthenticated
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, FileResponse, Http404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 from django.db import models
@@ -12,6 +12,7 @@ from django.utils import timezone
 import logging
 import json
 import re
+import os
 import random
 import time
 
@@ -22,7 +23,7 @@ from .models import (
     TestCase, TestCaseStep, TestCaseExecution, OperationRecord,
     TestCase, TestCaseStep, TestCaseExecution, OperationRecord,
     UiScheduledTask, UiNotificationLog, UiTaskNotificationSetting,
-    AICase, AIExecutionRecord
+    AICase, AIExecutionRecord, UiStepTiming
 )
 from .serializers import (
     UiProjectSerializer, UiProjectCreateSerializer, UiProjectUpdateSerializer,
@@ -38,11 +39,15 @@ from .serializers import (
     ScriptStepSerializer, ScriptElementUsageSerializer,
     ScriptAnalysisSerializer, ElementValidationSerializer, CodeGenerationSerializer,
     TestCaseSerializer, TestCaseStepSerializer, TestCaseExecutionSerializer, TestCaseRunSerializer,
-    OperationRecordSerializer,
+    SlowestStepsQuerySerializer, AILogLinesQuerySerializer, OperationRecordSerializer,
     UiScheduledTaskSerializer, UiNotificationLogSerializer, UiTaskNotificationSettingSerializer,
     AICaseSerializer, AIExecutionRecordSerializer
 )
 from .operation_logger import log_operation
+from .screenshot_store import externalize_screenshots, sign_screenshot_urls
+from . import login_cache
+from .tracing import save_step_timings
+from apps.core.job_queue import JobCancelled, check_cancelled
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -151,6 +156,9 @@ class UiProjectViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         instance = serializer.save()
+        # 登录用例或站点地址变化后，缓存的登录状态不再可用
+        if {'login_case', 'base_url'} & set(serializer.validated_data):
+            login_cache.invalidate(instance.id)
         # 记录操作
         log_operation('edit', 'project', instance.id, instance.name, self.request.user)
 
@@ -159,6 +167,52 @@ class UiProjectViewSet(viewsets.ModelViewSet):
         log_operation('delete', 'project', instance.id, instance.name, self.request.user)
         instance.delete()
 
+    @action(detail=True, methods=['post'])
+    def clear_login_state(self, request, pk=None):
+        """清除项目缓存的登录状态，下次执行套件时重新运行登录用例"""
+        project = self.get_object()
+        login_cache.invalidate(project.id)
+        return Response({'message': '登录状态缓存已清除'})
+
+    @action(detail=True, methods=['get'], url_path='slowest-steps')
+    def slowest_steps(self, request, pk=None):
+        """最近执行中平均耗时最长的步骤或元素
+
+        参数：days 统计最近几天（默认7），limit 返回条数（默认20），group_by 按 step（默认）或 element 分组
+        """
+        from datetime import timedelta
+        from django.db.models import Avg, Count, Max
+
+        project = self.get_object()
+        params = SlowestStepsQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        days = params.validated_data['days']
+        limit = min(params.validated_data['limit'], 100)
+        group_by = params.validated_data['group_by']
+
+        queryset = UiStepTiming.objects.filter(project=project, created_at__gte=timezone.now() - timedelta(days=days))
+        if group_by == 'element':
+            queryset = queryset.filter(element__isnull=False).values('element_id', 'element__name')
+        else:
+            queryset = queryset.values('test_case_id', 'test_case__name', 'step_number', 'action_type')
+        rows = queryset.annotate(
+            runs=Count('id'),
+            avg_ms=Avg('total_ms'),
+            max_ms=Max('total_ms'),
+            avg_locate_ms=Avg('locate_ms'),
+            avg_action_ms=Avg('action_ms'),
+            avg_wait_ms=Avg('wait_ms'),
+            avg_assert_ms=Avg('assert_ms'),
+        ).order_by('-avg_ms')[:limit]
+
+        results = []
+        for row in rows:
+            for key, value in row.items():
+                if key.startswith('avg_'):
+                    row[key] = round(value or 0)
+            results.append(row)
+        return Response({'group_by': group_by, 'days': days, 'results': results})
+
 
 class LocatorStrategyViewSet(viewsets.ModelViewSet):
     queryset = LocatorStrategy.objects.all()
@@ -781,30 +835,17 @@ class TestSuiteViewSet(viewsets.ModelViewSet):
         test_suite.save()
 
         try:
-            # 在后台线程中执行测试
-            import threading
-            from .test_executor import TestExecutor
-
-            def run_test():
-                executor = TestExecutor(
-                    test_suite=test_suite,
-                    engine=engine,
-                    browser=browser,
-                    headless=headless,
-                    executed_by=request.user
-                )
-                executor.run()
-
-            # 启动后台线程执行测试
-            thread = threading.Thread(target=run_test)
-            thread.daemon = True
-            thread.start()
+            # 提交到作业队列执行测试
+            from apps.core.job_queue import enqueue
+            job = enqueue('ui.run_test_suite', test_suite.id, engine, browser, headless, request.user.id,
+                          created_by=request.user)
 
             # 记录运行操作
             log_operation('run', 'suite', test_suite.id, test_suite.name, request.user)
 
             return Response({
                 'message': '测试套件开始执行',
+                'job_id': job.id,
                 'suite_id': test_suite.id,
                 'test_case_count': test_case_count,
                 'engine': engine,
@@ -896,6 +937,16 @@ class TestExecutionViewSet(viewsets.ModelViewSet):
         instance.delete()
 
 
+class ScreenshotBlobPermission(BasePermission):
+    """截图下载权限：地址签名有效，或登录用户有权限访问截图所属的项目"""
+
+    def has_permission(self, request, view):
+        from .screenshot_store import check_signature, user_can_access
+
+        sha256 = view.kwargs.get('sha256')
+        return check_signature(sha256, request.query_params.get('sig')) or user_can_access(request.user, sha256)
+
+
 class ScreenshotViewSet(viewsets.ModelViewSet):
     queryset = Screenshot.objects.all()
     permission_classes = [IsAuthenticated]
@@ -912,6 +963,29 @@ class ScreenshotViewSet(viewsets.ModelViewSet):
         executions = TestExecution.objects.filter(project__in=accessible_projects)
         return Screenshot.objects.filter(execution__in=executions)
 
+    @action(detail=False, methods=['get'], url_path=r'blob/(?P<sha256>[0-9a-f]{64})',
+            permission_classes=[ScreenshotBlobPermission])
+    def blob(self, request, sha256=None):
+        """获取截图存储中的截图，?thumbnail=1 返回缩略图
+
+        截图通过 <img> 标签按需加载，无法携带认证头，执行记录中的截图地址带有短期有效的签名（?sig=）；
+        没有签名时需要登录，并且截图属于用户有权限的项目。
+        """
+        from .screenshot_store import open_screenshot
+
+        thumbnail = request.query_params.get('thumbnail') == '1'
+        etag = f'"{sha256}-thumb"' if thumbnail else f'"{sha256}"'
+        if request.headers.get('If-None-Match') == etag:
+            return HttpResponse(status=304)
+        file, content_type = open_screenshot(sha256, thumbnail=thumbnail)
+        if file is None:
+            raise Http404('截图不存在')
+        response = FileResponse(file, content_type=content_type)
+        # 内容寻址，同一地址的内容不会变化；截图可能包含敏感信息，只允许浏览器缓存
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        response['ETag'] = etag
+        return response
+
 
 class TestCaseViewSet(viewsets.ModelViewSet):
     """测试用例视图集"""
@@ -978,6 +1052,7 @@ class TestCaseViewSet(viewsets.ModelViewSet):
                         element_id=step_data.get('element') if step_data.get('element') else None,
                         input_value=step_data.get('input_value', ''),
                         wait_time=step_data.get('wait_time', 1000),
+                        wait_strategy=step_data.get('wait_strategy', ''),
                         assert_type=step_data.get('assert_type', ''),
                         assert_value=step_data.get('assert_value', ''),
                         description=step_data.get('description', '')
@@ -1002,6 +1077,7 @@ class TestCaseViewSet(viewsets.ModelViewSet):
                 description=test_case.description,
                 priority=test_case.priority,
                 status=test_case.status,
+                parallel_safe=test_case.parallel_safe,
                 created_by=request.user
             )
             
@@ -1016,6 +1092,7 @@ class TestCaseViewSet(viewsets.ModelViewSet):
                     element=step.element,
                     input_value=step.input_value,
                     wait_time=step.wait_time,
+                    wait_strategy=step.wait_strategy,
                     assert_type=step.assert_type,
                     assert_value=step.assert_value,
                     description=step.description
@@ -1079,6 +1156,7 @@ class TestCaseViewSet(viewsets.ModelViewSet):
                         element_id=step_data.get('element') if step_data.get('element') else None,
                         input_value=step_data.get('input_value', ''),
                         wait_time=step_data.get('wait_time', 1000),
+                        wait_strategy=step_data.get('wait_strategy', ''),
                         assert_type=step_data.get('assert_type', ''),
                         assert_value=step_data.get('assert_value', ''),
                         description=step_data.get('description', '')
@@ -1383,7 +1461,8 @@ class TestCaseViewSet(viewsets.ModelViewSet):
                     headless = request.data.get('headless', False)
 
                     # 创建Selenium引擎实例
-                    engine = SeleniumTestEngine(browser_type=browser_type, headless=headless)
+                    engine = SeleniumTestEngine(browser_type=browser_type, headless=headless,
+                                                wait_strategy=test_case.project.wait_strategy)
 
                     try:
                         # 启动浏览器
@@ -1464,7 +1543,9 @@ class TestCaseViewSet(viewsets.ModelViewSet):
                                         'action_type': action_type,
                                         'description': description or '',
                                         'success': success,
-                                        'error': None if success else step_log
+                                        'error': None if success else step_log,
+                                        'timing': engine.last_step_timing,
+                                        'waits': engine.waiter.drain()
                                     })
 
                                     if not success:
@@ -1584,7 +1665,9 @@ class TestCaseViewSet(viewsets.ModelViewSet):
                         headless = request.data.get('headless', False)
 
                         # 创建Playwright引擎实例
-                        engine = PlaywrightTestEngine(browser_type=browser_type, headless=headless)
+                        engine = PlaywrightTestEngine(browser_type=browser_type, headless=headless,
+                                                      network_profile=test_case.project.network_profile,
+                                                      wait_strategy=test_case.project.wait_strategy)
 
                         try:
                             # 启动浏览器
@@ -1651,7 +1734,9 @@ class TestCaseViewSet(viewsets.ModelViewSet):
                                             'action_type': action_type,
                                             'description': description or '',
                                             'success': success,
-                                            'error': None if success else step_log
+                                            'error': None if success else step_log,
+                                            'timing': engine.last_step_timing,
+                                            'waits': engine.waiter.drain()
                                         })
 
                                         # 如果步骤失败,保存截图
@@ -1764,6 +1849,12 @@ class TestCaseViewSet(viewsets.ModelViewSet):
                             execution_logs.append("========== 清理资源 ==========")
                             await engine.stop()
                             execution_logs.append("✓ 浏览器已关闭")
+                            if engine.network is not None:
+                                network = engine.network.report()
+                                execution_logs.append(
+                                    f"✓ 网络配置: 共 {network['requests']} 个请求，拦截 {network['blocked']} 个，"
+                                    f"本地返回 {network['from_har'] + network['from_cache']} 个，节省 {network['bytes_saved'] // 1024} KB"
+                                )
 
                     # 在新的事件循环中运行测试
                     loop = asyncio.new_event_loop()
@@ -1802,9 +1893,14 @@ class TestCaseViewSet(viewsets.ModelViewSet):
             execution.execution_logs = json.dumps(step_results, ensure_ascii=False)
             execution.execution_time = total_time
             execution.finished_at = timezone.now()
+            # 截图转存到截图存储，执行记录只保存引用
+            screenshots = externalize_screenshots(screenshots)
             execution.screenshots = screenshots
             execution.save()
             logger.info(f"[调试] 执行结果已保存: execution.status = {execution.status}")
+            save_step_timings(execution, step_results, {
+                i: step_info['step'].element_id for i, step_info in enumerate(steps_data, 1)
+            })
 
             serializer = TestCaseExecutionSerializer(execution)
             # 格式化错误信息为统一的对象格式
@@ -1833,7 +1929,7 @@ class TestCaseViewSet(viewsets.ModelViewSet):
             return Response({
                 'success': execution.status == 'passed',
                 'logs': execution.execution_logs,
-                'screenshots': screenshots,
+                'screenshots': sign_screenshot_urls(screenshots),
                 'execution_time': execution.execution_time,
                 'errors': errors
             })
@@ -1951,6 +2047,20 @@ class TestCaseExecutionViewSet(viewsets.ModelViewSet):
         
         return Response({'message': f'成功删除 {deleted_count} 条记录'})
 
+    @action(detail=True, methods=['get'])
+    def trace(self, request, pk=None):
+        """下载用例失败时保存的 Playwright Trace（可用 playwright show-trace 或 trace.playwright.dev 查看）"""
+        import os
+        from django.conf import settings
+
+        execution = self.get_object()
+        if not execution.trace_file:
+            raise Http404('该执行记录没有 Trace')
+        path = os.path.join(settings.UI_TRACE_ROOT, execution.trace_file)
+        if not os.path.isfile(path):
+            raise Http404('Trace 文件不存在')
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'trace-{execution.id}.zip')
+
 
 
 
@@ -2067,50 +2177,15 @@ class UiScheduledTaskViewSet(viewsets.ModelViewSet):
                 test_suite.execution_status = 'running'
                 test_suite.save()
 
-                # 在后台线程中执行测试
-                import threading
-                from .test_executor import TestExecutor
-
-                def run_test():
-                    try:
-                        executor = TestExecutor(
-                            test_suite=test_suite,
-                            engine=task.engine,
-                            browser=task.browser,
-                            headless=task.headless,
-                            executed_by=task.created_by
-                        )
-                        executor.run()
-
-                        # 更新任务执行结果
-                        task.successful_runs += 1
-                        task.last_result = {'status': 'success', 'message': '测试套件执行成功'}
-                        task.error_message = ''
-                        task.save()
-
-                        # 发送成功通知
-                        self._send_task_notification(task, success=True)
-
-                    except Exception as e:
-                        task.failed_runs += 1
-                        task.last_result = {'status': 'failed', 'message': str(e)}
-                        task.error_message = str(e)
-                        test_suite.execution_status = 'failed'
-                        test_suite.save()
-                        task.save()
-
-                        # 发送失败通知
-                        self._send_task_notification(task, success=False)
-
-                # 启动后台线程执行测试
-                thread = threading.Thread(target=run_test)
-                thread.daemon = True
-                thread.start()
+                # 提交到作业队列执行测试
+                from apps.core.job_queue import enqueue
+                job = enqueue('ui.run_scheduled_task', task.id, created_by=request.user)
 
                 log_operation('run', 'scheduled_task', task.id, task.name, request.user)
 
                 return Response({
                     'message': '测试套件开始执行',
+                    'job_id': job.id,
                     'task_id': task.id,
                     'task_name': task.name,
                     'test_suite': test_suite.name,
@@ -2136,330 +2211,400 @@ class UiScheduledTaskViewSet(viewsets.ModelViewSet):
                         'error': '找不到配置的测试用例'
                     }, status=status.HTTP_400_BAD_REQUEST)
 
-                # 在后台线程中执行测试用例
-                import threading
+                # 提交到作业队列执行测试用例
+                from apps.core.job_queue import enqueue
+                job = enqueue('ui.run_scheduled_task', task.id, created_by=request.user)
 
-                def run_test_cases():
-                    """在后台线程中执行测试用例"""
-                    success_count = 0
-                    failed_count = 0
+                log_operation('run', 'scheduled_task', task.id, task.name, request.user)
 
-                    try:
-                        for test_case in test_cases:
-                            # 创建执行记录
-                            execution = TestCaseExecution.objects.create(
-                                test_case=test_case,
-                                project=task.project,
-                                execution_source='scheduled',
-                                status='running',
-                                engine=task.engine,
-                                browser=task.browser,
-                                headless=task.headless,
-                                created_by=task.created_by,
-                                started_at=timezone.now()
-                            )
-
-                            # 实际执行测试用例
-                            try:
-                                logger.info(f"开始执行定时任务的测试用例: {test_case.name} (ID: {test_case.id})")
-
-                                start_time = time.time()
-
-                                # 获取测试用例的所有步骤
-                                test_steps = list(test_case.steps.all().order_by('step_number'))
-
-                                # 预先获取所有步骤的数据
-                                steps_data = []
-                                for step in test_steps:
-                                    step_data = {
-                                        'step': step,
-                                        'action_type': step.action_type,
-                                        'description': step.description,
-                                        'input_value': step.input_value,
-                                        'wait_time': step.wait_time,
-                                        'assert_type': step.assert_type,
-                                        'assert_value': step.assert_value,
-                                    }
-
-                                    if step.element:
-                                        step_data['element_data'] = {
-                                            'locator_strategy': step.element.locator_strategy.name if step.element.locator_strategy else 'css',
-                                            'locator_value': step.element.locator_value,
-                                            'name': step.element.name,
-                                            'wait_timeout': step.element.wait_timeout,
-                                            'force_action': step.element.force_action
-                                        }
-                                    else:
-                                        step_data['element_data'] = None
-
-                                    steps_data.append(step_data)
-
-                                # 存储步骤执行结果和截图
-                                step_results = []
-                                screenshots = []
-                                execution_logs = []
-                                execution_result = {'status': 'passed', 'error_message': None}
-
-                                # 根据引擎类型执行
-                                if task.engine == 'selenium':
-                                    from .selenium_engine import SeleniumTestEngine
-
-                                    # 检查浏览器是否可用
-                                    is_available, error_msg = SeleniumTestEngine.check_browser_available(task.browser)
-                                    if not is_available:
-                                        execution.status = 'failed'
-                                        execution.error_message = error_msg
-                                        execution.execution_logs = json.dumps([{
-                                            'step_number': 0,
-                                            'action_type': '浏览器检查',
-                                            'description': '执行前浏览器环境检查',
-                                            'success': False,
-                                            'error': error_msg
-                                        }], ensure_ascii=False)
-                                        execution.finished_at = timezone.now()
-                                        execution.save()
-                                        failed_count += 1
-                                        continue
+                return Response({
+                    'message': '测试用例开始执行',
+                    'job_id': job.id,
+                    'task_id': task.id,
+                    'task_name': task.name,
+                    'test_case_count': test_case_count,
+                    'engine': task.engine,
+                    'browser': task.browser,
+                    'headless': task.headless
+                }, status=status.HTTP_200_OK)
 
-                                    # 创建Selenium引擎实例并执行
-                                    engine = SeleniumTestEngine(browser_type=task.browser, headless=task.headless)
+            else:
+                return Response({
+                    'error': '不支持的任务类型'
+                }, status=status.HTTP_400_BAD_REQUEST)
 
-                                    try:
-                                        # 启动浏览器
-                                        engine.start()
-                                        execution_logs.append("✓ 浏览器启动成功")
-
-                                        # 导航到项目基础URL
-                                        if test_case.project.base_url:
-                                            success, nav_log = engine.navigate(test_case.project.base_url)
-                                            execution_logs.append(nav_log)
-                                            if not success:
-                                                execution_result['status'] = 'failed'
-                                                execution_result['error_message'] = "导航到测试页面失败"
-                                                raise Exception("导航到测试页面失败")
-
-                                        # 执行测试步骤
-                                        for i, step_info in enumerate(steps_data, 1):
-                                            step = step_info['step']
-                                            action_type = step_info['action_type']
-                                            element_data = step_info['element_data']
-
-                                            success, step_log, screenshot_base64 = engine.execute_step(step, element_data or {})
-
-                                            step_results.append({
-                                                'step_number': i,
-                                                'action_type': action_type,
-                                                'description': step_info['description'] or '',
-                                                'success': success,
-                                                'error': None if success else step_log
-                                            })
+        except Exception as e:
+            logger.error(f'执行定时任务失败: {str(e)}')
+            return Response({
+                'error': f'执行失败: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-                                            if not success:
-                                                execution_result['status'] = 'failed'
-                                                execution_result['error_message'] = step_log
+    def _run_scheduled_task(self, task):
+        """执行定时任务（在作业队列的worker中调用）"""
+        if task.task_type == 'TEST_SUITE':
+            self._run_scheduled_suite(task)
+        elif task.task_type == 'TEST_CASE':
+            self._run_scheduled_test_cases(task)
+        else:
+            raise ValueError(f"不支持的任务类型: {task.task_type}")
+
+    def _run_scheduled_suite(self, task):
+        """执行定时任务关联的测试套件"""
+        from .test_executor import TestExecutor
 
-                                                if not screenshot_base64:
-                                                    screenshot_base64 = engine.capture_screenshot()
+        test_suite = task.test_suite
+
+        try:
+            executor = TestExecutor(
+                test_suite=test_suite,
+                engine=task.engine,
+                browser=task.browser,
+                headless=task.headless,
+                executed_by=task.created_by,
+                workers=task.workers
+            )
+            executor.run()
 
-                                                if screenshot_base64:
-                                                    screenshots.append({
-                                                        'url': screenshot_base64,
-                                                        'description': f'步骤 {i} 失败截图',
-                                                        'step_number': i,
-                                                        'timestamp': timezone.now().isoformat()
-                                                    })
+            # 更新任务执行结果
+            task.successful_runs += 1
+            task.last_result = {'status': 'success', 'message': '测试套件执行成功'}
+            task.error_message = ''
+            task.save()
 
-                                                break
+            # 发送成功通知
+            self._send_task_notification(task, success=True)
 
-                                            if action_type == 'screenshot' and screenshot_base64:
-                                                screenshots.append({
-                                                    'url': screenshot_base64,
-                                                    'description': f'步骤 {i}: {step_info["description"] or "手动截图"}',
-                                                    'step_number': i,
-                                                    'timestamp': timezone.now().isoformat()
-                                                })
+        except JobCancelled:
+            task.last_result = {'status': 'cancelled', 'message': '作业已取消'}
+            task.save()
+            raise
+        except Exception as e:
+            task.failed_runs += 1
+            task.last_result = {'status': 'failed', 'message': str(e)}
+            task.error_message = str(e)
+            test_suite.execution_status = 'failed'
+            test_suite.save()
+            task.save()
 
-                                    finally:
-                                        engine.stop()
+            # 发送失败通知
+            self._send_task_notification(task, success=False)
 
-                                else:  # Playwright
-                                    import asyncio
-                                    from asgiref.sync import sync_to_async
-                                    from .playwright_engine import PlaywrightTestEngine
+    def _run_scheduled_test_cases(self, task):
+        """逐个执行定时任务配置的测试用例"""
+        test_cases = TestCase.objects.filter(id__in=task.test_cases)
+        success_count = 0
+        failed_count = 0
 
-                                    async def run_playwright_test():
-                                        browser_map = {
-                                            'chrome': 'chromium',
-                                            'firefox': 'firefox',
-                                            'safari': 'webkit'
-                                        }
-                                        browser_type = browser_map.get(task.browser, 'chromium')
+        try:
+            for test_case in test_cases:
+                # 作业被取消时不再执行剩余的用例
+                check_cancelled()
+
+                # 创建执行记录
+                execution = TestCaseExecution.objects.create(
+                    test_case=test_case,
+                    project=task.project,
+                    execution_source='scheduled',
+                    status='running',
+                    engine=task.engine,
+                    browser=task.browser,
+                    headless=task.headless,
+                    created_by=task.created_by,
+                    started_at=timezone.now()
+                )
 
-                                        engine = PlaywrightTestEngine(browser_type=browser_type, headless=task.headless)
+                # 实际执行测试用例
+                try:
+                    logger.info(f"开始执行定时任务的测试用例: {test_case.name} (ID: {test_case.id})")
+
+                    start_time = time.time()
+
+                    # 获取测试用例的所有步骤
+                    test_steps = list(test_case.steps.all().order_by('step_number'))
+
+                    # 预先获取所有步骤的数据
+                    steps_data = []
+                    for step in test_steps:
+                        step_data = {
+                            'step': step,
+                            'action_type': step.action_type,
+                            'description': step.description,
+                            'input_value': step.input_value,
+                            'wait_time': step.wait_time,
+                            'assert_type': step.assert_type,
+                            'assert_value': step.assert_value,
+                        }
 
-                                        try:
-                                            # 启动浏览器
-                                            await engine.start()
-                                            execution_logs.append("✓ 浏览器启动成功")
-
-                                            # 获取项目基础URL（同步操作）
-                                            base_url = await sync_to_async(lambda: test_case.project.base_url)()
-
-                                            # 导航到项目基础URL
-                                            if base_url:
-                                                success, nav_log = await engine.navigate(base_url)
-                                                execution_logs.append(nav_log)
-                                                if not success:
-                                                    execution_result['status'] = 'failed'
-                                                    execution_result['error_message'] = "导航到测试页面失败"
-                                                    return False
-
-                                            # 执行测试步骤
-                                            for i, step_info in enumerate(steps_data, 1):
-                                                step = step_info['step']
-                                                action_type = step_info['action_type']
-                                                element_data = step_info['element_data']
-
-                                                success, step_log, screenshot_base64 = await engine.execute_step(step, element_data or {})
-
-                                                step_results.append({
-                                                    'step_number': i,
-                                                    'action_type': action_type,
-                                                    'description': step_info['description'] or '',
-                                                    'success': success,
-                                                    'error': None if success else step_log
-                                                })
+                        if step.element:
+                            step_data['element_data'] = {
+                                'locator_strategy': step.element.locator_strategy.name if step.element.locator_strategy else 'css',
+                                'locator_value': step.element.locator_value,
+                                'name': step.element.name,
+                                'wait_timeout': step.element.wait_timeout,
+                                'force_action': step.element.force_action
+                            }
+                        else:
+                            step_data['element_data'] = None
+
+                        steps_data.append(step_data)
+
+                    # 存储步骤执行结果和截图
+                    step_results = []
+                    screenshots = []
+                    execution_logs = []
+                    execution_result = {'status': 'passed', 'error_message': None}
+
+                    # 根据引擎类型执行
+                    if task.engine == 'selenium':
+                        from .selenium_engine import SeleniumTestEngine
+
+                        # 检查浏览器是否可用
+                        is_available, error_msg = SeleniumTestEngine.check_browser_available(task.browser)
+                        if not is_available:
+                            execution.status = 'failed'
+                            execution.error_message = error_msg
+                            execution.execution_logs = json.dumps([{
+                                'step_number': 0,
+                                'action_type': '浏览器检查',
+                                'description': '执行前浏览器环境检查',
+                                'success': False,
+                                'error': error_msg
+                            }], ensure_ascii=False)
+                            execution.finished_at = timezone.now()
+                            execution.save()
+                            failed_count += 1
+                            continue
+
+                        # 创建Selenium引擎实例并执行
+                        engine = SeleniumTestEngine(browser_type=task.browser, headless=task.headless,
+                                                    wait_strategy=task.project.wait_strategy)
 
-                                                if not success:
-                                                    execution_result['status'] = 'failed'
-                                                    execution_result['error_message'] = step_log
+                        try:
+                            # 启动浏览器
+                            engine.start()
+                            execution_logs.append("✓ 浏览器启动成功")
 
-                                                    if not screenshot_base64:
-                                                        screenshot_base64 = await engine.capture_screenshot()
+                            # 导航到项目基础URL
+                            if test_case.project.base_url:
+                                success, nav_log = engine.navigate(test_case.project.base_url)
+                                execution_logs.append(nav_log)
+                                if not success:
+                                    execution_result['status'] = 'failed'
+                                    execution_result['error_message'] = "导航到测试页面失败"
+                                    raise Exception("导航到测试页面失败")
 
-                                                    if screenshot_base64:
-                                                        screenshots.append({
-                                                            'url': screenshot_base64,
-                                                            'description': f'步骤 {i} 失败截图',
-                                                            'step_number': i,
-                                                            'timestamp': timezone.now().isoformat()
-                                                        })
+                            # 执行测试步骤
+                            for i, step_info in enumerate(steps_data, 1):
+                                step = step_info['step']
+                                action_type = step_info['action_type']
+                                element_data = step_info['element_data']
 
-                                                    return False
+                                success, step_log, screenshot_base64 = engine.execute_step(step, element_data or {})
 
-                                                if action_type == 'screenshot' and screenshot_base64:
-                                                    screenshots.append({
-                                                        'url': screenshot_base64,
-                                                        'description': f'步骤 {i}: {step_info["description"] or "手动截图"}',
-                                                        'step_number': i,
-                                                        'timestamp': timezone.now().isoformat()
-                                                    })
+                                step_results.append({
+                                    'step_number': i,
+                                    'action_type': action_type,
+                                    'description': step_info['description'] or '',
+                                    'success': success,
+                                    'error': None if success else step_log,
+                                    'timing': engine.last_step_timing,
+                                    'waits': engine.waiter.drain()
+                                })
 
-                                            return True
+                                if not success:
+                                    execution_result['status'] = 'failed'
+                                    execution_result['error_message'] = step_log
 
-                                        finally:
-                                            await engine.stop()
+                                    if not screenshot_base64:
+                                        screenshot_base64 = engine.capture_screenshot()
 
-                                    # 在新的事件循环中运行Playwright测试
-                                    loop = asyncio.new_event_loop()
-                                    asyncio.set_event_loop(loop)
-                                    try:
-                                        loop.run_until_complete(run_playwright_test())
-                                    finally:
-                                        loop.close()
-
-                                # 计算执行时间
-                                total_time = round(time.time() - start_time, 2)
-
-                                # 保存执行结果
-                                execution.status = execution_result['status']
-                                execution.error_message = execution_result['error_message'] or ''
-                                execution.execution_logs = json.dumps(step_results, ensure_ascii=False)
-                                execution.execution_time = total_time
-                                execution.screenshots = screenshots
-                                execution.finished_at = timezone.now()
-                                execution.save()
-
-                                if execution.status == 'passed':
-                                    success_count += 1
-                                    logger.info(f"测试用例 {test_case.name} 执行成功")
-                                else:
-                                    failed_count += 1
-                                    logger.warning(f"测试用例 {test_case.name} 执行失败: {execution.error_message}")
-
-                            except Exception as e:
-                                logger.error(f"执行测试用例 {test_case.name} 时发生异常: {str(e)}")
-                                execution.status = 'failed'
-                                execution.error_message = str(e)
-                                execution.finished_at = timezone.now()
-                                execution.save()
-                                failed_count += 1
-
-                        # 更新任务执行结果
-                        if failed_count == 0:
-                            task.successful_runs += 1
-                            task.last_result = {
-                                'status': 'success',
-                                'message': f'执行完成: {success_count}个成功',
-                                'success_count': success_count,
-                                'failed_count': failed_count
-                            }
-                            task.error_message = ''
-                            task.save()
+                                    if screenshot_base64:
+                                        screenshots.append({
+                                            'url': screenshot_base64,
+                                            'description': f'步骤 {i} 失败截图',
+                                            'step_number': i,
+                                            'timestamp': timezone.now().isoformat()
+                                        })
 
-                            # 发送成功通知
-                            self._send_task_notification(task, success=True)
-                        else:
-                            task.failed_runs += 1
-                            task.last_result = {
-                                'status': 'partial',
-                                'message': f'执行完成: {success_count}个成功, {failed_count}个失败',
-                                'success_count': success_count,
-                                'failed_count': failed_count
+                                    break
+
+                                if action_type == 'screenshot' and screenshot_base64:
+                                    screenshots.append({
+                                        'url': screenshot_base64,
+                                        'description': f'步骤 {i}: {step_info["description"] or "手动截图"}',
+                                        'step_number': i,
+                                        'timestamp': timezone.now().isoformat()
+                                    })
+
+                        finally:
+                            engine.stop()
+
+                    else:  # Playwright
+                        import asyncio
+                        from asgiref.sync import sync_to_async
+                        from .playwright_engine import PlaywrightTestEngine
+
+                        async def run_playwright_test():
+                            browser_map = {
+                                'chrome': 'chromium',
+                                'firefox': 'firefox',
+                                'safari': 'webkit'
                             }
-                            task.error_message = f'{failed_count}个测试用例执行失败'
-                            task.save()
+                            browser_type = browser_map.get(task.browser, 'chromium')
 
-                            # 发送失败通知
-                            self._send_task_notification(task, success=False)
+                            engine = PlaywrightTestEngine(browser_type=browser_type, headless=task.headless,
+                                                          wait_strategy=task.project.wait_strategy)
 
-                    except Exception as e:
-                        logger.error(f"执行定时任务测试用例时发生异常: {str(e)}")
-                        task.failed_runs += 1
-                        task.last_result = {'status': 'failed', 'message': str(e)}
-                        task.error_message = str(e)
-                        task.save()
+                            try:
+                                # 启动浏览器
+                                await engine.start()
+                                execution_logs.append("✓ 浏览器启动成功")
 
-                        # 发送失败通知
-                        self._send_task_notification(task, success=False)
+                                # 获取项目基础URL（同步操作）
+                                base_url = await sync_to_async(lambda: test_case.project.base_url)()
 
-                # 启动后台线程执行测试
-                thread = threading.Thread(target=run_test_cases)
-                thread.daemon = True
-                thread.start()
+                                # 导航到项目基础URL
+                                if base_url:
+                                    success, nav_log = await engine.navigate(base_url)
+                                    execution_logs.append(nav_log)
+                                    if not success:
+                                        execution_result['status'] = 'failed'
+                                        execution_result['error_message'] = "导航到测试页面失败"
+                                        return False
 
-                log_operation('run', 'scheduled_task', task.id, task.name, request.user)
+                                # 执行测试步骤
+                                for i, step_info in enumerate(steps_data, 1):
+                                    step = step_info['step']
+                                    action_type = step_info['action_type']
+                                    element_data = step_info['element_data']
 
-                return Response({
-                    'message': '测试用例开始执行',
-                    'task_id': task.id,
-                    'task_name': task.name,
-                    'test_case_count': test_case_count,
-                    'engine': task.engine,
-                    'browser': task.browser,
-                    'headless': task.headless
-                }, status=status.HTTP_200_OK)
+                                    success, step_log, screenshot_base64 = await engine.execute_step(step, element_data or {})
 
-            else:
-                return Response({
-                    'error': '不支持的任务类型'
-                }, status=status.HTTP_400_BAD_REQUEST)
+                                    step_results.append({
+                                        'step_number': i,
+                                        'action_type': action_type,
+                                        'description': step_info['description'] or '',
+                                        'success': success,
+                                        'error': None if success else step_log,
+                                        'timing': engine.last_step_timing,
+                                        'waits': engine.waiter.drain()
+                                    })
+
+                                    if not success:
+                                        execution_result['status'] = 'failed'
+                                        execution_result['error_message'] = step_log
+
+                                        if not screenshot_base64:
+                                            screenshot_base64 = await engine.capture_screenshot()
+
+                                        if screenshot_base64:
+                                            screenshots.append({
+                                                'url': screenshot_base64,
+                                                'description': f'步骤 {i} 失败截图',
+                                                'step_number': i,
+                                                'timestamp': timezone.now().isoformat()
+                                            })
+
+                                        return False
+
+                                    if action_type == 'screenshot' and screenshot_base64:
+                                        screenshots.append({
+                                            'url': screenshot_base64,
+                                            'description': f'步骤 {i}: {step_info["description"] or "手动截图"}',
+                                            'step_number': i,
+                                            'timestamp': timezone.now().isoformat()
+                                        })
+
+                                return True
+
+                            finally:
+                                await engine.stop()
+
+                        # 在新的事件循环中运行Playwright测试
+                        loop = asyncio.new_event_loop()
+                        asyncio.set_event_loop(loop)
+                        try:
+                            loop.run_until_complete(run_playwright_test())
+                        finally:
+                            loop.close()
+
+                    # 计算执行时间
+                    total_time = round(time.time() - start_time, 2)
+
+                    # 保存执行结果
+                    execution.status = execution_result['status']
+                    execution.error_message = execution_result['error_message'] or ''
+                    execution.execution_logs = json.dumps(step_results, ensure_ascii=False)
+                    execution.execution_time = total_time
+                    # 截图转存到截图存储，执行记录只保存引用
+                    execution.screenshots = externalize_screenshots(screenshots)
+                    execution.finished_at = timezone.now()
+                    execution.save()
+                    save_step_timings(execution, step_results, {
+                        i: step_info['step'].element_id for i, step_info in enumerate(steps_data, 1)
+                    })
+
+                    if execution.status == 'passed':
+                        success_count += 1
+                        logger.info(f"测试用例 {test_case.name} 执行成功")
+                    else:
+                        failed_count += 1
+                        logger.warning(f"测试用例 {test_case.name} 执行失败: {execution.error_message}")
+
+                except Exception as e:
+                    logger.error(f"执行测试用例 {test_case.name} 时发生异常: {str(e)}")
+                    execution.status = 'failed'
+                    execution.error_message = str(e)
+                    execution.finished_at = timezone.now()
+                    execution.save()
+                    failed_count += 1
+
+            # 更新任务执行结果
+            if failed_count == 0:
+                task.successful_runs += 1
+                task.last_result = {
+                    'status': 'success',
+                    'message': f'执行完成: {success_count}个成功',
+                    'success_count': success_count,
+                    'failed_count': failed_count
+                }
+                task.error_message = ''
+                task.save()
 
+                # 发送成功通知
+                self._send_task_notification(task, success=True)
+            else:
+                task.failed_runs += 1
+                task.last_result = {
+                    'status': 'partial',
+                    'message': f'执行完成: {success_count}个成功, {failed_count}个失败',
+                    'success_count': success_count,
+                    'failed_count': failed_count
+                }
+                task.error_message = f'{failed_count}个测试用例执行失败'
+                task.save()
+
+                # 发送失败通知
+                self._send_task_notification(task, success=False)
+
+        except JobCancelled:
+            task.last_result = {
+                'status': 'cancelled',
+                'message': f'作业已取消: {success_count}个成功, {failed_count}个失败',
+                'success_count': success_count,
+                'failed_count': failed_count
+            }
+            task.save()
+            raise
         except Exception as e:
-            logger.error(f'执行定时任务失败: {str(e)}')
-            return Response({
-                'error': f'执行失败: {str(e)}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            logger.error(f"执行定时任务测试用例时发生异常: {str(e)}")
+            task.failed_runs += 1
+            task.last_result = {'status': 'failed', 'message': str(e)}
+            task.error_message = str(e)
+            task.save()
+
+            # 发送失败通知
+            self._send_task_notification(task, success=False)
 
     def _send_task_notification(self, task, success):
         """发送任务执行通知"""
@@ -2889,125 +3034,132 @@ class AICaseViewSet(viewsets.ModelViewSet):
             logs="正在分析任务...\n"
         )
         
-        # 异步执行
-        import threading
-        from asgiref.sync import sync_to_async
-        from .ai_agent import run_full_process_sync
+        # 提交到作业队列异步执行
+        from apps.core.job_queue import enqueue
+        job = enqueue('ai.run_ai_case', ai_case.id, execution_record.id, created_by=request.user)
         
-        def run_task():
-            # 注册停止信号
-            STOP_SIGNALS[execution_record.id] = False
+        return Response({
+            'message': 'AI 用例开始执行',
+            'execution_id': execution_record.id,
+            'job_id': job.id
+        })
 
-            try:
-                def should_stop():
-                    return STOP_SIGNALS.get(execution_record.id, False)
-
-                async def on_analysis_complete(planned_tasks):
-                    execution_record.planned_tasks = planned_tasks
-                    execution_record.logs += "任务分析完成，开始执行...\n"
-                    await sync_to_async(execution_record.save)()
-                    
-                async def on_step_update(step_info):
-                    try:
-                        # 处理日志
-                        if step_info.get('type') == 'log':
-                            content = step_info.get('content')
-                            if content:
-                                execution_record.logs += content
-                                await sync_to_async(execution_record.save)()
-                            return
-
-                        # 处理任务状态
-                        task_id = step_info.get('task_id')
-                        status = step_info.get('status')
-                        if task_id and status:
-                            updated = False
-                            for task in execution_record.planned_tasks:
-                                if task['id'] == task_id:
-                                    task['status'] = status
-                                    updated = True
-                                    break
-                            if updated:
-                                await sync_to_async(execution_record.save)()
-                    except Exception as e:
-                        print(f"更新步骤状态失败: {e}")
-
-                history = run_full_process_sync(
-                    ai_case.task_description, 
-                    analysis_callback=on_analysis_complete, 
-                    step_callback=on_step_update,
-                    should_stop=should_stop
-                )
-                
-                # 检查是否是手动停止
-                if should_stop():
-                    execution_record.status = 'stopped'
-                    execution_record.logs += "\n[System] 任务已由用户停止。"
-                else:
-                    # 更新成功状态
-                    execution_record.status = 'passed'
-                    execution_record.logs += "\n执行完成。"
-
-                    # 记录任务完成统计信息
-                    if execution_record.planned_tasks:
-                        total_tasks = len(execution_record.planned_tasks)
-                        completed_tasks = len([t for t in execution_record.planned_tasks if t.get('status') == 'completed'])
-                        pending_tasks = len([t for t in execution_record.planned_tasks if t.get('status') == 'pending'])
-                        logger.info(f"🏁 Task completion summary: {completed_tasks}/{total_tasks} tasks completed, {pending_tasks} pending")
-                
-                execution_record.end_time = timezone.now()
-                execution_record.duration = (execution_record.end_time - execution_record.start_time).total_seconds()
-                
-                # 格式化 history 为日志 (如果不是停止状态)
-                steps = []
-                if history:
-                    if hasattr(history, 'steps'):
-                        steps = [extract_step_info(s, i) for i, s in enumerate(history.steps)]
-
-                execution_record.steps_completed = steps
-
-                # 自动标记已完成的任务
+    def _run_ai_case(self, ai_case, execution_record):
+        """执行AI用例并更新执行记录（在作业队列的worker中调用）"""
+        from .ai_agent import run_full_process_sync
+        from .ai_log_writer import AIExecutionLogWriter
+        from . import ai_llm, ai_report_cache, ai_sessions
+
+        log_writer = AIExecutionLogWriter(execution_record)
+        # 获取执行名额和独立的工作目录，停止信号通过执行记录跨进程传递（之后的代码都在 try 中，保证释放名额）
+        run = ai_sessions.start_session(execution_record.id)
+
+        try:
+            async def on_analysis_complete(planned_tasks):
+                log_writer.update(planned_tasks=planned_tasks)
+                log_writer.append("任务分析完成，开始执行...\n")
+                await log_writer.aflush(force=True)
+
+            async def on_step_update(step_info):
+                try:
+                    # 处理日志（缓存后批量追加写入）
+                    if step_info.get('type') == 'log':
+                        log_writer.append(step_info.get('content'))
+                        await log_writer.aflush()
+                        return
+
+                    # 处理结构化的步骤事件（随日志一起写入）
+                    if step_info.get('type') == 'step':
+                        log_writer.add_event(step_info)
+                        await log_writer.aflush()
+                        return
+
+                    # 处理任务状态
+                    task_id = step_info.get('task_id')
+                    status = step_info.get('status')
+                    if task_id and status:
+                        updated = False
+                        for task in execution_record.planned_tasks:
+                            if task['id'] == task_id:
+                                task['status'] = status
+                                updated = True
+                                break
+                        if updated:
+                            log_writer.update(planned_tasks=execution_record.planned_tasks)
+                            await log_writer.aflush()
+                except Exception as e:
+                    print(f"更新步骤状态失败: {e}")
+
+            history = run_full_process_sync(
+                ai_case.task_description, 
+                analysis_callback=on_analysis_complete, 
+                step_callback=on_step_update,
+                should_stop=run.astop_requested,
+                enable_gif=True,
+                case_name=ai_case.name,
+                work_dir=run.work_dir,
+                # 任务描述未修改时复用上次的任务规划
+                plan_cache=ai_llm.AICasePlanCache(ai_case)
+            )
+
+            # 检查是否是手动停止
+            if run.stop_requested():
+                execution_record.status = 'stopped'
+                log_writer.append("\n[System] 任务已由用户停止。")
+            else:
+                # 更新成功状态
+                execution_record.status = 'passed'
+                log_writer.append("\n执行完成。")
+
+                # 记录任务完成统计信息
                 if execution_record.planned_tasks:
-                    self._auto_mark_completed_tasks(execution_record)
+                    total_tasks = len(execution_record.planned_tasks)
+                    completed_tasks = len([t for t in execution_record.planned_tasks if t.get('status') == 'completed'])
+                    pending_tasks = len([t for t in execution_record.planned_tasks if t.get('status') == 'pending'])
+                    logger.info(f"🏁 Task completion summary: {completed_tasks}/{total_tasks} tasks completed, {pending_tasks} pending")
 
-                # 处理GIF录制文件
-                self._process_gif_recording(execution_record, history)
+            execution_record.end_time = timezone.now()
+            execution_record.duration = (execution_record.end_time - execution_record.start_time).total_seconds()
 
-                execution_record.save()
+            # 格式化 history 为日志 (如果不是停止状态)
+            steps = []
+            if history:
+                if hasattr(history, 'steps'):
+                    steps = [extract_step_info(s, i) for i, s in enumerate(history.steps)]
 
-            except Exception as e:
-                execution_record.status = 'failed'
-                execution_record.end_time = timezone.now()
-                execution_record.duration = (execution_record.end_time - execution_record.start_time).total_seconds()
-                execution_record.logs += f"\n执行出错: {str(e)}"
-                execution_record.save()
-            finally:
-                # 清理停止信号
-                if execution_record.id in STOP_SIGNALS:
-                    del STOP_SIGNALS[execution_record.id]
-
-        thread = threading.Thread(target=run_task)
-        thread.daemon = True
-        thread.start()
-        
-        return Response({
-            'message': 'AI 用例开始执行',
-            'execution_id': execution_record.id
-        })
+            execution_record.steps_completed = steps
+
+            # 自动标记已完成的任务
+            if execution_record.planned_tasks:
+                self._auto_mark_completed_tasks(execution_record)
+
+            # 处理GIF录制文件
+            self._process_gif_recording(execution_record, history, run.gif_path)
 
-    def _process_gif_recording(self, execution_record, history):
+            # 合并日志并保存最终结果
+            log_writer.finish()
+
+        except Exception as e:
+            execution_record.status = 'failed'
+            execution_record.end_time = timezone.now()
+            execution_record.duration = (execution_record.end_time - execution_record.start_time).total_seconds()
+            log_writer.append(f"\n执行出错: {str(e)}")
+            log_writer.finish()
+        finally:
+            # 释放执行名额并删除工作目录
+            run.close()
+            # 后台生成报告和PDF
+            ai_report_cache.schedule(execution_record)
+
+    def _process_gif_recording(self, execution_record, history, default_gif_path):
         """
         处理GIF录制文件
-        在执行完成后查找生成的GIF文件并保存路径到数据库
+        在执行完成后把本次执行工作目录中生成的GIF文件移动到 media/ai_recording，并保存路径到数据库
         """
         try:
-            import os
             from django.conf import settings
             from datetime import datetime
 
-            # browser-use 默认生成的GIF文件名（固定为agent_history.gif）
-            default_gif_path = os.path.join(os.getcwd(), 'agent_history.gif')
-
             # 如果找到GIF文件，移动到media/ai_recording目录并重命名
             if os.path.exists(default_gif_path):
                 import shutil
@@ -3020,7 +3172,7 @@ class AICaseViewSet(viewsets.ModelViewSet):
                 timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
                 # 清理用例名称中的非法字符
                 safe_case_name = "".join([c if c.isalnum() or c in (' ', '_', '-') else '_' for c in execution_record.case_name])
-                new_gif_filename = f"{safe_case_name}_{timestamp}.gif"
+                new_gif_filename = f"{safe_case_name}_{timestamp}_{execution_record.id}.gif"
                 new_gif_path = os.path.join(gif_dir, new_gif_filename)
 
                 # 移动并重命名文件
@@ -3071,9 +3223,6 @@ class AICaseViewSet(viewsets.ModelViewSet):
             logger.warning(f"⚠️ Failed to auto-mark completed tasks: {e}")
 
 
-# 全局停止信号字典 {execution_id: bool}
-STOP_SIGNALS = {}
-
 class AIExecutionRecordViewSet(viewsets.ModelViewSet):
     """AI执行记录视图集"""
     queryset = AIExecutionRecord.objects.all()
@@ -3094,7 +3243,11 @@ class AIExecutionRecordViewSet(viewsets.ModelViewSet):
         ).distinct()
 
     def perform_destroy(self, instance):
+        from . import ai_report_cache
+
+        record_id = instance.id
         instance.delete()
+        ai_report_cache.remove(record_id)
 
     @action(detail=False, methods=['post'])
     def batch_delete(self, request):
@@ -3108,14 +3261,40 @@ class AIExecutionRecordViewSet(viewsets.ModelViewSet):
         accessible_projects = UiProject.objects.filter(
             models.Q(owner=user) | models.Q(members=user)
         )
-        deleted_count, _ = AIExecutionRecord.objects.filter(
+        records = AIExecutionRecord.objects.filter(
             id__in=ids
         ).filter(
             models.Q(project__in=accessible_projects) | models.Q(project__isnull=True)
-        ).delete()
+        )
+        record_ids = list(records.values_list('id', flat=True))
+        deleted_count, _ = AIExecutionRecord.objects.filter(id__in=record_ids).delete()
+
+        # 删除缓存的报告文件
+        from . import ai_report_cache
+        for record_id in record_ids:
+            ai_report_cache.remove(record_id)
 
         return Response({'message': f'成功删除 {deleted_count} 条记录'})
 
+    @action(detail=True, methods=['get'], url_path='log-lines')
+    def log_lines(self, request, pk=None):
+        """增量获取执行中的日志行（序号大于 after 的行），执行结束后返回完整日志"""
+        from .ai_log_writer import read_log_lines
+
+        record = self.get_object()
+        params = AILogLinesQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        after = params.validated_data['after']
+        lines = read_log_lines(record, after)
+        data = {
+            'status': record.status,
+            'lines': lines,
+            'last_seq': lines[-1]['seq'] if lines else after,
+        }
+        if record.status != 'running':
+            data['logs'] = record.logs
+        return Response(data)
+
     @action(detail=False, methods=['post'], url_path='run_adhoc')
     def run_adhoc(self, request):
         """执行临时 AI 任务"""
@@ -3146,174 +3325,166 @@ class AIExecutionRecordViewSet(viewsets.ModelViewSet):
             logs="正在分析任务...\n"
         )
 
-        # 异步执行
-        import threading
-        from asgiref.sync import sync_to_async
+        # 提交到作业队列异步执行
+        from apps.core.job_queue import enqueue
+        job = enqueue('ai.run_adhoc_task', execution_record.id, execution_mode, enable_gif, created_by=request.user)
+        
+        return Response({
+            'message': 'AI 任务开始执行',
+            'execution_id': execution_record.id,
+            'job_id': job.id
+        })
+
+
+    def _run_adhoc_task(self, execution_record, execution_mode, enable_gif):
+        """执行临时AI任务并更新执行记录（在作业队列的worker中调用）"""
         from .ai_agent import run_full_process_sync
+        from .ai_log_writer import AIExecutionLogWriter
+        from . import ai_report_cache, ai_sessions
 
-        def run_task():
-            # 注册停止信号
-            STOP_SIGNALS[execution_record.id] = False
+        log_writer = AIExecutionLogWriter(execution_record)
+        # 获取执行名额和独立的工作目录，停止信号通过执行记录跨进程传递（之后的代码都在 try 中，保证释放名额）
+        run = ai_sessions.start_session(execution_record.id)
 
-            try:
-                # 定义异步安全的 should_stop
-                async def should_stop_async():
-                    # 优先检查内存信号
-                    if STOP_SIGNALS.get(execution_record.id, False):
-                        return True
-                    # 兜底检查数据库状态 (使用 sync_to_async 避免异步上下文错误)
-                    await sync_to_async(execution_record.refresh_from_db)()
-                    return execution_record.status == 'stopped'
-
-                # 定义同步版本的 should_stop 用于最后检查
-                def should_stop_sync():
-                    if STOP_SIGNALS.get(execution_record.id, False):
-                        return True
-                    execution_record.refresh_from_db()
-                    return execution_record.status == 'stopped'
-
-                async def on_analysis_complete(planned_tasks):
-                    execution_record.planned_tasks = planned_tasks
-                    execution_record.logs += "任务分析完成，开始执行...\n"
-                    await sync_to_async(execution_record.save)()
-                    
-                async def on_step_update(step_info):
-                    try:
-                        # 处理日志
-                        if step_info.get('type') == 'log':
-                            content = step_info.get('content')
-                            if content:
-                                execution_record.logs += content
-                                # 立即保存到数据库，确保前端轮询能看到最新日志
-                                await sync_to_async(execution_record.save)(update_fields=['logs'])
-                            return
-
-                        # 处理任务状态
-                        task_id = step_info.get('task_id')
-                        status = step_info.get('status')
-                        logger.info(f"DEBUG: on_step_update received: task_id={task_id}, status={status}")
-                        
-                        if task_id and status:
-                            updated = False
-                            if execution_record.planned_tasks:
-                                for task in execution_record.planned_tasks:
-                                    # 确保类型一致进行比较
-                                    if str(task['id']) == str(task_id):
-                                        old_status = task.get('status', 'pending')
-                                        task['status'] = status
-                                        updated = True
-                                        logger.info(f"DEBUG: Updated task {task_id} from {old_status} to {status}")
-                                        break
-                            if updated:
-                                # 立即保存到数据库，确保前端轮询能看到最新状态
-                                await sync_to_async(execution_record.save)(update_fields=['planned_tasks'])
-                            else:
-                                logger.warning(f"DEBUG: Task ID {task_id} not found in planned_tasks: {execution_record.planned_tasks}")
-                    except Exception as e:
-                        logger.error(f"更新步骤状态失败: {e}", exc_info=True)
-
-                history = run_full_process_sync(
-                    task_description,
-                    analysis_callback=on_analysis_complete,
-                    step_callback=on_step_update,
-                    should_stop=should_stop_async, # 传递异步版本
-                    execution_mode=execution_mode,
-                    enable_gif=enable_gif,  # 传递GIF录制开关
-                    case_name=task_description[:50] if task_description else "Adhoc Task"  # 传递用例名称用于GIF文件命名
-                )
+        try:
+            async def on_analysis_complete(planned_tasks):
+                log_writer.update(planned_tasks=planned_tasks)
+                log_writer.append("任务分析完成，开始执行...\n")
+                await log_writer.aflush(force=True)
 
-                # 检查是否是手动停止 (使用同步版本)
-                if should_stop_sync():
-                    execution_record.status = 'stopped'
-                    execution_record.logs += "\n[System] 任务已由用户停止。"
-                else:
-                    # 更新成功状态
-                    execution_record.status = 'passed'
-                    execution_record.logs += "\n执行完成。"
-
-                    # 记录任务完成统计信息
-                    if execution_record.planned_tasks:
-                        total_tasks = len(execution_record.planned_tasks)
-                        completed_tasks = len([t for t in execution_record.planned_tasks if t.get('status') == 'completed'])
-                        pending_tasks = len([t for t in execution_record.planned_tasks if t.get('status') == 'pending'])
-                        logger.info(f"🏁 Task completion summary: {completed_tasks}/{total_tasks} tasks completed, {pending_tasks} pending")
-                
-                execution_record.end_time = timezone.now()
-                execution_record.duration = (execution_record.end_time - execution_record.start_time).total_seconds()
-                
-                # 格式化 history 为日志 (如果不是停止状态)
-                steps = []
-                if history:
-                    if hasattr(history, 'steps'):
-                        steps = [extract_step_info(s, i) for i, s in enumerate(history.steps)]
-
-                execution_record.steps_completed = steps
-
-                # 自动标记已完成的任务
+            async def on_step_update(step_info):
+                try:
+                    # 处理日志（缓存后批量追加写入，前端轮询最多延迟 AI_LOG_FLUSH_INTERVAL 秒）
+                    if step_info.get('type') == 'log':
+                        log_writer.append(step_info.get('content'))
+                        await log_writer.aflush()
+                        return
+
+                    # 处理结构化的步骤事件（随日志一起写入）
+                    if step_info.get('type') == 'step':
+                        log_writer.add_event(step_info)
+                        await log_writer.aflush()
+                        return
+
+                    # 处理任务状态
+                    task_id = step_info.get('task_id')
+                    status = step_info.get('status')
+                    logger.info(f"DEBUG: on_step_update received: task_id={task_id}, status={status}")
+
+                    if task_id and status:
+                        updated = False
+                        if execution_record.planned_tasks:
+                            for task in execution_record.planned_tasks:
+                                # 确保类型一致进行比较
+                                if str(task['id']) == str(task_id):
+                                    old_status = task.get('status', 'pending')
+                                    task['status'] = status
+                                    updated = True
+                                    logger.info(f"DEBUG: Updated task {task_id} from {old_status} to {status}")
+                                    break
+                        if updated:
+                            log_writer.update(planned_tasks=execution_record.planned_tasks)
+                            await log_writer.aflush()
+                        else:
+                            logger.warning(f"DEBUG: Task ID {task_id} not found in planned_tasks: {execution_record.planned_tasks}")
+                except Exception as e:
+                    logger.error(f"更新步骤状态失败: {e}", exc_info=True)
+
+            history = run_full_process_sync(
+                execution_record.task_description,
+                analysis_callback=on_analysis_complete,
+                step_callback=on_step_update,
+                should_stop=run.astop_requested,
+                execution_mode=execution_mode,
+                enable_gif=enable_gif,  # 传递GIF录制开关
+                case_name=execution_record.task_description[:50] if execution_record.task_description else "Adhoc Task",  # 传递用例名称用于GIF文件命名
+                work_dir=run.work_dir
+            )
+
+            # 检查是否是手动停止
+            if run.stop_requested():
+                execution_record.status = 'stopped'
+                log_writer.append("\n[System] 任务已由用户停止。")
+            else:
+                # 更新成功状态
+                execution_record.status = 'passed'
+                log_writer.append("\n执行完成。")
+
+                # 记录任务完成统计信息
                 if execution_record.planned_tasks:
-                    self._auto_mark_completed_tasks(execution_record)
+                    total_tasks = len(execution_record.planned_tasks)
+                    completed_tasks = len([t for t in execution_record.planned_tasks if t.get('status') == 'completed'])
+                    pending_tasks = len([t for t in execution_record.planned_tasks if t.get('status') == 'pending'])
+                    logger.info(f"🏁 Task completion summary: {completed_tasks}/{total_tasks} tasks completed, {pending_tasks} pending")
 
-                # 处理GIF录制文件
-                self._process_gif_recording(execution_record, history)
+            execution_record.end_time = timezone.now()
+            execution_record.duration = (execution_record.end_time - execution_record.start_time).total_seconds()
 
-                execution_record.save()
+            # 格式化 history 为日志 (如果不是停止状态)
+            steps = []
+            if history:
+                if hasattr(history, 'steps'):
+                    steps = [extract_step_info(s, i) for i, s in enumerate(history.steps)]
 
-            except Exception as e:
-                execution_record.status = 'failed'
-                execution_record.end_time = timezone.now()
-                execution_record.duration = (execution_record.end_time - execution_record.start_time).total_seconds()
-                execution_record.logs += f"\n执行出错: {str(e)}"
-                execution_record.save()
-            finally:
-                # 清理停止信号
-                if execution_record.id in STOP_SIGNALS:
-                    del STOP_SIGNALS[execution_record.id]
-
-        thread = threading.Thread(target=run_task)
-        thread.daemon = True
-        thread.start()
-        
-        return Response({
-            'message': 'AI 任务开始执行',
-            'execution_id': execution_record.id
-        })
+            execution_record.steps_completed = steps
+
+            # 自动标记已完成的任务
+            if execution_record.planned_tasks:
+                self._auto_mark_completed_tasks(execution_record)
+
+            # 处理GIF录制文件
+            self._process_gif_recording(execution_record, history, run.gif_path)
+
+            # 合并日志并保存最终结果
+            log_writer.finish()
 
+        except Exception as e:
+            execution_record.status = 'failed'
+            execution_record.end_time = timezone.now()
+            execution_record.duration = (execution_record.end_time - execution_record.start_time).total_seconds()
+            log_writer.append(f"\n执行出错: {str(e)}")
+            log_writer.finish()
+        finally:
+            # 释放执行名额并删除工作目录
+            run.close()
+            # 后台生成报告和PDF
+            ai_report_cache.schedule(execution_record)
 
     @action(detail=True, methods=['post'], url_path='stop')
     def stop_task(self, request, pk=None):
         """停止正在执行的任务"""
         try:
-            execution_id = int(pk)
-            if execution_id in STOP_SIGNALS:
-                STOP_SIGNALS[execution_id] = True
-                return Response({'message': '已发送停止信号'})
-            else:
-                # 如果不在内存中，可能已经结束，或者重启过服务
-                # 尝试直接更新数据库状态
-                record = self.get_object()
-                if record.status == 'running':
-                    record.status = 'stopped'
-                    record.end_time = timezone.now()
-                    record.logs += "\n[System] 任务被强制标记为停止（未在运行队列中找到）。"
-                    record.save()
-                    return Response({'message': '任务已标记为停止'})
+            from . import ai_sessions
+
+            record = self.get_object()
+            if record.status != 'running':
                 return Response({'message': '任务不在运行中'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # 停止信号写入执行记录，任何 worker 进程中的执行都会在下一步结束时退出
+            if ai_sessions.request_stop(record.id) == 'running':
+                return Response({'message': '已发送停止信号'})
+
+            # 作业尚未开始、执行节点已失效或服务重启过，直接更新数据库状态
+            from .ai_log_writer import read_logs
+            # 合并已写入的日志行
+            record.logs = read_logs(record) + "\n[System] 任务被强制标记为停止（未在运行队列中找到）。"
+            record.status = 'stopped'
+            record.end_time = timezone.now()
+            record.save()
+            record.log_lines.all().delete()
+            return Response({'message': '任务已标记为停止'})
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def _process_gif_recording(self, execution_record, history):
+    def _process_gif_recording(self, execution_record, history, default_gif_path):
         """
         处理GIF录制文件
-        在执行完成后查找生成的GIF文件并保存路径到数据库
+        在执行完成后把本次执行工作目录中生成的GIF文件移动到 media/ai_recording，并保存路径到数据库
         """
         try:
-            import os
             from django.conf import settings
             from datetime import datetime
 
-            # browser-use 默认生成的GIF文件名（固定为agent_history.gif）
-            default_gif_path = os.path.join(os.getcwd(), 'agent_history.gif')
-
             # 如果找到GIF文件，移动到media/ai_recording目录并重命名
             if os.path.exists(default_gif_path):
                 import shutil
@@ -3326,7 +3497,7 @@ class AIExecutionRecordViewSet(viewsets.ModelViewSet):
                 timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
                 # 清理用例名称中的非法字符
                 safe_case_name = "".join([c if c.isalnum() or c in (' ', '_', '-') else '_' for c in execution_record.case_name])
-                new_gif_filename = f"{safe_case_name}_{timestamp}.gif"
+                new_gif_filename = f"{safe_case_name}_{timestamp}_{execution_record.id}.gif"
                 new_gif_path = os.path.join(gif_dir, new_gif_filename)
 
                 # 移动并重命名文件
@@ -3376,37 +3547,55 @@ class AIExecutionRecordViewSet(viewsets.ModelViewSet):
         except Exception as e:
             logger.warning(f"⚠️ Failed to auto-mark completed tasks: {e}")
 
+    def _cached_file_response(self, request, path, etag, content_type, filename=None):
+        """返回缓存的报告文件，带 ETag 和 Last-Modified，客户端缓存有效时返回 304"""
+        from django.utils.http import http_date, parse_http_date_safe
+
+        mtime = int(os.path.getmtime(path))
+        if_none_match = request.headers.get('If-None-Match')
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+        if if_none_match == etag or (if_none_match is None and if_modified_since and mtime <= if_modified_since):
+            response = HttpResponse(status=304)
+        elif filename:
+            response = FileResponse(open(path, 'rb'), content_type=content_type, as_attachment=True, filename=filename)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(mtime)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
     @action(detail=True, methods=['get'], url_path='report')
     def generate_report(self, request, pk=None):
         """
         生成AI执行报告
 
+        已结束的执行记录的报告只生成一次并缓存在 AI_REPORT_ROOT，之后直接读取文件返回
+
         Query Parameters:
             report_type: 报告类型 (summary/detailed/performance)，默认为 summary
 
         Returns:
             执行报告数据
         """
+        from . import ai_report_cache
+
         try:
             record = self.get_object()
             report_type = request.query_params.get('report_type', 'summary')
+            if report_type not in ai_report_cache.REPORT_TYPES:
+                report_type = 'summary'
 
-            # 导入报告生成器
-            from .reports import AIExecutionReportGenerator
-
-            # 生成报告
-            generator = AIExecutionReportGenerator(record)
-
-            if report_type == 'detailed':
-                report = generator.generate_detailed_report()
-            elif report_type == 'performance':
-                report = generator.generate_performance_report()
-            else:  # summary
-                report = generator.generate_summary_report()
+            if ai_report_cache.is_terminal(record):
+                path = ai_report_cache.report_json(record, report_type)
+                return self._cached_file_response(
+                    request, path, ai_report_cache.etag(record, report_type, 'json'), 'application/json'
+                )
 
+            # 执行中的记录实时生成
             return Response({
                 'success': True,
-                'data': report,
+                'data': ai_report_cache.build_report(record, report_type),
                 'report_type': report_type
             })
 
@@ -3422,41 +3611,47 @@ class AIExecutionRecordViewSet(viewsets.ModelViewSet):
         """
         导出AI执行报告为PDF
 
+        已结束的执行记录的PDF在执行结束后由后台作业生成，之后直接读取文件返回
+
         Query Parameters:
             report_type: 报告类型 (summary/detailed/performance)，默认为 summary
+            async: 为 1 时PDF尚未生成则提交后台作业并返回 202 和生成进度，不在请求中生成
 
         Returns:
             PDF文件下载
         """
+        from . import ai_report_cache
+        from .pdf_generator import AIReportPDFGenerator
+
         try:
             record = self.get_object()
             report_type = request.query_params.get('report_type', 'summary')
-
-            # 导入报告生成器
-            from .reports import AIExecutionReportGenerator
-            from .pdf_generator import AIReportPDFGenerator
-
-            # 生成报告数据
-            generator = AIExecutionReportGenerator(record)
-
-            if report_type == 'detailed':
-                report_data = generator.generate_detailed_report()
-            elif report_type == 'performance':
-                report_data = generator.generate_performance_report()
-            else:  # summary
-                report_data = generator.generate_summary_report()
-
-            # 生成PDF
-            pdf_generator = AIReportPDFGenerator(report_data, report_type)
-            pdf_buffer = pdf_generator.generate()
+            if report_type not in ai_report_cache.REPORT_TYPES:
+                report_type = 'summary'
 
             # 生成文件名
             from datetime import datetime
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+            timestamp = (record.end_time or timezone.now()).strftime('%Y%m%d%H%M%S')
             safe_case_name = "".join([c if c.isalnum() or c in (' ', '_', '-') else '_' for c in record.case_name])
             filename = f"AI_Report_{safe_case_name}_{timestamp}.pdf"
 
-            # 返回PDF文件
+            if ai_report_cache.is_terminal(record):
+                path = ai_report_cache.artifact_path(record, report_type, 'pdf')
+                if not os.path.exists(path) and request.query_params.get('async') == '1':
+                    job_record = ai_report_cache.schedule(record)
+                    return Response({
+                        'success': True,
+                        'status': 'generating',
+                        'job_id': job_record.id if job_record else None,
+                        'progress': ai_report_cache.progress(record)
+                    }, status=status.HTTP_202_ACCEPTED)
+                path = ai_report_cache.report_pdf(record, report_type)
+                return self._cached_file_response(
+                    request, path, ai_report_cache.etag(record, report_type, 'pdf'), 'application/pdf', filename
+                )
+
+            # 执行中的记录实时生成
+            pdf_buffer = AIReportPDFGenerator(ai_report_cache.build_report(record, report_type), report_type).generate()
             response = HttpResponse(
                 pdf_buffer.getvalue(),
                 content_type='application/pdf'
@@ -3479,6 +3674,17 @@ class AIExecutionRecordViewSet(viewsets.ModelViewSet):
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=True, methods=['get'], url_path='report-status')
+    def report_status(self, request, pk=None):
+        """报告和PDF的生成进度，build=1 时为已结束但尚未生成完的记录提交后台作业"""
+        from . import ai_report_cache
+
+        record = self.get_object()
+        progress = ai_report_cache.progress(record)
+        if progress['terminal'] and not progress['ready'] and request.query_params.get('build') == '1':
+            ai_report_cache.schedule(record)
+        return Response(progress)
+
 
 class UiDashboardViewSet(viewsets.ViewSet):
     """UI自动化仪表盘视图集"""
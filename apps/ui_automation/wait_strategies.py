@@ -0,0 +1,417 @@
+"""
+UI步骤执行的等待策略
+
+执行器原来在操作之后固定等待（点击后 800ms、输入/悬停后 300ms、打开首页后 2~3 秒、切换标签页后 1.5 秒等），
+页面已经稳定时白白浪费时间，页面较慢时又可能等不够。等待策略把这些固定等待换成基于条件的等待：
+
+- fixed：保持原来的固定等待时长
+- smart：条件满足即返回，超过 UI_WAIT_MAX_MS 仍未满足时继续执行
+    - DOM 静默：UI_WAIT_DOM_QUIET_MS 毫秒内没有 DOM 变更
+    - 网络空闲：UI_WAIT_NETWORK_IDLE_MS 毫秒内没有进行中（或新完成）的请求
+    - 元素稳定：元素的位置和大小在连续几次检查中不变
+    - 框架钩子：Element Plus 下拉框展开/收起动画结束
+
+策略可以在项目（UiProject.wait_strategy）和步骤（TestCaseStep.wait_strategy）上配置，步骤的配置优先。
+每次等待的实际耗时记录在 records 中，由执行器写入步骤结果的 waits 字段。
+
+套件执行器（test_executor）使用 PlaywrightWaiter / SeleniumWaiter，单用例调试和定时任务使用的
+执行引擎（playwright_engine 的异步 API、selenium_engine）分别使用 AsyncPlaywrightWaiter / SeleniumWaiter。
+"""
+import logging
+import platform
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 以下脚本都返回 Promise<boolean>：条件满足为 true，超时为 false
+# 页面级脚本接收一个数组参数，元素级脚本接收 (元素, 超时毫秒)
+
+DOM_QUIET_JS = """
+([quietMs, timeoutMs]) => new Promise(resolve => {
+    const start = performance.now();
+    let last = start;
+    const observer = new MutationObserver(() => { last = performance.now(); });
+    observer.observe(document.documentElement || document, {
+        childList: true, subtree: true, attributes: true, characterData: true
+    });
+    const check = () => {
+        const now = performance.now();
+        if (now - last >= quietMs || now - start >= timeoutMs) {
+            observer.disconnect();
+            resolve(now - last >= quietMs);
+        } else {
+            setTimeout(check, 50);
+        }
+    };
+    setTimeout(check, 50);
+})
+"""
+
+NETWORK_IDLE_JS = """
+([idleMs, timeoutMs]) => new Promise(resolve => {
+    const start = performance.now();
+    // 从最近一次请求完成的时间开始计算空闲时长
+    let last = 0;
+    for (const entry of performance.getEntriesByType('resource')) {
+        last = Math.max(last, entry.responseEnd);
+    }
+    const observer = new PerformanceObserver(() => { last = performance.now(); });
+    observer.observe({ type: 'resource' });
+    const check = () => {
+        const now = performance.now();
+        const idle = document.readyState === 'complete' && now - last >= idleMs;
+        if (idle || now - start >= timeoutMs) {
+            observer.disconnect();
+            resolve(idle);
+        } else {
+            setTimeout(check, 50);
+        }
+    };
+    check();
+})
+"""
+
+ELEMENT_STABLE_JS = """
+(el, timeoutMs) => new Promise(resolve => {
+    const start = performance.now();
+    let last = null;
+    let stableChecks = 0;
+    const check = () => {
+        if (!el.isConnected) return resolve(false);
+        const r = el.getBoundingClientRect();
+        const key = [r.x, r.y, r.width, r.height].join(',');
+        stableChecks = key === last ? stableChecks + 1 : 0;
+        last = key;
+        if (stableChecks >= 2) resolve(true);
+        else if (performance.now() - start >= timeoutMs) resolve(false);
+        else setTimeout(check, 30);
+    };
+    check();
+})
+"""
+
+ELEMENT_PLUS_DROPDOWN_JS = """
+([open, timeoutMs]) => new Promise(resolve => {
+    const start = performance.now();
+    const visible = el => {
+        const style = getComputedStyle(el);
+        const rect = el.getBoundingClientRect();
+        return style.display !== 'none' && style.visibility !== 'hidden' && rect.width > 0 && rect.height > 0;
+    };
+    const animating = el => el.getAnimations
+        ? el.getAnimations({ subtree: true }).some(a => a.playState === 'running')
+        : false;
+    const check = () => {
+        const dropdowns = Array.from(
+            document.querySelectorAll('.el-select-dropdown, .el-select__popper')
+        ).filter(visible);
+        const done = open
+            ? dropdowns.length > 0 && !dropdowns.some(animating)
+            : dropdowns.length === 0;
+        if (done) resolve(true);
+        else if (performance.now() - start >= timeoutMs) resolve(false);
+        else setTimeout(check, 30);
+    };
+    check();
+})
+"""
+
+# 框架钩子：名称 -> (页面级脚本, 参数前缀)
+FRAMEWORK_HOOKS = {
+    'element_plus.dropdown_open': (ELEMENT_PLUS_DROPDOWN_JS, [True]),
+    'element_plus.dropdown_closed': (ELEMENT_PLUS_DROPDOWN_JS, [False]),
+}
+
+
+def _navigation_extra_wait():
+    """fixed 策略下打开页面后的额外等待（秒），服务器无头模式需要更长时间"""
+    return 3 if platform.system() == 'Linux' else 2
+
+
+class BaseWaiter:
+    """等待策略基类，子类实现 _sleep / _evaluate / _evaluate_element 三个原语"""
+
+    def __init__(self, strategy=None):
+        self.strategy = strategy or 'smart'
+        self.records = []
+
+    @property
+    def max_ms(self):
+        return getattr(settings, 'UI_WAIT_MAX_MS', 5000)
+
+    @property
+    def dom_quiet_ms(self):
+        return getattr(settings, 'UI_WAIT_DOM_QUIET_MS', 300)
+
+    @property
+    def network_idle_ms(self):
+        return getattr(settings, 'UI_WAIT_NETWORK_IDLE_MS', 500)
+
+    def drain(self):
+        """取出并清空已记录的等待"""
+        records, self.records = self.records, []
+        return records
+
+    def _sleep(self, target, ms):
+        raise NotImplementedError
+
+    def _evaluate(self, target, js, arg):
+        raise NotImplementedError
+
+    def _evaluate_element(self, element, js, timeout_ms):
+        raise NotImplementedError
+
+    def _wait(self, name, target, fixed_ms, condition, strategy=None):
+        """执行一次等待并记录耗时
+
+        fixed 策略固定等待 fixed_ms；smart 策略调用 condition()，
+        条件检查出错（如页面正在跳转导致执行上下文销毁）时退回固定等待。
+        """
+        strategy = strategy or self.strategy
+        start = time.monotonic()
+        satisfied = True
+        if strategy == 'fixed':
+            self._sleep(target, fixed_ms)
+        else:
+            try:
+                satisfied = bool(condition())
+            except Exception as e:
+                logger.debug(f"等待条件 {name} 检查失败，改为固定等待: {e}")
+                satisfied = False
+                self._sleep(target, fixed_ms)
+        return self._record(name, strategy, start, satisfied)
+
+    def _record(self, name, strategy, start, satisfied):
+        duration_ms = int((time.monotonic() - start) * 1000)
+        self.records.append({
+            'wait': name,
+            'strategy': strategy,
+            'duration_ms': duration_ms,
+            'satisfied': satisfied,
+        })
+        return satisfied
+
+    def _dom_quiet(self, target):
+        return self._evaluate(target, DOM_QUIET_JS, [self.dom_quiet_ms, self.max_ms])
+
+    def _network_idle(self, target):
+        return self._evaluate(target, NETWORK_IDLE_JS, [self.network_idle_ms, self.max_ms])
+
+    def _hook(self, target, name):
+        js, args = FRAMEWORK_HOOKS[name]
+        return self._evaluate(target, js, args + [self.max_ms])
+
+    def after_action(self, target, action_type, strategy=None):
+        """点击/输入/悬停之后等待页面稳定（原固定等待：点击 800ms，其他 300ms）"""
+        fixed_ms = 800 if action_type == 'click' else 300
+        return self._wait(f'after_{action_type}', target, fixed_ms,
+                          lambda: self._dom_quiet(target), strategy)
+
+    def page_settled(self, target, strategy=None):
+        """页面（如新打开的标签页）加载后等待网络空闲和 DOM 静默（原固定等待 1500ms）"""
+        return self._wait('page_settled', target, 1500,
+                          lambda: self._network_idle(target) and self._dom_quiet(target), strategy)
+
+    def dropdown_open(self, target, strategy=None):
+        """等待 Element Plus 下拉框展开动画结束（原固定等待 800ms）"""
+        return self._wait('dropdown_open', target, 800,
+                          lambda: self._hook(target, 'element_plus.dropdown_open'), strategy)
+
+    def dropdown_closed(self, target, strategy=None):
+        """等待 Element Plus 下拉框收起（原固定等待 500ms）"""
+        return self._wait('dropdown_closed', target, 500,
+                          lambda: self._hook(target, 'element_plus.dropdown_closed'), strategy)
+
+    def element_stable(self, target, element, strategy=None):
+        """等待元素位置和大小稳定，如滚动或动画之后（原固定等待 300ms）"""
+        return self._wait('element_stable', target, 300,
+                          lambda: self._evaluate_element(element, ELEMENT_STABLE_JS, self.max_ms), strategy)
+
+    def dom_settled(self, target, fixed_ms, strategy=None):
+        """等待 DOM 静默，如元素过期（stale）后重新定位之前"""
+        return self._wait('dom_settled', target, fixed_ms,
+                          lambda: self._dom_quiet(target), strategy)
+
+
+class PlaywrightWaiter(BaseWaiter):
+    """Playwright 同步 API 的等待策略，target 为 Page"""
+
+    def _sleep(self, page, ms):
+        # 使用 wait_for_timeout 而不是 time.sleep，等待期间 Playwright 仍能处理页面事件
+        page.wait_for_timeout(ms)
+
+    def _evaluate(self, page, js, arg):
+        return page.evaluate(js, arg)
+
+    def _evaluate_element(self, locator, js, timeout_ms):
+        return locator.evaluate(js, timeout_ms)
+
+    def navigate(self, page, url, strategy=None):
+        """打开页面并等待页面就绪
+
+        fixed：等待 networkidle 后再固定等待 2~3 秒；
+        smart：等待 DOMContentLoaded 后，跟踪页面请求直到 UI_WAIT_NETWORK_IDLE_MS 毫秒内没有进行中的请求，再等待 DOM 静默。
+        """
+        strategy = strategy or self.strategy
+        if strategy == 'fixed':
+            page.goto(url, wait_until='networkidle', timeout=30000)
+            return self._wait('navigate', page, _navigation_extra_wait() * 1000, None, strategy)
+
+        inflight = set()
+
+        def on_request(request):
+            inflight.add(request)
+
+        def on_done(request):
+            inflight.discard(request)
+
+        page.on('request', on_request)
+        page.on('requestfinished', on_done)
+        page.on('requestfailed', on_done)
+        try:
+            page.goto(url, wait_until='domcontentloaded', timeout=30000)
+            return self._wait('navigate', page, _navigation_extra_wait() * 1000,
+                              lambda: self._track_network_idle(page, inflight) and self._dom_quiet(page),
+                              strategy)
+        finally:
+            page.remove_listener('request', on_request)
+            page.remove_listener('requestfinished', on_done)
+            page.remove_listener('requestfailed', on_done)
+
+    def _track_network_idle(self, page, inflight):
+        deadline = time.monotonic() + self.max_ms / 1000
+        idle_since = None
+        while True:
+            now = time.monotonic()
+            if inflight:
+                idle_since = None
+            elif idle_since is None:
+                idle_since = now
+            elif (now - idle_since) * 1000 >= self.network_idle_ms:
+                return True
+            if now >= deadline:
+                return False
+            # 等待期间 Playwright 分发 request / requestfinished 事件
+            page.wait_for_timeout(50)
+
+
+class AsyncPlaywrightWaiter(BaseWaiter):
+    """Playwright 异步 API 的等待策略，target 为 Page，等待方法都要 await"""
+
+    async def _sleep(self, page, ms):
+        await page.wait_for_timeout(ms)
+
+    async def _evaluate(self, page, js, arg):
+        return await page.evaluate(js, arg)
+
+    async def _evaluate_element(self, locator, js, timeout_ms):
+        return await locator.evaluate(js, timeout_ms)
+
+    async def _wait(self, name, target, fixed_ms, condition, strategy=None):
+        strategy = strategy or self.strategy
+        start = time.monotonic()
+        satisfied = True
+        if strategy == 'fixed':
+            await self._sleep(target, fixed_ms)
+        else:
+            try:
+                satisfied = bool(await condition())
+            except Exception as e:
+                logger.debug(f"等待条件 {name} 检查失败，改为固定等待: {e}")
+                satisfied = False
+                await self._sleep(target, fixed_ms)
+        return self._record(name, strategy, start, satisfied)
+
+    def page_settled(self, target, strategy=None):
+        async def condition():
+            return await self._network_idle(target) and await self._dom_quiet(target)
+        return self._wait('page_settled', target, 1500, condition, strategy)
+
+    async def navigate(self, page, url, strategy=None):
+        """打开页面并等待页面就绪，等待方式同 PlaywrightWaiter.navigate"""
+        strategy = strategy or self.strategy
+        if strategy == 'fixed':
+            await page.goto(url, wait_until='networkidle', timeout=30000)
+            return await self._wait('navigate', page, _navigation_extra_wait() * 1000, None, strategy)
+
+        inflight = set()
+
+        def on_request(request):
+            inflight.add(request)
+
+        def on_done(request):
+            inflight.discard(request)
+
+        page.on('request', on_request)
+        page.on('requestfinished', on_done)
+        page.on('requestfailed', on_done)
+        try:
+            await page.goto(url, wait_until='domcontentloaded', timeout=30000)
+
+            async def condition():
+                return await self._track_network_idle(page, inflight) and await self._dom_quiet(page)
+            return await self._wait('navigate', page, _navigation_extra_wait() * 1000, condition, strategy)
+        finally:
+            page.remove_listener('request', on_request)
+            page.remove_listener('requestfinished', on_done)
+            page.remove_listener('requestfailed', on_done)
+
+    async def _track_network_idle(self, page, inflight):
+        deadline = time.monotonic() + self.max_ms / 1000
+        idle_since = None
+        while True:
+            now = time.monotonic()
+            if inflight:
+                idle_since = None
+            elif idle_since is None:
+                idle_since = now
+            elif (now - idle_since) * 1000 >= self.network_idle_ms:
+                return True
+            if now >= deadline:
+                return False
+            await page.wait_for_timeout(50)
+
+
+class SeleniumWaiter(BaseWaiter):
+    """Selenium 的等待策略，target 为 WebDriver"""
+
+    # 把返回 Promise 的函数包装成 execute_async_script 脚本
+    _ASYNC_WRAPPER = (
+        "const done = arguments[arguments.length - 1];"
+        "const args = Array.prototype.slice.call(arguments, 0, -1);"
+        "Promise.resolve(({js})(...args)).then(done, () => done(false));"
+    )
+
+    def _script(self, js):
+        return self._ASYNC_WRAPPER.replace('{js}', js.strip())
+
+    def _sleep(self, driver, ms):
+        time.sleep(ms / 1000)
+
+    def _evaluate(self, driver, js, arg):
+        return driver.execute_async_script(self._script(js), arg)
+
+    def _evaluate_element(self, element, js, timeout_ms):
+        return element.parent.execute_async_script(self._script(js), element, timeout_ms)
+
+    def navigate(self, driver, url, strategy=None):
+        """打开页面并等待页面就绪
+
+        fixed：等待 document.readyState 为 complete 后再固定等待 2~3 秒；
+        smart：driver.get 返回后等待网络空闲（按资源加载记录判断）和 DOM 静默。
+        """
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        strategy = strategy or self.strategy
+        driver.get(url)
+        if strategy == 'fixed':
+            try:
+                WebDriverWait(driver, 15 if platform.system() == 'Linux' else 10).until(
+                    lambda d: d.execute_script("return document.readyState") == "complete"
+                )
+            except Exception:
+                pass  # 即使超时也继续执行
+        return self._wait('navigate', driver, _navigation_extra_wait() * 1000,
+                          lambda: self._network_idle(driver) and self._dom_quiet(driver), strategy)
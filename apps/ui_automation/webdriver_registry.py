@@ -0,0 +1,143 @@
+"""
+Selenium WebDriver 驱动注册表
+
+创建 Selenium 会话时原来每次都调用 ChromeDriverManager().install() 等方法，
+webdriver_manager 每次都要执行命令查询本机浏览器版本，缓存未命中时还会访问网络下载驱动，耗时数秒。
+
+注册表把解析结果（驱动路径、驱动版本、浏览器版本）保存在 UI_WEBDRIVER_REGISTRY 文件中：
+
+- python manage.py download_webdrivers 预先解析并写入注册表
+- 注册表中没有对应浏览器、驱动文件已不存在或与 UI_WEBDRIVER_VERSIONS 中固定的版本不一致时，
+  首次使用时解析一次并写回注册表，同一进程内不再重复解析
+- 已登记的浏览器直接使用登记的驱动路径启动，不再检查浏览器安装和版本
+"""
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 浏览器 -> (驱动管理器, 指定驱动版本的参数名, webdriver_manager 中的浏览器类型)
+DRIVER_MANAGERS = {
+    'chrome': ('webdriver_manager.chrome.ChromeDriverManager', 'driver_version', 'google-chrome'),
+    'firefox': ('webdriver_manager.firefox.GeckoDriverManager', 'version', 'firefox'),
+    'edge': ('webdriver_manager.microsoft.EdgeChromiumDriverManager', 'version', 'edge'),
+}
+
+_registry = None
+_lock = threading.Lock()
+# 同一时间只解析一次，避免并行的执行线程重复下载驱动
+_resolve_lock = threading.Lock()
+
+
+def _registry_path():
+    return settings.UI_WEBDRIVER_REGISTRY
+
+
+def _pinned_version(browser):
+    return (getattr(settings, 'UI_WEBDRIVER_VERSIONS', {}) or {}).get(browser) or None
+
+
+def _load():
+    global _registry
+    if _registry is None:
+        try:
+            with open(_registry_path(), encoding='utf-8') as f:
+                _registry = json.load(f)
+        except FileNotFoundError:
+            _registry = {}
+        except Exception as e:
+            logger.warning(f"读取 WebDriver 注册表失败，重新解析驱动: {e}")
+            _registry = {}
+    return _registry
+
+
+def _save():
+    path = _registry_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_registry, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _version_of(command):
+    """执行 `<command> --version`，返回其中的版本号"""
+    try:
+        output = subprocess.run([command, '--version'], capture_output=True, text=True, timeout=10).stdout
+    except Exception:
+        return None
+    match = re.search(r'\d+(\.\d+)+', output or '')
+    return match.group(0) if match else None
+
+
+def _valid(entry, browser):
+    if not entry or not os.path.isfile(entry.get('driver_path', '')):
+        return False
+    pinned = _pinned_version(browser)
+    return pinned is None or entry.get('driver_version') == pinned
+
+
+def resolve(browser):
+    """解析浏览器对应的驱动（必要时下载）并写入注册表，返回登记的信息"""
+    from django.utils.module_loading import import_string
+    from webdriver_manager.core.os_manager import OperationSystemManager
+
+    manager_path, version_arg, browser_type = DRIVER_MANAGERS[browser]
+    pinned = _pinned_version(browser)
+    manager = import_string(manager_path)(**({version_arg: pinned} if pinned else {}))
+    driver_path = manager.install()
+    try:
+        browser_version = OperationSystemManager().get_browser_version_from_os(browser_type)
+    except Exception:
+        browser_version = None
+    entry = {
+        'driver_path': driver_path,
+        'driver_version': pinned or _version_of(driver_path),
+        'browser_version': browser_version,
+        'resolved_at': timezone.now().isoformat(),
+    }
+    with _lock:
+        _load()[browser] = entry
+        _save()
+    logger.info(f"WebDriver 已登记: {browser} 驱动 {entry['driver_version']}，浏览器 {browser_version}")
+    return entry
+
+
+def is_registered(browser):
+    """浏览器的驱动已登记且可用（已登记的浏览器启动前不再检查安装）"""
+    with _lock:
+        return _valid(_load().get(browser), browser)
+
+
+def driver_path(browser):
+    """浏览器对应的驱动路径，未登记时解析一次"""
+    with _lock:
+        entry = _load().get(browser)
+        if _valid(entry, browser):
+            return entry['driver_path']
+    with _resolve_lock:
+        # 等待期间可能已由其他线程解析完成
+        with _lock:
+            entry = _load().get(browser)
+            if _valid(entry, browser):
+                return entry['driver_path']
+        return resolve(browser)['driver_path']
+
+
+def entries():
+    with _lock:
+        return dict(_load())
+
+
+def reset():
+    """清除进程内缓存，下次使用时重新读取注册表文件"""
+    global _registry
+    with _lock:
+        _registry = None
@@ -1,2 +1,5 @@
 import pymysql
-pymysql.install_as_MySQLdb()
\ No newline at end of file
+pymysql.install_as_MySQLdb()
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -0,0 +1,17 @@
+"""
+Celery 应用
+
+启动各队列的 worker（并发数按机器资源调整）：
+    celery -A backend worker -Q default,api -c 4 -n api@%h
+    celery -A backend worker -Q ui -c 2 -n ui@%h
+    celery -A backend worker -Q ai -c 2 -n ai@%h
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+app = Celery('backend')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
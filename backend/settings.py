@@ -260,6 +260,120 @@ SPECTACULAR_SETTINGS = {
 # Celery Configuration
 CELERY_BROKER_URL = config('REDIS_URL', default='redis://:1234@127.0.0.1:6379/0')
 CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://:1234@127.0.0.1:6379/0')
+CELERY_TASK_ACKS_LATE = True  # worker执行完成后才确认，worker崩溃时作业会被重新投递
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # 测试执行耗时较长，每个worker进程一次只取一个作业
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+
+# 后台作业队列（apps.core.job_queue）
+# thread: 在Web进程内用线程池执行；celery: 由Celery worker执行；eager: 立即同步执行（测试用）
+JOB_BACKEND = config('JOB_BACKEND', default='thread')
+# 各队列的并发上限（thread后端使用；celery后端由各队列worker的 -c 参数控制）
+JOB_QUEUES = {
+    'default': config('JOB_DEFAULT_CONCURRENCY', default=2, cast=int),
+    'api': config('JOB_API_CONCURRENCY', default=4, cast=int),
+    'ui': config('JOB_UI_CONCURRENCY', default=2, cast=int),
+    'ai': config('JOB_AI_CONCURRENCY', default=2, cast=int),
+}
+# 作业租约时长（秒），执行节点每隔三分之一租约续约一次，租约过期的作业由调度器重新提交
+JOB_LEASE_SECONDS = config('JOB_LEASE_SECONDS', default=60, cast=int)
+# 排队中/等待重试的作业超过计划执行时间多少秒仍未开始时重新提交（thread后端进程重启后接管未执行的作业）
+JOB_RECOVER_GRACE_SECONDS = config('JOB_RECOVER_GRACE_SECONDS', default=300, cast=int)
+
+# 定时任务调度器（run_all_scheduled_tasks）
+# 任务变更时Web进程向该UDP地址发送唤醒消息，调度器部署在其他主机时改为调度器所在地址，留空则不发送
+SCHEDULER_WAKEUP_ADDRESS = config('SCHEDULER_WAKEUP_ADDRESS', default='127.0.0.1:8765')
+# 全量同步间隔（秒），用于兜底丢失的唤醒消息，0 表示只在启动时同步
+SCHEDULER_RESYNC_INTERVAL = config('SCHEDULER_RESYNC_INTERVAL', default=600, cast=int)
+
+# 进度事件通道（apps.core.event_broker），用于SSE推送
+# memory: 进程内，发布者和SSE连接需在同一进程；redis: 基于Redis Stream，支持多进程部署
+EVENT_BROKER_BACKEND = config('EVENT_BROKER_BACKEND', default='memory')
+EVENT_BROKER_REDIS_URL = config('EVENT_BROKER_REDIS_URL', default=config('REDIS_URL', default='redis://:1234@127.0.0.1:6379/0'))
+EVENT_BROKER_MAX_EVENTS = config('EVENT_BROKER_MAX_EVENTS', default=20000, cast=int)  # 每个频道保留的事件数，用于断点续传
+EVENT_BROKER_TTL = config('EVENT_BROKER_TTL', default=600, cast=int)  # 频道结束或无活动后保留的秒数
+# SSE连接无新事件时，每隔多少秒从数据库检查点补齐一次
+SSE_IDLE_TIMEOUT = config('SSE_IDLE_TIMEOUT', default=5, cast=int)
+# 用例生成的流式内容写入数据库的间隔（秒）
+GENERATION_CHECKPOINT_INTERVAL = config('GENERATION_CHECKPOINT_INTERVAL', default=2, cast=float)
+
+# 大模型调用网关（apps.requirement_analysis.llm_gateway）
+LLM_MAX_CONCURRENCY = config('LLM_MAX_CONCURRENCY', default=8, cast=int)  # 进程内同时进行的调用数上限
+LLM_PROVIDER_MAX_CONCURRENCY = config('LLM_PROVIDER_MAX_CONCURRENCY', default=4, cast=int)  # 每种模型类型（服务商）的并发上限
+LLM_MAX_CONNECTIONS_PER_MODEL = config('LLM_MAX_CONNECTIONS_PER_MODEL', default=10, cast=int)  # 每个模型配置的连接池大小
+LLM_MAX_RETRIES = config('LLM_MAX_RETRIES', default=3, cast=int)  # 429/5xx/连接失败的最大重试次数
+LLM_RETRY_BACKOFF = config('LLM_RETRY_BACKOFF', default=2.0, cast=float)  # 首次重试的等待秒数，之后按指数退避
+# 大模型响应缓存（apps.requirement_analysis.llm_cache），留空关闭；db: 数据库表，file: LLM_CACHE_DIR 目录
+LLM_CACHE_BACKEND = config('LLM_CACHE_BACKEND', default='')
+LLM_CACHE_DIR = config('LLM_CACHE_DIR', default=os.path.join(BASE_DIR, 'cache', 'llm'))
+LLM_CACHE_TTL = config('LLM_CACHE_TTL', default=86400, cast=int)  # 缓存有效期（秒）
+LLM_CACHE_MAX_ENTRIES = config('LLM_CACHE_MAX_ENTRIES', default=1000, cast=int)  # 超出后淘汰最久未使用的条目
+LLM_CACHE_MAX_TEMPERATURE = config('LLM_CACHE_MAX_TEMPERATURE', default=0.0, cast=float)  # 只缓存不高于该温度的调用
+
+# API测试套件并行执行的全局并发上限（套件自身的 max_concurrency 不会超过该值）
+API_SUITE_MAX_WORKERS = config('API_SUITE_MAX_WORKERS', default=20, cast=int)
+
+# API请求执行的HTTP连接池配置（每个执行环境一个会话）
+API_HTTP_POOL_CONNECTIONS = config('API_HTTP_POOL_CONNECTIONS', default=20, cast=int)  # 缓存的主机连接池数量
+API_HTTP_POOL_MAXSIZE = config('API_HTTP_POOL_MAXSIZE', default=20, cast=int)  # 每个主机的最大连接数
+API_HTTP_POOL_BLOCK = config('API_HTTP_POOL_BLOCK', default=True, cast=bool)  # 连接数达到上限时等待而不是新建
+
+# UI自动化 Playwright 浏览器池（apps.ui_automation.browser_pool），每个执行线程复用常驻浏览器
+BROWSER_POOL_ENABLED = config('BROWSER_POOL_ENABLED', default=True, cast=bool)  # 关闭后每个用例单独启动浏览器
+BROWSER_POOL_MAX_CONTEXTS = config('BROWSER_POOL_MAX_CONTEXTS', default=50, cast=int)  # 浏览器创建多少个上下文后重启
+BROWSER_POOL_IDLE_TIMEOUT = config('BROWSER_POOL_IDLE_TIMEOUT', default=300, cast=int)  # 空闲超过该秒数的浏览器在下次取用时关闭
+# UI自动化 Selenium 会话池（apps.ui_automation.selenium_pool），进程内复用 WebDriver 会话
+SELENIUM_POOL_ENABLED = config('SELENIUM_POOL_ENABLED', default=True, cast=bool)  # 关闭后每次执行单独启动浏览器
+SELENIUM_POOL_MAX_SESSIONS = config('SELENIUM_POOL_MAX_SESSIONS', default=4, cast=int)  # 进程内同时存在的会话数上限（使用中 + 空闲）
+SELENIUM_POOL_MAX_AGE = config('SELENIUM_POOL_MAX_AGE', default=1800, cast=int)  # 会话创建超过该秒数后关闭
+SELENIUM_POOL_MAX_USES = config('SELENIUM_POOL_MAX_USES', default=50, cast=int)  # 会话被取用多少次后关闭
+SELENIUM_POOL_IDLE_TIMEOUT = config('SELENIUM_POOL_IDLE_TIMEOUT', default=300, cast=int)  # 空闲超过该秒数的会话在下次取用时关闭
+SELENIUM_POOL_ACQUIRE_TIMEOUT = config('SELENIUM_POOL_ACQUIRE_TIMEOUT', default=300, cast=int)  # 会话数达到上限时等待归还的最长秒数
+UI_SUITE_MAX_WORKERS = config('UI_SUITE_MAX_WORKERS', default=4, cast=int)  # 套件并行执行用例的线程数上限（每个线程各自驱动一个浏览器）
+UI_RECORDER_FLUSH_INTERVAL = config('UI_RECORDER_FLUSH_INTERVAL', default=2, cast=float)  # 套件执行中用例执行记录批量写入数据库的间隔（秒）
+UI_RECORDER_FLUSH_RETRIES = config('UI_RECORDER_FLUSH_RETRIES', default=3, cast=int)  # 执行结束时写入失败（如死锁）的重试次数
+
+# AI执行日志缓冲写入（apps.ui_automation.ai_log_writer）和报告缓存（apps.ui_automation.ai_report_cache）
+AI_LOG_FLUSH_INTERVAL = config('AI_LOG_FLUSH_INTERVAL', default=1, cast=float)  # AI执行日志追加写入数据库的间隔（秒）
+AI_LOG_FLUSH_BYTES = config('AI_LOG_FLUSH_BYTES', default=4096, cast=int)  # 缓存的日志超过该字节数时立即写入
+AI_REPORT_ROOT = config('AI_REPORT_ROOT', default=os.path.join(MEDIA_ROOT, 'ai_reports'))  # 已结束的AI执行记录的报告和PDF缓存目录
+
+# AI浏览器代理并发执行（apps.ui_automation.ai_sessions）
+AI_AGENT_MAX_SESSIONS = config('AI_AGENT_MAX_SESSIONS', default=2, cast=int)  # 每个进程同时执行的AI代理数上限（每个代理一个浏览器）
+AI_RUN_ROOT = config('AI_RUN_ROOT', default=os.path.join(BASE_DIR, 'cache', 'ai_runs'))  # 每次AI执行的工作目录（GIF录制、浏览器用户数据），执行结束后删除
+
+# AI浏览器代理的模型配置缓存（apps.ui_automation.ai_llm）
+AI_LLM_CONFIG_TTL = config('AI_LLM_CONFIG_TTL', default=60, cast=int)  # 模型配置在进程内的缓存时间（秒），本进程修改配置时立即刷新
+
+# Selenium WebDriver 驱动注册表（apps.ui_automation.webdriver_registry），由 download_webdrivers 命令或首次使用时写入
+UI_WEBDRIVER_REGISTRY = config('UI_WEBDRIVER_REGISTRY', default=os.path.join(BASE_DIR, 'cache', 'webdrivers.json'))
+# 固定的驱动版本，为空时使用与本机浏览器匹配的版本
+UI_WEBDRIVER_VERSIONS = {
+    'chrome': config('UI_CHROMEDRIVER_VERSION', default=''),
+    'firefox': config('UI_GECKODRIVER_VERSION', default=''),
+    'edge': config('UI_EDGEDRIVER_VERSION', default=''),
+}
+
+# UI自动化智能等待（apps.ui_automation.wait_strategies），项目或步骤的等待策略为 smart 时生效
+UI_WAIT_MAX_MS = config('UI_WAIT_MAX_MS', default=5000, cast=int)  # 单次等待的最长时间，超时后继续执行
+UI_WAIT_DOM_QUIET_MS = config('UI_WAIT_DOM_QUIET_MS', default=300, cast=int)  # 多长时间没有 DOM 变更视为页面稳定
+UI_WAIT_NETWORK_IDLE_MS = config('UI_WAIT_NETWORK_IDLE_MS', default=500, cast=int)  # 多长时间没有网络请求视为网络空闲
+
+# UI自动化截图存储（apps.ui_automation.screenshot_store），执行记录中只保存截图引用
+UI_SCREENSHOT_STORAGE = config('UI_SCREENSHOT_STORAGE', default='')  # Django Storage 类路径，为空时保存到 UI_SCREENSHOT_ROOT
+UI_SCREENSHOT_ROOT = config('UI_SCREENSHOT_ROOT', default=os.path.join(MEDIA_ROOT, 'ui_screenshots'))
+UI_SCREENSHOT_FORMAT = config('UI_SCREENSHOT_FORMAT', default='webp')  # webp / jpeg / png
+UI_SCREENSHOT_QUALITY = config('UI_SCREENSHOT_QUALITY', default=80, cast=int)  # webp/jpeg 压缩质量
+UI_SCREENSHOT_THUMBNAIL_WIDTH = config('UI_SCREENSHOT_THUMBNAIL_WIDTH', default=320, cast=int)  # 缩略图宽度（像素）
+UI_SCREENSHOT_FULL_PAGE = config('UI_SCREENSHOT_FULL_PAGE', default=False, cast=bool)  # 是否截取整个页面（默认只截取可视区域）
+UI_SCREENSHOT_URL_MAX_AGE = config('UI_SCREENSHOT_URL_MAX_AGE', default=3600, cast=int)  # 执行记录中截图地址签名的有效期（秒）
+
+# UI自动化网络配置（apps.ui_automation.network_profiles），项目配置了 network_profile 时生效
+UI_NETWORK_HAR_ROOT = config('UI_NETWORK_HAR_ROOT', default=os.path.join(MEDIA_ROOT, 'ui_har'))  # 项目网络配置引用的 HAR 文件所在目录
+UI_NETWORK_CACHE_MAX_BYTES = config('UI_NETWORK_CACHE_MAX_BYTES', default=100 * 1024 * 1024, cast=int)  # 进程内静态资源缓存的大小上限（字节）
+
+# UI自动化执行耗时（apps.ui_automation.tracing）
+UI_TRACE_ON_FAILURE = config('UI_TRACE_ON_FAILURE', default=False, cast=bool)  # 套件执行时录制 Playwright Trace，用例失败时保存
+UI_TRACE_ROOT = config('UI_TRACE_ROOT', default=os.path.join(MEDIA_ROOT, 'ui_traces'))
 
 # Email Configuration
 EMAIL_BACKEND = 'apps.api_testing.custom_email_backend.CustomEmailBackend'